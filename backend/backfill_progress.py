@@ -0,0 +1,84 @@
+"""Rebuild every tutor's progress aggregates and the cohort rollups from
+the scored sessions.
+
+Reads ended sessions from the configured session store (SESSION_STORE,
+DATABASE_URL) page by page in (created_at, id) order, folds their scores
+into fresh per-tutor aggregates and cohort rollup rows, then writes one
+progress document per tutor and replaces the rollups. Use it once after
+upgrading, or if the aggregates have drifted; scores recorded while it runs
+may be overwritten, so run it when scoring is quiet. See
+services/progress_service.py and services/analytics_service.py.
+
+Run from the backend directory:
+    python backfill_progress.py --page-size 500
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.analytics_service import merge_rollups, rollup_deltas
+from services.progress_service import rebuild_progress
+from services.session_store import start_session_store, stop_session_store
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--page-size", type=int, default=500, help="sessions read from the store per query")
+    parser.add_argument("--dry-run", action="store_true", help="rebuild, but do not write the aggregates")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+async def backfill(store, page_size: int = 500, dry_run: bool = False) -> dict:
+    """Rebuild and store the progress of every tutor with scored sessions,
+    and the cohort rollups"""
+    start = time.perf_counter()
+    read = 0
+    rollups = {}
+
+    async def sessions():
+        nonlocal read
+        async for session in store.iter_ended(page_size=page_size):
+            read += 1
+            if session.get("scores"):
+                merge_rollups(rollup_deltas(session, session["scores"]), rollups)
+            yield session
+
+    rebuilt = await rebuild_progress(sessions())
+    if not dry_run:
+        for tutor_name, progress in rebuilt.items():
+            await store.update_tutor_progress(tutor_name, lambda _, progress=progress: progress)
+        await store.update_rollups(list(rollups.values()), replace=True)
+    return {
+        "sessions_read": read,
+        "sessions_scored": sum(progress["sessions"] for progress in rebuilt.values()),
+        "tutors": len(rebuilt),
+        "rollup_rows": len(rollups),
+        "written": not dry_run,
+        "elapsed_seconds": round(time.perf_counter() - start, 2)
+    }
+
+
+async def main():
+    args = parse_args()
+    store = await start_session_store()
+    try:
+        report = await backfill(store, page_size=args.page_size, dry_run=args.dry_run)
+    finally:
+        await stop_session_store()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Read {report['sessions_read']} ended sessions, {report['sessions_scored']} with scores, "
+              f"for {report['tutors']} tutors ({report['rollup_rows']} rollup rows) in {report['elapsed_seconds']}s"
+              + ("" if report["written"] else " (dry run, nothing written)"))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
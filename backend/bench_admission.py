@@ -0,0 +1,152 @@
+"""Mixed-load benchmark for model-call admission control.
+
+Simulates a class against the local fake LLM server with a small number of
+model-call slots:
+
+- 20 tutors hold live conversations, one turn every half second,
+- a cohort of 150 tutors starts sessions at once a second in (opening turns),
+- a backlog of 40 scoring calls is waiting from the start.
+
+Once with the old first-come, first-served semaphore and once with the
+admission controller (persona turns first, then openings, then scoring;
+per-tutor caps; openings that cannot start within a deadline rejected with
+a 503 instead of queueing). Reports p50/p99 latency per kind of call and
+rejections. Live turns should stay fast while the cohort and the scoring
+backlog wait their turn.
+
+Run from the backend directory:
+    python bench_admission.py
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List
+
+from fake_llm_server import FakeLLMServer
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+
+from services.admission_service import (
+    OPENING_TURN,
+    AdmissionController,
+    AdmissionRejectedError
+)
+from services.claude_service import SCORING_MODEL, ClaudeService
+from services.metrics_service import reset_metrics
+
+SLOTS = 32
+LIVE_TUTORS = 20
+LIVE_TURNS = 12
+THINK_TIME = 1.0
+COHORT = 150
+COHORT_START = 1.0
+SCORING_BACKLOG = 40
+OPENING_MAX_WAIT = 3.0
+
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+TURN = [{"sender": "tutor", "content": "Which two numbers multiply to 6 and add to -5?"}]
+TRANSCRIPT = TURN + [{"sender": "learner", "content": "Is it -2 and -3?"}]
+
+
+class FirstComeFirstServed(AdmissionController):
+    """The previous behaviour: one semaphore, no priorities, caps or deadlines"""
+
+    def slot(self, priority=None, tutor=None, max_wait=None):
+        return super().slot(0, None, None)
+
+
+def percentile(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+
+async def simulate(server: FakeLLMServer, admission: AdmissionController) -> Dict[str, dict]:
+    service = ClaudeService(base_url=server.base_url, admission=admission, max_concurrency=SLOTS)
+    service.max_wait[OPENING_TURN] = OPENING_MAX_WAIT
+    latencies: Dict[str, List[float]] = {"persona": [], "opening": [], "scoring": []}
+    rejected: Dict[str, int] = {"persona": 0, "opening": 0, "scoring": 0}
+
+    async def timed(kind: str, call):
+        start = time.perf_counter()
+        try:
+            await call
+        except AdmissionRejectedError:
+            rejected[kind] += 1
+            return
+        latencies[kind].append(time.perf_counter() - start)
+
+    async def live_tutor(index: int):
+        # Tutors are spread over the think time rather than in lockstep
+        await asyncio.sleep(index * THINK_TIME / LIVE_TUTORS)
+        for _ in range(LIVE_TURNS):
+            await timed("persona", service.get_persona_response(
+                messages=TURN, persona_type="anxious_alex", problem=PROBLEM, tutor=f"live-{index}"
+            ))
+            await asyncio.sleep(THINK_TIME)
+
+    async def cohort():
+        await asyncio.sleep(COHORT_START)
+        await asyncio.gather(*(
+            timed("opening", service.get_persona_response(
+                messages=TURN, persona_type="anxious_alex", problem=PROBLEM,
+                priority=OPENING_TURN, tutor=f"cohort-{index}"
+            ))
+            for index in range(COHORT)
+        ))
+
+    async def scoring():
+        await asyncio.gather(*(
+            timed("scoring", service.get_session_scores(TRANSCRIPT, "anxious_alex", PROBLEM, mode="single"))
+            for _ in range(SCORING_BACKLOG)
+        ))
+
+    try:
+        await asyncio.gather(
+            *(live_tutor(index) for index in range(LIVE_TUTORS)),
+            cohort(),
+            scoring()
+        )
+    finally:
+        await service.aclose()
+    return {
+        kind: {
+            "count": len(samples),
+            "p50": percentile(samples, 0.50),
+            "p99": percentile(samples, 0.99),
+            "rejected": rejected[kind]
+        }
+        for kind, samples in latencies.items()
+    }
+
+
+def print_results(title: str, results: Dict[str, dict]):
+    print(f"\n{title}")
+    print(f"{'calls':>10} {'count':>8} {'p50 (ms)':>10} {'p99 (ms)':>10} {'rejected':>10}")
+    for kind, row in results.items():
+        print(f"{kind:>10} {row['count']:>8} {row['p50'] * 1000:>10.0f} "
+              f"{row['p99'] * 1000:>10.0f} {row['rejected']:>10}")
+
+
+async def main():
+    print("=" * 80)
+    print("ADMISSION CONTROL BENCHMARK")
+    print("=" * 80)
+    print(f"{SLOTS} model-call slots; {LIVE_TUTORS} live tutors, a cohort of {COHORT} session starts "
+          f"at {COHORT_START:.0f} s, {SCORING_BACKLOG} scoring calls queued")
+
+    with FakeLLMServer(latency=0.3, model_latency={SCORING_MODEL: 3.0}) as server:
+        reset_metrics()
+        before = await simulate(server, FirstComeFirstServed(SLOTS))
+        print_results("First come, first served (previous behaviour)", before)
+
+        reset_metrics()
+        admission = AdmissionController(SLOTS, per_tutor_limit=2)
+        after = await simulate(server, admission)
+        print_results(f"Admission controller (openings rejected after {OPENING_MAX_WAIT:.0f} s)", after)
+        print(f"\nMean slot hold time: {admission.stats()['mean_hold_ms']:.0f} ms")
+
+    print(f"\nLive turn p99: {before['persona']['p99'] * 1000:.0f} ms -> {after['persona']['p99'] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,152 @@
+"""Cohort analytics at 1M scored sessions: rollups vs scanning the sessions.
+
+Synthetic scores for 1M sessions (a year of weeks, 8 personas, 200 problems,
+the configured categories) are folded into the in-memory store's rollups:
+the first 100k one session at a time, as scoring results arrive, timing
+each update, and the rest in batches of 1000, as re-scoring and the
+backfill write them. Then typical dashboard queries are answered:
+
+- from the rollups (`SessionStore.get_cohorts`), p50/p99 over repeats,
+- by scanning every session's scores, which is what an ad hoc query over
+  sessions.scores does without rollups (timed once; it is O(sessions)).
+
+The PostgreSQL store runs the same shape of query over score_rollups,
+reading one category's rows in the week range through its primary key.
+
+Run from the backend directory:
+    python bench_analytics.py
+"""
+import asyncio
+import random
+import statistics
+import time
+from array import array
+from collections import defaultdict
+from datetime import date, timedelta
+
+from services.analytics_service import cohort_view, rollup_deltas
+from services.scoring_service import get_category_keys
+from services.session_store import InMemorySessionStore
+
+SESSIONS = 1_000_000
+WEEKS = 52
+PERSONAS = [f"persona_{index}" for index in range(8)]
+PROBLEMS = [f"Problem {index:03d}" for index in range(200)]
+TIMED_UPDATES = 100_000
+BATCH_SIZE = 1000
+QUERY_REPEATS = 50
+
+FIRST_WEEK = date(2025, 1, 6)
+WEEK_STARTS = [(FIRST_WEEK + timedelta(weeks=week)).isoformat() for week in range(WEEKS)]
+
+
+def synthetic_sessions(categories: list):
+    """Columns of session attributes and scores, 1 byte per score"""
+    rng = random.Random(42)
+    weeks = array("H", (rng.randrange(WEEKS) for _ in range(SESSIONS)))
+    personas = array("B", (rng.randrange(len(PERSONAS)) for _ in range(SESSIONS)))
+    problems = array("H", (rng.randrange(len(PROBLEMS)) for _ in range(SESSIONS)))
+    scores = array("B", (rng.randint(1, 5) for _ in range(SESSIONS * len(categories))))
+    return weeks, personas, problems, scores
+
+
+def scored(index: int, categories: list, columns):
+    weeks, personas, problems, scores = columns
+    session = {
+        "id": str(index),
+        "persona_type": PERSONAS[personas[index]],
+        "problem": PROBLEMS[problems[index]],
+        "ended_at": WEEK_STARTS[weeks[index]] + "T10:00:00"
+    }
+    offset = index * len(categories)
+    return session, {"categories": {key: {"score": scores[offset + i]} for i, key in enumerate(categories)}}
+
+
+async def fill_rollups(store: InMemorySessionStore, categories: list, columns) -> list:
+    latencies = []
+    for index in range(TIMED_UPDATES):
+        session, result = scored(index, categories, columns)
+        start = time.perf_counter()
+        await store.update_rollups(rollup_deltas(session, result))
+        latencies.append(time.perf_counter() - start)
+    for batch_start in range(TIMED_UPDATES, SESSIONS, BATCH_SIZE):
+        deltas = []
+        for index in range(batch_start, min(batch_start + BATCH_SIZE, SESSIONS)):
+            deltas.extend(rollup_deltas(*scored(index, categories, columns)))
+        await store.update_rollups(deltas)
+    return latencies
+
+
+def scan_cohorts(categories: list, columns, by: str, category: str, start: str, end: str, persona: str = None):
+    """The ad hoc query: every session's scores, filtered and grouped"""
+    weeks, personas, problems, scores = columns
+    count = len(categories)
+    position = categories.index(category) if category != "overall" else None
+    persona_index = PERSONAS.index(persona) if persona else None
+    totals = defaultdict(lambda: [0, 0.0])
+    for index in range(SESSIONS):
+        week = WEEK_STARTS[weeks[index]]
+        if week < start or week >= end or persona_index is not None and personas[index] != persona_index:
+            continue
+        session_scores = scores[index * count:(index + 1) * count]
+        value = sum(session_scores) / count if position is None else session_scores[position]
+        cohort = week if by == "week" else PERSONAS[personas[index]] if by == "persona" else PROBLEMS[problems[index]]
+        totals[cohort][0] += 1
+        totals[cohort][1] += value
+    return totals
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def main():
+    categories = get_category_keys()
+    print("=" * 80)
+    print("COHORT ANALYTICS BENCHMARK")
+    print("=" * 80)
+    print(f"{SESSIONS:,} sessions, {WEEKS} weeks, {len(PERSONAS)} personas, {len(PROBLEMS)} problems, "
+          f"{len(categories)} categories")
+
+    columns = synthetic_sessions(categories)
+    store = InMemorySessionStore()
+    start = time.perf_counter()
+    latencies = await fill_rollups(store, categories, columns)
+    elapsed = time.perf_counter() - start
+    rows = sum(len(week_rows) for weeks in store.rollups.values() for week_rows in weeks.values())
+    print(f"\nRollup updates per scored session: p50 {statistics.median(latencies) * 1e6:.0f} us, "
+          f"p99 {percentile(latencies, 0.99) * 1e6:.0f} us; {elapsed:.1f}s for all {SESSIONS:,}")
+    print(f"Rollup rows: {rows:,} ({rows / SESSIONS:.2f} per session)")
+
+    quarter_start, quarter_end = WEEK_STARTS[13], WEEK_STARTS[26]
+    queries = [
+        ("overall by week, whole year", "week", "overall", WEEK_STARTS[0], "9999-12-31", None),
+        (f"{categories[0]} by persona, one quarter", "persona", categories[0], quarter_start, quarter_end, None),
+        ("overall by problem for one persona, first page", "problem", "overall", WEEK_STARTS[0], "9999-12-31",
+         PERSONAS[3])
+    ]
+    print(f"\n{'query':<50} {'rollups p50':>12} {'p99':>9} {'scan':>9}")
+    for name, by, category, start_week, end_week, persona in queries:
+        timings = []
+        for _ in range(QUERY_REPEATS):
+            query_start = time.perf_counter()
+            cohorts = await store.get_cohorts(
+                by, [category], start=start_week, end=end_week, persona_type=persona, limit=50
+            )
+            [cohort_view(cohort) for cohort in cohorts]
+            timings.append(time.perf_counter() - query_start)
+
+        scan_start = time.perf_counter()
+        scanned = scan_cohorts(categories, columns, by, category, start_week, end_week, persona)
+        scan_elapsed = time.perf_counter() - scan_start
+        # Both give the same answer
+        first = cohorts[0]
+        assert scanned[first["cohort"]][0] == first["sessions"]
+        assert abs(scanned[first["cohort"]][1] - first["score_sum"]) < 1e-6 * first["sessions"]
+        print(f"{name:<50} {statistics.median(timings) * 1000:>9.2f} ms {percentile(timings, 0.99) * 1000:>6.2f} ms "
+              f"{scan_elapsed * 1000:>6.0f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""Latency benchmark for concurrent tutoring sessions against a local fake LLM.
+
+Runs N simulated sessions at once, each sending a few persona turns, and
+reports wall-clock time and throughput. With the async client, throughput
+should grow roughly linearly with N (wall time stays flat) until the
+concurrency limit is reached or the machine runs out of CPU; the cpu column
+(client and fake server together) shows when the latter happens. The
+blocking baseline reproduces the old synchronous client, where every call
+stalls the event loop.
+
+Run from the backend directory:
+    python bench_concurrency.py
+"""
+import asyncio
+import os
+import time
+from typing import List
+
+from anthropic import Anthropic
+
+from fake_llm_server import FakeLLMServer
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+
+from services.claude_service import ClaudeService, PERSONA_MODEL
+
+SESSION_COUNTS = [1, 5, 10, 25, 50]
+TURNS_PER_SESSION = 3
+LATENCY = 0.2
+
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+MESSAGES = [{"sender": "tutor", "content": f"Hello! I need help with this problem: {PROBLEM}"}]
+
+
+async def run_session(service: ClaudeService):
+    for _ in range(TURNS_PER_SESSION):
+        await service.get_persona_response(
+            messages=MESSAGES,
+            persona_type="anxious_alex",
+            problem=PROBLEM
+        )
+
+
+async def run_async(base_url: str, sessions: int) -> float:
+    service = ClaudeService(api_key="fake-key", base_url=base_url, max_concurrency=128)
+    try:
+        await run_session(service)  # open the first pooled connection
+        start = time.perf_counter()
+        await asyncio.gather(*(run_session(service) for _ in range(sessions)))
+        return time.perf_counter() - start
+    finally:
+        await service.aclose()
+
+
+async def run_blocking(base_url: str, sessions: int) -> float:
+    """The previous behaviour: a sync client called from async code"""
+    client = Anthropic(api_key="fake-key", base_url=base_url)
+
+    async def blocking_session():
+        for _ in range(TURNS_PER_SESSION):
+            client.messages.create(
+                model=PERSONA_MODEL,
+                max_tokens=300,
+                messages=[{"role": "user", "content": MESSAGES[0]["content"]}]
+            )
+
+    start = time.perf_counter()
+    await asyncio.gather(*(blocking_session() for _ in range(sessions)))
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed
+
+
+async def measure(runner, base_url: str, sessions: int) -> tuple:
+    cpu_start = time.process_time()
+    wall = await runner(base_url, sessions)
+    cpu = time.process_time() - cpu_start
+    return sessions, wall, sessions * TURNS_PER_SESSION / wall, cpu
+
+
+def print_table(title: str, rows: List[tuple]):
+    print(f"\n{title}")
+    print(f"{'sessions':>10} {'wall (s)':>10} {'turns/s':>10} {'scaling':>10} {'cpu (s)':>10}")
+    base_throughput = rows[0][2]
+    for sessions, wall, throughput, cpu in rows:
+        # 1.0 means perfectly linear: N sessions give N times the throughput
+        scaling = throughput / (base_throughput * sessions)
+        print(f"{sessions:>10} {wall:>10.2f} {throughput:>10.1f} {scaling:>10.2f} {cpu:>10.2f}")
+
+
+async def main():
+    print("=" * 80)
+    print("CONCURRENT SESSION BENCHMARK")
+    print("=" * 80)
+    print(f"Fake model latency: {LATENCY * 1000:.0f} ms, turns per session: {TURNS_PER_SESSION}")
+
+    with FakeLLMServer(latency=LATENCY) as server:
+        async_rows = [
+            await measure(run_async, server.base_url, sessions)
+            for sessions in SESSION_COUNTS
+        ]
+        print_table("Async pooled client", async_rows)
+
+        blocking_rows = [
+            await measure(run_blocking, server.base_url, sessions)
+            for sessions in SESSION_COUNTS[:3]
+        ]
+        print_table("Blocking client (previous behaviour)", blocking_rows)
+
+        print(f"\nPeak concurrent requests seen by the server: {server.max_in_flight}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""Bulk export throughput and memory: rows per second and peak RSS.
+
+Each run exports synthetic ended sessions (20 messages each, with scores)
+in a fresh child process, so its peak RSS is its own. The sessions come
+from a generator standing in for the PostgreSQL store's server-side
+cursor: one session exists at a time, as with a real export. Runs:
+
+- streaming ndjson and parquet (services/export_service.py) at 100k and
+  1M messages: peak RSS should be the same at both sizes,
+- "buffered" ndjson at the same sizes, reading every session before
+  encoding, which is what an export without a cursor does: its RSS grows
+  with the export.
+
+Parquet runs need pyarrow and are skipped without it.
+
+Run from the backend directory:
+    python bench_export.py
+"""
+import asyncio
+import importlib.util
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+MESSAGES_PER_SESSION = 20
+SIZES = [100_000, 1_000_000]
+CATEGORIES = ["explanation", "questioning", "patience", "adaptation", "encouragement"]
+
+
+async def synthetic_sessions(messages: int):
+    start = datetime(2025, 1, 1)
+    for index in range(messages // MESSAGES_PER_SESSION):
+        created_at = start + timedelta(seconds=index * 90)
+        yield {
+            "id": str(uuid.UUID(int=index + 1)),
+            "tutor_name": f"tutor-{index % 500}",
+            "problem": f"Solve the quadratic equation x² - {index % 50}x + 6 = 0",
+            "persona_type": f"persona_{index % 8}",
+            "messages": [
+                {
+                    "content": f"Turn {turn}: so if we factor this, which two numbers multiply to 6 and add to 5?",
+                    "sender": "tutor" if turn % 2 == 0 else "student",
+                    "timestamp": (created_at + timedelta(seconds=turn * 20)).isoformat()
+                }
+                for turn in range(MESSAGES_PER_SESSION)
+            ],
+            "created_at": created_at.isoformat(),
+            "ended_at": (created_at + timedelta(minutes=10)).isoformat(),
+            "is_active": False,
+            "scores": {
+                "categories": {key: {"score": (index + i) % 5 + 1, "feedback": "Good pacing."}
+                               for i, key in enumerate(CATEGORIES)}
+            }
+        }
+
+
+async def buffered_chunks(sessions):
+    """Every session read first, then encoded"""
+    from services.export_service import export_record
+
+    records = [export_record(session) async for session in sessions]
+    yield b"".join(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n" for record in records)
+
+
+def peak_rss_mb() -> float:
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def child(mode: str, messages: int):
+    from services.export_service import export_chunks
+
+    if mode == "parquet":
+        # Import up front so the baseline includes the library
+        import pyarrow.parquet  # noqa: F401
+    baseline = peak_rss_mb()
+    sessions = synthetic_sessions(messages)
+    chunks = buffered_chunks(sessions) if mode == "buffered" else export_chunks(sessions, mode, CATEGORIES)
+    written = 0
+    start = time.perf_counter()
+    with open(os.devnull, "wb") as output:
+        async for chunk in chunks:
+            output.write(chunk)
+            written += len(chunk)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "seconds": elapsed,
+        "bytes": written,
+        "baseline_mb": baseline,
+        "peak_mb": peak_rss_mb()
+    }))
+
+
+def run(mode: str, messages: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", mode, str(messages)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    print("=" * 80)
+    print("SESSION EXPORT BENCHMARK")
+    print("=" * 80)
+    print(f"{MESSAGES_PER_SESSION} messages per session, {len(CATEGORIES)} score categories")
+    modes = ["ndjson", "parquet", "buffered"]
+    if importlib.util.find_spec("pyarrow") is None:
+        print("pyarrow is not installed; skipping parquet")
+        modes.remove("parquet")
+
+    print(f"\n{'mode':<10} {'messages':>10} {'sessions/s':>11} {'messages/s':>11} {'MB out':>8} "
+          f"{'RSS base':>9} {'RSS peak':>9}")
+    for mode in modes:
+        for messages in SIZES:
+            result = run(mode, messages)
+            sessions = messages // MESSAGES_PER_SESSION
+            print(f"{mode:<10} {messages:>10,} {sessions / result['seconds']:>11,.0f} "
+                  f"{messages / result['seconds']:>11,.0f} {result['bytes'] / 1e6:>8.1f} "
+                  f"{result['baseline_mb']:>6.0f} MB {result['peak_mb']:>6.0f} MB")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        asyncio.run(child(sys.argv[2], int(sys.argv[3])))
+    else:
+        main()
@@ -0,0 +1,82 @@
+"""New-session latency when a class starts the same problem at once.
+
+Starts CLASS_SIZE sessions concurrently for one persona and problem, first
+with a cold opener cache (every session waits on the one model call made
+for the miss) and then after warming the pool up for the problem set, and
+reports how many distinct openers the class saw.
+
+Run from the backend directory:
+    python bench_opener_cache.py
+"""
+import asyncio
+import os
+import statistics
+import time
+
+from fake_llm_server import FakeLLMServer
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+
+from services.claude_service import ClaudeService
+from services.opener_service import OpenerCache
+
+CLASS_SIZE = 30
+LATENCY = 0.8
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+PERSONA = "anxious_alex"
+
+
+def varied_responder():
+    """Learner replies that differ per request, like sampled model output"""
+    counter = {"n": 0}
+
+    def respond(body: dict) -> str:
+        counter["n"] += 1
+        return f"Um, hi... I'm not sure where to start with this one (take {counter['n']})."
+
+    return respond
+
+
+async def start_class(cache: OpenerCache):
+    async def start_one():
+        start = time.perf_counter()
+        text = await cache.get_opener(PERSONA, PROBLEM)
+        return time.perf_counter() - start, text
+
+    results = await asyncio.gather(*(start_one() for _ in range(CLASS_SIZE)))
+    latencies = sorted(latency for latency, _ in results)
+    return latencies, len({text for _, text in results})
+
+
+def report(label: str, latencies, distinct: int):
+    print(f"{label:>8} {statistics.median(latencies) * 1000:>9.1f} "
+          f"{latencies[-1] * 1000:>9.1f} {distinct:>9}")
+
+
+async def main():
+    print("=" * 80)
+    print("OPENER CACHE BENCHMARK")
+    print("=" * 80)
+    print(f"{CLASS_SIZE} sessions started at once, fake model latency {LATENCY * 1000:.0f} ms")
+
+    with FakeLLMServer(latency=LATENCY, responder=varied_responder()) as server:
+        service = ClaudeService(api_key="fake-key", base_url=server.base_url)
+        print(f"\n{'cache':>8} {'p50 ms':>9} {'max ms':>9} {'openers':>9}")
+
+        cold = OpenerCache(service, pool_size=10, max_uses=3)
+        report("cold", *await start_class(cold))
+
+        warm = OpenerCache(service, pool_size=10, max_uses=3)
+        await warm.warm_up([PROBLEM], [PERSONA], wait=True)
+        report("warm", *await start_class(warm))
+
+        # Let the background refills finish before shutting the server down
+        for cache in (cold, warm):
+            await cache.warm_up([PROBLEM], [PERSONA], wait=True)
+            await cache.close()
+
+        await service.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""Persona registry cost with 10, 1000 and 5000 persona files.
+
+For each directory size this reports:
+
+- startup: creating the registry, which does not touch the directory
+- first index: the first listing, which reads every file's front matter
+- index memory: memory retained by the index (tracemalloc)
+- rescan: a later rescan with nothing changed, which only stats the files
+- list: serving /api/personas from the cached payload
+- body: the first and a cached load of one persona's text
+
+Run from the backend directory:
+    python bench_persona_registry.py
+"""
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from services.persona_registry import DEFAULT_PERSONA_DIR, PersonaRegistry
+
+DIRECTORY_SIZES = [10, 1000, 5000]
+LIST_CALLS = 10000
+
+
+def make_personas(directory: Path, count: int):
+    template = (DEFAULT_PERSONA_DIR / "anxious_alex.md").read_text()
+    for index in range(count):
+        (directory / f"persona_{index:05d}.md").write_text(
+            template.replace("name: Anxious Alex", f"name: Persona {index}")
+        )
+
+
+def timed(call):
+    start = time.perf_counter()
+    result = call()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    print("=" * 80)
+    print("PERSONA REGISTRY BENCHMARK")
+    print("=" * 80)
+    print(f"\n{'files':>6} {'startup ms':>11} {'index ms':>9} {'index KB':>9} {'rescan ms':>10} "
+          f"{'list us':>8} {'body ms':>8} {'cached us':>10}")
+
+    for count in DIRECTORY_SIZES:
+        with tempfile.TemporaryDirectory() as directory:
+            make_personas(Path(directory), count)
+
+            tracemalloc.start()
+            startup, registry = timed(lambda: PersonaRegistry(Path(directory), reload_interval=3600))
+            first_index, index = timed(registry.index)
+            retained, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            rescan, _ = timed(lambda: registry._scan(index))
+            list_total, _ = timed(lambda: [registry.index().api_payload for _ in range(LIST_CALLS)])
+            body, _ = timed(lambda: registry.load_body("persona_00000"))
+            cached, _ = timed(lambda: registry.load_body("persona_00000"))
+
+            print(f"{count:>6} {startup:>11.3f} {first_index:>9.1f} {retained / 1024:>9.0f} "
+                  f"{rescan:>10.1f} {list_total / LIST_CALLS * 1000:>8.2f} {body:>8.3f} {cached * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Prompt assembly time and allocations for 10-, 100- and 1000-turn sessions.
+
+Replays a session turn by turn and assembles, at every turn, the persona
+system prompt plus a scoring prompt over the transcript so far:
+
+- rebuilt: render everything from scratch each turn (generate_* functions)
+- cached: cached persona prompt and scoring instructions, as
+  ClaudeService assembles them (prompt_templates)
+
+Time is the mean per turn over the whole session; allocation is the peak
+memory allocated while assembling the last turn (tracemalloc).
+
+Run from the backend directory:
+    python bench_prompt_assembly.py
+"""
+import time
+import tracemalloc
+
+from services.persona_service import load_persona_prompt
+from services.prompt_service import generate_scoring_prompt, generate_scoring_session
+from services.prompt_templates import get_persona_system_prompt, get_scoring_instructions
+from services.scoring_service import generate_categories_list
+
+SESSION_TURNS = [10, 100, 1000]
+PERSONA = "anxious_alex"
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+
+TUTOR_LINE = ("Good start. Before we move on, can you tell me why we look for two numbers "
+              "that multiply to the constant term and add up to the middle coefficient?")
+LEARNER_LINE = ("Um, I think it's because when you expand (x - a)(x - b) you get x² - (a + b)x + ab? "
+                "Sorry if that's wrong, I always mix up the signs...")
+
+
+def rebuilt(conversation):
+    system = load_persona_prompt(PERSONA, PROBLEM)
+    scoring = generate_scoring_prompt({
+        'conversation': conversation,
+        'problem': PROBLEM,
+        'persona_name': 'Anxious Alex',
+        'categories_list': generate_categories_list()
+    })
+    return system, scoring
+
+
+def cached(conversation):
+    system = get_persona_system_prompt(PERSONA, PROBLEM)
+    instructions = get_scoring_instructions(generate_categories_list())
+    session = generate_scoring_session({
+        'conversation': conversation,
+        'conversation': conversation,
+        'problem': PROBLEM,
+        'persona_name': 'Anxious Alex'
+    })
+    return system, f"{instructions}\n\n{session}"
+
+
+def replay(assemble, turns: int):
+    conversation = []
+    elapsed = 0.0
+    for turn in range(turns):
+        conversation.append({'role': 'tutor', 'content': TUTOR_LINE})
+        conversation.append({'role': 'learner', 'content': LEARNER_LINE})
+        if turn == turns - 1:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = assemble(conversation)
+        elapsed += time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / turns, peak, result
+
+
+def main():
+    print("=" * 80)
+    print("PROMPT ASSEMBLY BENCHMARK")
+    print("=" * 80)
+    print(f"\n{'turns':>6} {'rebuilt us/turn':>16} {'cached us/turn':>15} "
+          f"{'rebuilt KB':>11} {'cached KB':>10}")
+    for turns in SESSION_TURNS:
+        old_time, old_peak, old_result = replay(rebuilt, turns)
+        new_time, new_peak, new_result = replay(cached, turns)
+        assert old_result == new_result
+        print(f"{turns:>6} {old_time * 1e6:>16.1f} {new_time * 1e6:>15.1f} "
+              f"{old_peak / 1024:>11.1f} {new_peak / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Per-turn latency and input cost of a long session with and without prompt caching.
+
+Replays a 30-turn session against the fake model, which remembers
+cache_control prefixes the way the provider does and prefills cached
+tokens ten times faster. Input cost uses Claude 3.5 Haiku pricing:
+$0.80/MTok input, $1.00/MTok cache writes and $0.08/MTok cache reads.
+The fake does not enforce the provider's minimum cacheable prefix length,
+so short prompts show savings the real API would not.
+
+Run from the backend directory:
+    python bench_prompt_caching.py
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List
+
+from fake_llm_server import FakeLLMServer
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+
+from services.claude_service import ClaudeService
+from services.metrics_service import get_metrics_snapshot, reset_metrics
+
+TURNS = 30
+REPORT_TURNS = [1, 5, 10, 20, 30]
+LATENCY = 0.1
+PER_INPUT_TOKEN_LATENCY = 0.0002
+
+PRICE_PER_TOKEN = {
+    "input": 0.80 / 1_000_000,
+    "cache_creation": 1.00 / 1_000_000,
+    "cache_read": 0.08 / 1_000_000
+}
+
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+TUTOR_LINE = ("Let's slow down and look at the middle term again. When you expand (x - a)(x - b), "
+              "what do you get for the coefficient of x, and how does that connect to -5 here? "
+              "Take your time and write out each step so we can check it together.")
+
+
+def usage_counters() -> Dict[str, int]:
+    counters = get_metrics_snapshot()["counters"]
+    return {
+        "input": counters.get("persona_input_tokens", 0),
+        "cache_creation": counters.get("persona_cache_creation_input_tokens", 0),
+        "cache_read": counters.get("persona_cache_read_input_tokens", 0)
+    }
+
+
+async def replay_session(base_url: str, prompt_caching: bool) -> List[dict]:
+    reset_metrics()
+    service = ClaudeService(api_key="fake-key", base_url=base_url, prompt_caching=prompt_caching)
+    messages = [{"sender": "tutor", "content": f"Hello! I need help with this problem: {PROBLEM}"}]
+    rows = []
+    for turn in range(1, TURNS + 1):
+        before = usage_counters()
+        start = time.perf_counter()
+        reply = await service.get_persona_response(
+            messages=messages,
+            persona_type="anxious_alex",
+            problem=PROBLEM
+        )
+        elapsed = time.perf_counter() - start
+        after = usage_counters()
+        usage = {key: after[key] - before[key] for key in after}
+        rows.append({
+            "turn": turn,
+            "latency": elapsed,
+            "cached": usage["cache_read"],
+            "total": sum(usage.values()),
+            "cost": sum(usage[key] * PRICE_PER_TOKEN[key] for key in usage)
+        })
+        messages.append({"sender": "learner", "content": reply})
+        messages.append({"sender": "tutor", "content": TUTOR_LINE})
+    await service.aclose()
+    return rows
+
+
+async def main():
+    print("=" * 80)
+    print("PROMPT CACHING BENCHMARK")
+    print("=" * 80)
+
+    with FakeLLMServer(latency=LATENCY, per_input_token_latency=PER_INPUT_TOKEN_LATENCY) as server:
+        uncached = await replay_session(server.base_url, prompt_caching=False)
+    with FakeLLMServer(latency=LATENCY, per_input_token_latency=PER_INPUT_TOKEN_LATENCY) as server:
+        cached = await replay_session(server.base_url, prompt_caching=True)
+
+    print(f"\n{'turn':>6} {'prompt tok':>11} {'cached tok':>11} "
+          f"{'ms (off)':>10} {'ms (on)':>10} {'$/1k (off)':>11} {'$/1k (on)':>11}")
+    for off, on in zip(uncached, cached):
+        if off["turn"] in REPORT_TURNS:
+            print(f"{off['turn']:>6} {on['total']:>11} {on['cached']:>11} "
+                  f"{off['latency'] * 1000:>10.0f} {on['latency'] * 1000:>10.0f} "
+                  f"{off['cost'] * 1000:>11.3f} {on['cost'] * 1000:>11.3f}")
+
+    total_off = sum(row["cost"] for row in uncached)
+    total_on = sum(row["cost"] for row in cached)
+    print(f"\nSession input cost per 1k sessions: ${total_off * 1000:.2f} without caching, "
+          f"${total_on * 1000:.2f} with caching ({1 - total_on / total_off:.0%} saved)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""/end latency with and without rolling scoring for 10-, 30- and 60-turn sessions.
+
+For each session length, the transcript is scored once from scratch (the
+old /end) and once with rolling scoring: evaluations run every
+ROLLING_SCORING_INTERVAL turns as the session is replayed (off the timed
+path), and only the final delta pass is timed.
+
+The fake model charges for prompt length as well as output, so re-reading
+a long transcript costs time as it would with the real model.
+
+Run from the backend directory:
+    python bench_rolling_scoring.py
+"""
+import asyncio
+import os
+import time
+from functools import partial
+
+from fake_llm_server import FakeLLMServer, default_responder
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+
+from services.claude_service import ClaudeService
+from services.rolling_scoring_service import (
+    get_rolling_interval,
+    schedule_rolling_evaluation,
+    wait_for_rolling_evaluation
+)
+
+SESSION_TURNS = [10, 30, 60]
+LATENCY = 0.3
+PER_INPUT_TOKEN_LATENCY = 0.0005
+PER_TOKEN_LATENCY = 0.004
+ANALYSIS_TOKENS = 300
+
+TUTOR_LINE = ("Good start. Before we move on, can you tell me why we look for two numbers "
+              "that multiply to the constant term and add up to the middle coefficient?")
+LEARNER_LINE = ("Um, I think it's because when you expand (x - a)(x - b) you get x² - (a + b)x + ab? "
+                "Sorry if that's wrong, I always mix up the signs...")
+
+
+def make_session(turns: int) -> dict:
+    return {
+        "id": f"bench-{turns}",
+        "persona_type": "anxious_alex",
+        "problem": "Solve the quadratic equation x² - 5x + 6 = 0",
+        "messages": []
+    }
+
+
+async def end_latency_full(service: ClaudeService, turns: int) -> float:
+    session = make_session(turns)
+    for _ in range(turns):
+        session["messages"].append({"sender": "tutor", "content": TUTOR_LINE})
+        session["messages"].append({"sender": "learner", "content": LEARNER_LINE})
+
+    start = time.perf_counter()
+    await service.get_session_scores(
+        conversation_history=session["messages"],
+        persona_type=session["persona_type"],
+        problem=session["problem"]
+    )
+    return time.perf_counter() - start
+
+
+async def end_latency_rolling(service: ClaudeService, turns: int) -> float:
+    session = make_session(turns)
+    for _ in range(turns):
+        session["messages"].append({"sender": "tutor", "content": TUTOR_LINE})
+        session["messages"].append({"sender": "learner", "content": LEARNER_LINE})
+        if schedule_rolling_evaluation(session, service):
+            # Tutors take longer to type than an evaluation takes to run
+            await wait_for_rolling_evaluation(session["id"])
+
+    start = time.perf_counter()
+    await service.get_session_scores(
+        conversation_history=session["messages"],
+        persona_type=session["persona_type"],
+        problem=session["problem"],
+        rolling_evaluation=session.get("rolling_evaluation")
+    )
+    return time.perf_counter() - start
+
+
+async def main():
+    print("=" * 80)
+    print("ROLLING SCORING /end LATENCY BENCHMARK")
+    print("=" * 80)
+    print(f"Rolling evaluation every {get_rolling_interval()} turns")
+
+    responder = partial(default_responder, analysis_tokens=ANALYSIS_TOKENS)
+    with FakeLLMServer(
+        latency=LATENCY,
+        per_token_latency=PER_TOKEN_LATENCY,
+        per_input_token_latency=PER_INPUT_TOKEN_LATENCY,
+        responder=responder
+    ) as server:
+        service = ClaudeService(api_key="fake-key", base_url=server.base_url)
+        print(f"\n{'turns':>8} {'full (s)':>10} {'rolling (s)':>12} {'reduction':>10}")
+        for turns in SESSION_TURNS:
+            full = await end_latency_full(service, turns)
+            rolling = await end_latency_rolling(service, turns)
+            print(f"{turns:>8} {full:>10.2f} {rolling:>12.2f} {1 - rolling / full:>10.0%}")
+        await service.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
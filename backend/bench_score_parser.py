@@ -0,0 +1,97 @@
+"""Scoring response parsing: the old regex extraction vs the streaming parser.
+
+- realistic: well-formed responses with growing <category_evaluation>
+  sections, parsed whole and fed in 4-character chunks as the model streams
+- adversarial: responses where the old regexes backtrack, e.g. an analysis
+  that repeatedly opens <json> or `{"categories": {` blocks that never close
+
+Times are the median of several runs. "failed" means the parser raised
+(for the old extraction, because no result could be found).
+
+Run from the backend directory:
+    python bench_score_parser.py
+"""
+import json
+import re
+import statistics
+import time
+
+from fake_llm_server import _filler
+from services.score_parser import ScoreStreamParser, parse_scoring_response
+from services.scoring_service import get_category_keys
+
+KEYS = get_category_keys()
+RUNS = 5
+ANALYSIS_SIZES = [300, 3_000, 30_000]
+ADVERSARIAL_REPEATS = [100, 1_000, 4_000]
+
+
+def old_extract(response_text: str) -> dict:
+    """The extraction get_session_scores used before the streaming parser"""
+    json_match = re.search(r'<json>\s*(\{.*?\})\s*</json>', response_text, re.DOTALL)
+    if not json_match:
+        json_match = re.search(r'\{[^{}]*"categories"\s*:\s*\{.*?\}\s*,\s*"session_summary"\s*:.*?\}', response_text, re.DOTALL)
+    if not json_match:
+        raise ValueError("No JSON found in response")
+    json_text = json_match.group(1) if json_match.lastindex else json_match.group(0)
+    return json.loads(json_text)
+
+
+def realistic_response(analysis_tokens: int) -> str:
+    categories = {key: {"score": 4, "feedback": f"Solid work on {key.replace('_', ' ')}."} for key in KEYS}
+    analysis = "\n".join(
+        f"<category_evaluation>{key}: {_filler(analysis_tokens)}</category_evaluation>" for key in KEYS
+    )
+    result = {"categories": categories, "session_summary": "A productive session."}
+    return f"{analysis}\n<json>\n{json.dumps(result, indent=2)}\n</json>"
+
+
+def adversarial_responses(repeats: int):
+    yield "unclosed <json> tags", "<json>{ \"draft\": 1 " * repeats
+    yield "unclosed categories", '{"x": 1, "categories": {"a": 1 ' * repeats
+
+
+def streamed(text: str) -> dict:
+    parser = ScoreStreamParser(KEYS)
+    for i in range(0, len(text), 4):
+        parser.feed(text[i:i + 4])
+    return parser.finish()
+
+
+def median_ms(parse, text: str):
+    timings = []
+    outcome = "ok"
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        try:
+            parse(text)
+        except ValueError:
+            outcome = "failed"
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, outcome
+
+
+def main():
+    print("=" * 80)
+    print("SCORE PARSER BENCHMARK")
+    print("=" * 80)
+
+    print(f"\nRealistic responses\n{'chars':>9} {'old regex ms':>13} {'parser ms':>10} {'streamed ms':>12}")
+    for tokens in ANALYSIS_SIZES:
+        text = realistic_response(tokens)
+        assert old_extract(text) == parse_scoring_response(text, KEYS) == streamed(text)
+        old_ms, _ = median_ms(old_extract, text)
+        new_ms, _ = median_ms(lambda t: parse_scoring_response(t, KEYS), text)
+        stream_ms, _ = median_ms(streamed, text)
+        print(f"{len(text):>9} {old_ms:>13.2f} {new_ms:>10.2f} {stream_ms:>12.2f}")
+
+    print(f"\nAdversarial responses\n{'case':<22} {'chars':>9} {'old regex ms':>13} {'parser ms':>10}")
+    for repeats in ADVERSARIAL_REPEATS:
+        for name, text in adversarial_responses(repeats):
+            old_ms, old_outcome = median_ms(old_extract, text)
+            new_ms, new_outcome = median_ms(lambda t: parse_scoring_response(t, KEYS), text)
+            print(f"{name:<22} {len(text):>9} {old_ms:>10.2f} {old_outcome:<2} {new_ms:>7.2f} {new_outcome}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Wall-clock comparison of single-call and parallel per-category scoring.
+
+The fake model streams output at a fixed per-token latency, so a single
+call that writes every category's analysis in sequence takes roughly the
+sum of all sections, while parallel mode takes roughly the longest one.
+A second run makes one category fail once to show that only that category
+is retried.
+
+Run from the backend directory:
+    python bench_scoring_modes.py
+"""
+import asyncio
+import os
+import time
+from functools import partial
+
+from fake_llm_server import FakeLLMServer, default_responder
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+
+from services.claude_service import ClaudeService
+from services.metrics_service import get_metrics_snapshot, reset_metrics
+
+LATENCY = 0.5
+PER_TOKEN_LATENCY = 0.005
+ANALYSIS_TOKENS = 300
+RUNS = 3
+
+CONVERSATION = [
+    {"sender": "tutor", "content": "Let's solve x² - 5x + 6 = 0. Have you seen quadratics before?"},
+    {"sender": "learner", "content": "I think we need to factor it somehow? Sorry if this is wrong..."},
+    {"sender": "tutor", "content": "Exactly! Which two numbers multiply to 6 and add to -5?"},
+    {"sender": "learner", "content": "Is it -2 and -3? So x = 2 or x = 3? But I'm probably wrong..."},
+]
+
+
+def flaky_responder(failing_category: str):
+    """Return garbage the first time a given category is scored"""
+    failed = set()
+
+    def respond(body: dict) -> str:
+        text = default_responder(body, analysis_tokens=ANALYSIS_TOKENS)
+        prompt = body["messages"][0]["content"]
+        if f"<category>\n{failing_category}:" in prompt and failing_category not in failed:
+            failed.add(failing_category)
+            return "<category_evaluation>truncated"
+        return text
+
+    return respond
+
+
+async def time_mode(service: ClaudeService, mode: str) -> float:
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = await service.get_session_scores(
+            conversation_history=CONVERSATION,
+            persona_type="anxious_alex",
+            problem="Solve x² - 5x + 6 = 0",
+            mode=mode
+        )
+        timings.append(time.perf_counter() - start)
+        assert set(result) == {"categories", "session_summary"}
+    return sum(timings) / len(timings)
+
+
+async def main():
+    print("=" * 80)
+    print("SCORING MODE BENCHMARK")
+    print("=" * 80)
+    print(f"Fake model: {LATENCY * 1000:.0f} ms + {PER_TOKEN_LATENCY * 1000:.0f} ms/token, "
+          f"{ANALYSIS_TOKENS} analysis tokens per category")
+
+    responder = partial(default_responder, analysis_tokens=ANALYSIS_TOKENS)
+    with FakeLLMServer(latency=LATENCY, per_token_latency=PER_TOKEN_LATENCY, responder=responder) as server:
+        service = ClaudeService(api_key="fake-key", base_url=server.base_url)
+        single = await time_mode(service, "single")
+        parallel = await time_mode(service, "parallel")
+        await service.aclose()
+
+    print(f"\n{'mode':>10} {'mean wall (s)':>15}")
+    print(f"{'single':>10} {single:>15.2f}")
+    print(f"{'parallel':>10} {parallel:>15.2f}")
+    print(f"\nSpeedup: {single / parallel:.1f}x")
+
+    print("\nPartial failure (one category fails once)")
+    reset_metrics()
+    with FakeLLMServer(
+        latency=LATENCY,
+        per_token_latency=PER_TOKEN_LATENCY,
+        responder=flaky_responder("adaptability")
+    ) as server:
+        service = ClaudeService(api_key="fake-key", base_url=server.base_url)
+        start = time.perf_counter()
+        await service.get_session_scores(
+            conversation_history=CONVERSATION,
+            persona_type="anxious_alex",
+            problem="Solve x² - 5x + 6 = 0",
+            mode="parallel"
+        )
+        elapsed = time.perf_counter() - start
+        await service.aclose()
+        print(f"  wall: {elapsed:.2f} s, model requests: {len(server.requests)}, "
+              f"retries: {get_metrics_snapshot()['counters'].get('scoring_category_retries', 0)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
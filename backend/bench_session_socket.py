@@ -0,0 +1,293 @@
+"""Load test: the WebSocket session channel vs per-turn HTTP posts.
+
+Runs the app as a uvicorn worker in a child process, against the fake LLM
+server in this one, and drives it with simulated tutors:
+
+- per-turn overhead: one tutor sends turns back to back, five per session,
+  with a model that answers at once. Whole replies over a new HTTP
+  connection per turn, a kept-alive one (POST /message) and the channel
+  with "stream": false; streamed replies over kept-alive HTTP (POST
+  /message/stream) and the channel. Reports client latency and the
+  worker's CPU time per turn.
+- connections per worker: 50 to 200 tutors hold a connection each and send
+  a turn every THINK_TIME seconds, with a model that takes LATENCY seconds.
+  Reports the worker's memory with every tutor connected and idle, then
+  turn latency, failed turns and the worker's CPU use under load.
+
+The load generator and the fake model share the machine with the worker,
+so absolute numbers depend on the core count; compare the transports.
+
+Run from the backend directory:
+    python bench_session_socket.py
+"""
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+import httpx
+import websockets
+
+from fake_llm_server import FakeLLMServer
+
+OVERHEAD_SESSIONS = 60
+TURNS_PER_SESSION = 5
+TUTOR_COUNTS = [50, 100, 200]
+TURNS_PER_TUTOR = 5
+THINK_TIME = 2.0
+LATENCY = 0.2
+
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+TURN = {"message": "Which two numbers multiply to 6 and add to 5?", "sender": "tutor"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Worker:
+    """The app in a uvicorn child process"""
+
+    def __init__(self, llm_url: str):
+        self.port = free_port()
+        env = {
+            **os.environ,
+            "ANTHROPIC_API_KEY": "fake-key",
+            "ANTHROPIC_BASE_URL": llm_url,
+            "SESSION_STORE": "memory",
+            "SESSION_SPILL_DIR": "",
+            "SESSION_WAL_DIR": "",
+            "OPENER_POOL_SIZE": "0",
+            "ROLLING_SCORING_INTERVAL": "0",
+            "SCORING_JOB_DIR": tempfile.mkdtemp(),
+            "ADMISSION_PERSONA_MAX_WAIT_SECONDS": "60",
+            "ADMISSION_OPENING_MAX_WAIT_SECONDS": "60"
+        }
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port), "--log-level", "warning",
+             "--backlog", "4096"],
+            env=env, stdout=subprocess.DEVNULL
+        )
+        self.url = f"127.0.0.1:{self.port}"
+
+    async def wait_ready(self):
+        async with httpx.AsyncClient() as client:
+            for _ in range(200):
+                try:
+                    if (await client.get(f"http://{self.url}/health")).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.05)
+        raise RuntimeError("The worker did not start")
+
+    def cpu_seconds(self) -> float:
+        with open(f"/proc/{self.process.pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def rss_mb(self) -> float:
+        with open(f"/proc/{self.process.pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def percentile(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class HttpTutor:
+    def __init__(self, worker: Worker, name: str, keep_alive: bool = True, stream: bool = False):
+        self.base = f"http://{worker.url}"
+        self.name = name
+        self.keep_alive = keep_alive
+        self.stream = stream
+        self.client = httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=1)) if keep_alive else None
+        self.session_id = None
+
+    async def _post(self, path: str, body: dict) -> dict:
+        if self.keep_alive:
+            response = await self.client.post(self.base + path, json=body)
+        else:
+            async with httpx.AsyncClient(timeout=120) as client:
+                response = await client.post(self.base + path, json=body)
+        response.raise_for_status()
+        return response.json()
+
+    async def start(self):
+        started = await self._post("/api/sessions/start", {
+            "tutor_name": self.name, "problem": PROBLEM, "persona_type": "anxious_alex"
+        })
+        self.session_id = started["session_id"]
+
+    async def turn(self) -> str:
+        if not self.stream:
+            return (await self._post(f"/api/sessions/{self.session_id}/message", TURN))["response"]
+        async with self.client.stream("POST", f"{self.base}/api/sessions/{self.session_id}/message/stream",
+                                      json=TURN) as response:
+            async for line in response.aiter_lines():
+                if line.startswith("data: ") and '"response"' in line:
+                    return json.loads(line[6:])["response"]
+        raise RuntimeError("Stream ended without a reply")
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+
+class SocketTutor:
+    def __init__(self, worker: Worker, name: str, stream: bool = True):
+        self.url = f"ws://{worker.url}/api/sessions/ws"
+        self.name = name
+        self.stream = stream
+        self.connection = None
+        self.session_id = None
+        self.turns = 0
+
+    async def _request(self, frame: dict) -> dict:
+        await self.connection.send(json.dumps(frame))
+        while True:
+            reply = json.loads(await self.connection.recv())
+            if reply["type"] == "ping":
+                await self.connection.send('{"type": "pong"}')
+            elif reply["type"] == "error":
+                raise RuntimeError(reply["detail"])
+            elif reply["type"] != "token":
+                return reply
+
+    async def start(self):
+        self.connection = await websockets.connect(self.url, max_queue=None, open_timeout=60)
+        started = await self._request({
+            "type": "start", "id": "start", "tutor_name": self.name, "problem": PROBLEM, "persona_type": "anxious_alex"
+        })
+        self.session_id = started["session_id"]
+
+    async def turn(self) -> str:
+        self.turns += 1
+        reply = await self._request({
+            "type": "message", "id": str(self.turns), "session_id": self.session_id, "stream": self.stream, **TURN
+        })
+        return reply["response"]
+
+    async def close(self):
+        await self.connection.close()
+
+
+TRANSPORTS = {
+    "http, new connection": lambda worker, name: HttpTutor(worker, name, keep_alive=False),
+    "http": lambda worker, name: HttpTutor(worker, name),
+    "websocket": lambda worker, name: SocketTutor(worker, name, stream=False),
+    "http sse, streamed": lambda worker, name: HttpTutor(worker, name, stream=True),
+    "websocket, streamed": SocketTutor
+}
+
+
+async def per_turn_overhead(worker: Worker):
+    turns = OVERHEAD_SESSIONS * TURNS_PER_SESSION
+    print(f"\nPer-turn overhead: {turns} turns back to back, {TURNS_PER_SESSION} per session, model answers at once")
+    print(f"{'transport':<22} {'p50':>8} {'p99':>8} {'worker CPU/turn':>16}")
+    for transport, make in TRANSPORTS.items():
+        latencies = []
+        cpu = 0.0
+        for index in range(OVERHEAD_SESSIONS):
+            tutor = make(worker, f"overhead-{transport}-{index}")
+            await tutor.start()
+            cpu_before = worker.cpu_seconds()
+            for _ in range(TURNS_PER_SESSION):
+                start = time.perf_counter()
+                await tutor.turn()
+                latencies.append(time.perf_counter() - start)
+            cpu += worker.cpu_seconds() - cpu_before
+            await tutor.close()
+        print(f"{transport:<22} {percentile(latencies, 0.5) * 1000:>5.2f} ms "
+              f"{percentile(latencies, 0.99) * 1000:>5.2f} ms {cpu / turns * 1000:>13.2f} ms")
+
+
+async def connections_per_worker(worker: Worker, transport: str, tutors: int) -> dict:
+    make = TRANSPORTS[transport]
+    clients = [make(worker, f"{transport}-{tutors}-{index}") for index in range(tutors)]
+    # Connect and start sessions a batch at a time
+    rss_before = worker.rss_mb()
+    for batch in range(0, tutors, 100):
+        await asyncio.gather(*(client.start() for client in clients[batch:batch + 100]))
+    # Connected and idle for a couple of heartbeats
+    await asyncio.sleep(1)
+    idle_rss = worker.rss_mb() - rss_before
+    latencies: List[float] = []
+    failures = 0
+
+    async def run(client, offset: float):
+        nonlocal failures
+        await asyncio.sleep(offset)
+        for _ in range(TURNS_PER_TUTOR):
+            start = time.perf_counter()
+            try:
+                await client.turn()
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                failures += 1
+            await asyncio.sleep(max(0.0, THINK_TIME - (time.perf_counter() - start)))
+
+    cpu = worker.cpu_seconds()
+    wall = time.perf_counter()
+    await asyncio.gather(*(run(client, THINK_TIME * index / tutors) for index, client in enumerate(clients)))
+    wall = time.perf_counter() - wall
+    cpu = worker.cpu_seconds() - cpu
+    await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+    return {
+        "p50": percentile(latencies, 0.5) if latencies else float("nan"),
+        "p99": percentile(latencies, 0.99) if latencies else float("nan"),
+        "failures": failures,
+        "cpu": cpu / wall,
+        "cpu_per_turn": cpu / max(1, len(latencies)),
+        "idle_kb_per_tutor": idle_rss * 1024 / tutors
+    }
+
+
+async def main():
+    print("=" * 80)
+    print("WEBSOCKET SESSION CHANNEL LOAD TEST")
+    print("=" * 80)
+    with FakeLLMServer(latency=0.0) as server:
+        worker = Worker(server.base_url)
+        try:
+            await worker.wait_ready()
+            await per_turn_overhead(worker)
+        finally:
+            worker.stop()
+
+    print(f"\nConnections per worker: each tutor sends a turn every {THINK_TIME:.0f}s, "
+          f"model latency {LATENCY * 1000:.0f} ms, {TURNS_PER_TUTOR} turns each")
+    print(f"{'transport':<20} {'tutors':>6} {'idle RSS/tutor':>15} {'p50':>8} {'p99':>8} {'failed':>7} "
+          f"{'worker CPU':>11} {'CPU/turn':>9}")
+    with FakeLLMServer(latency=LATENCY) as server:
+        for transport in ("http", "websocket", "http sse, streamed", "websocket, streamed"):
+            for tutors in TUTOR_COUNTS:
+                # A fresh worker per run, so RSS is this run's
+                worker = Worker(server.base_url)
+                try:
+                    await worker.wait_ready()
+                    result = await connections_per_worker(worker, transport, tutors)
+                finally:
+                    worker.stop()
+                print(f"{transport:<20} {tutors:>6} {result['idle_kb_per_tutor']:>12.0f} KB "
+                      f"{result['p50'] * 1000:>5.0f} ms {result['p99'] * 1000:>5.0f} ms {result['failures']:>7} "
+                      f"{result['cpu'] * 100:>10.0f}% {result['cpu_per_turn'] * 1000:>6.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
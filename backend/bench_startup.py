@@ -0,0 +1,153 @@
+"""Cold-start cost of the API process.
+
+Each measurement runs in a fresh Python process:
+
+- import time: `python -X importtime -c "import main"`, the total and the
+  heaviest imports it makes, and whether the Anthropic SDK was loaded.
+  For comparison, the same with the Claude service imported as well, which
+  is roughly what every start paid when it was created at import time,
+- cold start: importing the app, running its startup, then the first
+  /health, /api/personas and two session starts (the first builds the
+  Claude client) against the local fake Messages API.
+
+Each cold start is run several times; medians are reported.
+
+Run from the backend directory:
+    python bench_startup.py
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+RUNS = 5
+TOP_IMPORTS = 8
+
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+
+CHILD_ENV = {
+    "SESSION_STORE": "memory",
+    "SESSION_SPILL_DIR": "",
+    "SESSION_WAL_DIR": "",
+    "OPENER_POOL_SIZE": "0",
+    "ROLLING_SCORING_INTERVAL": "0",
+}
+
+
+def child_env(**extra: str) -> Dict[str, str]:
+    env = dict(os.environ, **CHILD_ENV, **extra)
+    env.setdefault("ANTHROPIC_API_KEY", "fake-key")
+    env.setdefault("SCORING_JOB_DIR", os.path.join(os.getcwd(), "data", "bench_startup_jobs"))
+    return env
+
+
+def import_times(code: str, modules: List[str]) -> Tuple[float, List[Tuple[str, float]], bool]:
+    """Run `code` under -X importtime
+
+    Returns:
+        Total milliseconds to import `modules`, the heaviest imports they
+        made directly, and whether anthropic was imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=child_env(), capture_output=True, text=True, check=True
+    )
+    total = 0.0
+    direct = []
+    pending = []
+    loaded = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Imports are listed after the ones they made, indented one level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        loaded.add(name)
+        ms = int(cumulative) / 1000
+        if depth == 1:
+            pending.append((name, ms))
+        elif depth == 0:
+            if name in modules:
+                total += ms
+                direct.extend(pending)
+            pending = []
+    direct.sort(key=lambda item: item[1], reverse=True)
+    return total, direct[:TOP_IMPORTS], "anthropic" in loaded
+
+
+async def cold_start() -> Dict[str, float]:
+    """One process start, timed step by step (runs in the child)"""
+    timings = {}
+    start = time.perf_counter()
+
+    def mark(step: str):
+        nonlocal start
+        now = time.perf_counter()
+        timings[step] = (now - start) * 1000
+        start = now
+
+    import main
+    mark("import")
+    import httpx
+    start = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        mark("startup")
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            (await client.get("/health")).raise_for_status()
+            mark("first /health")
+            (await client.get("/api/personas")).raise_for_status()
+            mark("first /api/personas")
+            session = {"tutor_name": "bench", "problem": PROBLEM, "persona_type": "anxious_alex"}
+            (await client.post("/api/sessions/start", json=session)).raise_for_status()
+            mark("first session start")
+            (await client.post("/api/sessions/start", json=session)).raise_for_status()
+            mark("second session start")
+    return timings
+
+
+def main():
+    from fake_llm_server import FakeLLMServer
+
+    print("=" * 80)
+    print("STARTUP BENCHMARK")
+    print("=" * 80)
+
+    total, heaviest, loaded = import_times("import main", ["main"])
+    eager_total, _, _ = import_times("import main, services.claude_service", ["main", "services.claude_service"])
+    print(f"\nimport main: {total:.0f} ms (anthropic loaded: {'yes' if loaded else 'no'})")
+    print(f"import main + Claude service (previous eager start): {eager_total:.0f} ms")
+    print(f"\n{'heaviest imports made by main':<40} {'ms':>8}")
+    for name, ms in heaviest:
+        print(f"{name:<40} {ms:>8.1f}")
+
+    with FakeLLMServer(latency=0.0) as server:
+        runs = []
+        for _ in range(RUNS):
+            result = subprocess.run(
+                [sys.executable, __file__, "--child"],
+                env=child_env(ANTHROPIC_BASE_URL=server.base_url),
+                capture_output=True, text=True, check=True
+            )
+            runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    print(f"\nCold start, median of {RUNS} processes")
+    print(f"{'step':<28} {'ms':>8}")
+    for step in runs[0]:
+        print(f"{step:<28} {statistics.median(run[step] for run in runs):>8.1f}")
+    to_health = statistics.median(run["import"] + run["startup"] + run["first /health"] for run in runs)
+    print(f"\nProcess start to first /health: {to_health:.0f} ms")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--child"]:
+        import asyncio
+        print(json.dumps(asyncio.run(cold_start())))
+    else:
+        main()
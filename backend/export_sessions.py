@@ -0,0 +1,108 @@
+"""Export ended sessions, with their transcripts and scores, to a file.
+
+Reads sessions from the configured session store (SESSION_STORE,
+DATABASE_URL) in (created_at, id) order, through a server-side cursor with
+PostgreSQL, and writes them as NDJSON or Parquet while they are read, so
+memory stays flat however large the export is. Parquet needs pyarrow
+(pip install pyarrow). See services/export_service.py.
+
+Run from the backend directory:
+    python export_sessions.py --format parquet --output sessions.parquet --from 2025-01-01
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.export_service import FORMATS, ExportUnavailableError, check_format, export_chunks
+from services.scoring_service import get_category_keys
+from services.session_store import start_session_store, stop_session_store
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--format", choices=list(FORMATS), default="ndjson", help="export format")
+    parser.add_argument("--output", required=True, help="file to write")
+    parser.add_argument("--from", dest="start", help="only sessions created from this ISO timestamp on")
+    parser.add_argument("--to", dest="end", help="only sessions created before this ISO timestamp")
+    parser.add_argument("--persona", help="only sessions with this persona")
+    parser.add_argument("--tutor", help="only this tutor's sessions")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows fetched from the store at a time")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+async def export(
+    store,
+    output: str,
+    export_format: str = "ndjson",
+    start: str = None,
+    end: str = None,
+    persona_type: str = None,
+    tutor_name: str = None,
+    batch_size: int = 500
+) -> dict:
+    """Write the matching sessions to a file in an export format
+
+    Raises:
+        ValueError: If the format is unknown
+        ExportUnavailableError: If the format's package is not installed
+    """
+    check_format(export_format)
+    started = time.perf_counter()
+    counts = {"sessions": 0, "messages": 0}
+
+    async def sessions():
+        async for session in store.iter_export(
+            start=start, end=end, persona_type=persona_type, tutor_name=tutor_name, batch_size=batch_size
+        ):
+            counts["sessions"] += 1
+            counts["messages"] += len(session["messages"])
+            yield session
+
+    written = 0
+    with open(output, "wb") as file:
+        async for chunk in export_chunks(sessions(), export_format, get_category_keys()):
+            file.write(chunk)
+            written += len(chunk)
+    return {
+        **counts,
+        "bytes": written,
+        "format": export_format,
+        "output": output,
+        "elapsed_seconds": round(time.perf_counter() - started, 2)
+    }
+
+
+async def main():
+    args = parse_args()
+    store = await start_session_store()
+    try:
+        report = await export(
+            store,
+            args.output,
+            export_format=args.format,
+            start=args.start,
+            end=args.end,
+            persona_type=args.persona,
+            tutor_name=args.tutor,
+            batch_size=args.batch_size
+        )
+    except ExportUnavailableError as e:
+        raise SystemExit(str(e))
+    finally:
+        await stop_session_store()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Exported {report['sessions']} sessions ({report['messages']} messages) to {report['output']} "
+              f"as {report['format']}, {report['bytes']} bytes in {report['elapsed_seconds']}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
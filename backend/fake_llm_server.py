@@ -0,0 +1,379 @@
+"""Local stand-in for the Anthropic Messages API used by benchmarks and tests.
+
+The server speaks just enough of the Messages API (plain and streaming) for
+``AsyncAnthropic`` to talk to it, and simulates model latency as a fixed
+per-request delay plus per-input-token and per-output-token delays. Prompt
+prefixes marked with cache_control are remembered like the provider's prompt
+cache: later requests sharing them report cache reads and prefill faster.
+A FaultInjector makes it answer like a provider under load: 429s with
+retry-after, 529 overloaded errors, and occasional very slow replies.
+
+Usage:
+    with FakeLLMServer(latency=0.2) as server:
+        service = ClaudeService(api_key="test", base_url=server.base_url)
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from services.scoring_service import get_category_keys
+
+Responder = Callable[[dict], str]
+
+
+def _prompt_text(body: dict) -> str:
+    """Flatten the system prompt and messages of a request into one string"""
+    parts: List[str] = []
+    system = body.get("system")
+    if isinstance(system, str):
+        parts.append(system)
+    elif isinstance(system, list):
+        parts.extend(block.get("text", "") for block in system)
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get("text", "") for block in content)
+    return "\n".join(parts)
+
+
+def _prompt_blocks(body: dict) -> List[Tuple[str, bool]]:
+    """(text, is_cache_breakpoint) for every block in prompt order"""
+    blocks: List[Tuple[str, bool]] = []
+    sections = [body.get("system")] + [m.get("content") for m in body.get("messages", [])]
+    for section in sections:
+        if isinstance(section, str):
+            blocks.append((section, False))
+        elif isinstance(section, list):
+            blocks.extend((b.get("text", ""), "cache_control" in b) for b in section)
+    return blocks
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def _filler(tokens: int) -> str:
+    """Analysis-like text of roughly the given number of tokens"""
+    sentence = "The tutor asked a guiding question and waited for the learner. "
+    return (sentence * (tokens * 4 // len(sentence) + 1))[:tokens * 4]
+
+
+def default_responder(body: dict, analysis_tokens: int = 20) -> str:
+    """Answer scoring prompts with well-formed reports, anything else as the learner
+
+    Args:
+        analysis_tokens: Length of each <category_evaluation> section, to
+            simulate realistic scoring output lengths
+    """
+    prompt = _prompt_text(body)
+    if "<running_evidence>" in prompt:
+        keys = get_category_keys()
+        if '"session_summary"' in prompt:
+            # Final pass over running evidence: brief analysis, full report
+            categories = {
+                key: {"score": 4, "feedback": f"Solid work on {key.replace('_', ' ')}."}
+                for key in keys
+            }
+            result = {"categories": categories, "session_summary": "A productive session."}
+            return (
+                f"<category_evaluation>{_filler(analysis_tokens // 4)}</category_evaluation>\n"
+                f"<json>\n{json.dumps(result, indent=2)}\n</json>"
+            )
+        result = {
+            "categories": {
+                key: {"score": 4, "new_evidence": ["Tutor checked understanding with a question."]}
+                for key in keys
+            }
+        }
+        return f"<json>\n{json.dumps(result, indent=2)}\n</json>"
+    if "<categories>" in prompt:
+        categories = {
+            key: {"score": 4, "feedback": f"Solid work on {key.replace('_', ' ')}."}
+            for key in get_category_keys()
+        }
+        analysis = "\n".join(
+            f"<category_evaluation>{key}: {_filler(analysis_tokens)}</category_evaluation>"
+            for key in categories
+        )
+        result = {"categories": categories, "session_summary": "A productive session."}
+        return f"{analysis}\n<json>\n{json.dumps(result, indent=2)}\n</json>"
+    if "<scoring_rubric>" in prompt:
+        key = re.search(r"<category>\s*(\w+):", prompt).group(1)
+        result = {"score": 4, "feedback": f"Solid work on {key.replace('_', ' ')}."}
+        return (
+            f"<category_evaluation>{_filler(analysis_tokens)}</category_evaluation>\n"
+            f"<json>\n{json.dumps(result, indent=2)}\n</json>"
+        )
+    if '"session_summary"' in prompt:
+        return '<json>\n{"session_summary": "A productive session."}\n</json>'
+    if "<previous_memo>" in prompt:
+        return "<memo>I factored x² - 5x + 6 into (x - 2)(x - 3) and found x = 2 or x = 3.</memo>"
+    return "Oh... I think I'm starting to see it now. So we factor it first, right?"
+
+
+class FaultInjector:
+    """Decides which requests fail or stall, like a provider under load"""
+
+    def __init__(
+        self,
+        rate_limited: float = 0.0,
+        overloaded: float = 0.0,
+        slow: float = 0.0,
+        slow_latency: float = 2.0,
+        retry_after: Optional[float] = None,
+        script: Optional[List[Optional[str]]] = None,
+        seed: int = 0
+    ):
+        """
+        Args:
+            rate_limited, overloaded, slow: Share of requests answered with
+                a 429, answered with a 529, or delayed by `slow_latency`
+            retry_after: Seconds sent in the retry-after header of 429s and 529s
+            script: Faults for the first requests, in order ("rate_limited",
+                "overloaded", "slow" or None), before the random ones apply
+        """
+        self.rate_limited = rate_limited
+        self.overloaded = overloaded
+        self.slow = slow
+        self.slow_latency = slow_latency
+        self.retry_after = retry_after
+        self.script = list(script or [])
+        self.injected: Counter = Counter()
+        self._rng = random.Random(seed)
+
+    def choose(self) -> Optional[str]:
+        if self.script:
+            fault = self.script.pop(0)
+        else:
+            roll = self._rng.random()
+            fault = None
+            for name in ("rate_limited", "overloaded", "slow"):
+                share = getattr(self, name)
+                if roll < share:
+                    fault = name
+                    break
+                roll -= share
+        if fault is not None:
+            self.injected[fault] += 1
+        return fault
+
+    def error_response(self, fault: str) -> JSONResponse:
+        status, error_type = (429, "rate_limit_error") if fault == "rate_limited" else (529, "overloaded_error")
+        headers = {"retry-after": str(self.retry_after)} if self.retry_after is not None else {}
+        return JSONResponse(
+            {"type": "error", "error": {"type": error_type, "message": f"Injected {fault} fault"}},
+            status_code=status,
+            headers=headers
+        )
+
+
+class FakeLLMServer:
+    """Messages API stub served by uvicorn on a background thread"""
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        per_token_latency: float = 0.0,
+        per_input_token_latency: float = 0.0,
+        responder: Optional[Responder] = None,
+        host: str = "127.0.0.1",
+        faults: Optional[FaultInjector] = None,
+        model_latency: Optional[Dict[str, float]] = None
+    ):
+        """
+        Args:
+            latency: Fixed delay before the first token of every reply
+            model_latency: Fixed delay for specific models, instead of `latency`
+        """
+        self.latency = latency
+        self.model_latency = model_latency or {}
+        self.per_token_latency = per_token_latency
+        self.per_input_token_latency = per_input_token_latency
+        self.responder = responder or default_responder
+        self.faults = faults
+        self.host = host
+        self.port: Optional[int] = None
+        self.requests: List[dict] = []
+        self._prompt_cache: Set[str] = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self.app = self._build_app()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/v1/messages")
+        async def create_message(request: Request):
+            body = await request.json()
+            self.requests.append(body)
+            fault = self.faults.choose() if self.faults is not None else None
+            if fault in ("rate_limited", "overloaded"):
+                return self.faults.error_response(fault)
+            extra_latency = self.faults.slow_latency if fault == "slow" else 0.0
+            text = self.responder(body)
+            usage = self._input_usage(body)
+            usage["output_tokens"] = estimate_tokens(text)
+            if body.get("stream"):
+                return StreamingResponse(
+                    self._stream(body, text, usage, extra_latency),
+                    media_type="text/event-stream"
+                )
+            self._enter()
+            try:
+                await asyncio.sleep(
+                    self._prefill_latency(body, usage)
+                    + extra_latency
+                    + usage["output_tokens"] * self.per_token_latency
+                )
+            finally:
+                self._exit()
+            return JSONResponse(self._message(body, text, usage))
+
+        return app
+
+    def _input_usage(self, body: dict) -> Dict[str, int]:
+        """Split prompt tokens into uncached, cache-read and cache-write counts"""
+        prefix = hashlib.sha256()
+        total = cached = last_breakpoint = 0
+        new_keys = []
+        for text, is_breakpoint in _prompt_blocks(body):
+            prefix.update(text.encode())
+            total += estimate_tokens(text)
+            key = prefix.hexdigest()
+            if key in self._prompt_cache:
+                cached = total
+            if is_breakpoint:
+                last_breakpoint = total
+                new_keys.append(key)
+        self._prompt_cache.update(new_keys)
+
+        created = max(0, last_breakpoint - cached)
+        return {
+            "input_tokens": total - cached - created,
+            "cache_read_input_tokens": cached,
+            "cache_creation_input_tokens": created
+        }
+
+    def _prefill_latency(self, body: dict, usage: Dict[str, int]) -> float:
+        # Cached prefixes are read about ten times faster than fresh input
+        fresh = usage["input_tokens"] + usage["cache_creation_input_tokens"]
+        cached = usage["cache_read_input_tokens"]
+        latency = self.model_latency.get(body.get("model"), self.latency)
+        return latency + (fresh + cached * 0.1) * self.per_input_token_latency
+
+    def _enter(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _exit(self):
+        self.in_flight -= 1
+
+    def _message(self, body: dict, text: str, usage: Dict[str, int]) -> dict:
+        return {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "fake"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": usage
+        }
+
+    async def _stream(self, body: dict, text: str, usage: Dict[str, int], extra_latency: float = 0.0):
+        def event(name: str, data: dict) -> str:
+            return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+        self._enter()
+        try:
+            start = self._message(body, "", {**usage, "output_tokens": 0})
+            start["content"] = []
+            yield event("message_start", {"type": "message_start", "message": start})
+            yield event("content_block_start", {
+                "type": "content_block_start",
+                "index": 0,
+                "content_block": {"type": "text", "text": ""}
+            })
+            await asyncio.sleep(self._prefill_latency(body, usage) + extra_latency)
+            # Emit roughly one token (four characters) per delta
+            for i in range(0, len(text), 4):
+                await asyncio.sleep(self.per_token_latency)
+                yield event("content_block_delta", {
+                    "type": "content_block_delta",
+                    "index": 0,
+                    "delta": {"type": "text_delta", "text": text[i:i + 4]}
+                })
+            yield event("content_block_stop", {"type": "content_block_stop", "index": 0})
+            yield event("message_delta", {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": usage["output_tokens"]}
+            })
+            yield event("message_stop", {"type": "message_stop"})
+        finally:
+            self._exit()
+
+    def start(self) -> "FakeLLMServer":
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, 0))
+        self.port = sock.getsockname()[1]
+
+        config = uvicorn.Config(self.app, log_level="warning", loop="asyncio", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(
+            target=self._server.run,
+            kwargs={"sockets": [sock]},
+            daemon=True
+        )
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    # Run standalone, e.g. ANTHROPIC_BASE_URL=http://127.0.0.1:8089 uvicorn main:app
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the fake Messages API server")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--per-token-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    fake = FakeLLMServer(latency=args.latency, per_token_latency=args.per_token_latency)
+    uvicorn.run(fake.app, host="127.0.0.1", port=args.port, log_level="warning")
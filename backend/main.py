@@ -1,21 +1,91 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, WebSocket
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from contextlib import asynccontextmanager
 import os
+import json
+import hashlib
+import asyncio
 import uuid
-from typing import Dict
-from datetime import datetime
+import math
+import sys
+from typing import List, Literal, Optional
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
 # Import services
-from services.claude_service import get_claude_service
 from services.persona_service import get_available_personas
-from services.scoring_service import get_scoring_categories
+from services.persona_registry import get_persona_registry, start_persona_registry, stop_persona_registry
+from services.scoring_service import get_category_registry
+from services.metrics_service import get_metrics_snapshot, increment
+from services.rolling_scoring_service import schedule_rolling_evaluation, cancel_rolling_evaluation
+from services.context_service import schedule_context_summary
+from services.opener_service import get_opener_cache, close_opener_cache, opening_message
+from services.admission_service import ServiceUnavailableError
+from services.session_store import get_session_store, start_session_store, stop_session_store
+from services.score_cache import get_score_cache, close_score_cache, scoring_cache_key
+from services.progress_service import progress_view, record_scores, stats_view
+from services.analytics_service import COHORT_DIMENSIONS, MAX_COHORT_PAGE, cohort_view, week_of
+from services.export_service import FORMATS, ExportUnavailableError, check_format, export_chunks
+from services.session_channel import SessionChannel, error_frame, open_channel
+from services.idempotency_service import (
+    get_idempotency_cache,
+    request_fingerprint,
+    IdempotencyConflictError,
+    MAX_KEY_LENGTH
+)
+from services.job_service import (
+    get_scoring_job_queue,
+    start_scoring_job_queue,
+    stop_scoring_job_queue,
+    QueueFullError,
+    FAILED,
+    TERMINAL_STATUSES
+)
+
+async def score_session(payload: dict, on_category) -> dict:
+    """Run one scoring job (see services/job_service.py)
+    
+    Identical transcripts share one scoring call and its cached result
+    (see services/score_cache.py).
+    """
+    from services.claude_service import get_claude_service
+    claude_service = get_claude_service()
+    cache_key = scoring_cache_key(
+        payload["conversation_history"],
+        payload["persona_type"],
+        payload["problem"],
+        claude_service.scoring_mode,
+        payload.get("rolling_evaluation")
+    )
+    return await get_score_cache().get_or_compute(
+        cache_key,
+        lambda report: claude_service.get_session_scores(**payload, on_category=report),
+        on_category=on_category
+    )
+
+async def store_scores(job: dict):
+    """Keep a completed job's scores with its session and update tutor progress"""
+    from services.claude_service import get_claude_service
+    from services.rescoring_service import scoring_fingerprint
+    store = get_session_store()
+    # An ended session may have been evicted from the memory store
+    session = await store.get(job["session_id"]) or {
+        "id": job["session_id"],
+        "tutor_name": job["tutor_name"],
+        "persona_type": job["payload"]["persona_type"],
+        "problem": job["payload"]["problem"]
+    }
+    await record_scores(store, session, {
+        **job["result"],
+        "fingerprint": scoring_fingerprint(get_claude_service().scoring_mode),
+        "scored_at": job["finished_at"]
+    })
 
 @asynccontextmanager
 async def lifespan(app_instance: FastAPI):
@@ -24,9 +94,26 @@ async def lifespan(app_instance: FastAPI):
     # Validate API key
     if not os.getenv("ANTHROPIC_API_KEY"):
         print("WARNING: ANTHROPIC_API_KEY not set. AI features will not work.")
+    await start_persona_registry()
+    await start_session_store()
+    await start_scoring_job_queue(score_session, on_result=store_scores)
     yield
     # Shutdown
     print("Shutting down...")
+    # The Claude client is created on first use, so there may be none to close
+    claude_loaded = "services.claude_service" in sys.modules
+    if claude_loaded:
+        from services.claude_service import close_claude_service, drain_claude_service
+        # Let turns in flight finish and reach the session store before it closes
+        if not await drain_claude_service(float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "20"))):
+            print("WARNING: Conversation turns still in flight at shutdown")
+    await stop_scoring_job_queue()
+    await close_score_cache()
+    await stop_session_store()
+    await close_opener_cache()
+    await stop_persona_registry()
+    if claude_loaded:
+        await close_claude_service()
 
 app = FastAPI(
     title="AI Tutor Training Platform",
@@ -44,8 +131,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory session storage (will migrate to PostgreSQL)
-active_sessions: Dict[str, dict] = {}
+BUSY_DETAIL = "The AI service is busy, please try again shortly"
+
+@app.exception_handler(ServiceUnavailableError)
+async def service_unavailable_handler(request: Request, exc: ServiceUnavailableError):
+    """Answer 503 when a model call could not start in time or the provider
+    is still busy after our retries (see admission_service, traffic_service)"""
+    increment("provider_busy_responses")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": BUSY_DETAIL, "reason": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+def get_claude():
+    """The shared ClaudeService, created on first use
+    
+    Routes take it as a dependency, so the app starts (and serves /health,
+    personas and categories) without loading the Anthropic SDK or having an
+    API key; only model-backed routes answer 503 when no key is set.
+    """
+    from services.claude_service import get_claude_service
+    try:
+        return get_claude_service()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=f"AI features are unavailable: {e}")
 
 # Pydantic models
 class SessionStart(BaseModel):
@@ -55,7 +165,12 @@ class SessionStart(BaseModel):
 
 class Message(BaseModel):
     message: str
-    sender: str
+    # The only senders the messages table accepts
+    sender: Literal["tutor", "learner"]
+
+class OpenerWarmUp(BaseModel):
+    problems: List[str]
+    persona_types: Optional[List[str]] = None
 
 class SessionResponse(BaseModel):
     session_id: str
@@ -67,129 +182,745 @@ class SessionResponse(BaseModel):
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Get in-process latency and counter metrics"""
+    return get_metrics_snapshot()
+
+@app.get("/api/admission")
+async def get_admission_stats(claude_service=Depends(get_claude)):
+    """Get live model-call queue depths, slots in use and rejections"""
+    return claude_service.admission.stats()
+
 @app.get("/api/personas")
-async def get_personas():
-    """Get available AI personas"""
-    persona_ids = get_available_personas()
-    
-    # Transform persona IDs into display-friendly format
-    personas = []
-    for persona_id in persona_ids:
-        # Convert snake_case to Title Case for display name
-        display_name = persona_id.replace("_", " ").title()
-        personas.append({
-            "id": persona_id,
-            "name": display_name
-        })
-    
-    return {"personas": personas}
+async def get_personas(request: Request):
+    """Get available AI personas
+    
+    Served from the persona registry's pre-serialized payload, with an ETag
+    so revalidating clients get a 304.
+    """
+    index = get_persona_registry().index()
+    headers = {"ETag": index.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == index.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=index.api_payload, media_type="application/json", headers=headers)
 
 @app.get("/api/scoring-categories")
-async def get_scoring_categories_endpoint():
-    """Get scoring categories configuration"""
-    categories = get_scoring_categories()
-    return {"categories": categories}
+async def get_scoring_categories_endpoint(request: Request):
+    """Get scoring categories configuration
+    
+    The response body is serialized once per configuration change and
+    carries an ETag, so clients revalidating with If-None-Match get a 304.
+    """
+    registry = get_category_registry()
+    headers = {"ETag": registry.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == registry.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=registry.api_payload, media_type="application/json", headers=headers)
+
+@app.post("/api/sessions/start", dependencies=[Depends(get_claude)])
+async def start_session(session_data: SessionStart, store=Depends(get_session_store)):
+    return await _start_session(session_data, store)
 
-@app.post("/api/sessions/start")
-async def start_session(session_data: SessionStart):
+async def _start_session(session_data: SessionStart, store) -> SessionResponse:
+    """Create a session with its opening exchange"""
+    persona = get_persona_registry().get(session_data.persona_type)
+    if persona is None:
+        raise HTTPException(status_code=400, detail=f"Unknown persona type: {session_data.persona_type}")
     session_id = str(uuid.uuid4())
-    
-    # Initialize session
-    active_sessions[session_id] = {
-        "id": session_id,
-        "tutor_name": session_data.tutor_name,
-        "problem": session_data.problem,
-        "persona_type": session_data.persona_type,
-        "messages": [],
-        "created_at": datetime.now().isoformat(),
-        "is_active": True
-    }
+    created_at = datetime.now(timezone.utc).isoformat()
     
     # Get initial response from AI persona
     initial_message = {
-        "content": f"Hello! I need help with this problem: {session_data.problem}",
+        "content": opening_message(session_data.problem),
         "sender": "tutor",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": created_at
     }
     
-    active_sessions[session_id]["messages"].append(initial_message)
-    
-    # Get AI response
-    claude_service = get_claude_service()
-    initial_response = await claude_service.get_persona_response(
-        messages=[initial_message],
+    # Get AI response, pre-generated when this persona/problem is warm
+    initial_response = await get_opener_cache().get_opener(
         persona_type=session_data.persona_type,
-        problem=session_data.problem
+        problem=session_data.problem,
+        tutor=session_data.tutor_name
     )
     
-    # Add AI response to history
-    active_sessions[session_id]["messages"].append({
-        "content": initial_response,
-        "sender": "learner",
-        "timestamp": datetime.now().isoformat()
+    # Store the session with its opening exchange
+    await store.create({
+        "id": session_id,
+        "tutor_name": session_data.tutor_name,
+        "problem": session_data.problem,
+        "persona_type": session_data.persona_type,
+        "messages": [
+            initial_message,
+            {
+                "content": initial_response,
+                "sender": "learner",
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+        ],
+        "created_at": created_at,
+        "is_active": True
     })
     
     return SessionResponse(
         session_id=session_id,
         initial_response=initial_response,
         persona_info={
-            "name": session_data.persona_type.replace("_", " ").title(),
-            "type": session_data.persona_type
+            "name": persona.name,
+            "type": persona.id
         }
     )
 
+@app.post("/api/openers/warm-up", status_code=202, dependencies=[Depends(get_claude)])
+async def warm_up_openers(warm_up: OpenerWarmUp):
+    """Pre-generate opening learner turns for a problem set before a class
+    
+    Pools are filled in the background; sessions started before they are
+    ready generate their opener as usual.
+    """
+    available = get_available_personas()
+    persona_types = warm_up.persona_types or available
+    unknown = sorted(set(persona_types) - set(available))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown personas: {', '.join(unknown)}")
+    
+    cache = get_opener_cache()
+    scheduled = await cache.warm_up(warm_up.problems, persona_types)
+    return {
+        "problems": len(warm_up.problems),
+        "persona_types": persona_types,
+        "pools_filling": scheduled,
+        "pool_size": cache.pool_size
+    }
+
 @app.post("/api/sessions/{session_id}/message")
-async def send_message(session_id: str, message: Message):
-    if session_id not in active_sessions:
+async def send_message(
+    session_id: str,
+    message: Message,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    claude_service=Depends(get_claude),
+    store=Depends(get_session_store)
+):
+    """Send a tutor message and get the learner's reply
+    
+    With an Idempotency-Key header, repeats of the same turn wait for or
+    replay the first reply instead of running the turn again; replays are
+    marked with an `Idempotent-Replayed: true` header.
+    """
+    session = await store.get(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = active_sessions[session_id]
+    if idempotency_key is None:
+        return await _run_turn(claude_service, store, session, message)
     
-    # Add message to history
-    session["messages"].append({
+    _check_idempotency_key(idempotency_key)
+    try:
+        result, replayed = await get_idempotency_cache().run(
+            session_id,
+            idempotency_key,
+            request_fingerprint(message.sender, message.message),
+            lambda: _run_turn(claude_service, store, session, message)
+        )
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+def _check_idempotency_key(idempotency_key: str):
+    if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+
+async def _run_turn(claude_service, store, session: dict, message: Message) -> dict:
+    """Get the learner's reply to a tutor message and store both"""
+    tutor_message = {
         "content": message.message,
         "sender": message.sender,
-        "timestamp": datetime.now().isoformat()
-    })
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
     
     # Get Claude Haiku response based on persona
-    claude_service = get_claude_service()
     ai_response = await claude_service.get_persona_response(
-        messages=session["messages"],
+        messages=session["messages"] + [tutor_message],
         persona_type=session["persona_type"],
-        problem=session["problem"]
+        problem=session["problem"],
+        context_memo=session.get("context_memo"),
+        tutor=session["tutor_name"]
     )
     
-    # Add AI response to history
-    session["messages"].append({
-        "content": ai_response,
-        "sender": "learner",
-        "timestamp": datetime.now().isoformat()
-    })
+    # Add the exchange to history
+    session = await _append_turn(store, session, tutor_message, ai_response)
+    
+    # Evaluate the new turns in the background so /end has less to do
+    schedule_rolling_evaluation(session, claude_service, on_update=store.update)
+    schedule_context_summary(session, claude_service, on_update=store.update)
     
     return {
         "response": ai_response,
         "session_active": session["is_active"]
     }
 
-@app.post("/api/sessions/{session_id}/end")
-async def end_session(session_id: str):
-    if session_id not in active_sessions:
+async def _append_turn(store, session: dict, tutor_message: dict, ai_response: str) -> dict:
+    """Store a tutor message and the learner's reply
+    
+    Returns:
+        The session with the new messages, for the background evaluators
+    """
+    new_messages = [
+        tutor_message,
+        {
+            "content": ai_response,
+            "sender": "learner",
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+    ]
+    history = session["messages"] + new_messages
+    await store.append_messages(session["id"], new_messages)
+    return {**session, "messages": history}
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_turn(claude_service, store, session: dict, tutor_message: dict, request: Optional[Request], claimed):
+    """(event, data) pairs for a streamed turn: `token`s, then `done` or `error`
+    
+    Resolves `claimed` with the reply if given. Stops early if `request`
+    disconnects; without a request the turn always runs to the end.
+    """
+    chunks = []
+    try:
+        async for text in claude_service.stream_persona_response(
+            messages=session["messages"] + [tutor_message],
+            persona_type=session["persona_type"],
+            problem=session["problem"],
+            context_memo=session.get("context_memo"),
+            tutor=session["tutor_name"]
+        ):
+            if request is not None and await request.is_disconnected():
+                increment("persona_stream_disconnects")
+                return
+            chunks.append(text)
+            yield "token", {"text": text}
+    except Exception as e:
+        print(f"Streaming reply failed for session {session['id']}: {e}")
+        if claimed is not None:
+            claimed.set_exception(e)
+        if isinstance(e, ServiceUnavailableError):
+            yield "error", {"detail": BUSY_DETAIL, "retry_after": math.ceil(e.retry_after)}
+        else:
+            yield "error", {"detail": "Failed to generate a response"}
+        return
+    
+    ai_response = "".join(chunks)
+    updated = await _append_turn(store, session, tutor_message, ai_response)
+    result = {
+        "response": ai_response,
+        "session_active": session["is_active"]
+    }
+    if claimed is not None:
+        claimed.set_result(result)
+    schedule_rolling_evaluation(updated, claude_service, on_update=store.update)
+    schedule_context_summary(updated, claude_service, on_update=store.update)
+    yield "done", result
+
+async def _replay_turn(session_id: str, claimed: asyncio.Future):
+    """(event, data) pairs for a repeated turn: the first request's reply in one piece"""
+    try:
+        result = await asyncio.shield(claimed)
+    except (Exception, asyncio.CancelledError) as e:
+        if not claimed.done():
+            # This request went away, not the turn it was waiting on
+            raise
+        print(f"Replaying reply failed for session {session_id}: {e!r}")
+        yield "error", {"detail": "Failed to generate a response"}
+        return
+    yield "token", {"text": result["response"]}
+    yield "done", result
+
+async def _sse_frames(events):
+    async for event, data in events:
+        yield _sse_event(event, data)
+
+@app.post("/api/sessions/{session_id}/message/stream")
+async def stream_message(
+    session_id: str,
+    message: Message,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    claude_service=Depends(get_claude),
+    store=Depends(get_session_store)
+):
+    """Send a message and stream the learner reply as Server-Sent Events
+    
+    Emits `token` events with text chunks, then a single `done` event with
+    the full reply. The tutor message and reply are only added to the
+    session history once the stream completes, so a client that disconnects
+    mid-stream can simply resend the turn.
+    
+    With an Idempotency-Key header, a repeat of a turn that is streaming or
+    has completed gets the whole reply as one `token` event, then `done`.
+    """
+    session = await store.get(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = active_sessions[session_id]
-    session["is_active"] = False
-    session["ended_at"] = datetime.now().isoformat()
+    claimed = None
+    if idempotency_key is not None:
+        _check_idempotency_key(idempotency_key)
+        try:
+            claimed, is_new = get_idempotency_cache().claim(
+                session_id,
+                idempotency_key,
+                request_fingerprint(message.sender, message.message)
+            )
+        except IdempotencyConflictError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if not is_new:
+            return StreamingResponse(
+                _sse_frames(_replay_turn(session_id, claimed)),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Idempotent-Replayed": "true"}
+            )
     
-    # Get scoring from Claude Sonnet
-    claude_service = get_claude_service()
-    scores = await claude_service.get_session_scores(
-        conversation_history=session["messages"],
-        persona_type=session["persona_type"],
-        problem=session["problem"]
+    tutor_message = {
+        "content": message.message,
+        "sender": message.sender,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+    
+    async def event_stream():
+        try:
+            async for event, data in _stream_turn(claude_service, store, session, tutor_message, request, claimed):
+                yield _sse_event(event, data)
+        finally:
+            # A stream that stopped early releases its key, so a retry runs the turn
+            if claimed is not None and not claimed.done():
+                claimed.cancel()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/sessions/{session_id}/end", status_code=202)
+async def end_session(
+    session_id: str,
+    claude_service=Depends(get_claude),
+    store=Depends(get_session_store)
+):
+    """End a session and queue it for scoring
+    
+    Returns the scoring job immediately; poll /api/scoring-jobs/{job_id} or
+    stream /api/scoring-jobs/{job_id}/events for the result. Ending a
+    session twice, even concurrently, returns the job that is already
+    scoring it, and a transcript that was scored before completes at once
+    from the scoring cache.
+    """
+    return await _end_session(session_id, claude_service, store)
+
+async def _end_session(session_id: str, claude_service, store) -> dict:
+    """End a session and queue it for scoring; returns the job's public view"""
+    session = await store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    queue = get_scoring_job_queue()
+    
+    existing_job = queue.get(session.get("scoring_job_id", ""))
+    if existing_job is not None and existing_job["status"] != FAILED:
+        return queue.public_view(existing_job)
+    
+    # Queue scoring from Claude Sonnet, starting from the running evidence
+    cancel_rolling_evaluation(session_id)
+    cache_key = scoring_cache_key(
+        session["messages"],
+        session["persona_type"],
+        session["problem"],
+        claude_service.scoring_mode,
+        session.get("rolling_evaluation")
+    )
+    try:
+        job = queue.submit(
+            session_id=session_id,
+            tutor_name=session["tutor_name"],
+            payload={
+                "conversation_history": list(session["messages"]),
+                "persona_type": session["persona_type"],
+                "problem": session["problem"],
+                "rolling_evaluation": session.get("rolling_evaluation")
+            },
+            dedupe_key=f"{session_id}:{cache_key}",
+            result=get_score_cache().get(cache_key)
+        )
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    await store.update(session_id, {
+        "is_active": False,
+        "ended_at": datetime.now(timezone.utc).isoformat(),
+        "scoring_job_id": job["id"]
+    })
+    
+    return queue.public_view(job)
+
+@app.get("/api/scoring-jobs/{job_id}")
+async def get_scoring_job(job_id: str):
+    """Get the status of a scoring job, including the scores once completed"""
+    queue = get_scoring_job_queue()
+    job = queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Scoring job not found")
+    return queue.public_view(job)
+
+@app.get("/api/scoring-jobs/{job_id}/events")
+async def stream_scoring_job(job_id: str, request: Request):
+    """Stream status changes of a scoring job as Server-Sent Events"""
+    queue = get_scoring_job_queue()
+    if queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Scoring job not found")
+    
+    async def event_stream():
+        sent = None
+        while True:
+            job = queue.get(job_id)
+            if job is None:
+                return
+            # Compared with the last frame sent rather than woken by events
+            # alone: a change made while a yield was suspended sets no event,
+            # so the job is read again after every frame before waiting
+            view = queue.public_view(job)
+            if view != sent:
+                yield _sse_event("status", view)
+                sent = view
+                continue
+            if view["status"] in TERMINAL_STATUSES:
+                return
+            if not await queue.wait_for_update(job_id, timeout=15):
+                if await request.is_disconnected():
+                    return
+                # Comment frames keep proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
+
+@app.websocket("/api/sessions/ws")
+async def session_socket(websocket: WebSocket):
+    """One connection for a tutor's sessions instead of a request per turn
+    
+    Requests are frames with a "type" and a client-chosen "id", repeated in
+    the frames that answer them:
+    
+    - start {tutor_name, problem, persona_type}: started {session_id,
+      initial_response, persona_info, seq}
+    - message {session_id, message, sender, idempotency_key?, stream?}:
+      token {session_id, text} frames (none if stream is false), then
+      reply {session_id, response, session_active, seq, replayed}
+    - end {session_id}: ended {session_id, job}, then scoring {session_id,
+      job} frames as the job changes, until it finishes
+    - resume {session_id, after}: resumed {session_id, messages (those after
+      the first `after`), seq, session_active, scoring_job}, then scoring
+      frames while the session is being scored
+    
+    `seq` is the number of messages in the session; a client that
+    reconnects resumes from the last one it has, and resends a turn it got
+    no reply for with the same idempotency_key. Failures answer with error
+    {status, detail} frames carrying the status the HTTP endpoint would
+    return. Heartbeats and backpressure: see services/session_channel.py.
+    """
+    store = get_session_store()
+    channel = open_channel(websocket)
+    await channel.serve(lambda frame: _channel_request(channel, store, frame))
+
+async def _channel_request(channel: SessionChannel, store, frame: dict):
+    """Answer one request frame of a session channel"""
+    request_id = frame.get("id")
+    kind = frame.get("type")
+    try:
+        if kind == "start":
+            get_claude()
+            started = await _start_session(SessionStart.model_validate(frame), store)
+            await channel.send({"type": "started", "id": request_id, **started.model_dump(), "seq": 2})
+        elif kind == "message":
+            await _channel_turn(channel, store, frame)
+        elif kind == "end":
+            job = await _end_session(_frame_session_id(frame), get_claude(), store)
+            await channel.send({"type": "ended", "id": request_id, "session_id": job["session_id"], "job": job})
+            await _watch_scoring(channel, request_id, job)
+        elif kind == "resume":
+            await _channel_resume(channel, store, frame)
+        else:
+            await channel.send(error_frame(request_id, 400, f"Unknown request type: {kind}"))
+    except HTTPException as e:
+        retry_after = (e.headers or {}).get("Retry-After")
+        await channel.send(error_frame(request_id, e.status_code, e.detail, int(retry_after) if retry_after else None))
+    except ValidationError as e:
+        errors = e.errors(include_url=False, include_context=False, include_input=False)
+        await channel.send(error_frame(request_id, 422, "Invalid request", errors=errors))
+    except ServiceUnavailableError as e:
+        increment("provider_busy_responses")
+        await channel.send(error_frame(request_id, 503, BUSY_DETAIL, math.ceil(e.retry_after)))
+
+def _frame_session_id(frame: dict) -> str:
+    session_id = frame.get("session_id")
+    if not isinstance(session_id, str):
+        raise HTTPException(status_code=422, detail="session_id is required")
+    return session_id
+
+async def _channel_turn(channel: SessionChannel, store, frame: dict):
+    """Answer a turn with token frames, unless "stream" is false, then a reply frame"""
+    request_id = frame.get("id")
+    session_id = _frame_session_id(frame)
+    message = Message.model_validate(frame)
+    claude_service = get_claude()
+    idempotency_key = frame.get("idempotency_key")
+    if idempotency_key is not None:
+        _check_idempotency_key(idempotency_key if isinstance(idempotency_key, str) else "")
+    
+    # Turns of one session run in the order they were sent
+    async with channel.lock(session_id):
+        session = await store.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        # Messages once this turn is stored (the memory store appends in place)
+        seq = len(session["messages"]) + 2
+        
+        async def send_reply(result: dict, replayed: bool):
+            await channel.send({
+                "type": "reply",
+                "id": request_id,
+                "session_id": session_id,
+                **result,
+                # A replayed turn was stored by the request that ran it
+                "seq": len((await store.get(session_id))["messages"]) if replayed else seq,
+                "replayed": replayed
+            })
+        
+        try:
+            if frame.get("stream", True) is False:
+                if idempotency_key is None:
+                    await send_reply(await _run_turn(claude_service, store, session, message), False)
+                else:
+                    await send_reply(*await get_idempotency_cache().run(
+                        session_id,
+                        idempotency_key,
+                        request_fingerprint(message.sender, message.message),
+                        lambda: _run_turn(claude_service, store, session, message)
+                    ))
+                return
+            
+            claimed, is_new = None, True
+            if idempotency_key is not None:
+                claimed, is_new = get_idempotency_cache().claim(
+                    session_id,
+                    idempotency_key,
+                    request_fingerprint(message.sender, message.message)
+                )
+        except IdempotencyConflictError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        
+        if is_new:
+            tutor_message = {
+                "content": message.message,
+                "sender": message.sender,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+            events = _stream_turn(claude_service, store, session, tutor_message, None, claimed)
+        else:
+            events = _replay_turn(session_id, claimed)
+        try:
+            async for event, data in events:
+                if event == "token":
+                    await channel.send({
+                        "type": "token", "id": request_id, "session_id": session_id, "text": data["text"]
+                    })
+                elif event == "done":
+                    await send_reply(data, not is_new)
+                else:
+                    status = 503 if "retry_after" in data else 500
+                    await channel.send(error_frame(
+                        request_id, status, data["detail"], data.get("retry_after"), session_id=session_id
+                    ))
+        finally:
+            # A turn that stopped early releases its key, so a retry runs it
+            if claimed is not None and is_new and not claimed.done():
+                claimed.cancel()
+
+async def _channel_resume(channel: SessionChannel, store, frame: dict):
+    """Send the messages a reconnecting client missed, then any scoring progress"""
+    request_id = frame.get("id")
+    session_id = _frame_session_id(frame)
+    after = frame.get("after", 0)
+    if not isinstance(after, int) or after < 0:
+        raise HTTPException(status_code=422, detail="after must be a message count")
+    session = await store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    queue = get_scoring_job_queue()
+    job = queue.get(session.get("scoring_job_id", ""))
+    view = queue.public_view(job) if job is not None else None
+    await channel.send({
+        "type": "resumed",
+        "id": request_id,
+        "session_id": session_id,
+        "messages": session["messages"][after:],
+        "seq": len(session["messages"]),
+        "session_active": session["is_active"],
+        "scoring_job": view
+    })
+    if view is not None:
+        await _watch_scoring(channel, request_id, view)
+
+async def _watch_scoring(channel: SessionChannel, request_id, job: dict):
+    """Send a scoring frame each time a job changes, until it finishes"""
+    queue = get_scoring_job_queue()
+    while job["status"] not in TERMINAL_STATUSES and not channel.closed:
+        await queue.wait_for_update(job["id"], timeout=channel.heartbeat)
+        current = queue.get(job["id"])
+        if current is None:
+            return
+        view = queue.public_view(current)
+        if view != job:
+            await channel.send({"type": "scoring", "id": request_id, "session_id": view["session_id"], "job": view})
+            job = view
+
+@app.get("/api/users/{tutor_name}/progress")
+async def get_tutor_progress(tutor_name: str, store=Depends(get_session_store)):
+    """Get a tutor's running score aggregates: overall, per category and per persona
     
-    return scores
+    Read from the tutor's progress document, updated as each session is
+    scored (see services/progress_service.py), not computed from history.
+    """
+    progress = await store.get_tutor_progress(tutor_name)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="No scored sessions for this tutor")
+    return progress_view(tutor_name, progress)
+
+@app.get("/api/users/{tutor_name}/progress/categories/{category}")
+async def get_tutor_category_progress(tutor_name: str, category: str, store=Depends(get_session_store)):
+    """Get a tutor's aggregates for one scoring category, overall and per persona"""
+    progress = await store.get_tutor_progress(tutor_name)
+    if progress is None or category not in progress["categories"]:
+        raise HTTPException(status_code=404, detail="No scores in this category for this tutor")
+    return {
+        "tutor_name": tutor_name,
+        "category": category,
+        "overall": stats_view(progress["categories"][category]),
+        "personas": {
+            persona: stats_view(aggregates["categories"][category])
+            for persona, aggregates in progress["personas"].items()
+            if category in aggregates["categories"]
+        }
+    }
+
+# Seconds clients and proxies may cache analytics responses
+ANALYTICS_CACHE_SECONDS = int(os.getenv("ANALYTICS_CACHE_SECONDS", "60"))
+
+@app.get("/api/analytics/cohorts")
+async def get_cohorts(
+    request: Request,
+    by: str = "week",
+    category: str = "overall",
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    persona: Optional[str] = None,
+    problem: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_COHORT_PAGE),
+    store=Depends(get_session_store)
+):
+    """Get score distributions of scored sessions grouped into cohorts
+    
+    Groups sessions by week, persona, problem or category (`by`) and gives
+    each cohort's session count, mean, standard deviation and histogram of
+    `category` scores ("overall" is a session's mean category score). Only
+    weeks from the one containing `from` and starting before `to` (ISO
+    dates) count. Pass `next_cursor` back as `cursor` for the next page.
+    
+    Read from rollups kept up to date as sessions are scored (see
+    services/analytics_service.py), so the cost does not grow with the
+    number of sessions; responses carry an ETag and may be cached for
+    ANALYTICS_CACHE_SECONDS.
+    """
+    if by not in COHORT_DIMENSIONS:
+        raise HTTPException(status_code=422, detail=f"by must be one of: {', '.join(COHORT_DIMENSIONS)}")
+    try:
+        start = week_of(start) if start else None
+        end = datetime.fromisoformat(end).date().isoformat() if end else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="from and to must be ISO dates")
+    categories = [*get_category_registry().keys, "overall"] if by == "category" else [category]
+    
+    cohorts = await store.get_cohorts(
+        by,
+        categories,
+        start=start,
+        end=end,
+        persona_type=persona,
+        problem=problem,
+        after=cursor,
+        limit=limit
+    )
+    body = json.dumps({
+        "by": by,
+        "category": None if by == "category" else category,
+        "cohorts": [cohort_view(cohort) for cohort in cohorts],
+        "next_cursor": cohorts[-1]["cohort"] if len(cohorts) == limit else None
+    }).encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={ANALYTICS_CACHE_SECONDS}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/export/sessions")
+async def export_sessions(
+    format: str = "ndjson",
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    persona: Optional[str] = None,
+    tutor: Optional[str] = None,
+    store=Depends(get_session_store)
+):
+    """Export ended sessions with their transcripts and scores
+    
+    Streams NDJSON (one session per line) or Parquet (one row per session,
+    with a column per category score) for sessions created from `from` and
+    before `to` (ISO timestamps), optionally only one persona's or tutor's.
+    Sessions are read and encoded as they are sent, so memory use does not
+    depend on the size of the export (see services/export_service.py).
+    """
+    try:
+        check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ExportUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    try:
+        start = datetime.fromisoformat(start).isoformat() if start else None
+        end = datetime.fromisoformat(end).isoformat() if end else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="from and to must be ISO timestamps")
+    
+    sessions = store.iter_export(start=start, end=end, persona_type=persona, tutor_name=tutor)
+    filename = f"sessions-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{format}"
+    return StreamingResponse(
+        export_chunks(sessions, format, list(get_category_registry().keys)),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 # Serve React app in production
 if os.path.exists("../dist"):
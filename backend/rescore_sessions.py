@@ -0,0 +1,76 @@
+"""Re-score ended sessions after the scoring categories or prompt change.
+
+Reads ended sessions from the configured session store (SESSION_STORE,
+DATABASE_URL), scores them again with the current scoring configuration
+and writes the scores back to the sessions. Progress is checkpointed, so
+running the same command again after a crash or Ctrl-C resumes the run.
+See services/rescoring_service.py.
+
+Run from the backend directory:
+    python rescore_sessions.py --concurrency 8 --requests-per-minute 50
+"""
+import argparse
+import asyncio
+import json
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.admission_service import AdmissionController
+from services.claude_service import SCORING_MODES, ClaudeService
+from services.rescoring_service import DEFAULT_CHECKPOINT_PATH, BatchRescorer, format_report
+from services.session_store import start_session_store, stop_session_store
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=8, help="sessions scored at the same time")
+    parser.add_argument("--requests-per-minute", type=float, default=50,
+                        help="upper bound on scoring requests started per minute")
+    parser.add_argument("--mode", choices=SCORING_MODES, help="scoring mode (defaults to SCORING_MODE)")
+    parser.add_argument("--page-size", type=int, default=100, help="sessions read from the store per query")
+    parser.add_argument("--write-batch-size", type=int, default=50, help="scores written back per batch")
+    parser.add_argument("--max-attempts", type=int, default=3, help="attempts per session before it counts as failed")
+    parser.add_argument("--limit", type=int, help="stop after this many sessions")
+    parser.add_argument("--checkpoint", type=Path, default=DEFAULT_CHECKPOINT_PATH, help="progress file")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    if args.restart:
+        args.checkpoint.unlink(missing_ok=True)
+
+    store = await start_session_store()
+    # Nothing else runs on this service, so scoring may use every slot
+    claude_service = ClaudeService(
+        max_concurrency=args.concurrency,
+        admission=AdmissionController(args.concurrency, background_share=1.0)
+    )
+    try:
+        rescorer = BatchRescorer(
+            store,
+            claude_service,
+            checkpoint_path=args.checkpoint,
+            concurrency=args.concurrency,
+            requests_per_minute=args.requests_per_minute,
+            page_size=args.page_size,
+            write_batch_size=args.write_batch_size,
+            max_attempts=args.max_attempts,
+            mode=args.mode,
+            limit=args.limit
+        )
+        report = await rescorer.run()
+    finally:
+        await claude_service.aclose()
+        await stop_session_store()
+
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
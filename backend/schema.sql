@@ -10,13 +10,23 @@ CREATE TABLE IF NOT EXISTS sessions (
     scores JSONB,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     ended_at TIMESTAMP WITH TIME ZONE,
-    is_active BOOLEAN DEFAULT true
+    is_active BOOLEAN DEFAULT true,
+    scoring_job_id VARCHAR(64),
+    state JSONB NOT NULL DEFAULT '{}',
+    message_count INTEGER NOT NULL DEFAULT 0
 );
 
+-- Columns added for the session store (services/session_store.py)
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS scoring_job_id VARCHAR(64);
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS state JSONB NOT NULL DEFAULT '{}';
+ALTER TABLE sessions ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0;
+
 -- Indexes for performance
-CREATE INDEX idx_sessions_tutor_name ON sessions(tutor_name);
-CREATE INDEX idx_sessions_created_at ON sessions(created_at);
-CREATE INDEX idx_sessions_persona_type ON sessions(persona_type);
+CREATE INDEX IF NOT EXISTS idx_sessions_tutor_name ON sessions(tutor_name);
+CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions(created_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_persona_type ON sessions(persona_type);
+-- Ended sessions in the order offline re-scoring reads them
+CREATE INDEX IF NOT EXISTS idx_sessions_ended_created ON sessions(created_at, id) WHERE ended_at IS NOT NULL;
 
 -- Tutor profiles table (for progress tracking)
 CREATE TABLE IF NOT EXISTS tutor_profiles (
@@ -26,17 +36,46 @@ CREATE TABLE IF NOT EXISTS tutor_profiles (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     total_sessions INTEGER DEFAULT 0,
     average_scores JSONB,
-    last_session_at TIMESTAMP WITH TIME ZONE
+    last_session_at TIMESTAMP WITH TIME ZONE,
+    progress JSONB
 );
 
--- Messages table (optional, for detailed message tracking)
+-- Running progress aggregates (services/progress_service.py)
+ALTER TABLE tutor_profiles ADD COLUMN IF NOT EXISTS progress JSONB;
+
+-- Cohort score rollups (services/analytics_service.py): one row per
+-- category, grain, week, persona and problem ('*' for all of them in the
+-- coarser grains); cohort queries read one category's rows of one grain in
+-- a week range through the primary key
+CREATE TABLE IF NOT EXISTS score_rollups (
+    category VARCHAR(100) NOT NULL,
+    grain SMALLINT NOT NULL,
+    week DATE NOT NULL,
+    persona_type VARCHAR(50) NOT NULL,
+    problem TEXT NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    score_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    histogram INTEGER[] NOT NULL,
+    PRIMARY KEY (category, grain, week, persona_type, problem)
+);
+
+-- Ad hoc queries over scored sessions by when they ended; per-category
+-- score expression indexes are created at startup (session_store.py)
+CREATE INDEX IF NOT EXISTS idx_sessions_scored_ended ON sessions(ended_at, persona_type) WHERE scores IS NOT NULL;
+
+-- Messages table (one row per message, appended as the session goes on)
 CREATE TABLE IF NOT EXISTS messages (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     session_id UUID NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
     content TEXT NOT NULL,
     sender VARCHAR(20) NOT NULL CHECK (sender IN ('tutor', 'learner')),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE INDEX idx_messages_session_id ON messages(session_id);
-CREATE INDEX idx_messages_created_at ON messages(created_at);
\ No newline at end of file
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS seq INTEGER;
+
+-- Position of each message in its session; also serves lookups by session
+CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_session_seq ON messages(session_id, seq);
+CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages(created_at);
\ No newline at end of file
@@ -1,63 +1,90 @@
-# Export prompt types
-from .prompt_types import (
-    BaseStudentPromptParams,
-    ScoringPromptParams,
-    ConversationMessage
-)
-
-# Export prompt functions
-from .prompt_service import (
-    generate_base_student_prompt,
-    generate_scoring_prompt,
-    load_persona_content,
-    list_available_personas,
-    get_anxious_alex_persona,
-    get_methodical_maya_persona,
-    get_overconfident_olivia_persona,
-    get_struggling_sam_persona
-)
-
-# Export other services
-from .persona_service import (
-    get_available_personas,
-    load_persona_prompt
-)
-
-from .scoring_service import (
-    get_scoring_categories,
-    get_category_keys,
-    generate_categories_list
-)
-
-from .claude_service import (
-    ClaudeService,
-    get_claude_service,
-    claude_service
-)
-
-__all__ = [
-    # Types
-    'BaseStudentPromptParams',
-    'ScoringPromptParams',
-    'ConversationMessage',
-    
+# Exports are resolved on first access, so importing one service module (or
+# the app) does not load every other one, the Anthropic SDK included.
+import importlib
+
+_EXPORTS = {
+    # Prompt types
+    'prompt_types': [
+        'BaseStudentPromptParams',
+        'RenderedConversation',
+        'ScoringPromptParams',
+        'CategoryScoringPromptParams',
+        'SessionSummaryPromptParams',
+        'RollingScoringPromptParams',
+        'ContextSummaryPromptParams',
+        'ConversationMessage'
+    ],
+
     # Prompt functions
-    'generate_base_student_prompt',
-    'generate_scoring_prompt',
-    'load_persona_content',
-    'list_available_personas',
-    'get_anxious_alex_persona',
-    'get_methodical_maya_persona',
-    'get_overconfident_olivia_persona',
-    'get_struggling_sam_persona',
-    
+    'prompt_service': [
+        'generate_base_student_prompt',
+        'generate_scoring_prompt',
+        'generate_scoring_instructions',
+        'generate_scoring_session',
+        'generate_category_scoring_prompt',
+        'generate_session_summary_prompt',
+        'generate_rolling_scoring_prompt',
+        'generate_final_scoring_prompt',
+        'generate_context_summary_prompt',
+        'format_conversation',
+        'load_persona_content',
+        'list_available_personas'
+    ],
+
+    # Prompt templates
+    'prompt_templates': [
+        'PromptTemplate',
+        'format_message',
+        'get_persona_system_prompt',
+        'get_scoring_instructions'
+    ],
+
     # Services
-    'get_available_personas',
-    'load_persona_prompt',
-    'get_scoring_categories',
-    'get_category_keys',
-    'generate_categories_list',
-    'ClaudeService',
-    'get_claude_service',
-    'claude_service'
-]
\ No newline at end of file
+    'persona_registry': [
+        'PersonaInfo',
+        'PersonaRegistry',
+        'get_persona_registry'
+    ],
+    'persona_service': [
+        'get_available_personas',
+        'load_persona_prompt'
+    ],
+    'scoring_service': [
+        'ScoringCategory',
+        'CategoryRegistry',
+        'get_category_registry',
+        'get_scoring_categories',
+        'get_category_keys',
+        'generate_categories_list',
+        'format_category',
+        'format_scoring_rubric',
+        'format_running_evidence'
+    ],
+    'score_parser': [
+        'ScoreStreamParser',
+        'parse_scoring_response',
+        'validate_session_scores',
+        'extract_json'
+    ],
+    'claude_service': [
+        'ClaudeService',
+        'get_claude_service'
+    ]
+}
+
+_MODULE_BY_NAME = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_MODULE_BY_NAME)
+
+
+def __getattr__(name: str):
+    module = _MODULE_BY_NAME.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,249 @@
+"""Admission control for model calls: priorities, per-tutor caps and deadlines.
+
+A plain semaphore served model calls first come, first served, so a burst
+of session starts from one cohort, or a batch of scoring jobs, queued ahead
+of live conversation turns. Every Messages API request from ClaudeService
+now takes a slot from an AdmissionController:
+
+- waiting calls are served by priority: live persona turns, then opening
+  turns, then scoring and other background work. Calls are not preempted,
+  so scoring may only hold ADMISSION_BACKGROUND_SHARE of the slots; the
+  rest stay free for turns arriving while long scoring calls run,
+- within a priority, tutors take turns, and no tutor holds more than
+  ADMISSION_PER_TUTOR_LIMIT slots at once,
+- a call may carry a deadline for starting. If the estimated wait (queued
+  calls ahead of it times the recent mean slot hold time, spread over the
+  slots) already exceeds it, the call is rejected at once instead of
+  queueing, and a call still queued at its deadline is rejected then.
+  Rejections raise AdmissionRejectedError, which the API turns into a 503.
+
+Queue depths per priority and slots in use are kept as gauges
+(`admission_queue_depth_<priority>`, `admission_active`) and returned by
+`stats()`.
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional
+
+from .metrics_service import increment, record_latency, set_gauge
+
+# Priorities, served lowest first
+PERSONA_TURN = 0
+OPENING_TURN = 1
+SCORING = 2
+PRIORITY_NAMES = {PERSONA_TURN: "persona", OPENING_TURN: "opening", SCORING: "scoring"}
+
+# Weight of each completed call in the mean slot hold time
+HOLD_TIME_SMOOTHING = 0.1
+
+
+class ServiceUnavailableError(Exception):
+    """A model call cannot be served right now; the API answers 503"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionRejectedError(ServiceUnavailableError):
+    """Raised when a call cannot start before its deadline"""
+
+
+class _Waiter:
+    __slots__ = ("future", "priority", "tutor", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, priority: int, tutor: Optional[str]):
+        self.future = future
+        self.priority = priority
+        self.tutor = tutor
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        per_tutor_limit: int = 2,
+        background_share: float = 0.5,
+        initial_hold_time: float = 1.0
+    ):
+        """
+        Args:
+            max_concurrency: Model calls in flight at once
+            per_tutor_limit: Calls in flight at once for any one tutor
+            background_share: Share of the slots scoring calls may hold
+            initial_hold_time: Assumed seconds per call until some complete
+        """
+        self.max_concurrency = max_concurrency
+        self.per_tutor_limit = per_tutor_limit
+        self.mean_hold_time = initial_hold_time
+        self.active = 0
+        self._limits = [max_concurrency] * len(PRIORITY_NAMES)
+        self._limits[SCORING] = max(1, int(max_concurrency * background_share))
+        self._active = [0] * len(PRIORITY_NAMES)
+        self._by_tutor: Dict[str, int] = {}
+        # One queue per priority: tutor -> waiters, in round-robin order
+        self._queues: List["OrderedDict[Optional[str], Deque[_Waiter]]"] = [
+            OrderedDict() for _ in PRIORITY_NAMES
+        ]
+        self._queued = [0] * len(PRIORITY_NAMES)
+        self._rejected = [0] * len(PRIORITY_NAMES)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = SCORING, tutor: Optional[str] = None, max_wait: Optional[float] = None):
+        """Hold a slot for one model call
+
+        Args:
+            priority: PERSONA_TURN, OPENING_TURN or SCORING
+            tutor: Whose call this is, for the per-tutor cap; None for work
+                not tied to a tutor (no cap)
+            max_wait: Seconds the call may wait to start; None to wait as
+                long as it takes
+
+        Raises:
+            AdmissionRejectedError: If the call cannot start within `max_wait`
+        """
+        await self._acquire(priority, tutor, max_wait)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.mean_hold_time += HOLD_TIME_SMOOTHING * (time.monotonic() - start - self.mean_hold_time)
+            self._release(priority, tutor)
+
+    def estimated_wait(self, priority: int) -> float:
+        """Seconds a new call of this priority would likely wait for a slot"""
+        ahead = sum(self._queued[: priority + 1])
+        if self.active + ahead < self.max_concurrency:
+            return 0.0
+        return (ahead + 1) / self.max_concurrency * self.mean_hold_time
+
+    async def drain(self, timeout: float, max_priority: int = OPENING_TURN) -> bool:
+        """Wait for running and queued calls to finish, e.g. before shutting down
+
+        Args:
+            max_priority: Wait only for calls of this priority and more
+                urgent ones; by default scoring, which is resumed after a
+                restart, is not waited for
+
+        Returns:
+            Whether they all finished within `timeout`
+        """
+        deadline = time.monotonic() + timeout
+        while any(self._active[priority] or self._queued[priority] for priority in range(max_priority + 1)):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "active_by_priority": {name: self._active[priority] for priority, name in PRIORITY_NAMES.items()},
+            "max_concurrency": self.max_concurrency,
+            "per_tutor_limit": self.per_tutor_limit,
+            "mean_hold_ms": round(self.mean_hold_time * 1000, 1),
+            "queued": {name: self._queued[priority] for priority, name in PRIORITY_NAMES.items()},
+            "estimated_wait_ms": {
+                name: round(self.estimated_wait(priority) * 1000, 1) for priority, name in PRIORITY_NAMES.items()
+            },
+            "rejected": {name: self._rejected[priority] for priority, name in PRIORITY_NAMES.items()}
+        }
+
+    async def _acquire(self, priority: int, tutor: Optional[str], max_wait: Optional[float]):
+        if max_wait is not None:
+            estimate = self.estimated_wait(priority)
+            if estimate > max_wait:
+                self._reject(priority, f"estimated wait {estimate:.1f}s", estimate)
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), priority, tutor)
+        self._queues[priority].setdefault(tutor, deque()).append(waiter)
+        self._set_queued(priority, 1)
+        self._dispatch()
+        if waiter.future.done():
+            record_latency(f"admission_wait_{PRIORITY_NAMES[priority]}", 0.0)
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max_wait)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self._reject(priority, f"not started within {max_wait:.1f}s", self.estimated_wait(priority))
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        record_latency(f"admission_wait_{PRIORITY_NAMES[priority]}", time.monotonic() - waiter.enqueued_at)
+
+    def _abandon(self, waiter: _Waiter):
+        """Give up on a queued call; hand its slot on if it was just granted one"""
+        if waiter.future.done() and not waiter.future.cancelled():
+            self._release(waiter.priority, waiter.tutor)
+            return
+        waiter.future.cancel()
+        queue = self._queues[waiter.priority].get(waiter.tutor)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.priority][waiter.tutor]
+            self._set_queued(waiter.priority, -1)
+
+    def _reject(self, priority: int, reason: str, retry_after: float):
+        self._rejected[priority] += 1
+        increment(f"admission_rejected_{PRIORITY_NAMES[priority]}")
+        raise AdmissionRejectedError(
+            f"{PRIORITY_NAMES[priority].capitalize()} call rejected: {reason}",
+            retry_after=max(1.0, retry_after)
+        )
+
+    def _under_cap(self, tutor: Optional[str]) -> bool:
+        return tutor is None or self._by_tutor.get(tutor, 0) < self.per_tutor_limit
+
+    def _grant(self, priority: int, tutor: Optional[str]):
+        self.active += 1
+        self._active[priority] += 1
+        if tutor is not None:
+            self._by_tutor[tutor] = self._by_tutor.get(tutor, 0) + 1
+        set_gauge("admission_active", self.active)
+
+    def _release(self, priority: int, tutor: Optional[str]):
+        self.active -= 1
+        self._active[priority] -= 1
+        if tutor is not None:
+            remaining = self._by_tutor[tutor] - 1
+            if remaining:
+                self._by_tutor[tutor] = remaining
+            else:
+                del self._by_tutor[tutor]
+        set_gauge("admission_active", self.active)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant free slots to the waiters next in line"""
+        while self.active < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self._grant(waiter.priority, waiter.tutor)
+            waiter.future.set_result(None)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority, queue in enumerate(self._queues):
+            if self._active[priority] >= self._limits[priority]:
+                continue
+            for tutor, waiters in queue.items():
+                if not self._under_cap(tutor):
+                    continue
+                # The queue is changed only after iterating stops
+                waiter = waiters.popleft()
+                # The tutor goes to the back of the round-robin order
+                del queue[tutor]
+                if waiters:
+                    queue[tutor] = waiters
+                self._set_queued(priority, -1)
+                return waiter
+        return None
+
+    def _set_queued(self, priority: int, change: int):
+        self._queued[priority] += change
+        set_gauge(f"admission_queue_depth_{PRIORITY_NAMES[priority]}", self._queued[priority])
@@ -0,0 +1,237 @@
+"""Cohort score analytics served from precomputed rollups.
+
+Score distributions by persona, problem or week used to mean scanning every
+scored session (and decoding its scores JSONB). Instead each scoring result
+adds to a few rollup rows per category (plus "overall", the session's mean
+category score), keyed by week, persona and problem:
+
+    {
+        "category": "patience_encouragement",
+        "week": "2025-01-06",               # Monday of the week the session ended
+        "persona_type": "anxious_alex",
+        "problem": "...",
+        "sessions": 41,
+        "score_sum": 147.0,
+        "score_sumsq": 561.0,
+        "histogram": [0, 3, 9, 17, 12]      # sessions per score, MIN_SCORE..MAX_SCORE
+    }
+
+A session goes into four rows per category, one per grain: its persona
+and problem, its persona with problem ALL, ALL personas with its problem,
+and ALL of both. A query reads only the coarsest grain that has the
+dimensions it groups or filters by, so "overall by week" sums one row per
+week, "by persona" weeks x personas rows, and only queries involving both
+persona and problem read the finest grain; none depends on how many
+sessions were scored.
+
+Rows only ever have deltas added to them (a re-scored session adds minus
+its old values and its new ones), so concurrent updates commute and need
+no locking.
+
+The session store keeps the rows (`SessionStore.update_rollups`,
+`SessionStore.get_cohorts`); backfill_progress.py rebuilds them from the
+stored sessions.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .metrics_service import increment
+from .score_parser import MAX_SCORE, MIN_SCORE
+
+# Query dimension -> rollup field
+COHORT_DIMENSIONS = {
+    "week": "week",
+    "persona": "persona_type",
+    "problem": "problem",
+    "category": "category"
+}
+
+# Largest page of cohorts served at once
+MAX_COHORT_PAGE = 200
+
+# Stands for every persona or every problem in the coarser rollup grains
+ALL = "*"
+
+# (category, week, persona_type, problem)
+RollupKey = Tuple[str, str, str, str]
+
+
+def session_values(scores: dict) -> Dict[str, float]:
+    """Category scores of a result, plus their mean under "overall" """
+    values = {key: float(category["score"]) for key, category in scores.get("categories", {}).items()}
+    if values:
+        values["overall"] = sum(values.values()) / len(values)
+    return values
+
+
+def week_of(timestamp: str) -> str:
+    """The Monday of the week an ISO timestamp falls in, as an ISO date"""
+    day = datetime.fromisoformat(timestamp).date()
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def _bucket(value: float) -> int:
+    """Histogram position of a score, rounding half up"""
+    return min(max(int(value + 0.5), MIN_SCORE), MAX_SCORE) - MIN_SCORE
+
+
+def rollup_key(row: dict) -> RollupKey:
+    return (row["category"], row["week"], row["persona_type"], row["problem"])
+
+
+def rollup_grain(row: dict) -> int:
+    """What a row is broken down by: 0 nothing, 1 persona, 2 problem, 3 both"""
+    return (row["persona_type"] != ALL) + 2 * (row["problem"] != ALL)
+
+
+def query_grain(by: str, persona_type: Optional[str] = None, problem: Optional[str] = None) -> int:
+    """The coarsest grain that answers a cohort query"""
+    return (by == "persona" or persona_type is not None) + 2 * (by == "problem" or problem is not None)
+
+
+def rollup_deltas(session: dict, scores: dict, previous: Optional[dict] = None) -> List[dict]:
+    """The rollup changes for a session's scoring result
+
+    Args:
+        session: The scored session ("persona_type", "problem", "ended_at")
+        scores: Its result ({"categories": {key: {"score": ...}}, ...})
+        previous: The session's earlier result, if it was scored before;
+            its values are taken out again
+
+    Returns:
+        One delta row per changed rollup row, in key order
+    """
+    week = week_of(session.get("ended_at") or scores.get("scored_at") or session["created_at"])
+    persona_type, problem = session["persona_type"], session.get("problem", "")
+    grains = ((persona_type, problem), (persona_type, ALL), (ALL, problem), (ALL, ALL))
+    rows: Dict[RollupKey, dict] = {}
+    for values, sign in ((session_values(previous) if previous else {}, -1), (session_values(scores), 1)):
+        for category, value in values.items():
+            bucket = _bucket(value)
+            for grain_persona, grain_problem in grains:
+                key = (category, week, grain_persona, grain_problem)
+                delta = rows.get(key)
+                if delta is None:
+                    delta = rows[key] = new_rollup(*key)
+                delta["sessions"] += sign
+                delta["score_sum"] += sign * value
+                delta["score_sumsq"] += sign * value * value
+                delta["histogram"][bucket] += sign
+    increment("analytics_rollup_updates")
+    return [rows[key] for key in sorted(rows)]
+
+
+def new_rollup(category: str, week: str, persona_type: str, problem: str) -> dict:
+    return {
+        "category": category,
+        "week": week,
+        "persona_type": persona_type,
+        "problem": problem,
+        "sessions": 0,
+        "score_sum": 0.0,
+        "score_sumsq": 0.0,
+        "histogram": [0] * (MAX_SCORE - MIN_SCORE + 1)
+    }
+
+
+def add_rollup(row: dict, delta: dict):
+    """Add a delta to a rollup row in place"""
+    row["sessions"] += delta["sessions"]
+    row["score_sum"] += delta["score_sum"]
+    row["score_sumsq"] += delta["score_sumsq"]
+    histogram = row["histogram"]
+    for index, change in enumerate(delta["histogram"]):
+        if change:
+            histogram[index] += change
+
+
+def merge_rollups(rows: Iterable[dict], into: Optional[Dict[RollupKey, dict]] = None) -> Dict[RollupKey, dict]:
+    """Sum rows (or deltas) with the same key
+
+    Args:
+        rows: The rows to add
+        into: Rows to add them to, changed in place; new rows are copies
+
+    Returns:
+        Key -> summed row
+    """
+    merged = {} if into is None else into
+    for row in rows:
+        key = rollup_key(row)
+        if key in merged:
+            add_rollup(merged[key], row)
+        else:
+            merged[key] = {**row, "histogram": list(row["histogram"])}
+    return merged
+
+
+def filter_rollups(
+    rows: Iterable[dict],
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    persona_type: Optional[str] = None,
+    problem: Optional[str] = None
+) -> Iterator[dict]:
+    """Rows in the week range [start, end) of the persona and problem, if given"""
+    for row in rows:
+        if start is not None and row["week"] < start or end is not None and row["week"] >= end:
+            continue
+        if persona_type is not None and row["persona_type"] != persona_type:
+            continue
+        if problem is None or row["problem"] == problem:
+            yield row
+
+
+def aggregate_cohorts(
+    rows: Iterable[dict],
+    by: str,
+    after: Optional[str] = None,
+    limit: int = 50
+) -> List[dict]:
+    """Sum matching rollup rows into cohorts, one page in cohort order
+
+    Args:
+        rows: The rollup rows of the query's grain that match its filters
+        by: A COHORT_DIMENSIONS key
+        after: Only cohorts after this one (the previous page's last)
+        limit: Cohorts per page
+
+    Returns:
+        Cohorts with sessions ({"cohort", "sessions", "score_sum",
+        "score_sumsq", "histogram"})
+    """
+    field = COHORT_DIMENSIONS[by]
+    cohorts: Dict[str, dict] = {}
+    for row in rows:
+        cohort = row[field]
+        if after is not None and cohort <= after:
+            continue
+        total = cohorts.get(cohort)
+        if total is None:
+            cohorts[cohort] = {
+                "cohort": cohort,
+                "sessions": row["sessions"],
+                "score_sum": row["score_sum"],
+                "score_sumsq": row["score_sumsq"],
+                "histogram": list(row["histogram"])
+            }
+        else:
+            add_rollup(total, row)
+    return [cohorts[cohort] for cohort in sorted(cohorts) if cohorts[cohort]["sessions"] > 0][:limit]
+
+
+def cohort_view(cohort: dict) -> dict:
+    """The API form of a cohort: mean, standard deviation and histogram"""
+    count = cohort["sessions"]
+    mean = cohort["score_sum"] / count
+    # Population variance from the sums; rounding can take it just below 0
+    variance = max(0.0, cohort["score_sumsq"] / count - mean * mean)
+    return {
+        "cohort": cohort["cohort"],
+        "sessions": count,
+        "mean": round(mean, 3),
+        "stddev": round(variance ** 0.5, 3),
+        "histogram": {
+            str(score): cohort["histogram"][score - MIN_SCORE] for score in range(MIN_SCORE, MAX_SCORE + 1)
+        }
+    }
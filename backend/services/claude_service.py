@@ -1,127 +1,724 @@
 import os
-from typing import List, Dict, Optional
+import asyncio
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Callable, List, Dict, Optional, Tuple, Union
 import anthropic
-from anthropic import Anthropic
-import json
-from .persona_service import load_persona_prompt
-from .prompt_service import generate_scoring_prompt
-from .prompt_types import ScoringPromptParams, ConversationMessage
-from .scoring_service import get_category_keys, generate_categories_list
+from anthropic import AsyncAnthropic
+import httpx
+from .prompt_service import (
+    format_conversation,
+    generate_scoring_session,
+    generate_category_scoring_prompt,
+    generate_session_summary_prompt,
+    generate_rolling_scoring_prompt,
+    generate_final_scoring_prompt,
+    generate_context_summary_prompt
+)
+from .prompt_types import (
+    ScoringPromptParams,
+    CategoryScoringPromptParams,
+    SessionSummaryPromptParams,
+    RollingScoringPromptParams,
+    ContextSummaryPromptParams,
+    ConversationMessage
+)
+from .scoring_service import (
+    ScoringCategory,
+    get_category_registry,
+    generate_categories_list,
+    format_running_evidence
+)
+from .prompt_templates import get_persona_system_prompt, get_scoring_instructions
+from .metrics_service import record_latency, increment
+from .score_parser import ScoreStreamParser, extract_json
+from .context_service import ContextPolicy, get_context_policy
+from .admission_service import AdmissionController, OPENING_TURN, PERSONA_TURN, SCORING
+from .traffic_service import RetryPolicy, TokenBucket, TrafficController
+
+PERSONA_MODEL = "claude-3-5-haiku-latest"
+SCORING_MODEL = "claude-sonnet-4-20250514"
+
+# "single": one call evaluates every category; "parallel": one call per category
+SCORING_MODES = ("single", "parallel")
+
+# Already-evaluated messages shown before new turns in rolling scoring prompts
+ROLLING_CONTEXT_MESSAGES = 2
+
+EPHEMERAL_CACHE = {"type": "ephemeral"}
+
+# Called with (category key, {'score': ..., 'feedback': ...}) as each category is scored
+CategoryCallback = Callable[[str, Dict], None]
+
+
+class _PrimedStream:
+    """A message stream read up to its first text while it was being opened
+    
+    Hedged persona streams race to the first token, which is what the tutor
+    waits for, so that text is held here and replayed first.
+    """
+    
+    def __init__(self, stream, first_text: str):
+        self._stream = stream
+        self._first_text = first_text
+        self.text_stream = self._text()
+    
+    @classmethod
+    async def prime(cls, stream) -> "_PrimedStream":
+        while True:
+            try:
+                event = await stream.__anext__()
+            except StopAsyncIteration:
+                return cls(stream, "")
+            if event.type == "content_block_delta" and event.delta.type == "text_delta":
+                return cls(stream, event.delta.text)
+    
+    async def _text(self) -> AsyncIterator[str]:
+        if self._first_text:
+            yield self._first_text
+        async for text in self._stream.text_stream:
+            yield text
+    
+    async def get_final_message(self):
+        return await self._stream.get_final_message()
+    
+    async def close(self):
+        await self._stream.close()
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
 
 class ClaudeService:
-    def __init__(self):
-        api_key = os.getenv("ANTHROPIC_API_KEY")
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        persona_timeout: Optional[float] = None,
+        scoring_timeout: Optional[float] = None,
+        scoring_mode: Optional[str] = None,
+        prompt_caching: Optional[bool] = None,
+        context_policy: Optional[ContextPolicy] = None,
+        traffic: Optional[TrafficController] = None,
+        hedge_persona: Optional[bool] = None,
+        admission: Optional[AdmissionController] = None
+    ):
+        """Create the service around a single pooled async HTTP client.
+        
+        Arguments left as None fall back to environment variables:
+        CLAUDE_MAX_CONCURRENCY, CLAUDE_MAX_CONNECTIONS,
+        CLAUDE_PERSONA_TIMEOUT_SECONDS, CLAUDE_SCORING_TIMEOUT_SECONDS,
+        CLAUDE_CONNECT_TIMEOUT_SECONDS, CLAUDE_PROMPT_CACHING, SCORING_MODE,
+        ANTHROPIC_BASE_URL, the CONTEXT_* settings (see context_service),
+        the rate limit, retry and hedging settings (see `_traffic_from_env`)
+        and the ADMISSION_* settings (see admission_service).
+        """
+        api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
         
-        self.client = Anthropic(api_key=api_key)
+        if max_connections is None:
+            max_connections = _env_int("CLAUDE_MAX_CONNECTIONS", 100)
+        if max_concurrency is None:
+            max_concurrency = _env_int("CLAUDE_MAX_CONCURRENCY", 64)
+        
+        self.persona_timeout = persona_timeout or _env_float("CLAUDE_PERSONA_TIMEOUT_SECONDS", 30.0)
+        self.scoring_timeout = scoring_timeout or _env_float("CLAUDE_SCORING_TIMEOUT_SECONDS", 180.0)
+        self.connect_timeout = _env_float("CLAUDE_CONNECT_TIMEOUT_SECONDS", 5.0)
+        
+        # One connection pool shared by every request on this worker
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+            timeout=httpx.Timeout(self.scoring_timeout, connect=self.connect_timeout)
+        )
+        self.client = AsyncAnthropic(
+            api_key=api_key,
+            base_url=base_url or os.getenv("ANTHROPIC_BASE_URL") or None,
+            http_client=self.http_client,
+            # Retries are handled by the traffic controller
+            max_retries=0
+        )
+        self.traffic = traffic or _traffic_from_env()
+        if hedge_persona is None:
+            hedge_persona = os.getenv("CLAUDE_HEDGE_PERSONA", "false").lower() == "true"
+        self.hedge_persona = hedge_persona
+        self.max_concurrency = max_concurrency
+        self.admission = admission or AdmissionController(
+            max_concurrency,
+            per_tutor_limit=_env_int("ADMISSION_PER_TUTOR_LIMIT", 2),
+            background_share=_env_float("ADMISSION_BACKGROUND_SHARE", 0.5)
+        )
+        # Longest wait for a slot before a call is rejected; scoring waits its turn
+        self.max_wait = {
+            PERSONA_TURN: _env_float("ADMISSION_PERSONA_MAX_WAIT_SECONDS", 10.0),
+            OPENING_TURN: _env_float("ADMISSION_OPENING_MAX_WAIT_SECONDS", 20.0),
+            SCORING: None
+        }
+        
+        self.scoring_mode = scoring_mode or os.getenv("SCORING_MODE", "single")
+        if self.scoring_mode not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode: {self.scoring_mode}")
+        # Extra attempts per category in parallel scoring mode
+        self.category_retries = _env_int("SCORING_CATEGORY_RETRIES", 2)
+        
+        if prompt_caching is None:
+            prompt_caching = os.getenv("CLAUDE_PROMPT_CACHING", "true").lower() != "false"
+        self.prompt_caching = prompt_caching
+        self.context_policy = context_policy or get_context_policy()
+    
+    async def aclose(self):
+        """Close the underlying connection pool"""
+        await self.client.close()
+    
+    @property
+    def _messages(self):
+        """Messages API resource; the prompt caching one accepts cache_control blocks"""
+        if self.prompt_caching:
+            return self.client.beta.prompt_caching.messages
+        return self.client.messages
+    
+    def _slot(self, priority: int, tutor: Optional[str]):
+        """Admission slot for one model call (see admission_service)"""
+        return self.admission.slot(priority, tutor, self.max_wait[priority])
+    
+    async def _create_message(
+        self,
+        usage_label: str,
+        hedge: bool = False,
+        priority: int = SCORING,
+        tutor: Optional[str] = None,
+        **kwargs
+    ):
+        """Send a Messages API request once admitted
+        
+        Each attempt waits for an admission slot at `priority`, and the
+        request goes through the traffic controller's rate limit and retries
+        (hedged if `hedge`). Token usage, including prompt cache reads and
+        writes, is added to the `<usage_label>_*_tokens` counters.
+        """
+        async def send():
+            async with self._slot(priority, tutor):
+                return await self._messages.create(**kwargs)
+        
+        response = await self.traffic.call(kwargs["model"], send, hedge=hedge)
+        self._record_usage(usage_label, response.usage)
+        return response
+    
+    @asynccontextmanager
+    async def _open_stream(
+        self,
+        priority: int = SCORING,
+        tutor: Optional[str] = None,
+        hedge: bool = False,
+        **kwargs
+    ):
+        """Open a streaming Messages API request through the traffic controller
+        
+        Like `_create_message`, each attempt waits for its own admission
+        slot, so none is held through the retry backoff; the slot of the
+        attempt that opened the stream is held until the stream is closed.
+        Only opening the stream is retried; an error after the first event
+        is raised to the caller, which may already have used the output.
+        
+        If `hedge`, an open counts as done at the first text, and one slower
+        than the recent p95 time to first text is raced by a second; the
+        stream that loses is closed and its slot released.
+        """
+        async def send():
+            async with AsyncExitStack() as stack:
+                await stack.enter_async_context(self._slot(priority, tutor))
+                stream = await self._messages.stream(**kwargs).__aenter__()
+                stack.push_async_callback(stream.close)
+                if hedge:
+                    stream = await _PrimedStream.prime(stream)
+                # Keep the slot and the stream past this attempt
+                return stream, stack.pop_all()
+        
+        async def discard(opened):
+            await opened[1].aclose()
+        
+        stream, opened = await self.traffic.call(
+            kwargs["model"],
+            send,
+            hedge=hedge,
+            latency_key=f"{kwargs['model']}:first_text",
+            discard=discard
+        )
+        async with opened:
+            yield stream
+    
+    def _record_usage(self, usage_label: str, usage):
+        increment(f"{usage_label}_input_tokens", usage.input_tokens)
+        increment(f"{usage_label}_output_tokens", usage.output_tokens)
+        increment(
+            f"{usage_label}_cache_read_input_tokens",
+            getattr(usage, "cache_read_input_tokens", None) or 0
+        )
+        increment(
+            f"{usage_label}_cache_creation_input_tokens",
+            getattr(usage, "cache_creation_input_tokens", None) or 0
+        )
+    
+    def _cacheable(self, text: str) -> Union[str, List[Dict]]:
+        """Wrap text in a content block marked as a cache breakpoint"""
+        if not self.prompt_caching:
+            return text
+        return [{"type": "text", "text": text, "cache_control": EPHEMERAL_CACHE}]
+    
+    def _get_persona_request(
+        self,
+        messages: List[Dict[str, str]],
+        persona_type: str,
+        problem: str,
+        context_memo: Optional[Dict] = None
+    ) -> Tuple[Union[str, List[Dict]], List[Dict]]:
+        """Build the system prompt and messages for a persona turn
         
+        The context policy decides which messages are sent, with the memo of
+        older turns (if any) added after the persona prompt. The system
+        prompt and every turn before the newest tutor message are identical
+        to the previous request, so both are marked as cacheable and only
+        the latest exchange is processed from scratch.
+        """
+        system_prompt = self._get_persona_prompt(persona_type, problem)
+        selected = self.context_policy.select(messages, context_memo)
+        claude_messages = self._format_messages_for_claude(selected)
+        
+        if self.prompt_caching and len(claude_messages) >= 2:
+            prior = claude_messages[-2]
+            claude_messages[-2] = {
+                "role": prior["role"],
+                "content": self._cacheable(prior["content"])
+            }
+        
+        if not (context_memo and context_memo.get("summary")) or len(selected) == len(messages):
+            return self._cacheable(system_prompt), claude_messages
+        
+        memo = (
+            "Your notes on the earlier part of this session, which is no longer shown:\n"
+            f"<memo>\n{context_memo['summary']}\n</memo>"
+        )
+        if not self.prompt_caching:
+            return f"{system_prompt}\n\n{memo}", claude_messages
+        return self._cacheable(system_prompt) + [{"type": "text", "text": memo}], claude_messages
+    
+    async def summarize_context(
+        self,
+        messages: List[Dict[str, str]],
+        previous_summary: str,
+        problem: str
+    ) -> str:
+        """Fold a chunk of older turns into the learner's memo with Claude Haiku"""
+        params: ContextSummaryPromptParams = {
+            'conversation': self._to_conversation(messages),
+            'previous_summary': previous_summary,
+            'problem': problem
+        }
+        response = await self._create_message(
+            "context_summary",
+            model=PERSONA_MODEL,
+            max_tokens=500,
+            temperature=0,
+            messages=[{
+                "role": "user",
+                "content": generate_context_summary_prompt(params)
+            }],
+            timeout=httpx.Timeout(self.persona_timeout, connect=self.connect_timeout)
+        )
+        import re
+        
+        text = response.content[0].text
+        memo_match = re.search(r'<memo>\s*(.*?)\s*</memo>', text, re.DOTALL)
+        return memo_match.group(1) if memo_match else text.strip()
+    
     async def get_persona_response(
         self, 
         messages: List[Dict[str, str]], 
         persona_type: str,
-        problem: str
+        problem: str,
+        context_memo: Optional[Dict] = None,
+        priority: int = PERSONA_TURN,
+        tutor: Optional[str] = None
     ) -> str:
-        """Get a response from Claude Haiku based on the persona type"""
+        """Get a response from Claude Haiku based on the persona type
         
-        # Get the persona prompt
-        system_prompt = self._get_persona_prompt(persona_type, problem)
+        Args:
+            priority: Admission priority; OPENING_TURN for session openers
+            tutor: Tutor the turn is for, for the per-tutor admission cap
+        """
         
-        # Format messages for Claude API
-        claude_messages = self._format_messages_for_claude(messages)
+        # Get the persona prompt and format messages for Claude API
+        system_prompt, claude_messages = self._get_persona_request(
+            messages, persona_type, problem, context_memo
+        )
         
-        response = self.client.messages.create(
-            model="claude-3-5-haiku-latest",
+        start = time.perf_counter()
+        response = await self._create_message(
+            "persona",
+            hedge=self.hedge_persona,
+            priority=priority,
+            tutor=tutor,
+            model=PERSONA_MODEL,
             max_tokens=300,
             temperature=0.7,
             system=system_prompt,
-            messages=claude_messages
+            messages=claude_messages,
+            timeout=httpx.Timeout(self.persona_timeout, connect=self.connect_timeout)
         )
+        record_latency("persona_response", time.perf_counter() - start)
         
         return response.content[0].text
     
+    async def stream_persona_response(
+        self,
+        messages: List[Dict[str, str]],
+        persona_type: str,
+        problem: str,
+        context_memo: Optional[Dict] = None,
+        tutor: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream a Claude Haiku response as text chunks as they are generated
+        
+        Records time-to-first-token and total latency. If the consumer stops
+        iterating early (e.g. the client disconnected), the upstream request
+        is closed and the stream is counted as abandoned.
+        """
+        system_prompt, claude_messages = self._get_persona_request(
+            messages, persona_type, problem, context_memo
+        )
+        
+        start = time.perf_counter()
+        first_token = True
+        completed = False
+        try:
+            async with self._open_stream(
+                priority=PERSONA_TURN,
+                tutor=tutor,
+                hedge=self.hedge_persona,
+                model=PERSONA_MODEL,
+                max_tokens=300,
+                temperature=0.7,
+                system=system_prompt,
+                messages=claude_messages,
+                timeout=httpx.Timeout(self.persona_timeout, connect=self.connect_timeout)
+            ) as stream:
+                async for text in stream.text_stream:
+                    if first_token:
+                        record_latency("persona_stream_ttft", time.perf_counter() - start)
+                        first_token = False
+                    yield text
+                self._record_usage("persona", (await stream.get_final_message()).usage)
+            completed = True
+            record_latency("persona_stream_total", time.perf_counter() - start)
+        finally:
+            if not completed:
+                increment("persona_stream_abandoned")
+    
     async def get_session_scores(
         self,
         conversation_history: List[Dict[str, str]],
         persona_type: str,
-        problem: str
+        problem: str,
+        mode: Optional[str] = None,
+        rolling_evaluation: Optional[Dict] = None,
+        on_category: Optional[CategoryCallback] = None
     ) -> Dict:
-        """Get scoring from Claude Sonnet for the tutoring session"""
+        """Get scoring from Claude Sonnet for the tutoring session
         
-        scoring_prompt = self._get_scoring_prompt(
+        Args:
+            mode: "single" or "parallel"; defaults to the service's scoring mode
+            rolling_evaluation: Running evidence gathered during the session
+                (see services/rolling_scoring_service.py). When present, only
+                the turns it does not cover are re-read.
+            on_category: Called with each category's score as soon as it is
+                known, before the whole result is ready
+        """
+        if rolling_evaluation and rolling_evaluation.get("evaluated_through"):
+            return await self._finalize_rolling_scores(
+                conversation_history,
+                persona_type,
+                problem,
+                rolling_evaluation,
+                on_category
+            )
+        
+        if (mode or self.scoring_mode) == "parallel":
+            return await self._get_session_scores_parallel(
+                conversation_history,
+                persona_type,
+                problem,
+                on_category
+            )
+        
+        # Static instructions go first as a cacheable prefix, the session last
+        instructions, session_prompt = self._get_scoring_prompt(
             conversation_history, 
             persona_type, 
             problem
         )
         
-        response = self.client.messages.create(
-            model="claude-sonnet-4-20250514",
+        return await self._stream_scores(
+            on_category,
+            model=SCORING_MODEL,
             max_tokens=4000,  # Increased to ensure complete response
             temperature=0,
+            system=self._cacheable(instructions),
             messages=[{
                 "role": "user",
-                "content": scoring_prompt
-            }]
+                "content": session_prompt
+            }],
+            timeout=httpx.Timeout(self.scoring_timeout, connect=self.connect_timeout)
         )
+    
+    async def _stream_scores(self, on_category: Optional[CategoryCallback], **kwargs) -> Dict:
+        """Stream a scoring response through the incremental score parser
         
-        # Parse JSON response
-        response_text = response.content[0].text
+        Categories are passed to `on_category` as their JSON objects close,
+        and the full result is validated against the category schema.
+        """
+        parser = ScoreStreamParser(get_category_registry().keys)
+        async with self._open_stream(**kwargs) as stream:
+            async for text in stream.text_stream:
+                for key, category in parser.feed(text):
+                    if on_category is not None:
+                        on_category(key, category)
+            self._record_usage("scoring", (await stream.get_final_message()).usage)
+        return parser.finish()
+    
+    async def evaluate_new_turns(
+        self,
+        conversation_history: List[Dict[str, str]],
+        persona_type: str,
+        problem: str,
+        rolling_evaluation: Optional[Dict] = None
+    ) -> Dict:
+        """Evaluate turns not yet covered by the running evidence
         
-        # Extract JSON from response - look for <json> tags first, then fallback to regex
-        import re
+        Returns:
+            {'categories': {key: {'score': ..., 'new_evidence': [...]}}}
+        """
+        params = self._get_rolling_params(
+            conversation_history,
+            persona_type,
+            problem,
+            rolling_evaluation
+        )
+        response = await self._create_message(
+            "scoring",
+            model=SCORING_MODEL,
+            max_tokens=1500,
+            temperature=0,
+            messages=[{
+                "role": "user",
+                "content": generate_rolling_scoring_prompt(params)
+            }],
+            timeout=httpx.Timeout(self.scoring_timeout, connect=self.connect_timeout)
+        )
+        result = self._extract_json(response.content[0].text)
+        categories = result.get('categories', {})
+        for key in get_category_registry().keys:
+            if key not in categories or 'score' not in categories[key]:
+                raise ValueError(f"Missing provisional score for category: {key}")
+        return result
+    
+    async def _finalize_rolling_scores(
+        self,
+        conversation_history: List[Dict[str, str]],
+        persona_type: str,
+        problem: str,
+        rolling_evaluation: Dict,
+        on_category: Optional[CategoryCallback] = None
+    ) -> Dict:
+        """Produce final scores from running evidence plus a short delta pass"""
+        params = self._get_rolling_params(
+            conversation_history,
+            persona_type,
+            problem,
+            rolling_evaluation
+        )
+        return await self._stream_scores(
+            on_category,
+            model=SCORING_MODEL,
+            max_tokens=2000,
+            temperature=0,
+            messages=[{
+                "role": "user",
+                "content": generate_final_scoring_prompt(params)
+            }],
+            timeout=httpx.Timeout(self.scoring_timeout, connect=self.connect_timeout)
+        )
+    
+    def _get_rolling_params(
+        self,
+        conversation_history: List[Dict[str, str]],
+        persona_type: str,
+        problem: str,
+        rolling_evaluation: Optional[Dict]
+    ) -> RollingScoringPromptParams:
+        """Split the transcript into evaluated context and new turns"""
+        rolling_evaluation = rolling_evaluation or {}
+        evaluated_through = rolling_evaluation.get('evaluated_through', 0)
+        conversation = self._to_conversation(conversation_history)
+        context_start = max(0, evaluated_through - ROLLING_CONTEXT_MESSAGES)
+        
+        return {
+            'new_turns': conversation[evaluated_through:],
+            'recent_context': conversation[context_start:evaluated_through],
+            'problem': problem,
+            'persona_name': persona_type.replace('_', ' ').title(),
+            'categories_list': generate_categories_list(),
+            'running_evidence': format_running_evidence(rolling_evaluation.get('categories', {}))
+        }
+    
+    async def _get_session_scores_parallel(
+        self,
+        conversation_history: List[Dict[str, str]],
+        persona_type: str,
+        problem: str,
+        on_category: Optional[CategoryCallback] = None
+    ) -> Dict:
+        """Score every category with its own concurrent request
         
-        # First try to extract JSON from <json> tags
-        json_match = re.search(r'<json>\s*(\{.*?\})\s*</json>', response_text, re.DOTALL)
-        
-        # If not found in tags, try to find raw JSON
-        if not json_match:
-            json_match = re.search(r'\{[^{}]*"categories"\s*:\s*\{.*?\}\s*,\s*"session_summary"\s*:.*?\}', response_text, re.DOTALL)
-        
-        if json_match:
-            # Use group(1) if we matched with <json> tags, otherwise group(0)
-            json_text = json_match.group(1) if json_match.lastindex else json_match.group(0)
-            result = json.loads(json_text)
-            
-            # Handle old format - convert to new nested structure
-            if 'scores' in result and 'feedback' in result:
-                old_scores = result.get('scores', {})
-                old_feedback = result.get('feedback', {})
-                
-                # Convert to new format
-                categories = {}
-                for key in get_category_keys():
-                    score = old_scores.get(key)
-                    if score is None:
-                        raise ValueError(f"Missing score for category: {key}")
-                    
-                    if isinstance(old_feedback, dict):
-                        feedback = old_feedback.get(key)
-                        if feedback is None:
-                            raise ValueError(f"Missing feedback for category: {key}")
-                    else:
-                        feedback = old_feedback if isinstance(old_feedback, str) else None
-                        if feedback is None:
-                            raise ValueError(f"Invalid feedback format")
-                    
-                    categories[key] = {
-                        'score': score,
-                        'feedback': feedback
-                    }
-                
-                result = {
-                    'categories': categories,
-                    'session_summary': result.get('session_summary', 'Session completed.')
-                }
-            
+        Each category is evaluated against its scoring rubric and retried on
+        its own if it fails, while a small separate call writes the session
+        summary. Returns the same shape as single-call scoring.
+        """
+        conversation = self._to_conversation(conversation_history)
+        # Every request sends the same transcript, so render it once
+        conversation_text = format_conversation(conversation)
+        persona_name = persona_type.replace('_', ' ').title()
+        categories = get_category_registry().categories
+        
+        async def score(category: ScoringCategory) -> Dict:
+            result = await self._score_category(
+                conversation, conversation_text, persona_name, problem, category
+            )
+            if on_category is not None:
+                on_category(category.key, result)
             return result
-        else:
-            raise ValueError("No JSON found in response")
+        
+        results = await asyncio.gather(
+            self._with_retries(
+                "session_summary",
+                lambda: self._summarize_session(conversation, conversation_text, persona_name, problem)
+            ),
+            *[
+                self._with_retries(category.key, lambda category=category: score(category))
+                for category in categories
+            ],
+            return_exceptions=True
+        )
+        
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        
+        summary, category_results = results[0], results[1:]
+        return {
+            'categories': {
+                category.key: category_result
+                for category, category_result in zip(categories, category_results)
+            },
+            'session_summary': summary
+        }
+    
+    async def _with_retries(self, label: str, call):
+        """Run `call()` with up to `category_retries` extra attempts"""
+        for attempt in range(self.category_retries + 1):
+            try:
+                return await call()
+            except (anthropic.APIError, ValueError) as e:
+                # Transient API errors are retried by the traffic controller,
+                # which raises ProviderBusyError (not caught here) when it gives up
+                if attempt == self.category_retries:
+                    raise ValueError(f"Scoring failed for {label}: {e}") from e
+                increment("scoring_category_retries")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+    
+    async def _score_category(
+        self,
+        conversation: List[ConversationMessage],
+        conversation_text: str,
+        persona_name: str,
+        problem: str,
+        category: ScoringCategory
+    ) -> Dict:
+        """Score a single category; returns {'score': ..., 'feedback': ...}"""
+        params: CategoryScoringPromptParams = {
+            'conversation': conversation,
+            'conversation_text': conversation_text,
+            'problem': problem,
+            'persona_name': persona_name,
+            'category': category.prompt_line,
+            'rubric': category.rubric_text
+        }
+        response = await self._create_message(
+            "scoring",
+            model=SCORING_MODEL,
+            max_tokens=1500,
+            temperature=0,
+            messages=[{
+                "role": "user",
+                "content": generate_category_scoring_prompt(params)
+            }],
+            timeout=httpx.Timeout(self.scoring_timeout, connect=self.connect_timeout)
+        )
+        result = self._extract_json(response.content[0].text)
+        if 'score' not in result or 'feedback' not in result:
+            raise ValueError(f"Incomplete evaluation for category: {category.key}")
+        return {'score': result['score'], 'feedback': result['feedback']}
+    
+    async def _summarize_session(
+        self,
+        conversation: List[ConversationMessage],
+        conversation_text: str,
+        persona_name: str,
+        problem: str
+    ) -> str:
+        """Get the overall session summary"""
+        params: SessionSummaryPromptParams = {
+            'conversation': conversation,
+            'conversation_text': conversation_text,
+            'problem': problem,
+            'persona_name': persona_name
+        }
+        response = await self._create_message(
+            "scoring",
+            model=SCORING_MODEL,
+            max_tokens=400,
+            temperature=0,
+            messages=[{
+                "role": "user",
+                "content": generate_session_summary_prompt(params)
+            }],
+            timeout=httpx.Timeout(self.scoring_timeout, connect=self.connect_timeout)
+        )
+        result = self._extract_json(response.content[0].text)
+        if 'session_summary' not in result:
+            raise ValueError("Missing session summary")
+        return result['session_summary']
+    
+    def _extract_json(self, response_text: str) -> Dict:
+        """Parse the JSON object inside <json> tags"""
+        return extract_json(response_text)
     
     def _get_persona_prompt(self, persona_type: str, problem: str) -> str:
         """Get the system prompt for a specific persona"""
         
-        # Use the shared persona service to load the prompt
-        persona_prompt = load_persona_prompt(persona_type, problem)
+        # Rendered once per persona and problem, then served from an LRU cache
+        persona_prompt = get_persona_system_prompt(persona_type, problem)
         
         if not persona_prompt:
             raise ValueError(f"Failed to load persona prompt for: {persona_type}")
@@ -159,17 +756,11 @@ class ClaudeService:
         conversation_history: List[Dict[str, str]], 
         persona_type: str,
         problem: str
-    ) -> str:
-        """Generate the scoring prompt for Claude Sonnet"""
+    ) -> Tuple[str, str]:
+        """Generate the scoring instructions and session prompt for Claude Sonnet"""
         
         # Format conversation as list of messages
-        conversation: List[ConversationMessage] = [
-            {
-                'role': msg['sender'],
-                'content': msg['content']
-            }
-            for msg in conversation_history
-        ]
+        conversation = self._to_conversation(conversation_history)
         
         # Convert persona type to display name
         persona_name = persona_type.replace('_', ' ').title()
@@ -186,7 +777,35 @@ class ClaudeService:
         }
         
         # Generate the scoring prompt with typed parameters
-        return generate_scoring_prompt(params)
+        return get_scoring_instructions(categories_list), generate_scoring_session(params)
+    
+    def _to_conversation(self, conversation_history: List[Dict[str, str]]) -> List[ConversationMessage]:
+        """Convert session messages to the conversation format used in prompts"""
+        return [
+            {
+                'role': msg['sender'],
+                'content': msg['content']
+            }
+            for msg in conversation_history
+        ]
+
+def _traffic_from_env() -> TrafficController:
+    """Traffic controller configured from CLAUDE_PERSONA_REQUESTS_PER_MINUTE,
+    CLAUDE_SCORING_REQUESTS_PER_MINUTE, CLAUDE_MAX_RETRIES,
+    CLAUDE_RETRY_BASE_DELAY_SECONDS, CLAUDE_RETRY_MAX_DELAY_SECONDS and
+    CLAUDE_HEDGE_MIN_DELAY_SECONDS"""
+    return TrafficController(
+        buckets={
+            PERSONA_MODEL: TokenBucket("persona", _env_float("CLAUDE_PERSONA_REQUESTS_PER_MINUTE", 4000)),
+            SCORING_MODEL: TokenBucket("scoring", _env_float("CLAUDE_SCORING_REQUESTS_PER_MINUTE", 4000))
+        },
+        retry_policy=RetryPolicy(
+            max_retries=_env_int("CLAUDE_MAX_RETRIES", 4),
+            base_delay=_env_float("CLAUDE_RETRY_BASE_DELAY_SECONDS", 0.5),
+            max_delay=_env_float("CLAUDE_RETRY_MAX_DELAY_SECONDS", 20.0)
+        ),
+        hedge_min_delay=_env_float("CLAUDE_HEDGE_MIN_DELAY_SECONDS", 1.0)
+    )
 
 # Create a singleton instance (will be initialized on first use)
 _claude_service = None
@@ -197,4 +816,19 @@ def get_claude_service():
         _claude_service = ClaudeService()
     return _claude_service
 
-claude_service = get_claude_service()
\ No newline at end of file
+async def drain_claude_service(timeout: float) -> bool:
+    """Wait for in-flight conversation turns to finish (called on app shutdown)
+
+    Returns:
+        Whether they finished within `timeout`
+    """
+    if _claude_service is None:
+        return True
+    return await _claude_service.admission.drain(timeout)
+
+async def close_claude_service():
+    """Release the shared client's connections (called on app shutdown)"""
+    global _claude_service
+    if _claude_service is not None:
+        await _claude_service.aclose()
+        _claude_service = None
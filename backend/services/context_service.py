@@ -0,0 +1,199 @@
+"""Context policies that bound how much history is sent on each persona turn.
+
+Policies (CONTEXT_POLICY):
+
+- full: send every message (the original behaviour)
+- window: send the most recent CONTEXT_WINDOW_MESSAGES messages
+- budget: send the most recent messages that fit in CONTEXT_TOKEN_BUDGET
+- summary: fold older turns into a running memo of what the learner has
+  understood so far, and send the memo plus the recent turns
+
+The cut-off point only moves in steps of CONTEXT_TRIM_STEP messages, so the
+history prefix stays identical between most turns and prompt caching keeps
+working. Scoring never goes through these policies and always sees the full
+transcript.
+
+The summary memo lives on the session under "context_memo":
+
+    {"summary": <memo text>, "through": <number of messages summarized>}
+"""
+import asyncio
+import os
+from typing import Dict, List, Optional
+
+from .metrics_service import increment
+from .rolling_scoring_service import SessionUpdater
+
+_summary_tasks: Dict[str, asyncio.Task] = {}
+
+
+def estimate_message_tokens(message: dict) -> int:
+    """Rough token count for a message
+
+    Computed from the content length on each call, which costs no more than
+    a cache lookup would; the message itself is never written to, since it
+    is what gets logged, snapshotted, exported and sent to clients.
+    """
+    # About four characters per token, plus the role/formatting overhead
+    return len(message["content"]) // 4 + 4
+
+
+def _round_up(index: int, step: int) -> int:
+    return -(-index // step) * step
+
+
+class ContextPolicy:
+    """Send the full history"""
+
+    name = "full"
+
+    def select(self, messages: List[dict], memo: Optional[dict] = None) -> List[dict]:
+        """Choose the messages to send verbatim"""
+        return messages
+
+    def needs_summary(self, messages: List[dict], memo: Optional[dict]) -> bool:
+        return False
+
+
+class SlidingWindowPolicy(ContextPolicy):
+    """Send only the most recent messages"""
+
+    name = "window"
+
+    def __init__(self, max_messages: int, step: int):
+        self.max_messages = max_messages
+        self.step = step
+
+    def select(self, messages: List[dict], memo: Optional[dict] = None) -> List[dict]:
+        start = max(0, len(messages) - self.max_messages)
+        start = min(_round_up(start, self.step), len(messages) - 1)
+        return messages[max(0, start):]
+
+
+class TokenBudgetPolicy(ContextPolicy):
+    """Send the most recent messages that fit in a token budget"""
+
+    name = "budget"
+
+    def __init__(self, max_tokens: int, step: int):
+        self.max_tokens = max_tokens
+        self.step = step
+
+    def select(self, messages: List[dict], memo: Optional[dict] = None) -> List[dict]:
+        start = len(messages)
+        total = 0
+        for index in range(len(messages) - 1, -1, -1):
+            total += estimate_message_tokens(messages[index])
+            if total > self.max_tokens:
+                break
+            start = index
+        if start == 0:
+            return messages
+        start = min(_round_up(start, self.step), len(messages) - 1)
+        return messages[start:]
+
+
+class SummaryPolicy(TokenBudgetPolicy):
+    """Send the memo of older turns plus the turns after it
+
+    The token budget still applies to the unsummarized turns, in case the
+    summarizer falls behind.
+    """
+
+    name = "summary"
+
+    def __init__(self, max_tokens: int, step: int, keep_messages: int, chunk_tokens: int):
+        super().__init__(max_tokens, step)
+        self.keep_messages = keep_messages
+        self.chunk_tokens = chunk_tokens
+
+    def select(self, messages: List[dict], memo: Optional[dict] = None) -> List[dict]:
+        through = memo["through"] if memo else 0
+        return super().select(messages[through:])
+
+    def needs_summary(self, messages: List[dict], memo: Optional[dict]) -> bool:
+        """Summarize once enough turns have aged out of the recent window"""
+        through = memo["through"] if memo else 0
+        aged_out = messages[through:max(through, len(messages) - self.keep_messages)]
+        return sum(estimate_message_tokens(m) for m in aged_out) >= self.chunk_tokens
+
+
+def get_context_policy() -> ContextPolicy:
+    """Build the context policy configured in the environment"""
+    name = os.getenv("CONTEXT_POLICY", "full")
+    step = int(os.getenv("CONTEXT_TRIM_STEP", "10"))
+    max_tokens = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+
+    if name == "full":
+        return ContextPolicy()
+    if name == "window":
+        return SlidingWindowPolicy(int(os.getenv("CONTEXT_WINDOW_MESSAGES", "30")), step)
+    if name == "budget":
+        return TokenBudgetPolicy(max_tokens, step)
+    if name == "summary":
+        return SummaryPolicy(
+            max_tokens,
+            step,
+            keep_messages=int(os.getenv("CONTEXT_SUMMARY_KEEP_MESSAGES", "10")),
+            chunk_tokens=int(os.getenv("CONTEXT_SUMMARY_CHUNK_TOKENS", "1500"))
+        )
+    raise ValueError(f"Unknown context policy: {name}")
+
+
+def schedule_context_summary(
+    session: dict,
+    claude_service,
+    on_update: Optional[SessionUpdater] = None
+) -> bool:
+    """Fold aged-out turns into the session memo in the background
+
+    Only the turns since the last summary are sent, together with the
+    previous memo, so each update costs the same however long the session
+    gets. The new memo is set on `session` and passed to `on_update`, if
+    given.
+
+    Returns:
+        True if a summary update was started
+    """
+    policy = claude_service.context_policy
+    memo = session.get("context_memo")
+    if not policy.needs_summary(session["messages"], memo):
+        return False
+    task = _summary_tasks.get(session["id"])
+    if task is not None and not task.done():
+        return False
+
+    _summary_tasks[session["id"]] = asyncio.create_task(_summarize(session, claude_service, on_update))
+    return True
+
+
+async def wait_for_context_summary(session_id: str):
+    """Wait for the in-flight summary update of a session (benchmarks)"""
+    task = _summary_tasks.get(session_id)
+    if task is not None:
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def _summarize(session: dict, claude_service, on_update: Optional[SessionUpdater]):
+    memo = session.get("context_memo")
+    start = memo["through"] if memo else 0
+    through = len(session["messages"]) - claude_service.context_policy.keep_messages
+    try:
+        summary = await claude_service.summarize_context(
+            messages=session["messages"][start:through],
+            previous_summary=memo["summary"] if memo else "",
+            problem=session["problem"]
+        )
+    except Exception as e:
+        # The policy keeps sending the unsummarized turns, so nothing is lost
+        print(f"Context summary failed for session {session['id']}: {e}")
+        increment("context_summary_failed")
+        return
+    finally:
+        if _summary_tasks.get(session["id"]) is asyncio.current_task():
+            del _summary_tasks[session["id"]]
+
+    session["context_memo"] = {"summary": summary, "through": through}
+    if on_update is not None:
+        await on_update(session["id"], {"context_memo": session["context_memo"]})
+    increment("context_summary_updates")
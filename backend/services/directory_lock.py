@@ -0,0 +1,65 @@
+"""Exclusive use of a data directory by one process.
+
+The session log and the scoring job queue keep their state in files that
+only one process may write. Each takes an exclusive flock on a `lock` file
+in its directory and holds it until it stops; a second process (another
+worker, or a maintenance script started while the app is up) gets
+DirectoryLockedError instead of interleaving its writes. The lock dies
+with the process, so a crash leaves nothing to clean up.
+
+Within one process the lock is taken over rather than waited on, so a
+component restarted in place (as tests do to simulate a crash) opens its
+directory again.
+"""
+import fcntl
+import os
+from pathlib import Path
+from typing import Dict, Tuple
+
+LOCK_FILE = "lock"
+
+# Directory -> (descriptor holding its lock, current owner)
+_held_locks: Dict[Path, Tuple[int, object]] = {}
+
+
+class DirectoryLockedError(RuntimeError):
+    """Raised when another process holds a directory's lock"""
+
+
+def lock_directory(directory: Path, owner: object, purpose: str):
+    """Take the directory's lock for `owner`
+
+    Args:
+        directory: An existing directory
+        owner: Whoever releases it later (see `unlock_directory`)
+        purpose: What the directory is, for the error message
+
+    Raises:
+        DirectoryLockedError: If another process holds it
+    """
+    key = Path(directory).resolve()
+    held = _held_locks.get(key)
+    if held is None:
+        fd = os.open(key / LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            holder = os.read(fd, 32).decode("ascii", "replace").strip() or "unknown"
+            os.close(fd)
+            raise DirectoryLockedError(
+                f"{purpose} {directory} is in use by another process (pid {holder}); "
+                "run a single worker process"
+            ) from None
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, str(os.getpid()).encode("ascii"), 0)
+        held = (fd, owner)
+    _held_locks[key] = (held[0], owner)
+
+
+def unlock_directory(directory: Path, owner: object):
+    """Release the directory's lock, unless another owner took it over"""
+    key = Path(directory).resolve()
+    held = _held_locks.get(key)
+    if held is not None and held[1] is owner:
+        del _held_locks[key]
+        os.close(held[0])
@@ -0,0 +1,217 @@
+"""Bulk export of ended sessions: transcripts and scores.
+
+Research needs every transcript with its scores for rubric calibration.
+An export reads the matching sessions from the store one at a time
+(`SessionStore.iter_export`, a server-side cursor with PostgreSQL) and
+encodes them as they arrive, so memory stays flat however large the
+export is:
+
+- ndjson: one JSON object per line and session, with its messages,
+- parquet: one row per session with a column per category score, the full
+  scores as JSON and the messages as a list of structs, written in row
+  groups of about `row_group_messages` messages. Needs pyarrow, which is
+  imported only for this format.
+
+Both come out as a stream of byte chunks, for a streaming HTTP response or
+a file (export_sessions.py).
+"""
+import asyncio
+import importlib.util
+import json
+from typing import AsyncIterator, List, Optional
+
+from .analytics_service import session_values
+from .metrics_service import increment
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+# NDJSON bytes collected before a chunk is handed out
+NDJSON_CHUNK_BYTES = 64 * 1024
+
+# Messages buffered per Parquet row group
+ROW_GROUP_MESSAGES = 50_000
+
+
+class ExportUnavailableError(Exception):
+    """The requested export format needs a package that is not installed"""
+
+
+def export_record(session: dict) -> dict:
+    """The exported form of a session: what it was, what was said, its scores"""
+    return {
+        "id": session["id"],
+        "tutor_name": session["tutor_name"],
+        "persona_type": session["persona_type"],
+        "problem": session["problem"],
+        "created_at": session["created_at"],
+        "ended_at": session.get("ended_at"),
+        "scores": session.get("scores"),
+        "messages": [
+            {"sender": message["sender"], "content": message["content"], "timestamp": message["timestamp"]}
+            for message in session["messages"]
+        ]
+    }
+
+
+def check_format(export_format: str):
+    """
+    Raises:
+        ValueError: If the format is unknown
+        ExportUnavailableError: If the format's package is not installed
+    """
+    if export_format not in FORMATS:
+        raise ValueError(f"Unknown export format: {export_format} (use {' or '.join(FORMATS)})")
+    if export_format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise ExportUnavailableError("Parquet export needs pyarrow (pip install pyarrow)")
+
+
+def export_chunks(
+    sessions: AsyncIterator[dict],
+    export_format: str,
+    category_keys: Optional[List[str]] = None
+) -> AsyncIterator[bytes]:
+    """Encode sessions in an export format, as a stream of byte chunks
+
+    Args:
+        sessions: Sessions with their messages, e.g. from `SessionStore.iter_export`
+        export_format: A FORMATS key (see `check_format`)
+        category_keys: Categories that get their own score column (parquet)
+    """
+    if export_format == "parquet":
+        return parquet_chunks(sessions, category_keys or [])
+    return ndjson_chunks(sessions)
+
+
+async def ndjson_chunks(sessions: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    buffer: List[bytes] = []
+    size = 0
+    async for session in sessions:
+        line = json.dumps(export_record(session), ensure_ascii=False).encode("utf-8") + b"\n"
+        buffer.append(line)
+        size += len(line)
+        _count(session)
+        if size >= NDJSON_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+            # A store that never waits (the memory store) would otherwise
+            # hold the event loop for the whole export
+            await asyncio.sleep(0)
+    if buffer:
+        yield b"".join(buffer)
+
+
+class _ChunkSink:
+    """File-like target for pyarrow that hands out what was written so far"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_schema(category_keys: List[str]):
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("id", pa.string()),
+            ("tutor_name", pa.string()),
+            ("persona_type", pa.string()),
+            ("problem", pa.string()),
+            ("created_at", pa.string()),
+            ("ended_at", pa.string()),
+            ("message_count", pa.int32()),
+            ("score_overall", pa.float64())
+        ]
+        + [(f"score_{key}", pa.float64()) for key in category_keys]
+        + [
+            ("scores", pa.string()),
+            ("messages", pa.list_(pa.struct([
+                ("sender", pa.string()),
+                ("content", pa.string()),
+                ("timestamp", pa.string())
+            ])))
+        ]
+    )
+
+
+def _parquet_row(record: dict, category_keys: List[str]) -> dict:
+    values = session_values(record["scores"]) if record["scores"] else {}
+    row = {
+        "id": record["id"],
+        "tutor_name": record["tutor_name"],
+        "persona_type": record["persona_type"],
+        "problem": record["problem"],
+        "created_at": record["created_at"],
+        "ended_at": record["ended_at"],
+        "message_count": len(record["messages"]),
+        "score_overall": values.get("overall"),
+        "scores": json.dumps(record["scores"], ensure_ascii=False) if record["scores"] else None,
+        "messages": record["messages"]
+    }
+    for key in category_keys:
+        row[f"score_{key}"] = values.get(key)
+    return row
+
+
+async def parquet_chunks(
+    sessions: AsyncIterator[dict],
+    category_keys: List[str],
+    row_group_messages: int = ROW_GROUP_MESSAGES
+) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(category_keys)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+
+    def write_row_group(rows: List[dict]):
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+
+    rows: List[dict] = []
+    messages = 0
+    try:
+        async for session in sessions:
+            record = export_record(session)
+            rows.append(_parquet_row(record, category_keys))
+            messages += len(record["messages"])
+            _count(session)
+            if messages >= row_group_messages:
+                # Encoding and compressing a row group takes a while; keep
+                # the event loop free for other requests meanwhile
+                await asyncio.to_thread(write_row_group, rows)
+                rows, messages = [], 0
+                yield sink.take()
+        if rows:
+            await asyncio.to_thread(write_row_group, rows)
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def _count(session: dict):
+    increment("export_sessions")
+    increment("export_messages", len(session["messages"]))
@@ -0,0 +1,167 @@
+"""Idempotency keys for session turns.
+
+A client that retries a message post (say, after a network blip on a
+phone) used to add the tutor turn twice and pay for two learner replies.
+Clients can now send an `Idempotency-Key` header with each turn:
+
+- the first request with a key runs the turn,
+- duplicates that arrive while it is running wait for the same reply,
+- duplicates that arrive afterwards get the stored reply without a model
+  call, and
+- reusing a key for a different message is rejected.
+
+Keys are scoped to their session and expire IDEMPOTENCY_TTL_SECONDS after
+the turn finished; at most IDEMPOTENCY_MAX_KEYS finished turns are kept,
+oldest dropped first. Turns still running are kept until they finish,
+however many there are, so a retry always joins them. A turn that fails
+is forgotten, so retrying it runs it again.
+
+Keys are remembered per process; with several workers each keeps its own.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from .metrics_service import increment, set_gauge
+
+# Longest Idempotency-Key accepted
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflictError(ValueError):
+    """Raised when a key is reused for a different request"""
+
+
+class IdempotencyCache:
+    def __init__(self, ttl: float = 600, max_keys: int = 10000):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        # (scope, key) -> (request fingerprint, future) of turns still running
+        self._running: Dict[Tuple[str, str], Tuple[str, asyncio.Future]] = {}
+        # (scope, key) -> (expires_at, request fingerprint, future) of finished
+        # turns, in the order they finished, which is also soonest to expire
+        # first since the TTL is fixed
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str, asyncio.Future]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._running) + len(self._entries)
+
+    def claim(self, scope: str, key: str, fingerprint: str) -> Tuple[asyncio.Future, bool]:
+        """Register a turn under (scope, key), or find the one already registered
+
+        Args:
+            scope: What the key belongs to (the session id)
+            key: Client-chosen idempotency key
+            fingerprint: Identifies the request body (see `request_fingerprint`)
+
+        Returns:
+            (future, is_new): if is_new, the caller runs the turn and must
+            resolve the future with its result or exception; otherwise the
+            future belongs to the earlier request with the same key
+
+        Raises:
+            IdempotencyConflictError: If the key was used for a different request
+        """
+        self._expire()
+        entry = self._running.get((scope, key)) or self._entries.get((scope, key))
+        if entry is not None:
+            known_fingerprint, future = entry[-2:]
+            if known_fingerprint != fingerprint:
+                increment("idempotency_conflicts")
+                raise IdempotencyConflictError("Idempotency-Key was already used for a different message")
+            increment("idempotency_replays" if future.done() else "idempotency_joins")
+            return future, False
+
+        future = asyncio.get_running_loop().create_future()
+        self._running[(scope, key)] = (fingerprint, future)
+        future.add_done_callback(lambda done: self._finish(scope, key, done))
+        set_gauge("idempotency_keys", len(self))
+        return future, True
+
+    async def run(
+        self,
+        scope: str,
+        key: str,
+        fingerprint: str,
+        compute: Callable[[], Awaitable[dict]]
+    ) -> Tuple[dict, bool]:
+        """Run `compute` once per (scope, key) and share its result
+
+        The turn keeps running even if the request that started it goes
+        away, so duplicates waiting on it still get the reply.
+
+        Returns:
+            (result, replayed): replayed is True if the result came from an
+            earlier request with the same key
+
+        Raises:
+            IdempotencyConflictError: If the key was used for a different request
+        """
+        future, is_new = self.claim(scope, key, fingerprint)
+        if is_new:
+            task = asyncio.ensure_future(compute())
+            task.add_done_callback(lambda done: _resolve(future, done))
+        # Shielded so one request giving up does not cancel the turn
+        return await asyncio.shield(future), not is_new
+
+    def _finish(self, scope: str, key: str, future: asyncio.Future):
+        entry = self._running.get((scope, key))
+        if entry is None or entry[1] is not future:
+            return
+        fingerprint, _ = self._running.pop((scope, key))
+        # Failed turns are not replayed; the client's retry runs them again
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._entries[(scope, key)] = (time.monotonic() + self.ttl, fingerprint, future)
+        # Only finished turns are dropped: a running one would run again
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+            increment("idempotency_keys_evicted")
+        set_gauge("idempotency_keys", len(self))
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._entries:
+            expires_at, _, _ = next(iter(self._entries.values()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+        set_gauge("idempotency_keys", len(self))
+
+
+def _resolve(future: asyncio.Future, task: asyncio.Future):
+    """Copy the outcome of a finished task onto a claimed future"""
+    if future.done():
+        return
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+
+def request_fingerprint(*parts: str) -> str:
+    """Hash of the request fields a reused key must match"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+_idempotency_cache: Optional[IdempotencyCache] = None
+
+
+def get_idempotency_cache() -> IdempotencyCache:
+    """Get the process-wide idempotency cache, configured from the environment"""
+    global _idempotency_cache
+    if _idempotency_cache is None:
+        _idempotency_cache = IdempotencyCache(
+            ttl=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600")),
+            max_keys=int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+        )
+    return _idempotency_cache
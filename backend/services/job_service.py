@@ -0,0 +1,407 @@
+"""Background scoring jobs with a bounded worker pool.
+
+Scoring a session takes one long Sonnet call, so `/end` submits a job here
+and returns immediately. Jobs are:
+
+- served by a fixed number of worker tasks,
+- scheduled round-robin across tutors so one tutor's backlog cannot starve
+  the rest of a class,
+- rejected with QueueFullError once the queue (or a tutor's share of it) is
+  full, so callers can answer 503 instead of queueing unbounded work,
+- persisted as one JSON file per job, so queued and running jobs are picked
+  up again after a worker restart,
+- kept, in memory and on disk, for SCORING_JOB_RETENTION_SECONDS after they
+  finish, without the transcript they were scored from.
+
+Jobs are looked up and run by the process that owns the job directory, so
+the app runs as a single worker process: the queue locks SCORING_JOB_DIR
+(see directory_lock) while it runs, and a second worker fails at startup
+instead of re-running every unfinished job and answering 404 for jobs
+the first one holds.
+
+While a job runs, categories are added to its `partial_scores` as soon as
+they are scored, and each addition wakes up job event streams. Completed
+jobs, including those completed at once from a cached result, are handed
+to `on_result` (the app stores the scores and updates tutor progress).
+"""
+import asyncio
+import json
+import os
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from .directory_lock import lock_directory, unlock_directory
+from .metrics_service import increment, record_latency
+
+# Receives (category key, category score) while a job runs
+ProgressCallback = Callable[[str, dict], None]
+Scorer = Callable[[dict, ProgressCallback], Awaitable[dict]]
+ResultHandler = Callable[[dict], Awaitable[None]]
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+TERMINAL_STATUSES = (COMPLETED, FAILED)
+
+DEFAULT_JOB_DIR = Path(__file__).parent.parent / "data" / "scoring_jobs"
+
+# Finished jobs are forgotten (and their files deleted) this long after
+# they finish
+JOB_RETENTION = timedelta(days=1)
+
+
+class QueueFullError(Exception):
+    """Raised when the queue cannot accept another job"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ScoringJobQueue:
+    def __init__(
+        self,
+        scorer: Scorer,
+        job_dir: Optional[Path] = None,
+        workers: int = 4,
+        max_pending: int = 200,
+        max_pending_per_tutor: int = 3,
+        on_result: Optional[ResultHandler] = None,
+        retention: timedelta = JOB_RETENTION
+    ):
+        self.scorer = scorer
+        self.on_result = on_result
+        self.job_dir = Path(job_dir or DEFAULT_JOB_DIR)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_pending_per_tutor = max_pending_per_tutor
+        self.retention = retention
+
+        self.jobs: Dict[str, dict] = {}
+        # tutor name -> FIFO of that tutor's queued job ids, in round-robin order
+        self._tutor_queues: "OrderedDict[str, Deque[str]]" = OrderedDict()
+        self._pending = 0
+        self._wakeup = asyncio.Event()
+        self._updates: Dict[str, asyncio.Event] = {}
+        self._worker_tasks: List[asyncio.Task] = []
+        # dedupe key -> id of the latest job submitted with it
+        self._by_dedupe_key: Dict[str, str] = {}
+        self._deliveries: set = set()
+        # (finished_at, job id) of finished jobs, oldest first
+        self._finished: Deque[Tuple[datetime, str]] = deque()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def start(self):
+        """Load persisted jobs, re-queue unfinished ones and start the workers
+
+        Raises:
+            DirectoryLockedError: If another process is using the job directory
+        """
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        lock_directory(self.job_dir, self, "Scoring job directory")
+        cutoff = datetime.now() - self.retention
+        restored = []
+        finished = []
+        for path in self.job_dir.glob("*.json"):
+            try:
+                job = json.loads(path.read_text())
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Skipping unreadable scoring job {path.name}: {e}")
+                continue
+            if job["status"] in TERMINAL_STATUSES:
+                finished_at = datetime.fromisoformat(job["finished_at"])
+                if finished_at < cutoff:
+                    path.unlink(missing_ok=True)
+                    continue
+                job.pop("payload", None)
+                finished.append((finished_at, job["id"]))
+            self.jobs[job["id"]] = job
+            if job.get("dedupe_key"):
+                self._by_dedupe_key[job["dedupe_key"]] = job["id"]
+            if job["status"] not in TERMINAL_STATUSES:
+                restored.append(job)
+
+        self._finished.extend(sorted(finished))
+
+        # Jobs that were running when the previous worker died start over
+        for job in sorted(restored, key=lambda j: j["created_at"]):
+            job["status"] = QUEUED
+            self._enqueue(job)
+        if restored:
+            print(f"Re-queued {len(restored)} unfinished scoring job(s)")
+
+        self._worker_tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Stop the workers; unfinished jobs stay on disk for the next start"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        unlock_directory(self.job_dir, self)
+
+    def submit(
+        self,
+        session_id: str,
+        tutor_name: str,
+        payload: dict,
+        dedupe_key: Optional[str] = None,
+        result: Optional[dict] = None
+    ) -> dict:
+        """Queue a scoring job
+
+        Args:
+            session_id: Session being scored
+            tutor_name: Used to share the workers fairly between tutors
+            payload: Keyword arguments for the scorer
+            dedupe_key: If a job with this key is queued, running or
+                completed, it is returned instead of submitting another
+            result: Record the job as already completed with this result
+                (e.g. from the scoring cache) instead of queueing it
+
+        Raises:
+            QueueFullError: If the queue or the tutor's share of it is full
+        """
+        self._forget_expired()
+        if dedupe_key is not None:
+            existing = self.jobs.get(self._by_dedupe_key.get(dedupe_key, ""))
+            if existing is not None and existing["status"] != FAILED:
+                increment("scoring_jobs_deduplicated")
+                return existing
+
+        if result is not None:
+            now = datetime.now().isoformat()
+            job = self._new_job(session_id, tutor_name, payload, dedupe_key)
+            job.update(status=COMPLETED, started_at=now, finished_at=now, result=result)
+            self._save(job)
+            increment("scoring_jobs_completed")
+            delivery = asyncio.create_task(self._settle(job))
+            self._deliveries.add(delivery)
+            delivery.add_done_callback(self._deliveries.discard)
+            return job
+
+        if self._pending >= self.max_pending:
+            increment("scoring_jobs_rejected")
+            raise QueueFullError(
+                "Scoring queue is full, please retry shortly",
+                retry_after=self._estimate_wait()
+            )
+        if len(self._tutor_queues.get(tutor_name, ())) >= self.max_pending_per_tutor:
+            increment("scoring_jobs_rejected")
+            raise QueueFullError(
+                f"Too many scoring jobs queued for {tutor_name}",
+                retry_after=self._estimate_wait()
+            )
+
+        job = self._new_job(session_id, tutor_name, payload, dedupe_key)
+        self._save(job)
+        self._enqueue(job)
+        increment("scoring_jobs_submitted")
+        return job
+
+    def _new_job(self, session_id: str, tutor_name: str, payload: dict, dedupe_key: Optional[str]) -> dict:
+        job = {
+            "id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "tutor_name": tutor_name,
+            "status": QUEUED,
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "partial_scores": {},
+            "error": None,
+            "dedupe_key": dedupe_key,
+            "payload": payload
+        }
+        self.jobs[job["id"]] = job
+        if dedupe_key is not None:
+            self._by_dedupe_key[dedupe_key] = job["id"]
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+    def public_view(self, job: dict) -> dict:
+        """Job fields safe to return from the API (no transcript payload)"""
+        view = {key: value for key, value in job.items() if key not in ("payload", "dedupe_key")}
+        # A copy, so views taken before and after a category was added differ
+        view["partial_scores"] = dict(job.get("partial_scores") or {})
+        if job["status"] == QUEUED:
+            view["queue_position"] = self._queue_position(job)
+        return view
+
+    async def wait_for_update(self, job_id: str, timeout: float) -> bool:
+        """Wait until the job changes; returns False on timeout"""
+        event = self._updates.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _enqueue(self, job: dict):
+        self._tutor_queues.setdefault(job["tutor_name"], deque()).append(job["id"])
+        self._pending += 1
+        self._wakeup.set()
+
+    def _dequeue(self) -> Optional[dict]:
+        """Take the next job, rotating through tutors round-robin"""
+        if not self._tutor_queues:
+            return None
+        tutor_name, queue = self._tutor_queues.popitem(last=False)
+        job_id = queue.popleft()
+        if queue:
+            self._tutor_queues[tutor_name] = queue
+        self._pending -= 1
+        return self.jobs[job_id]
+
+    def _queue_position(self, job: dict) -> int:
+        """1-based position of a queued job in the round-robin order"""
+        queue = self._tutor_queues.get(job["tutor_name"])
+        if queue is None or job["id"] not in queue:
+            return 0
+        depth = list(queue).index(job["id"])
+        tutor_index = list(self._tutor_queues).index(job["tutor_name"])
+        # Tutors earlier in the rotation get one more turn before ours
+        ahead = sum(
+            min(len(other), depth + (1 if i < tutor_index else 0))
+            for i, other in enumerate(self._tutor_queues.values())
+        )
+        return ahead + 1
+
+    def _estimate_wait(self) -> int:
+        """Rough seconds until a slot frees up, for Retry-After headers"""
+        return max(5, int(self._pending / max(1, self.workers) * 20))
+
+    async def _worker(self):
+        while True:
+            job = self._dequeue()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._run(job)
+
+    async def _run(self, job: dict):
+        job["status"] = RUNNING
+        job["started_at"] = datetime.now().isoformat()
+        self._save(job)
+        self._notify(job)
+
+        queued_for = datetime.now() - datetime.fromisoformat(job["created_at"])
+        record_latency("scoring_job_queue_wait", queued_for.total_seconds())
+        job["partial_scores"] = {}
+
+        def on_category(key: str, category: dict):
+            # Not saved to disk: a restarted job scores every category again
+            job["partial_scores"][key] = category
+            self._notify(job)
+
+        try:
+            job["result"] = await self.scorer(job["payload"], on_category)
+            job["status"] = COMPLETED
+            increment("scoring_jobs_completed")
+        except asyncio.CancelledError:
+            # Shutting down: leave the job on disk as running so it is retried
+            raise
+        except Exception as e:
+            print(f"Scoring job {job['id']} failed: {e}")
+            job["status"] = FAILED
+            job["error"] = str(e)
+            increment("scoring_jobs_failed")
+        job["finished_at"] = datetime.now().isoformat()
+        self._save(job)
+        self._notify(job)
+        await self._settle(job)
+
+    async def _settle(self, job: dict):
+        """Hand a finished job's result over, then keep only what the API shows"""
+        if job["status"] == COMPLETED:
+            await self._deliver(job)
+        # The transcript was only needed to score the job and store the scores
+        job.pop("payload", None)
+        self._finished.append((datetime.fromisoformat(job["finished_at"]), job["id"]))
+        self._forget_expired()
+
+    def _forget_expired(self):
+        """Drop jobs that finished longer than the retention window ago"""
+        cutoff = datetime.now() - self.retention
+        while self._finished and self._finished[0][0] < cutoff:
+            _, job_id = self._finished.popleft()
+            job = self.jobs.pop(job_id, None)
+            if job is None:
+                continue
+            if self._by_dedupe_key.get(job.get("dedupe_key")) == job_id:
+                del self._by_dedupe_key[job["dedupe_key"]]
+            # Wakes up event streams still open for it; they find it gone
+            self._notify(job)
+            (self.job_dir / f"{job_id}.json").unlink(missing_ok=True)
+            increment("scoring_jobs_expired")
+
+    async def _deliver(self, job: dict):
+        if self.on_result is None:
+            return
+        try:
+            await self.on_result(job)
+        except Exception as e:
+            print(f"Handling the result of scoring job {job['id']} failed: {e}")
+            increment("scoring_job_result_errors")
+
+    def _notify(self, job: dict):
+        event = self._updates.pop(job["id"], None)
+        if event is not None:
+            event.set()
+
+    def _save(self, job: dict):
+        """Write the job atomically so a crash never leaves a partial file"""
+        path = self.job_dir / f"{job['id']}.json"
+        tmp_path = path.with_suffix(".tmp")
+        if job["status"] in TERMINAL_STATUSES:
+            # Finished jobs are not run again, so their transcript is not kept
+            job = {key: value for key, value in job.items() if key != "payload"}
+        tmp_path.write_text(json.dumps(job))
+        os.replace(tmp_path, path)
+
+
+# Created in the app lifespan
+_scoring_job_queue: Optional[ScoringJobQueue] = None
+
+
+def get_scoring_job_queue() -> ScoringJobQueue:
+    if _scoring_job_queue is None:
+        raise RuntimeError("Scoring job queue has not been started")
+    return _scoring_job_queue
+
+
+async def start_scoring_job_queue(scorer: Scorer, on_result: Optional[ResultHandler] = None) -> ScoringJobQueue:
+    """Create and start the process-wide queue using environment settings"""
+    global _scoring_job_queue
+    job_dir = os.getenv("SCORING_JOB_DIR")
+    _scoring_job_queue = ScoringJobQueue(
+        scorer,
+        job_dir=Path(job_dir) if job_dir else None,
+        workers=int(os.getenv("SCORING_WORKERS", "4")),
+        max_pending=int(os.getenv("SCORING_QUEUE_MAX_PENDING", "200")),
+        max_pending_per_tutor=int(os.getenv("SCORING_QUEUE_MAX_PER_TUTOR", "3")),
+        on_result=on_result,
+        retention=timedelta(seconds=int(os.getenv("SCORING_JOB_RETENTION_SECONDS", "86400")))
+    )
+    await _scoring_job_queue.start()
+    return _scoring_job_queue
+
+
+async def stop_scoring_job_queue():
+    global _scoring_job_queue
+    if _scoring_job_queue is not None:
+        await _scoring_job_queue.stop()
+        _scoring_job_queue = None
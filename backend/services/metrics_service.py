@@ -0,0 +1,85 @@
+"""In-process metrics: counters, gauges and latency summaries served by /api/metrics."""
+import threading
+from collections import deque
+from typing import Deque, Dict
+
+# Number of recent samples kept per latency metric for percentiles
+SAMPLE_WINDOW = 1000
+
+
+class LatencyStats:
+    """Running count/total plus a window of recent samples"""
+
+    def __init__(self, window: int = SAMPLE_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def summary(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+
+        def percentile(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": round(percentile(0.50) * 1000, 2),
+            "p95_ms": round(percentile(0.95) * 1000, 2),
+            "p99_ms": round(percentile(0.99) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2)
+        }
+
+
+_lock = threading.Lock()
+_counters: Dict[str, int] = {}
+_gauges: Dict[str, float] = {}
+_latencies: Dict[str, LatencyStats] = {}
+
+
+def increment(name: str, amount: int = 1):
+    """Increase a named counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def set_gauge(name: str, value: float):
+    """Set a named gauge to its current value"""
+    with _lock:
+        _gauges[name] = value
+
+
+def record_latency(name: str, seconds: float):
+    """Record one latency sample for a named metric"""
+    with _lock:
+        stats = _latencies.get(name)
+        if stats is None:
+            stats = _latencies[name] = LatencyStats()
+        stats.record(seconds)
+
+
+def get_metrics_snapshot() -> Dict[str, dict]:
+    """Get all counters, gauges and latency summaries"""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "latencies": {name: stats.summary() for name, stats in _latencies.items()}
+        }
+
+
+def reset_metrics():
+    """Clear all metrics (used by benchmarks and tests)"""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _latencies.clear()
@@ -0,0 +1,214 @@
+"""Pre-generated opening learner turns for new sessions.
+
+Every session opens with the same synthetic tutor message, so the learner's
+first reply only depends on the persona and the problem. In a classroom,
+dozens of tutors start the same problem with the same persona at once;
+instead of one Haiku call each, `start_session` takes a reply from a small
+pool kept per (persona_type, problem hash):
+
+- each pooled reply is handed out at most OPENER_MAX_USES times, least-used
+  first, so concurrent sessions see different openers,
+- pools are topped back up to OPENER_POOL_SIZE in the background,
+- `warm_up` fills pools for a problem set ahead of a class.
+
+A miss falls back to generating the reply inline, as before; concurrent
+misses for the same key wait for that one reply instead of each making a
+call.
+"""
+import asyncio
+import hashlib
+import os
+import random
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .admission_service import OPENING_TURN
+from .metrics_service import increment
+
+OpenerKey = Tuple[str, str]
+
+
+def opening_message(problem: str) -> str:
+    """The tutor message every session starts with"""
+    return f"Hello! I need help with this problem: {problem}"
+
+
+def opener_key(persona_type: str, problem: str) -> OpenerKey:
+    return persona_type, hashlib.sha256(problem.encode("utf-8")).hexdigest()[:16]
+
+
+class OpenerCache:
+    def __init__(
+        self,
+        claude_service,
+        pool_size: int = 4,
+        max_uses: int = 3,
+        max_keys: int = 256
+    ):
+        self.claude_service = claude_service
+        self.pool_size = pool_size
+        self.max_uses = max_uses
+        self.max_keys = max_keys
+
+        # key -> pooled openers ({"text", "uses"}), least recently used first
+        self._pools: "OrderedDict[OpenerKey, List[dict]]" = OrderedDict()
+        self._refills: Dict[OpenerKey, asyncio.Task] = {}
+        # key -> the inline generation of a miss and how many callers share it
+        self._misses: Dict[OpenerKey, dict] = {}
+
+    async def get_opener(self, persona_type: str, problem: str, tutor: Optional[str] = None) -> str:
+        """Return an opening learner reply, generating one on a miss
+        
+        Args:
+            tutor: Tutor starting the session, for the per-tutor admission cap
+        """
+        key = opener_key(persona_type, problem)
+        pool = self._pools.get(key)
+        if pool:
+            self._pools.move_to_end(key)
+            fewest = min(entry["uses"] for entry in pool)
+            entry = random.choice([entry for entry in pool if entry["uses"] == fewest])
+            entry["uses"] += 1
+            if entry["uses"] >= self.max_uses:
+                pool.remove(entry)
+            increment("opener_cache_hits")
+            self._schedule_refill(key, persona_type, problem)
+            return entry["text"]
+
+        miss = self._misses.get(key)
+        if miss is not None:
+            increment("opener_cache_coalesced")
+            miss["callers"] += 1
+            # Shielded so one caller giving up does not cancel the others
+            return await asyncio.shield(miss["future"])
+
+        increment("opener_cache_misses")
+        miss = self._misses[key] = {"callers": 1}
+        miss["future"] = asyncio.ensure_future(self._generate_miss(key, miss, persona_type, problem, tutor))
+        # Retrieved here too, in case every caller has given up
+        miss["future"].add_done_callback(lambda done: done.cancelled() or done.exception())
+        return await asyncio.shield(miss["future"])
+
+    async def warm_up(self, problems: List[str], persona_types: List[str], wait: bool = False) -> int:
+        """Fill the pools for every persona/problem combination
+
+        Args:
+            problems: Problem texts exactly as tutors will start them
+            persona_types: Personas to generate openers for
+            wait: Wait for the pools to fill instead of returning at once
+
+        Returns:
+            The number of pools being filled
+        """
+        tasks = [
+            self._schedule_refill(opener_key(persona_type, problem), persona_type, problem)
+            for problem in problems
+            for persona_type in persona_types
+        ]
+        tasks = [task for task in tasks if task is not None]
+        if wait:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return len(tasks)
+
+    def pooled(self, persona_type: str, problem: str) -> int:
+        """Number of openers currently pooled for a persona and problem"""
+        return len(self._pools.get(opener_key(persona_type, problem), []))
+
+    async def close(self):
+        """Cancel background refills and inline generations"""
+        tasks = list(self._refills.values()) + [miss["future"] for miss in self._misses.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._refills.clear()
+        self._misses.clear()
+
+    async def _generate_miss(
+        self,
+        key: OpenerKey,
+        miss: dict,
+        persona_type: str,
+        problem: str,
+        tutor: Optional[str]
+    ) -> str:
+        try:
+            text = await self._generate(persona_type, problem, tutor)
+        finally:
+            if self._misses.get(key) is miss:
+                del self._misses[key]
+        if self.pool_size > 0:
+            # Every caller that shared the reply used it once
+            if miss["callers"] < self.max_uses:
+                self._add(key, text, uses=miss["callers"])
+            self._schedule_refill(key, persona_type, problem)
+        return text
+
+    def _add(self, key: OpenerKey, text: str, uses: int = 0):
+        pool = self._pools.setdefault(key, [])
+        self._pools.move_to_end(key)
+        if len(pool) < self.pool_size:
+            pool.append({"text": text, "uses": uses})
+        while len(self._pools) > self.max_keys:
+            self._pools.popitem(last=False)
+
+    def _schedule_refill(self, key: OpenerKey, persona_type: str, problem: str) -> Optional[asyncio.Task]:
+        task = self._refills.get(key)
+        if task is not None:
+            return task
+        if self.pool_size <= 0 or len(self._pools.get(key, [])) >= self.pool_size:
+            return None
+        task = asyncio.create_task(self._refill(key, persona_type, problem))
+        self._refills[key] = task
+        return task
+
+    async def _refill(self, key: OpenerKey, persona_type: str, problem: str):
+        try:
+            missing = self.pool_size - len(self._pools.get(key, []))
+            results = await asyncio.gather(
+                *(self._generate(persona_type, problem) for _ in range(missing)),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    print(f"Opener refill failed for {persona_type}: {result}")
+                    increment("opener_refill_failed")
+                else:
+                    self._add(key, result)
+                    increment("opener_refills")
+        finally:
+            if self._refills.get(key) is asyncio.current_task():
+                del self._refills[key]
+
+    async def _generate(self, persona_type: str, problem: str, tutor: Optional[str] = None) -> str:
+        return await self.claude_service.get_persona_response(
+            messages=[{"sender": "tutor", "content": opening_message(problem)}],
+            persona_type=persona_type,
+            problem=problem,
+            priority=OPENING_TURN,
+            tutor=tutor
+        )
+
+
+_opener_cache: Optional[OpenerCache] = None
+
+
+def get_opener_cache() -> OpenerCache:
+    """Get the process-wide opener cache, configured from the environment"""
+    global _opener_cache
+    if _opener_cache is None:
+        from .claude_service import get_claude_service
+
+        _opener_cache = OpenerCache(
+            get_claude_service(),
+            pool_size=int(os.getenv("OPENER_POOL_SIZE", "4")),
+            max_uses=int(os.getenv("OPENER_MAX_USES", "3")),
+            max_keys=int(os.getenv("OPENER_CACHE_MAX_KEYS", "256"))
+        )
+    return _opener_cache
+
+
+async def close_opener_cache():
+    global _opener_cache
+    if _opener_cache is not None:
+        await _opener_cache.close()
+        _opener_cache = None
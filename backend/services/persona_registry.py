@@ -0,0 +1,259 @@
+"""Learner personas, loaded from backend/personas/*.md.
+
+Each persona is one Markdown file named after its id, with a short front
+matter block followed by the persona text:
+
+    ---
+    name: Anxious Alex
+    description: Knows the material but second-guesses every step
+    ---
+    You are Alex, a high school student who is anxious about math.
+    ...
+
+The index only keeps each file's front matter. Bodies are read on first
+use and kept in a bounded LRU (PERSONA_BODY_CACHE_SIZE), so memory and the
+cost of listing personas stay small with thousands of files. The directory
+is rescanned every PERSONA_RELOAD_INTERVAL_SECONDS. In the app this runs in
+a background task started with the app (see `start_persona_registry`), so
+requests only read the current index and never wait on a scan; elsewhere
+(scripts, benchmarks) a due rescan runs on the next lookup. Only files
+whose mtime or size changed are re-read, and the new index is swapped in
+with a single assignment. Personas can be added or edited without
+restarting workers.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .metrics_service import increment
+
+DEFAULT_PERSONA_DIR = Path(__file__).parent.parent / "personas"
+
+FRONT_MATTER_DELIMITER = "---"
+
+
+@dataclass(frozen=True)
+class PersonaInfo:
+    id: str
+    name: str
+    description: str
+    path: Path
+    # (mtime_ns, size) of the file the metadata was read from
+    version: Tuple[int, int]
+
+    def to_dict(self) -> Dict[str, str]:
+        data = {"id": self.id, "name": self.name}
+        if self.description:
+            data["description"] = self.description
+        return data
+
+
+@dataclass(frozen=True)
+class PersonaIndex:
+    personas: Dict[str, PersonaInfo]
+    api_payload: bytes
+    etag: str
+
+
+def _read_front_matter(lines) -> Dict[str, str]:
+    """Parse `key: value` lines up to the closing delimiter"""
+    if next(lines, "").strip() != FRONT_MATTER_DELIMITER:
+        return {}
+    meta = {}
+    for line in lines:
+        if line.strip() == FRONT_MATTER_DELIMITER:
+            return meta
+        key, separator, value = line.partition(":")
+        if not separator:
+            raise ValueError(f"Invalid front matter line: {line.strip()}")
+        meta[key.strip()] = value.strip()
+    raise ValueError("Front matter is not closed")
+
+
+def read_persona_body(path: Path) -> str:
+    """Read the persona text that follows the front matter"""
+    text = path.read_text(encoding="utf-8")
+    if text.startswith(FRONT_MATTER_DELIMITER):
+        _, _, text = text[len(FRONT_MATTER_DELIMITER):].partition(f"\n{FRONT_MATTER_DELIMITER}\n")
+    return text.strip("\n")
+
+
+class PersonaRegistry:
+    def __init__(
+        self,
+        directory: Path = DEFAULT_PERSONA_DIR,
+        reload_interval: float = 5.0,
+        body_cache_size: int = 256
+    ):
+        self.directory = Path(directory)
+        self.reload_interval = reload_interval
+        self.body_cache_size = body_cache_size
+
+        self._index: Optional[PersonaIndex] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        # persona id -> (version, body), least recently used first
+        self._bodies: "OrderedDict[str, Tuple[Tuple[int, int], str]]" = OrderedDict()
+        # persona id -> version of a file that failed to parse, so it is only reported once
+        self._invalid: Dict[str, Tuple[int, int]] = {}
+        self._reloader: Optional[asyncio.Task] = None
+
+    def index(self) -> PersonaIndex:
+        """The current index, rescanning the directory if it is due
+
+        While the background reloader runs, this never scans.
+        """
+        index = self._index
+        if index is not None and (
+            self._reloader is not None or time.monotonic() - self._checked_at < self.reload_interval
+        ):
+            return index
+        with self._lock:
+            if self._index is None or time.monotonic() - self._checked_at >= self.reload_interval:
+                self._index = self._scan(self._index)
+                self._checked_at = time.monotonic()
+            return self._index
+
+    def reload(self) -> PersonaIndex:
+        """Rescan the directory now"""
+        with self._lock:
+            self._index = self._scan(self._index)
+            self._checked_at = time.monotonic()
+            return self._index
+
+    async def start(self):
+        """Load the index and rescan it in the background from now on"""
+        await asyncio.to_thread(self.reload)
+        if self._reloader is None:
+            self._reloader = asyncio.create_task(self._reload_periodically())
+
+    async def stop(self):
+        if self._reloader is not None:
+            self._reloader.cancel()
+            try:
+                await self._reloader
+            except asyncio.CancelledError:
+                pass
+            self._reloader = None
+
+    async def _reload_periodically(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await asyncio.to_thread(self.reload)
+            except OSError as e:
+                # Keep serving the last index until the directory is back
+                print(f"Persona directory rescan failed: {e}")
+                increment("persona_registry_reload_errors")
+
+    def get(self, persona_id: str) -> Optional[PersonaInfo]:
+        return self.index().personas.get(persona_id)
+
+    def load_body(self, persona_id: str) -> str:
+        """Get a persona's text, reading the file on first use
+
+        Raises:
+            ValueError: If the persona type is not found
+        """
+        info = self.get(persona_id)
+        if info is None:
+            raise ValueError(f"Unknown persona type: {persona_id}")
+
+        with self._lock:
+            cached = self._bodies.get(persona_id)
+            if cached is not None and cached[0] == info.version:
+                self._bodies.move_to_end(persona_id)
+                return cached[1]
+
+        body = read_persona_body(info.path)
+        increment("persona_body_loads")
+        with self._lock:
+            self._bodies[persona_id] = (info.version, body)
+            self._bodies.move_to_end(persona_id)
+            while len(self._bodies) > self.body_cache_size:
+                self._bodies.popitem(last=False)
+        return body
+
+    def _scan(self, previous: Optional[PersonaIndex]) -> PersonaIndex:
+        known = previous.personas if previous else {}
+        personas: Dict[str, PersonaInfo] = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                persona_id, extension = os.path.splitext(entry.name)
+                if extension != ".md" or not persona_id.isidentifier():
+                    continue
+                stat = entry.stat()
+                version = (stat.st_mtime_ns, stat.st_size)
+                info = known.get(persona_id)
+                if info is None or info.version != version:
+                    if self._invalid.get(persona_id) == version:
+                        continue
+                    info = self._read_info(persona_id, Path(entry.path), version)
+                    if info is None:
+                        self._invalid[persona_id] = version
+                        continue
+                personas[persona_id] = info
+
+        if previous is not None and personas == previous.personas:
+            return previous
+        if previous is not None:
+            increment("persona_registry_reloads")
+
+        ordered = {persona_id: personas[persona_id] for persona_id in sorted(personas)}
+        api_payload = json.dumps({"personas": [info.to_dict() for info in ordered.values()]}).encode("utf-8")
+        return PersonaIndex(
+            personas=ordered,
+            api_payload=api_payload,
+            etag=f'"{hashlib.sha256(api_payload).hexdigest()[:16]}"'
+        )
+
+    @staticmethod
+    def _read_info(persona_id: str, path: Path, version: Tuple[int, int]) -> Optional[PersonaInfo]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                meta = _read_front_matter(iter(f))
+        except (ValueError, OSError) as e:
+            print(f"Skipping persona file {path.name}: {e}")
+            increment("persona_files_invalid")
+            return None
+        return PersonaInfo(
+            id=persona_id,
+            name=meta.get("name") or persona_id.replace("_", " ").title(),
+            description=meta.get("description", ""),
+            path=path,
+            version=version
+        )
+
+
+_persona_registry: Optional[PersonaRegistry] = None
+
+
+def get_persona_registry() -> PersonaRegistry:
+    """Get the process-wide persona registry, configured from the environment"""
+    global _persona_registry
+    if _persona_registry is None:
+        _persona_registry = PersonaRegistry(
+            Path(os.getenv("PERSONA_DIR", str(DEFAULT_PERSONA_DIR))),
+            reload_interval=float(os.getenv("PERSONA_RELOAD_INTERVAL_SECONDS", "5")),
+            body_cache_size=int(os.getenv("PERSONA_BODY_CACHE_SIZE", "256"))
+        )
+    return _persona_registry
+
+
+async def start_persona_registry() -> PersonaRegistry:
+    """Load the persona index and keep it fresh in the background"""
+    registry = get_persona_registry()
+    await registry.start()
+    return registry
+
+
+async def stop_persona_registry():
+    if _persona_registry is not None:
+        await _persona_registry.stop()
@@ -0,0 +1,212 @@
+"""Running per-tutor progress aggregates, updated as scoring results land.
+
+Showing a tutor's progress used to mean re-reading every scored session.
+Instead each tutor has one progress document, changed in O(1) whenever a
+session is scored (or re-scored) and read in O(1) by the progress API:
+
+    {
+        "sessions": 12,
+        "last_session_at": "...",
+        "overall": stats,                    # mean category score per session
+        "categories": {key: stats},
+        "personas": {persona: {"overall": stats, "categories": {key: stats}}}
+    }
+
+where `stats` holds the count, mean and sum of squared deviations
+(Welford's method, so values can also be taken out again when a session is
+re-scored) and the most recent RECENT_WINDOW values, from which the trend is
+computed.
+
+The session store keeps the documents (`SessionStore.update_tutor_progress`,
+which applies a change under a lock on the tutor's row with PostgreSQL).
+`record_scores` saves a result with the session and then folds it into the
+progress and the cohort rollups (analytics_service.py); if the process dies
+in between, backfill_progress.py recomputes both from the stored sessions.
+"""
+import copy
+from typing import AsyncIterator, Dict, List, Optional
+
+from .analytics_service import rollup_deltas, session_values
+from .metrics_service import increment
+
+# Values per aggregate kept for the recent-window trend
+RECENT_WINDOW = 10
+
+
+def _new_stats() -> dict:
+    return {"count": 0, "mean": 0.0, "m2": 0.0, "recent": []}
+
+
+def _add(stats: dict, session_id: str, value: float):
+    stats["count"] += 1
+    delta = value - stats["mean"]
+    stats["mean"] += delta / stats["count"]
+    stats["m2"] += delta * (value - stats["mean"])
+    stats["recent"].append([session_id, value])
+    del stats["recent"][:-RECENT_WINDOW]
+
+
+def _replace(stats: dict, session_id: str, old: float, new: float):
+    """Swap a session's value for a new one, keeping its place in the window"""
+    count = stats["count"]
+    if count <= 1:
+        stats.update(_new_stats(), recent=[[session_id, new]], count=1, mean=new)
+        return
+    # Take the old value out, then add the new one
+    delta = old - stats["mean"]
+    mean = stats["mean"] - delta / (count - 1)
+    m2 = stats["m2"] - delta * (old - mean)
+    delta = new - mean
+    stats["mean"] = mean + delta / count
+    stats["m2"] = max(0.0, m2 + delta * (new - stats["mean"]))
+    for entry in stats["recent"]:
+        if entry[0] == session_id:
+            entry[1] = new
+
+
+def new_progress() -> dict:
+    return {"sessions": 0, "last_session_at": None, "overall": _new_stats(), "categories": {}, "personas": {}}
+
+
+def apply_scores(
+    progress: Optional[dict],
+    session: dict,
+    scores: dict,
+    previous: Optional[dict] = None
+) -> dict:
+    """Fold a session's scoring result into its tutor's progress
+
+    Args:
+        progress: The tutor's progress so far, or None for a new tutor
+        session: The scored session ("id", "persona_type", "ended_at")
+        scores: Its result ({"categories": {key: {"score": ...}}, ...})
+        previous: The session's earlier result, if it was scored before;
+            its values are replaced rather than counted twice
+
+    Returns:
+        The updated progress (a new document; `progress` is not changed)
+    """
+    progress = _fold(copy.deepcopy(progress) if progress else new_progress(), session, scores, previous)
+    increment("tutor_progress_updates")
+    return progress
+
+
+def _fold(progress: dict, session: dict, scores: dict, previous: Optional[dict] = None) -> dict:
+    """apply_scores, changing `progress` in place"""
+    new_values = session_values(scores)
+    old_values = session_values(previous) if previous else {}
+    if not new_values:
+        return progress
+
+    persona = progress["personas"].setdefault(session["persona_type"], {"overall": _new_stats(), "categories": {}})
+    for key, value in new_values.items():
+        for stats in _targets(progress, persona, key):
+            if key in old_values and stats["count"]:
+                _replace(stats, session["id"], old_values[key], value)
+            else:
+                _add(stats, session["id"], value)
+
+    if not old_values:
+        progress["sessions"] += 1
+    scored_at = session.get("ended_at") or scores.get("scored_at")
+    if scored_at and (progress["last_session_at"] is None or scored_at > progress["last_session_at"]):
+        progress["last_session_at"] = scored_at
+    return progress
+
+
+def _targets(progress: dict, persona: dict, key: str) -> List[dict]:
+    """The tutor-wide and per-persona aggregates a value goes into"""
+    if key == "overall":
+        return [progress["overall"], persona["overall"]]
+    return [
+        progress["categories"].setdefault(key, _new_stats()),
+        persona["categories"].setdefault(key, _new_stats())
+    ]
+
+
+def _trend(recent: List[list]) -> Optional[float]:
+    """Least-squares change in score per session over the recent window"""
+    values = [value for _, value in recent]
+    n = len(values)
+    if n < 2:
+        return None
+    mean_x = (n - 1) / 2
+    mean_y = sum(values) / n
+    numerator = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+    denominator = sum((x - mean_x) ** 2 for x in range(n))
+    return numerator / denominator
+
+
+def stats_view(stats: dict) -> dict:
+    count = stats["count"]
+    variance = max(0.0, stats["m2"]) / (count - 1) if count > 1 else 0.0
+    recent = [value for _, value in stats["recent"]]
+    trend = _trend(stats["recent"])
+    return {
+        "count": count,
+        "mean": round(stats["mean"], 3),
+        "variance": round(variance, 3),
+        "stddev": round(variance ** 0.5, 3),
+        "recent_mean": round(sum(recent) / len(recent), 3) if recent else None,
+        "trend_per_session": round(trend, 3) if trend is not None else None
+    }
+
+
+def progress_view(tutor_name: str, progress: dict) -> dict:
+    """The API form of a tutor's progress"""
+    return {
+        "tutor_name": tutor_name,
+        "sessions": progress["sessions"],
+        "last_session_at": progress["last_session_at"],
+        "overall": stats_view(progress["overall"]),
+        "categories": {key: stats_view(stats) for key, stats in progress["categories"].items()},
+        "personas": {
+            persona: {
+                "overall": stats_view(aggregates["overall"]),
+                "categories": {key: stats_view(stats) for key, stats in aggregates["categories"].items()}
+            }
+            for persona, aggregates in progress["personas"].items()
+        }
+    }
+
+
+def average_scores(progress: dict) -> Dict[str, float]:
+    """Mean score per category, for tutor_profiles.average_scores"""
+    return {key: round(stats["mean"], 3) for key, stats in progress["categories"].items()}
+
+
+async def record_scores(store, session: dict, scores: dict):
+    """Store a session's scoring result, then update its tutor's progress
+    and the cohort rollups
+
+    Args:
+        store: The SessionStore
+        session: The scored session as stored, with any earlier "scores"
+        scores: The new result
+    """
+    previous = session.get("scores")
+    await store.save_scores({session["id"]: scores})
+    await store.update_tutor_progress(
+        session["tutor_name"],
+        lambda progress: apply_scores(progress, session, scores, previous)
+    )
+    await store.update_rollups(rollup_deltas(session, scores, previous))
+
+
+async def rebuild_progress(sessions: AsyncIterator[dict]) -> Dict[str, dict]:
+    """Recompute every tutor's progress from scored sessions
+
+    Args:
+        sessions: Ended sessions in (created_at, id) order, e.g. from
+            `SessionStore.iter_ended`; read one at a time
+
+    Returns:
+        Tutor name -> progress
+    """
+    rebuilt: Dict[str, dict] = {}
+    async for session in sessions:
+        if session.get("scores"):
+            tutor = session["tutor_name"]
+            # The rebuilt documents are private to the rebuild, so no copies
+            rebuilt[tutor] = _fold(rebuilt.get(tutor) or new_progress(), session, session["scores"])
+    return rebuilt
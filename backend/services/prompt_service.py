@@ -1,29 +1,37 @@
 """Service for generating prompts with typed parameters."""
 from typing import List
-from .prompt_types import BaseStudentPromptParams, ScoringPromptParams
-
-
-def generate_base_student_prompt(params: BaseStudentPromptParams) -> str:
-    """Generate the base student prompt with typed parameters.
+from .prompt_types import (
+    BaseStudentPromptParams,
+    ScoringPromptParams,
+    CategoryScoringPromptParams,
+    SessionSummaryPromptParams,
+    RollingScoringPromptParams,
+    ContextSummaryPromptParams,
+    ConversationMessage
+)
+from .prompt_templates import PromptTemplate, format_message
+from .persona_registry import get_persona_registry
+
+
+def format_conversation(conversation: List[ConversationMessage]) -> str:
+    """Format conversation messages as a plain-text transcript."""
+    return "\n\n".join([format_message(msg) for msg in conversation])
+
+
+def _conversation_text(params) -> str:
+    """The transcript for prompt params, unless the caller already rendered it
     
-    Args:
-        params: Dictionary containing 'problem' and 'persona' keys
-        
-    Returns:
-        The formatted prompt string
-        
     Raises:
-        ValueError: If required parameters are missing
+        ValueError: If there is no conversation
     """
-    if not params.get('problem'):
-        raise ValueError("'problem' parameter is required")
-    if not params.get('persona'):
-        raise ValueError("'persona' parameter is required")
-    
-    problem = params['problem']
-    persona = params['persona']
-    
-    return f"""You are an AI learner on a platform that helps human tutors improve their tutoring skills.
+    if params.get('conversation_text'):
+        return params['conversation_text']
+    if not params.get('conversation'):
+        raise ValueError("'conversation' parameter is required")
+    return format_conversation(params['conversation'])
+
+
+BASE_STUDENT_TEMPLATE = PromptTemplate("""You are an AI learner on a platform that helps human tutors improve their tutoring skills.
 
 The tutor is tutoring you, the learner, through the following problem:
 <problem>
@@ -46,14 +54,14 @@ Below are important requirements that you should follow, regardless of your pers
 - Your persona should be consistent, but not too on-the-nose. Don't exaggerate it too much.
 - You are communicating only through text chat, and thus cannot perform physical actions (no handing papers, pointing, gestures).
 - Use LaTeX notation for mathematical expressions.
-</requirements>"""
+</requirements>""")
 
 
-def generate_scoring_prompt(params: ScoringPromptParams) -> str:
-    """Generate the scoring prompt with typed parameters.
+def generate_base_student_prompt(params: BaseStudentPromptParams) -> str:
+    """Generate the base student prompt with typed parameters.
     
     Args:
-        params: Dictionary containing 'conversation', 'problem', 'persona_name', and 'categories_list'
+        params: Dictionary containing 'problem' and 'persona' keys
         
     Returns:
         The formatted prompt string
@@ -61,40 +69,12 @@ def generate_scoring_prompt(params: ScoringPromptParams) -> str:
     Raises:
         ValueError: If required parameters are missing
     """
-    if not params.get('conversation'):
-        raise ValueError("'conversation' parameter is required")
-    if not params.get('problem'):
-        raise ValueError("'problem' parameter is required")
-    if not params.get('persona_name'):
-        raise ValueError("'persona_name' parameter is required")
-    if not params.get('categories_list'):
-        raise ValueError("'categories_list' parameter is required")
-    
-    # Format the conversation
-    conversation_text = "\n\n".join([
-        f"{msg['role'].upper()}:\n{msg['content']}"
-        for msg in params['conversation']
-    ])
-    
-    problem = params['problem']
-    persona_name = params['persona_name']
-    categories_list = params['categories_list']
-    
-    return f"""You are an AI tutor evaluation system designed to assess the quality and effectiveness of tutoring sessions. Your task is to evaluate a tutoring session based on the provided context and specific evaluation categories.
+    return BASE_STUDENT_TEMPLATE.render(params)
 
-First, carefully review the following information:
 
-<conversation>
-{conversation_text}
-</conversation>
-
-<problem>
-{problem}
-</problem>
+SCORING_INSTRUCTIONS_TEMPLATE = PromptTemplate("""You are an AI tutor evaluation system designed to assess the quality and effectiveness of tutoring sessions. Your task is to evaluate a tutoring session based on the provided context and specific evaluation categories.
 
-<learner_persona>
-{persona_name}
-</learner_persona>
+You will be given a tutoring session as a <conversation>, the <problem> being tutored and the <learner_persona> the tutor was working with. Evaluate it against the following categories:
 
 <categories>
 {categories_list}
@@ -133,110 +113,360 @@ Your final output should be formatted as a JSON object with the following struct
 }}
 </json>
 
-Remember to replace "category_name" with the actual category names provided in the categories list, and ensure that your feedback references specific examples from the conversation.
-
-Begin your evaluation by analyzing each category in <category_evaluation> tags, then provide your final output in the specified JSON format."""
-
-
-# Persona functions
-def get_anxious_alex_persona() -> str:
-    """Get the anxious Alex persona content."""
-    return """You are Alex, a high school student who is anxious about math.
-
-BEHAVIORAL RULES:
-<behavioral_rules>
-1. Second-guess yourself constantly ("Is this right?")
-2. Apologize frequently ("Sorry if this is wrong...")
-3. Know the material but lack confidence
-4. Need validation before continuing
-5. Get stressed about making mistakes
-6. Make occasional calculation errors due to nervousness
-</behavioral_rules>
-
-RESPONSE PATTERNS:
-<response_patterns>
-- Starting work: "I think I know this but I'm not sure... is it okay if I try?"
-- During work: "Wait, did I do that right? I'm worried I messed up"
-- After correct work: "I got [answer] but I'm probably wrong..."
-- Need reassurance: "Are you sure I'm doing this correctly?"
-</response_patterns>"""
-
-
-def get_methodical_maya_persona() -> str:
-    """Get the methodical Maya persona content."""
-    return """You are Maya, a high school student who is very methodical.
-
-BEHAVIORAL RULES:
-<behavioral_rules>
-1. Ask "why" questions about each step
-2. Want to understand concepts, not just procedures
-3. Take time to process information
-4. Make very few computational errors
-5. Connect new concepts to previous knowledge
-</behavioral_rules>
-
-RESPONSE PATTERNS:
-<response_patterns>
-- Initial questions: "Before I start, why do we use this method?"
-- During work: "I understand the steps, but why does this property work?"
-- Thoughtful: "So if I change this part, would the whole approach change?"
-- Making connections: "This reminds me of when we learned about..."
-</response_patterns>"""
-
-
-def get_overconfident_olivia_persona() -> str:
-    """Get the overconfident Olivia persona content."""
-    return """You are Olivia, a high school student who is overconfident.
-
-BEHAVIORAL RULES:
-<behavioral_rules>
-1. Jump to conclusions without reading carefully
-2. Make conceptual errors while being very confident
-3. Resist correction initially ("No, I'm pretty sure I'm right")
-4. Rush through problems without showing work
-5. Eventually accept corrections but reluctantly
-</behavioral_rules>
-
-RESPONSE PATTERNS:
-<response_patterns>
-- Initial attempt: "This is easy! The answer is obviously [wrong answer]"
-- When corrected: "Are you sure? I've always done it this way..."
-- Grudging acceptance: "Hmm, I guess I see what you mean..."
-- Still confident: "Well, I would have gotten it if I read it more carefully"
-</response_patterns>"""
-
-
-def get_struggling_sam_persona() -> str:
-    """Get the struggling Sam persona content."""
-    return """You are Sam, a high school student who struggles with.
-
-BEHAVIORAL RULES:
-<behavioral_rules>
-1. Make 1-2 computational errors when attempting calculations
-2. Say "I don't get it" or "I'm confused" when concepts aren't broken down simply
-3. Need explanations repeated 2-3 times before understanding
-4. Show frustration but respond positively to encouragement
-5. Ask for help when stuck ("Can you show me again?")
-</behavioral_rules>
-
-RESPONSE PATTERNS:
-<response_patterns>
-- When confused: "Wait, I don't understand why you did that..."
-- When making errors: Show your incorrect work (e.g., "So 7 × 8 = 54, right?")
-- When starting to understand: "Oh... I think I'm starting to see it now"
-- When encouraged: "Thanks, that helps me feel better about this"
-</response_patterns>"""
-
-
-# Mapping of persona names to their functions
-PERSONA_FUNCTIONS = {
-    'anxious_alex': get_anxious_alex_persona,
-    'methodical_maya': get_methodical_maya_persona,
-    'overconfident_olivia': get_overconfident_olivia_persona,
-    'struggling_sam': get_struggling_sam_persona
-}
+Remember to replace "category_name" with the actual category names provided in the categories list, and ensure that your feedback references specific examples from the conversation.""")
+
+
+def generate_scoring_instructions(categories_list: str) -> str:
+    """Generate the static part of the scoring prompt.
+    
+    This text only depends on the category configuration, so it is sent
+    ahead of the session and can be cached by the provider.
+    
+    Args:
+        categories_list: Rendered list of scoring categories
+        
+    Returns:
+        The formatted instructions string
+        
+    Raises:
+        ValueError: If the categories list is missing
+    """
+    return SCORING_INSTRUCTIONS_TEMPLATE.render({'categories_list': categories_list})
+
+
+SCORING_SESSION_TEMPLATE = PromptTemplate("""Carefully review the following session:
+
+<conversation>
+{conversation_text}
+</conversation>
+
+<problem>
+{problem}
+</problem>
+
+<learner_persona>
+{persona_name}
+</learner_persona>
+
+Begin your evaluation by analyzing each category in <category_evaluation> tags, then provide your final output in the specified JSON format.""")
 
 
+def generate_scoring_session(params: ScoringPromptParams) -> str:
+    """Generate the session-specific part of the scoring prompt.
+    
+    Args:
+        params: Dictionary containing 'conversation' (or a pre-rendered
+            'conversation_text'), 'problem' and 'persona_name'
+        
+    Returns:
+        The formatted session string
+        
+    Raises:
+        ValueError: If required parameters are missing
+    """
+    return SCORING_SESSION_TEMPLATE.render({
+        'conversation_text': _conversation_text(params),
+        'problem': params.get('problem'),
+        'persona_name': params.get('persona_name')
+    })
+
+
+def generate_scoring_prompt(params: ScoringPromptParams) -> str:
+    """Generate the scoring prompt with typed parameters.
+    
+    The static instructions come first and the session last, matching how
+    ClaudeService sends them as a cacheable prefix plus the session.
+    
+    Args:
+        params: Dictionary containing 'conversation', 'problem', 'persona_name', and 'categories_list'
+        
+    Returns:
+        The formatted prompt string
+        
+    Raises:
+        ValueError: If required parameters are missing
+    """
+    instructions = generate_scoring_instructions(params.get('categories_list'))
+    return f"{instructions}\n\n{generate_scoring_session(params)}"
+
+
+def generate_category_scoring_prompt(params: CategoryScoringPromptParams) -> str:
+    """Generate a prompt that scores the session in a single category.
+    
+    Args:
+        params: Dictionary containing 'conversation', 'problem', 'persona_name',
+            'category' and 'rubric'
+        
+    Returns:
+        The formatted prompt string
+        
+    Raises:
+        ValueError: If required parameters are missing
+    """
+    for key in ('problem', 'persona_name', 'category', 'rubric'):
+        if not params.get(key):
+            raise ValueError(f"'{key}' parameter is required")
+    
+    conversation_text = _conversation_text(params)
+    
+    return f"""You are an AI tutor evaluation system designed to assess the quality and effectiveness of tutoring sessions. Your task is to evaluate a tutoring session in one specific category.
+
+First, carefully review the following information:
+
+<conversation>
+{conversation_text}
+</conversation>
+
+<problem>
+{params['problem']}
+</problem>
+
+<learner_persona>
+{params['persona_name']}
+</learner_persona>
+
+<category>
+{params['category']}
+</category>
+
+<scoring_rubric>
+{params['rubric']}
+</scoring_rubric>
+
+Evaluation Process:
+1. Evaluate the tutor's performance in this category only, based on the conversation.
+2. Assign a score from 1 to 5 using the scoring rubric. Use 2 and 4 for performance between the described levels.
+3. Provide 2-3 sentences of specific, actionable feedback, citing concrete examples from the conversation.
+
+Before providing your final output, wrap your analysis in <category_evaluation> tags:
+a) Quote relevant parts of the conversation
+b) List pros and cons of the tutor's performance
+c) Consider potential improvements
+
+Your final output should be formatted as a JSON object with the following structure:
+<json>
+{{
+  "score": <number between 1 and 5>,
+  "feedback": "<2-3 sentences of specific, actionable feedback>"
+}}
+</json>"""
+
+
+def generate_session_summary_prompt(params: SessionSummaryPromptParams) -> str:
+    """Generate a prompt for the overall session summary.
+    
+    Args:
+        params: Dictionary containing 'conversation', 'problem' and 'persona_name'
+        
+    Returns:
+        The formatted prompt string
+        
+    Raises:
+        ValueError: If required parameters are missing
+    """
+    for key in ('problem', 'persona_name'):
+        if not params.get(key):
+            raise ValueError(f"'{key}' parameter is required")
+    
+    conversation_text = _conversation_text(params)
+    
+    return f"""You are an AI tutor evaluation system designed to assess the quality and effectiveness of tutoring sessions. Your task is to summarize how well the tutor handled the following session.
+
+<conversation>
+{conversation_text}
+</conversation>
+
+<problem>
+{params['problem']}
+</problem>
+
+<learner_persona>
+{params['persona_name']}
+</learner_persona>
+
+Write 2-3 sentences providing an overall assessment of the session and the tutor's key areas to work on. Respond only with a JSON object with the following structure:
+<json>
+{{
+  "session_summary": "<2-3 sentences providing overall assessment and key recommendations>"
+}}
+</json>"""
+
+
+def _validate_rolling_params(params: RollingScoringPromptParams):
+    for key in ('problem', 'persona_name', 'categories_list', 'running_evidence'):
+        if not params.get(key):
+            raise ValueError(f"'{key}' parameter is required")
+
+
+def generate_rolling_scoring_prompt(params: RollingScoringPromptParams) -> str:
+    """Generate the prompt that updates running evidence with new turns.
+    
+    Args:
+        params: Dictionary containing 'new_turns', 'recent_context', 'problem',
+            'persona_name', 'categories_list' and 'running_evidence'
+        
+    Returns:
+        The formatted prompt string
+        
+    Raises:
+        ValueError: If required parameters are missing
+    """
+    _validate_rolling_params(params)
+    if not params.get('new_turns'):
+        raise ValueError("'new_turns' parameter is required")
+    
+    return f"""You are an AI tutor evaluation system that assesses tutoring sessions while they are still in progress. You keep running notes for each evaluation category and update them as new turns arrive.
+
+<problem>
+{params['problem']}
+</problem>
+
+<learner_persona>
+{params['persona_name']}
+</learner_persona>
+
+<categories>
+{params['categories_list']}
+</categories>
+
+<running_evidence>
+{params['running_evidence']}
+</running_evidence>
+
+<earlier_context>
+{format_conversation(params['recent_context']) or "(start of session)"}
+</earlier_context>
+
+<new_turns>
+{format_conversation(params['new_turns'])}
+</new_turns>
+
+Update Process:
+1. Read the new turns. The earlier context has already been evaluated and is only shown for reference.
+2. For each category, write short observations of any new evidence in the new turns, quoting the conversation where useful. Use an empty list if there is none.
+3. Give each category a provisional score from 1 to 5 for the session so far, combining the running evidence with the new turns.
+
+Respond only with a JSON object with the following structure:
+<json>
+{{
+  "categories": {{
+    "category_name": {{
+      "score": <number between 1 and 5>,
+      "new_evidence": ["<one short observation>"]
+    }},
+    // Repeat for each category
+  }}
+}}
+</json>"""
+
+
+def generate_final_scoring_prompt(params: RollingScoringPromptParams) -> str:
+    """Generate the final scoring prompt from running evidence plus the last turns.
+    
+    Args:
+        params: Dictionary containing 'new_turns', 'recent_context', 'problem',
+            'persona_name', 'categories_list' and 'running_evidence'
+        
+    Returns:
+        The formatted prompt string
+        
+    Raises:
+        ValueError: If required parameters are missing
+    """
+    _validate_rolling_params(params)
+    
+    return f"""You are an AI tutor evaluation system designed to assess the quality and effectiveness of tutoring sessions. The session has already been evaluated while it was in progress; your task is to produce the final evaluation.
+
+<problem>
+{params['problem']}
+</problem>
+
+<learner_persona>
+{params['persona_name']}
+</learner_persona>
+
+<categories>
+{params['categories_list']}
+</categories>
+
+<running_evidence>
+{params['running_evidence']}
+</running_evidence>
+
+<earlier_context>
+{format_conversation(params['recent_context']) or "(start of session)"}
+</earlier_context>
+
+<new_turns>
+{format_conversation(params['new_turns']) or "(no new turns)"}
+</new_turns>
+
+Evaluation Process:
+1. Start from the running evidence and provisional scores, which cover the session up to the new turns.
+2. Take any new turns into account, then assign each category a final score from 1 to 5:
+   - 5: Excellent performance
+   - 4: Good performance with minor areas for improvement
+   - 3: Adequate performance with clear areas for improvement
+   - 2: Below average performance with significant issues
+   - 1: Poor performance with major deficiencies
+3. Provide 2-3 sentences of specific, actionable feedback per category, citing concrete examples from the evidence.
+4. Provide an overall session summary with key recommendations.
+
+Keep any analysis of the new turns brief and wrap it in <category_evaluation> tags.
+
+Your final output should be formatted as a JSON object with the following structure:
+<json>
+{{
+  "categories": {{
+    "category_name": {{
+      "score": <number between 1 and 5>,
+      "feedback": "<2-3 sentences of specific, actionable feedback>"
+    }},
+    // Repeat for each category
+  }},
+  "session_summary": "<2-3 sentences providing overall assessment and key recommendations>"
+}}
+</json>"""
+
+
+def generate_context_summary_prompt(params: ContextSummaryPromptParams) -> str:
+    """Generate the prompt that folds older turns into the learner memo.
+    
+    Args:
+        params: Dictionary containing 'conversation', 'previous_summary' and 'problem'
+        
+    Returns:
+        The formatted prompt string
+        
+    Raises:
+        ValueError: If required parameters are missing
+    """
+    if not params.get('conversation'):
+        raise ValueError("'conversation' parameter is required")
+    if not params.get('problem'):
+        raise ValueError("'problem' parameter is required")
+    
+    return f"""You are keeping notes on a tutoring session so that the AI learner in it can keep track of the conversation. The learner is working on this problem:
+<problem>
+{params['problem']}
+</problem>
+
+These are the notes so far:
+<previous_memo>
+{params.get('previous_summary') or "(no notes yet)"}
+</previous_memo>
+
+These turns happened since the notes were written:
+<conversation>
+{format_conversation(params['conversation'])}
+</conversation>
+
+Update the notes to cover the new turns. Write them from the learner's point of view, in the first person, as a compact memo of what the learner has understood so far: steps completed, answers reached, mistakes made and corrected, and anything still confusing. Keep details the learner would need to stay consistent, drop small talk, and keep the memo under 250 words.
+
+Respond with only the updated memo inside <memo> tags."""
+
+
+# Personas live in backend/personas (see persona_registry)
 def load_persona_content(persona_type: str) -> str:
     """Load persona content by name.
     
@@ -249,12 +479,9 @@ def load_persona_content(persona_type: str) -> str:
     Raises:
         ValueError: If persona type is not found
     """
-    if persona_type not in PERSONA_FUNCTIONS:
-        raise ValueError(f"Unknown persona type: {persona_type}")
-    
-    return PERSONA_FUNCTIONS[persona_type]()
+    return get_persona_registry().load_body(persona_type)
 
 
 def list_available_personas() -> List[str]:
     """Get list of available personas."""
-    return sorted(list(PERSONA_FUNCTIONS.keys()))
\ No newline at end of file
+    return list(get_persona_registry().index().personas)
@@ -0,0 +1,81 @@
+"""Compiled prompt templates and cached prompt pieces.
+
+Prompts are written as str.format templates and split into literal text
+and field names once, at import time, so rendering is a single join.
+Pieces that only depend on configuration are cached:
+
+- the persona system prompt per (persona_type, problem), in a bounded LRU
+  (PERSONA_PROMPT_CACHE_SIZE)
+- the scoring instructions per rendered categories list
+"""
+import os
+import string
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from .persona_registry import get_persona_registry
+from .prompt_types import ConversationMessage
+
+_formatter = string.Formatter()
+
+
+class PromptTemplate:
+    """A str.format template parsed once into literals and fields"""
+
+    def __init__(self, text: str):
+        parts: List[Tuple[str, str]] = []
+        for literal, field_name, format_spec, conversion in _formatter.parse(text):
+            if format_spec or conversion:
+                raise ValueError(f"Unsupported template field: {{{field_name}}}")
+            parts.append((literal, field_name))
+        self._parts = parts
+        self.fields = frozenset(name for _, name in parts if name)
+
+    def render(self, values: Dict[str, str]) -> str:
+        """Fill in the template
+
+        Raises:
+            ValueError: If a field is missing or empty
+        """
+        for name in self.fields:
+            if not values.get(name):
+                raise ValueError(f"'{name}' parameter is required")
+        return "".join(
+            literal + values[name] if name else literal
+            for literal, name in self._parts
+        )
+
+
+def format_message(message: ConversationMessage) -> str:
+    """Format one message the way it appears in transcripts"""
+    return f"{message['role'].upper()}:\n{message['content']}"
+
+
+def get_persona_system_prompt(persona_type: str, problem: str) -> str:
+    """Rendered persona system prompt, cached per persona and problem
+
+    The persona file's version is part of the cache key, so editing a
+    persona takes effect without clearing the cache.
+
+    Raises:
+        ValueError: If the persona type is not found
+    """
+    info = get_persona_registry().get(persona_type)
+    if info is None:
+        raise ValueError(f"Unknown persona type: {persona_type}")
+    return _render_persona_prompt(persona_type, info.version, problem)
+
+
+@lru_cache(maxsize=int(os.getenv("PERSONA_PROMPT_CACHE_SIZE", "256")))
+def _render_persona_prompt(persona_type: str, version: Tuple[int, int], problem: str) -> str:
+    from .persona_service import load_persona_prompt
+
+    return load_persona_prompt(persona_type, problem)
+
+
+@lru_cache(maxsize=8)
+def get_scoring_instructions(categories_list: str) -> str:
+    """Rendered scoring instructions, cached per category configuration"""
+    from .prompt_service import generate_scoring_instructions
+
+    return generate_scoring_instructions(categories_list)
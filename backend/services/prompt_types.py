@@ -14,9 +14,51 @@ class BaseStudentPromptParams(TypedDict):
     persona: str
 
 
-class ScoringPromptParams(TypedDict):
+class RenderedConversation(TypedDict, total=False):
+    """Optional pre-rendered transcript, used instead of 'conversation'.
+    
+    Lets callers that send one session in several prompts render it once
+    (see ClaudeService._get_session_scores_parallel).
+    """
+    conversation_text: str
+
+
+class ScoringPromptParams(RenderedConversation):
     """Parameters for the scoring prompt."""
     conversation: List[ConversationMessage]
     problem: str
     persona_name: str
-    categories_list: str
\ No newline at end of file
+    categories_list: str
+
+
+class CategoryScoringPromptParams(RenderedConversation):
+    """Parameters for the single-category scoring prompt."""
+    conversation: List[ConversationMessage]
+    problem: str
+    persona_name: str
+    category: str
+    rubric: str
+
+
+class SessionSummaryPromptParams(RenderedConversation):
+    """Parameters for the session summary prompt."""
+    conversation: List[ConversationMessage]
+    problem: str
+    persona_name: str
+
+
+class RollingScoringPromptParams(TypedDict):
+    """Parameters for the in-session and final rolling scoring prompts."""
+    new_turns: List[ConversationMessage]
+    recent_context: List[ConversationMessage]
+    problem: str
+    persona_name: str
+    categories_list: str
+    running_evidence: str
+
+
+class ContextSummaryPromptParams(TypedDict):
+    """Parameters for the context memo prompt."""
+    conversation: List[ConversationMessage]
+    previous_summary: str
+    problem: str
@@ -0,0 +1,350 @@
+"""Offline re-scoring of stored sessions.
+
+Changing config/scoring_categories.json or the scoring prompt leaves past
+scores out of date. BatchRescorer walks the ended sessions in the session
+store and scores each one again:
+
+- sessions are read page by page in (created_at, id) order, never all at
+  once, and handed to a fixed pool of workers through a bounded queue,
+- workers start scoring requests no faster than `requests_per_minute` and
+  retry a failed session with backoff before giving up on it,
+- results are written back in batches (SessionStore.save_scores), tagged
+  with a fingerprint of the scoring configuration, and sessions already
+  scored with the current fingerprint are skipped; each tutor's progress
+  aggregates and the cohort rollups then swap the old scores for the new
+  ones,
+- a checkpoint file records the position up to which every session is
+  written, plus running totals, so a crashed run resumes where it stopped.
+
+Each run ends with a report of throughput, token usage and cost, and
+failures.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
+
+import anthropic
+
+from .admission_service import ServiceUnavailableError
+from .analytics_service import rollup_deltas
+from .claude_service import SCORING_MODEL, ClaudeService
+from .metrics_service import get_metrics_snapshot, increment
+from .progress_service import apply_scores
+from .prompt_service import (
+    generate_category_scoring_prompt,
+    generate_final_scoring_prompt,
+    generate_scoring_prompt,
+    generate_session_summary_prompt
+)
+from .scoring_service import format_running_evidence, generate_categories_list, get_category_registry
+from .session_store import SessionCursor, SessionStore, session_cursor
+
+DEFAULT_CHECKPOINT_PATH = Path(__file__).parent.parent / "data" / "rescore_checkpoint.json"
+
+# Claude Sonnet 4 pricing, in dollars per token
+PRICE_PER_TOKEN = {
+    "input": 3.00 / 1_000_000,
+    "output": 15.00 / 1_000_000,
+    "cache_read_input": 0.30 / 1_000_000,
+    "cache_creation_input": 3.75 / 1_000_000
+}
+
+# Sessions whose latest failure is kept in the checkpoint and the report
+MAX_REPORTED_FAILURES = 100
+
+_PROBE_CONVERSATION = [{"role": "tutor", "content": "probe"}, {"role": "learner", "content": "probe"}]
+
+
+def scoring_fingerprint(mode: str) -> str:
+    """Identify the scoring configuration: model, mode, categories and prompts
+
+    The prompts are rendered for a fixed probe session, so any change to the
+    categories, rubrics or prompt templates changes the fingerprint.
+    """
+    return _scoring_fingerprint(mode, get_category_registry().etag)
+
+
+@lru_cache(maxsize=16)
+def _scoring_fingerprint(mode: str, categories_etag: str) -> str:
+    base = {"conversation": _PROBE_CONVERSATION, "problem": "probe", "persona_name": "Probe"}
+    prompts = [SCORING_MODEL, mode]
+    if mode == "parallel":
+        prompts.extend(
+            generate_category_scoring_prompt({**base, "category": category.prompt_line, "rubric": category.rubric_text})
+            for category in get_category_registry().categories
+        )
+        prompts.append(generate_session_summary_prompt(base))
+    else:
+        prompts.append(generate_scoring_prompt({**base, "categories_list": generate_categories_list()}))
+    return hashlib.sha256("\0".join(prompts).encode("utf-8")).hexdigest()[:16]
+
+
+def rolling_scoring_fingerprint() -> str:
+    """Identify the configuration that finalizes scores from running evidence
+
+    Like `scoring_fingerprint`, but for the final prompt of sessions that
+    were evaluated while live (see rolling_scoring_service).
+    """
+    return _rolling_scoring_fingerprint(get_category_registry().etag)
+
+
+@lru_cache(maxsize=16)
+def _rolling_scoring_fingerprint(categories_etag: str) -> str:
+    prompt = generate_final_scoring_prompt({
+        "new_turns": _PROBE_CONVERSATION,
+        "recent_context": [],
+        "problem": "probe",
+        "persona_name": "Probe",
+        "categories_list": generate_categories_list(),
+        "running_evidence": format_running_evidence({})
+    })
+    return hashlib.sha256(f"{SCORING_MODEL}\0rolling\0{prompt}".encode("utf-8")).hexdigest()[:16]
+
+
+class RateLimiter:
+    """Space out request starts evenly to stay under a per-minute rate"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        await asyncio.sleep(start - now)
+
+
+class BatchRescorer:
+    def __init__(
+        self,
+        store: SessionStore,
+        claude_service: ClaudeService,
+        checkpoint_path: Path = DEFAULT_CHECKPOINT_PATH,
+        concurrency: int = 8,
+        requests_per_minute: float = 50,
+        page_size: int = 100,
+        write_batch_size: int = 50,
+        max_attempts: int = 3,
+        mode: Optional[str] = None,
+        limit: Optional[int] = None
+    ):
+        """
+        Args:
+            store: Where sessions are read from and scores written back
+            checkpoint_path: Progress file; the run resumes from it if it
+                was written for the same scoring configuration
+            requests_per_minute: Upper bound on scoring requests started;
+                in parallel mode each session makes one per category plus one
+            limit: Stop after sending this many sessions for scoring
+        """
+        self.store = store
+        self.claude_service = claude_service
+        self.checkpoint_path = Path(checkpoint_path)
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.write_batch_size = write_batch_size
+        self.max_attempts = max_attempts
+        self.mode = mode or claude_service.scoring_mode
+        self.limit = limit
+        self.fingerprint = scoring_fingerprint(self.mode)
+
+        requests_per_session = len(get_category_registry().keys) + 1 if self.mode == "parallel" else 1
+        self._rate_limiter = RateLimiter(requests_per_minute / requests_per_session)
+        self._checkpoint = self._load_checkpoint()
+        # session id -> cursor of every session read but not yet written, in read order
+        self._unwritten: "OrderedDict[str, SessionCursor]" = OrderedDict()
+        self._written: set = set()
+        self._results: Dict[str, dict] = {}
+        # Scored sessions waiting to be written, with the scores they had
+        self._scored: Dict[str, tuple] = {}
+        self._write_lock = asyncio.Lock()
+        self._queued = 0
+
+    async def run(self) -> dict:
+        """Re-score every ended session not yet scored with the current configuration
+
+        Returns:
+            The report (see `format_report`)
+        """
+        totals = self._checkpoint["totals"]
+        counters_before = get_metrics_snapshot()["counters"]
+        start = time.perf_counter()
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        tasks = [asyncio.create_task(self._read_sessions(queue))]
+        tasks.extend(asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency))
+        try:
+            # Stop everything as soon as any task fails
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            counters_after = get_metrics_snapshot()["counters"]
+            for kind in PRICE_PER_TOKEN:
+                name = f"scoring_{kind}_tokens"
+                totals[f"{kind}_tokens"] += counters_after.get(name, 0) - counters_before.get(name, 0)
+            totals["elapsed_seconds"] += time.perf_counter() - start
+            # Whatever was scored before a crash or interrupt is kept
+            await self._flush()
+        return self.report()
+
+    async def _read_sessions(self, queue: asyncio.Queue):
+        """Queue the sessions to score, then one stop marker per worker"""
+        totals = self._checkpoint["totals"]
+        after = tuple(self._checkpoint["cursor"]) if self._checkpoint["cursor"] else None
+        async for session in self.store.iter_ended(after=after, page_size=self.page_size):
+            if self.limit is not None and self._queued >= self.limit:
+                break
+            self._unwritten[session["id"]] = session_cursor(session)
+            if (session.get("scores") or {}).get("fingerprint") == self.fingerprint or not session["messages"]:
+                totals["skipped"] += 1
+                self._written.add(session["id"])
+                continue
+            await queue.put(session)
+            self._queued += 1
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    def report(self) -> dict:
+        totals = self._checkpoint["totals"]
+        elapsed = totals["elapsed_seconds"]
+        return {
+            "fingerprint": self.fingerprint,
+            "scored": totals["scored"],
+            "skipped": totals["skipped"],
+            "failed": totals["failed"],
+            "retries": totals["retries"],
+            "elapsed_seconds": round(elapsed, 2),
+            "sessions_per_minute": round(totals["scored"] / elapsed * 60, 1) if elapsed else 0.0,
+            "tokens": {kind: totals[f"{kind}_tokens"] for kind in PRICE_PER_TOKEN},
+            "cost_usd": round(sum(totals[f"{kind}_tokens"] * price for kind, price in PRICE_PER_TOKEN.items()), 4),
+            "failures": self._checkpoint["failures"]
+        }
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            session = await queue.get()
+            if session is None:
+                return
+            previous = session.get("scores")
+            scores = await self._score(session)
+            if scores is not None:
+                self._results[session["id"]] = scores
+                self._scored[session["id"]] = (session, previous)
+            if len(self._results) >= self.write_batch_size:
+                await self._flush()
+
+    async def _score(self, session: dict) -> Optional[dict]:
+        """Score one session, retrying with backoff; None if every attempt failed"""
+        totals = self._checkpoint["totals"]
+        for attempt in range(self.max_attempts):
+            await self._rate_limiter.acquire()
+            try:
+                result = await self.claude_service.get_session_scores(
+                    conversation_history=session["messages"],
+                    persona_type=session["persona_type"],
+                    problem=session["problem"],
+                    mode=self.mode
+                )
+            except (anthropic.APIError, ServiceUnavailableError, ValueError) as e:
+                if attempt + 1 < self.max_attempts:
+                    totals["retries"] += 1
+                    increment("rescore_retries")
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                    continue
+                print(f"Re-scoring session {session['id']} failed: {e}")
+                totals["failed"] += 1
+                increment("rescore_failures")
+                failures = self._checkpoint["failures"]
+                failures.append({"session_id": session["id"], "error": str(e)})
+                del failures[:-MAX_REPORTED_FAILURES]
+                self._written.add(session["id"])
+                return None
+            return {**result, "fingerprint": self.fingerprint, "scored_at": datetime.now().isoformat()}
+
+    async def _flush(self):
+        """Write collected scores in one batch and move the checkpoint forward"""
+        async with self._write_lock:
+            results, self._results = self._results, {}
+            scored, self._scored = self._scored, {}
+            if results:
+                await self.store.save_scores(results)
+                deltas = []
+                for session_id, scores in results.items():
+                    session, previous = scored[session_id]
+                    await self.store.update_tutor_progress(
+                        session["tutor_name"],
+                        lambda progress: apply_scores(progress, session, scores, previous)
+                    )
+                    deltas.extend(rollup_deltas(session, scores, previous))
+                # One write for the whole batch
+                await self.store.update_rollups(deltas)
+                self._checkpoint["totals"]["scored"] += len(results)
+                increment("rescore_sessions_scored", len(results))
+                self._written.update(results)
+
+            # The cursor only passes sessions that are written (or skipped or
+            # failed), so sessions in flight are read again after a crash
+            cursor = None
+            while self._unwritten:
+                session_id = next(iter(self._unwritten))
+                if session_id not in self._written:
+                    break
+                cursor = self._unwritten.pop(session_id)
+                self._written.discard(session_id)
+            if cursor is not None:
+                self._checkpoint["cursor"] = list(cursor)
+            self._save_checkpoint()
+
+    def _load_checkpoint(self) -> dict:
+        try:
+            checkpoint = json.loads(self.checkpoint_path.read_text())
+        except (OSError, ValueError):
+            checkpoint = None
+        if checkpoint is not None and checkpoint.get("fingerprint") == self.fingerprint:
+            print(f"Resuming re-scoring after {checkpoint['totals']['scored']} scored sessions")
+            return checkpoint
+        totals = {key: 0 for key in ("scored", "skipped", "failed", "retries")}
+        totals.update({f"{kind}_tokens": 0 for kind in PRICE_PER_TOKEN})
+        totals["elapsed_seconds"] = 0.0
+        return {"fingerprint": self.fingerprint, "cursor": None, "totals": totals, "failures": []}
+
+    def _save_checkpoint(self):
+        """Write the checkpoint atomically so a crash never leaves a partial file"""
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        self._checkpoint["updated_at"] = datetime.now().isoformat()
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self._checkpoint))
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+def format_report(report: dict) -> str:
+    """Human-readable summary of a re-scoring run"""
+    tokens = report["tokens"]
+    lines = [
+        f"Scoring configuration: {report['fingerprint']}",
+        f"Sessions scored: {report['scored']}, skipped: {report['skipped']}, "
+        f"failed: {report['failed']} ({report['retries']} retries)",
+        f"Elapsed: {report['elapsed_seconds']:.1f} s ({report['sessions_per_minute']:.1f} sessions/min)",
+        f"Tokens: {tokens['input']} input, {tokens['output']} output, "
+        f"{tokens['cache_read_input']} cache read, {tokens['cache_creation_input']} cache write",
+        f"Cost: ${report['cost_usd']:.4f}"
+    ]
+    for failure in report["failures"][:10]:
+        lines.append(f"  failed {failure['session_id']}: {failure['error']}")
+    return "\n".join(lines)
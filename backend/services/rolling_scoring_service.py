@@ -0,0 +1,146 @@
+"""Incremental scoring that runs in the background while a session is live.
+
+Every few turns the new messages are evaluated against the running
+per-category evidence kept on the session under "rolling_evaluation":
+
+    {
+        "evaluated_through": <number of messages covered>,
+        "categories": {key: {"score": <provisional score>, "evidence": [...]}}
+    }
+
+Ending the session then only needs a short pass over the turns after
+`evaluated_through` instead of re-reading the whole transcript.
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from .metrics_service import increment
+
+# Keep the most recent observations per category so prompts stay bounded
+MAX_EVIDENCE_PER_CATEGORY = 8
+
+_tasks: Dict[str, asyncio.Task] = {}
+
+# Persists changed session fields, e.g. SessionStore.update
+SessionUpdater = Callable[[str, dict], Awaitable[None]]
+
+# session id -> (latest session, claude service, on_update), evaluated once
+# the in-flight evaluation for the session finishes
+_followups: Dict[str, Tuple[dict, object, Optional[SessionUpdater]]] = {}
+
+
+def get_rolling_interval() -> int:
+    """Turns between background evaluations (0 disables rolling scoring)"""
+    return int(os.getenv("ROLLING_SCORING_INTERVAL", "2"))
+
+
+def schedule_rolling_evaluation(
+    session: dict,
+    claude_service,
+    on_update: Optional[SessionUpdater] = None
+) -> bool:
+    """Start a background evaluation if enough new turns have accumulated
+
+    An evaluation still running for an older transcript is left to finish:
+    cancelling it whenever the tutor is faster than the model would mean
+    nothing is ever recorded (and every cancelled call is still billed).
+    Instead the latest transcript is looked at again once it finishes. The
+    new running evidence is set on `session` and passed to `on_update`, if
+    given.
+
+    Returns:
+        True if a new evaluation was started
+    """
+    interval = get_rolling_interval()
+    if interval <= 0:
+        return False
+
+    task = _tasks.get(session["id"])
+    if task is not None and not task.done():
+        _followups[session["id"]] = (session, claude_service, on_update)
+        increment("rolling_scoring_deferred")
+        return False
+
+    state = session.get("rolling_evaluation") or {}
+    new_messages = len(session["messages"]) - state.get("evaluated_through", 0)
+    # A turn is one tutor message plus the learner's reply
+    if new_messages < interval * 2:
+        return False
+
+    _tasks[session["id"]] = asyncio.create_task(_evaluate(session, claude_service, on_update))
+    return True
+
+
+def cancel_rolling_evaluation(session_id: str):
+    """Cancel the in-flight evaluation for a session, if any"""
+    _followups.pop(session_id, None)
+    task = _tasks.pop(session_id, None)
+    if task is not None and not task.done():
+        task.cancel()
+        increment("rolling_scoring_cancelled")
+
+
+async def wait_for_rolling_evaluation(session_id: str):
+    """Wait for the evaluations of a session to finish, follow-ups included"""
+    task = _tasks.get(session_id)
+    while task is not None:
+        await asyncio.gather(task, return_exceptions=True)
+        following = _tasks.get(session_id)
+        task = following if following is not task else None
+
+
+async def _evaluate(session: dict, claude_service, on_update: Optional[SessionUpdater]):
+    try:
+        await _evaluate_once(session, claude_service, on_update)
+    finally:
+        if _tasks.get(session["id"]) is asyncio.current_task():
+            del _tasks[session["id"]]
+
+    followup = _followups.pop(session["id"], None)
+    if followup is None:
+        return
+    latest, claude_service, on_update = followup
+    # Turns may hand over a fresh copy of the session (the PostgreSQL store)
+    # that does not have the evidence just recorded yet
+    done = session.get("rolling_evaluation") or {}
+    if done.get("evaluated_through", 0) > (latest.get("rolling_evaluation") or {}).get("evaluated_through", 0):
+        latest["rolling_evaluation"] = done
+    schedule_rolling_evaluation(latest, claude_service, on_update)
+
+
+async def _evaluate_once(session: dict, claude_service, on_update: Optional[SessionUpdater]):
+    messages = list(session["messages"])
+    previous = session.get("rolling_evaluation")
+    try:
+        result = await claude_service.evaluate_new_turns(
+            conversation_history=messages,
+            persona_type=session["persona_type"],
+            problem=session["problem"],
+            rolling_evaluation=previous
+        )
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # The final pass falls back to whatever evidence we already have
+        print(f"Rolling evaluation failed for session {session['id']}: {e}")
+        increment("rolling_scoring_failed")
+        return
+
+    session["rolling_evaluation"] = merge_rolling_evaluation(previous, result, len(messages))
+    if on_update is not None:
+        await on_update(session["id"], {"rolling_evaluation": session["rolling_evaluation"]})
+    increment("rolling_scoring_updates")
+
+
+def merge_rolling_evaluation(previous: dict, result: dict, evaluated_through: int) -> dict:
+    """Fold a model update into the running per-category evidence"""
+    previous_categories = (previous or {}).get("categories", {})
+    categories = {}
+    for key, update in result["categories"].items():
+        evidence = previous_categories.get(key, {}).get("evidence", []) + list(update.get("new_evidence", []))
+        categories[key] = {
+            "score": update["score"],
+            "evidence": evidence[-MAX_EVIDENCE_PER_CATEGORY:]
+        }
+    return {"evaluated_through": evaluated_through, "categories": categories}
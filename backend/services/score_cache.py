@@ -0,0 +1,196 @@
+"""Scoring results cached by content, with single-flight deduplication.
+
+Scoring the same transcript twice (a double-clicked "End", a retried
+request) used to pay for and wait on two full Sonnet calls. Results are
+now cached under a hash of what determines them: the transcript, the
+persona, the problem and the scoring configuration fingerprint (model,
+mode, categories and prompts; see rescoring_service.scoring_fingerprint).
+A session finalized from running evidence gathered while it was live is
+keyed by that evidence and the final prompt's fingerprint as well, so it
+never shares a result with a full scoring pass.
+
+- Concurrent requests for the same key share one in-flight computation,
+  and each of them is told every category as it is scored, also the ones
+  scored before it joined.
+- Failures are not cached, so the next request tries again.
+- The cache is an LRU bounded by entries and by estimated bytes
+  (SCORE_CACHE_MAX_ENTRIES, SCORE_CACHE_MAX_BYTES).
+
+The cache is per process; with several workers each keeps its own.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .metrics_service import increment, set_gauge
+
+CategoryCallback = Callable[[str, Dict[str, Any]], None]
+
+
+def scoring_cache_key(
+    conversation_history: List[Dict[str, str]],
+    persona_type: str,
+    problem: str,
+    mode: str,
+    rolling_evaluation: Optional[Dict[str, Any]] = None
+) -> str:
+    """Content hash identifying a scoring result
+
+    Message timestamps are left out: the same words scored under the same
+    configuration give the same result.
+
+    Args:
+        rolling_evaluation: The running evidence scoring starts from, if any
+            (see ClaudeService.get_session_scores)
+    """
+    # Imported here so loading the cache does not load the Anthropic SDK
+    from .rescoring_service import rolling_scoring_fingerprint, scoring_fingerprint
+
+    rolling = None
+    if rolling_evaluation and rolling_evaluation.get("evaluated_through"):
+        rolling = [
+            rolling_scoring_fingerprint(),
+            rolling_evaluation["evaluated_through"],
+            rolling_evaluation.get("categories", {})
+        ]
+    content = json.dumps(
+        [
+            scoring_fingerprint(mode),
+            rolling,
+            persona_type,
+            problem,
+            [[message["sender"], message["content"]] for message in conversation_history]
+        ],
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ScoreCache:
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # key -> result, least recently used first
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self.resident_bytes = 0
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # key -> (categories scored so far, callbacks of the callers waiting)
+        self._partials: Dict[str, Tuple[Dict[str, Any], List[CategoryCallback]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Cached result, or None (a miss is only counted when computing)"""
+        result = self._entries.get(key)
+        if result is not None:
+            self._entries.move_to_end(key)
+            increment("score_cache_hits")
+        return result
+
+    def put(self, key: str, result: dict):
+        if key in self._entries:
+            self.resident_bytes -= self._sizes[key]
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        self._sizes[key] = len(json.dumps(result))
+        self.resident_bytes += self._sizes[key]
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self.resident_bytes > self.max_bytes
+        ):
+            evicted, _ = self._entries.popitem(last=False)
+            self.resident_bytes -= self._sizes.pop(evicted)
+            increment("score_cache_evictions")
+        set_gauge("score_cache_entries", len(self._entries))
+        set_gauge("score_cache_bytes", self.resident_bytes)
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[CategoryCallback], Awaitable[dict]],
+        on_category: Optional[CategoryCallback] = None
+    ) -> dict:
+        """Return the cached result, or compute it once for all concurrent callers
+
+        Args:
+            compute: Computes the result, reporting each category to the
+                callback it is given as soon as it is scored
+            on_category: Called with each category of the computation this
+                caller waits on, starting with those already scored
+
+        Raises:
+            Whatever `compute` raises, to every caller waiting on it
+        """
+        result = self.get(key)
+        if result is not None:
+            return result
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            increment("score_cache_coalesced")
+            scored, listeners = self._partials[key]
+            if on_category is not None:
+                for category_key, category in list(scored.items()):
+                    on_category(category_key, category)
+        else:
+            increment("score_cache_misses")
+            scored, listeners = self._partials[key] = ({}, [])
+
+            def report(category_key: str, category: Dict[str, Any]):
+                scored[category_key] = category
+                for listener in list(listeners):
+                    listener(category_key, category)
+
+            future = asyncio.ensure_future(compute(report))
+            self._in_flight[key] = future
+            # Cached even if every caller has given up by the time it finishes
+            future.add_done_callback(lambda done: self._finish(key, done))
+
+        if on_category is not None:
+            listeners.append(on_category)
+        try:
+            # Shielded so one caller giving up does not cancel the others
+            return await asyncio.shield(future)
+        finally:
+            if on_category is not None:
+                listeners.remove(on_category)
+
+    def _finish(self, key: str, future: asyncio.Future):
+        self._in_flight.pop(key, None)
+        self._partials.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self.put(key, future.result())
+
+    async def close(self):
+        """Cancel computations still in flight"""
+        futures = list(self._in_flight.values())
+        for future in futures:
+            future.cancel()
+        await asyncio.gather(*futures, return_exceptions=True)
+
+
+_score_cache: Optional[ScoreCache] = None
+
+
+def get_score_cache() -> ScoreCache:
+    """Get the process-wide scoring result cache, configured from the environment"""
+    global _score_cache
+    if _score_cache is None:
+        _score_cache = ScoreCache(
+            max_entries=int(os.getenv("SCORE_CACHE_MAX_ENTRIES", "1000")),
+            max_bytes=int(os.getenv("SCORE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        )
+    return _score_cache
+
+
+async def close_score_cache():
+    global _score_cache
+    if _score_cache is not None:
+        await _score_cache.close()
+        _score_cache = None
@@ -0,0 +1,352 @@
+"""Incremental parser for scoring responses.
+
+Scoring responses are a long analysis (<category_evaluation> sections)
+followed by the result inside <json> tags. ScoreStreamParser consumes a
+response as it streams in:
+
+- text inside <category_evaluation> sections is skipped without being kept
+  for parsing, so a <json> tag quoted in the analysis is ignored,
+- the first <json> tag after the analysis marks the start of the result,
+- the JSON object is scanned once, tracking only nesting and strings, so
+  parsing stays linear in the response length whatever the model writes,
+- each category is reported as soon as its object under "categories"
+  closes, and
+- the complete object is decoded with json.loads and checked against the
+  category schema.
+
+If the response has no usable <json> block, the raw response is searched
+once more for a bare `{"categories": ...}` object.
+"""
+import bisect
+import json
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+SEARCHING = "searching"
+ANALYSIS = "analysis"
+JSON_START = "json_start"
+IN_JSON = "in_json"
+DONE = "done"
+
+_TAG = re.compile(r"<(/?)(category_evaluation|json)>")
+# Text kept between chunks so a tag split across them is still found
+_TAG_OVERLAP = len("</category_evaluation>") - 1
+_STRING_RUN = re.compile(r'[^"\\]*')
+_STRUCTURE_RUN = re.compile(r'[^"{}\[\]]*')
+_BARE_RESULT = re.compile(r'\{\s*"categories"\s*:')
+
+MIN_SCORE = 1
+MAX_SCORE = 5
+
+DEFAULT_SESSION_SUMMARY = "Session completed."
+
+# (category key, {'score': ..., 'feedback': ...})
+CategoryScore = Tuple[str, Dict]
+
+
+class ScoreStreamParser:
+    """Find and parse the <json> result of a scoring response chunk by chunk
+
+    Usage:
+        parser = ScoreStreamParser(category_keys)
+        for chunk in chunks:
+            for key, category in parser.feed(chunk):
+                ...  # category scored
+        result = parser.finish()
+
+    Without category keys the parser extracts any JSON object from the
+    <json> block and skips schema validation.
+    """
+
+    def __init__(self, category_keys: Optional[Sequence[str]] = None, skip_analysis: bool = True):
+        self.category_keys = list(category_keys) if category_keys is not None else None
+        self.skip_analysis = skip_analysis
+
+        self._state = SEARCHING
+        self._raw: List[str] = []
+        # Text not yet searched for tags
+        self._pending = ""
+
+        # JSON text from its opening brace, with each part's start offset
+        self._parts: List[str] = []
+        self._part_starts: List[int] = []
+        self._size = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        # One (opening character, start offset, key) entry per open container
+        self._stack: List[Tuple[str, int, Optional[str]]] = []
+        # Last string seen directly inside the container at each depth
+        self._last_string: Dict[int, str] = {}
+        self._reported: Dict[str, Dict] = {}
+        self._result: Optional[Dict] = None
+        self._error: Optional[ValueError] = None
+
+    @property
+    def categories(self) -> Dict[str, Dict]:
+        """Categories reported so far"""
+        return dict(self._reported)
+
+    def feed(self, text: str) -> List[CategoryScore]:
+        """Consume the next chunk of the response
+
+        Returns:
+            Categories whose objects closed within this chunk
+        """
+        self._raw.append(text)
+        events: List[CategoryScore] = []
+        if self._state == IN_JSON:
+            self._scan(text, events)
+        elif self._state != DONE:
+            self._search(text, events)
+        return events
+
+    def finish(self) -> Dict:
+        """Return the parsed result once the whole response has been fed
+
+        Raises:
+            ValueError: If no complete JSON result is found, it is not valid
+                JSON, or it does not match the category schema
+        """
+        if self._result is None:
+            try:
+                self._result = self._fallback()
+            except ValueError:
+                # Report why the <json> block was rejected, if there was one
+                if self._error is not None:
+                    raise self._error
+                raise
+        if self.category_keys is None:
+            return self._result
+        return validate_session_scores(self._result, self.category_keys)
+
+    def _search(self, text: str, events: List[CategoryScore]):
+        """Look for the tags that open and close the analysis and the result"""
+        buffer = self._pending + text
+        position = 0
+        while self._state in (SEARCHING, ANALYSIS, JSON_START):
+            if self._state == JSON_START:
+                remainder = buffer[position:].lstrip()
+                if not remainder:
+                    self._pending = ""
+                    return
+                if remainder[0] == "{":
+                    self._state = IN_JSON
+                    self._scan(remainder, events)
+                    return
+                # A stray tag, not followed by the result
+                self._state = SEARCHING
+                position = len(buffer) - len(remainder)
+                continue
+
+            match = _TAG.search(buffer, position)
+            if match is None:
+                self._pending = buffer[max(position, len(buffer) - _TAG_OVERLAP):]
+                return
+            position = match.end()
+            closing, name = match.group(1), match.group(2)
+            if self._state == ANALYSIS:
+                if closing and name == "category_evaluation":
+                    self._state = SEARCHING
+            elif not closing:
+                if name == "json":
+                    self._state = JSON_START
+                elif self.skip_analysis:
+                    self._state = ANALYSIS
+
+    def _scan(self, text: str, events: List[CategoryScore]):
+        """Track strings and nesting through the JSON text"""
+        base = self._size
+        self._parts.append(text)
+        self._part_starts.append(base)
+        self._size += len(text)
+
+        i, n = 0, len(text)
+        while i < n:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                j = _STRING_RUN.match(text, i).end()
+                if j == n:
+                    return
+                if text[j] == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                    depth = len(self._stack)
+                    # Only keys of the root and of "categories" are needed
+                    if depth <= 2:
+                        self._last_string[depth] = _decode_string(self._slice(self._string_start, base + j + 1))
+                i = j + 1
+                continue
+
+            j = _STRUCTURE_RUN.match(text, i).end()
+            if j == n:
+                return
+            character = text[j]
+            position = base + j
+            if character == '"':
+                self._in_string = True
+                self._string_start = position
+            elif character in "{[":
+                key = self._last_string.get(len(self._stack)) if character == "{" else None
+                self._stack.append((character, position, key))
+            elif self._stack:
+                opening, start, key = self._stack.pop()
+                if not self._stack:
+                    self._complete(position + 1)
+                    return
+                if (
+                    opening == "{"
+                    and len(self._stack) == 2
+                    and self._stack[1][0] == "{"
+                    and self._stack[1][2] == "categories"
+                ):
+                    self._report(key, self._slice(start, position + 1), events)
+            i = j + 1
+
+    def _slice(self, start: int, end: int) -> str:
+        """JSON text between two offsets, which may span several chunks"""
+        first = bisect.bisect_right(self._part_starts, start) - 1
+        last = bisect.bisect_right(self._part_starts, end - 1) - 1
+        if first == last:
+            offset = self._part_starts[first]
+            return self._parts[first][start - offset:end - offset]
+        text = "".join(self._parts[first:last + 1])
+        offset = self._part_starts[first]
+        return text[start - offset:end - offset]
+
+    def _report(self, key: Optional[str], text: str, events: List[CategoryScore]):
+        if key is None or key in self._reported:
+            return
+        if self.category_keys is not None and key not in self.category_keys:
+            return
+        try:
+            category = _validate_category(key, json.loads(text))
+        except ValueError:
+            # Reported as part of the full result in finish()
+            return
+        self._reported[key] = category
+        events.append((key, category))
+
+    def _complete(self, end: int):
+        self._state = DONE
+        text = self._slice(0, end)
+        # Drop the scanning state; only the decoded result is needed now
+        self._parts, self._part_starts = [], []
+        try:
+            result = json.loads(text)
+        except ValueError as e:
+            self._error = ValueError(f"Invalid JSON in response: {e}")
+            return
+        if not isinstance(result, dict):
+            self._error = ValueError("Scoring result is not a JSON object")
+            return
+        self._result = result
+
+    def _fallback(self) -> Dict:
+        """Recover a result the streaming pass could not find"""
+        text = "".join(self._raw)
+        if self._state == IN_JSON:
+            raise ValueError("Incomplete JSON in response")
+        if self.skip_analysis and "<json>" in text:
+            # The analysis may not have been closed
+            parser = ScoreStreamParser(skip_analysis=False)
+            parser.feed(text)
+            if parser._result is not None:
+                return parser._result
+        match = _BARE_RESULT.search(text)
+        if match is None:
+            raise ValueError("No JSON found in response")
+        result, _ = json.JSONDecoder().raw_decode(text, match.start())
+        return result
+
+
+def _decode_string(literal: str) -> str:
+    """Decode a JSON string literal, keeping it raw if its escapes are invalid"""
+    try:
+        return json.loads(literal)
+    except ValueError:
+        # json.loads on the full result reports the error
+        return literal[1:-1]
+
+
+def _validate_category(key: str, category) -> Dict:
+    if not isinstance(category, dict):
+        raise ValueError(f"Invalid evaluation for category: {key}")
+    score = category.get("score")
+    if isinstance(score, bool) or not isinstance(score, (int, float)):
+        raise ValueError(f"Missing score for category: {key}")
+    if not MIN_SCORE <= score <= MAX_SCORE:
+        raise ValueError(f"Score out of range for category: {key}")
+    feedback = category.get("feedback")
+    if not isinstance(feedback, str):
+        raise ValueError(f"Missing feedback for category: {key}")
+    return {"score": score, "feedback": feedback}
+
+
+def validate_session_scores(result: Dict, category_keys: Sequence[str]) -> Dict:
+    """Check a scoring result against the category schema
+
+    Results in the old {"scores": ..., "feedback": ...} format are converted
+    to the nested one. Categories are returned in schema order; unknown
+    categories are dropped.
+
+    Returns:
+        {'categories': {key: {'score': ..., 'feedback': ...}}, 'session_summary': ...}
+
+    Raises:
+        ValueError: If a category is missing or its score or feedback is invalid
+    """
+    if "scores" in result and "feedback" in result:
+        result = _convert_old_format(result, category_keys)
+
+    categories = result.get("categories")
+    if not isinstance(categories, dict):
+        raise ValueError("Missing categories in scoring result")
+    validated = {}
+    for key in category_keys:
+        if key not in categories:
+            raise ValueError(f"Missing score for category: {key}")
+        validated[key] = _validate_category(key, categories[key])
+
+    summary = result.get("session_summary")
+    return {
+        "categories": validated,
+        "session_summary": summary if isinstance(summary, str) and summary else DEFAULT_SESSION_SUMMARY
+    }
+
+
+def _convert_old_format(result: Dict, category_keys: Sequence[str]) -> Dict:
+    old_scores = result.get("scores") or {}
+    old_feedback = result.get("feedback")
+    categories = {}
+    for key in category_keys:
+        if isinstance(old_feedback, dict):
+            feedback = old_feedback.get(key)
+        elif isinstance(old_feedback, str):
+            feedback = old_feedback
+        else:
+            raise ValueError("Invalid feedback format")
+        categories[key] = {"score": old_scores.get(key), "feedback": feedback}
+    return {"categories": categories, "session_summary": result.get("session_summary")}
+
+
+def parse_scoring_response(response_text: str, category_keys: Sequence[str]) -> Dict:
+    """Parse a complete scoring response (see ScoreStreamParser)"""
+    parser = ScoreStreamParser(category_keys)
+    parser.feed(response_text)
+    return parser.finish()
+
+
+def extract_json(response_text: str) -> Dict:
+    """Parse the JSON object inside the <json> tags of a response
+
+    Raises:
+        ValueError: If no JSON object is found or it is not valid JSON
+    """
+    parser = ScoreStreamParser()
+    parser.feed(response_text)
+    return parser.finish()
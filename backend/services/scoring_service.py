@@ -1,33 +1,177 @@
+"""Scoring categories, loaded from config/scoring_categories.json.
+
+The file is parsed and validated once into an immutable CategoryRegistry
+that also holds the forms callers need (key list, prompt block, API
+response and its ETag). The registry is rebuilt when the file's mtime or
+size changes and swapped in with a single assignment, so a request always
+works from one consistent snapshot.
+"""
+import hashlib
 import json
+import os
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 
-def get_scoring_categories() -> List[Dict[str, Any]]:
-    """Load scoring categories from configuration file"""
-    config_path = Path(__file__).parent.parent / "config" / "scoring_categories.json"
+CONFIG_PATH = Path(__file__).parent.parent / "config" / "scoring_categories.json"
+
+@dataclass(frozen=True)
+class ScoringCategory:
+    key: str
+    label: str
+    description: str = ""
+    scoring_rubric: Dict[str, str] = field(default_factory=dict)
+    # Prompt forms, rendered once at load time
+    prompt_line: str = ""
+    rubric_text: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The category as it appears in the configuration file"""
+        data: Dict[str, Any] = {"key": self.key, "label": self.label}
+        if self.description:
+            data["description"] = self.description
+        if self.scoring_rubric:
+            data["scoring_rubric"] = dict(self.scoring_rubric)
+        return data
+
+@dataclass(frozen=True)
+class CategoryRegistry:
+    categories: Tuple[ScoringCategory, ...]
+    keys: Tuple[str, ...]
+    categories_list: str
+    api_payload: bytes
+    etag: str
+    # (mtime_ns, size) of the file this was loaded from
+    version: Tuple[int, int]
+
+    def get(self, key: str) -> Optional[ScoringCategory]:
+        return next((category for category in self.categories if category.key == key), None)
+
+_registry: Optional[CategoryRegistry] = None
+# Version of a changed file that failed validation, so it is not re-parsed on every call
+_failed_version: Optional[Tuple[int, int]] = None
+_reload_lock = threading.Lock()
+
+def _parse_category(raw: Any, index: int) -> ScoringCategory:
+    if not isinstance(raw, dict):
+        raise ValueError(f"Category {index} is not an object")
+    key = raw.get('key')
+    if not isinstance(key, str) or not key.isidentifier():
+        raise ValueError(f"Category {index} needs a snake_case 'key'")
+    if not isinstance(raw.get('label'), str) or not raw['label']:
+        raise ValueError(f"Category '{key}' needs a 'label'")
+    description = raw.get('description', '')
+    if not isinstance(description, str):
+        raise ValueError(f"Category '{key}' has a non-text 'description'")
+    rubric = raw.get('scoring_rubric', {})
+    if not isinstance(rubric, dict) or not all(
+        str(score).isdigit() and isinstance(text, str) for score, text in rubric.items()
+    ):
+        raise ValueError(f"Category '{key}' needs a 'scoring_rubric' of score -> text")
+
+    return ScoringCategory(
+        key=key,
+        label=raw['label'],
+        description=description,
+        scoring_rubric={str(score): text for score, text in rubric.items()},
+        prompt_line=format_category(raw),
+        rubric_text=format_scoring_rubric(raw)
+    )
+
+def load_category_registry(path: Path = CONFIG_PATH) -> CategoryRegistry:
+    """Parse and validate a scoring categories file
     
-    with open(config_path, 'r') as f:
+    Raises:
+        ValueError: If the file has no categories or a category is malformed
+    """
+    stat = os.stat(path)
+    with open(path, 'r') as f:
         data = json.load(f)
-        categories = data.get('categories', [])
-        if not categories:
-            raise ValueError("No categories found in scoring configuration")
-        return categories
+    raw_categories = data.get('categories', [])
+    if not raw_categories:
+        raise ValueError("No categories found in scoring configuration")
+
+    categories = tuple(_parse_category(raw, index) for index, raw in enumerate(raw_categories))
+    keys = tuple(category.key for category in categories)
+    if len(set(keys)) != len(keys):
+        raise ValueError("Duplicate category keys in scoring configuration")
+
+    api_payload = json.dumps({"categories": [category.to_dict() for category in categories]}).encode("utf-8")
+    return CategoryRegistry(
+        categories=categories,
+        keys=keys,
+        categories_list="\n".join(f"- {category.prompt_line}" for category in categories),
+        api_payload=api_payload,
+        etag=f'"{hashlib.sha256(api_payload).hexdigest()[:16]}"',
+        version=(stat.st_mtime_ns, stat.st_size)
+    )
+
+def get_category_registry() -> CategoryRegistry:
+    """Get the current registry, reloading it if the file has changed
+    
+    If a changed file fails validation, the previous registry stays in use.
+    """
+    global _registry, _failed_version
+    registry = _registry
+    stat = os.stat(CONFIG_PATH)
+    version = (stat.st_mtime_ns, stat.st_size)
+    if registry is not None and version in (registry.version, _failed_version):
+        return registry
+
+    with _reload_lock:
+        # Another thread may have reloaded while we waited
+        registry = _registry
+        if registry is not None and version in (registry.version, _failed_version):
+            return registry
+        try:
+            _registry = load_category_registry(CONFIG_PATH)
+        except (ValueError, OSError) as e:
+            if registry is None:
+                raise
+            print(f"Keeping previous scoring categories, reload failed: {e}")
+            _failed_version = version
+            return registry
+        return _registry
+
+def get_scoring_categories() -> List[Dict[str, Any]]:
+    """Load scoring categories from configuration file"""
+    return [category.to_dict() for category in get_category_registry().categories]
 
 def get_category_keys() -> List[str]:
     """Get just the keys of all scoring categories"""
-    return [cat['key'] for cat in get_scoring_categories()]
+    return list(get_category_registry().keys)
 
 def generate_categories_list() -> str:
     """Generate a simple list of categories for evaluation"""
-    categories = get_scoring_categories()
-    category_lines = []
-    
-    for cat in categories:
-        # Include description if available
-        description = cat.get('description', '')
-        if description:
-            category_lines.append(f"- {cat['key']}: {cat['label']} - {description}")
-        else:
-            category_lines.append(f"- {cat['key']}: {cat['label']}")
+    return get_category_registry().categories_list
+
+def format_category(category: Dict[str, Any]) -> str:
+    """Format one category as a single line for evaluation prompts"""
+    description = category.get('description', '')
+    if description:
+        return f"{category['key']}: {category['label']} - {description}"
+    return f"{category['key']}: {category['label']}"
+
+def format_scoring_rubric(category: Dict[str, Any]) -> str:
+    """Format a category's scoring rubric, highest score first"""
+    rubric = category.get('scoring_rubric', {})
+    if not rubric:
+        return "5: Excellent performance\n3: Adequate performance\n1: Poor performance"
+    return "\n".join(
+        f"{score}: {rubric[score]}"
+        for score in sorted(rubric, key=int, reverse=True)
+    )
+
+def format_running_evidence(categories_state: Dict[str, Dict[str, Any]]) -> str:
+    """Format per-category provisional scores and evidence for scoring prompts"""
+    if not categories_state:
+        return "(no evidence yet)"
     
-    return "\n".join(category_lines)
\ No newline at end of file
+    sections = []
+    for key, state in categories_state.items():
+        evidence = state.get('evidence') or ["(no evidence yet)"]
+        lines = [f"{key} (provisional score {state['score']}):"]
+        lines.extend(f"- {item}" for item in evidence)
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
@@ -0,0 +1,240 @@
+"""WebSocket channel for sessions: framing, heartbeats and backpressure.
+
+A tutor's client keeps one WebSocket open instead of posting each turn.
+Every frame is a JSON object with a "type"; requests carry a client-chosen
+"id" that the server's frames for them repeat, so several requests (turns
+in different sessions, a scoring watch) can be in flight on one connection
+and their frames interleave. main.py handles the request types; this module
+runs the connection:
+
+- outgoing frames go through a bounded queue drained by one writer task. A
+  producer (a streaming reply, a scoring watch) waits while the queue is
+  full, so a client that reads slowly slows down its own replies instead of
+  growing the server's memory; one that accepts nothing for
+  WS_SEND_TIMEOUT_SECONDS is disconnected. Token frames of one reply that
+  queued up are sent as one, so a client that falls behind gets fewer,
+  larger frames,
+- at most WS_MAX_IN_FLIGHT requests run at once per connection; further
+  frames are not read until one finishes, so TCP pushes back on the client,
+- the server sends {"type": "ping"} every WS_HEARTBEAT_SECONDS and closes a
+  connection that sent nothing (a "pong" counts) for WS_IDLE_TIMEOUT_SECONDS.
+  A client "ping" is answered with a "pong".
+
+Requests still running when the connection closes finish without sending
+anything, so a turn that was started is stored and a reconnecting client
+gets it by resuming (see the "resume" request in main.py).
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from .metrics_service import increment, record_latency, set_gauge
+
+# Close codes (RFC 6455)
+NORMAL_CLOSURE = 1000
+GOING_AWAY = 1001
+TRY_AGAIN_LATER = 1013
+
+FrameHandler = Callable[[dict], Awaitable[None]]
+
+_open_channels = 0
+
+
+def error_frame(
+    request_id: Optional[str],
+    status: int,
+    detail: str,
+    retry_after: Optional[int] = None,
+    **fields
+) -> dict:
+    """An error answering a request, with the HTTP status it would have had"""
+    frame = {"type": "error", "id": request_id, "status": status, "detail": detail, **fields}
+    if retry_after is not None:
+        frame["retry_after"] = retry_after
+    return frame
+
+
+class SessionChannel:
+    def __init__(
+        self,
+        websocket: WebSocket,
+        heartbeat: float = 20,
+        idle_timeout: float = 60,
+        queue_frames: int = 256,
+        send_timeout: float = 10,
+        max_in_flight: int = 8
+    ):
+        self.websocket = websocket
+        self.heartbeat = heartbeat
+        self.idle_timeout = idle_timeout
+        self.queue_frames = queue_frames
+        self.send_timeout = send_timeout
+        self.closed = False
+        self.close_code = NORMAL_CLOSURE
+        self._outbox: deque = deque()
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tasks: set = set()
+
+    async def send(self, frame: dict):
+        """Queue a frame for the client, waiting while its queue is full
+
+        Frames sent after the connection closed are dropped.
+        """
+        while not self.closed and len(self._outbox) >= self.queue_frames:
+            increment("ws_send_waits")
+            self._space.clear()
+            try:
+                await asyncio.wait_for(self._space.wait(), self.send_timeout)
+            except asyncio.TimeoutError:
+                increment("ws_slow_consumers_closed")
+                self.close(TRY_AGAIN_LATER)
+        if self.closed:
+            return
+        self._outbox.append(frame)
+        self._ready.set()
+
+    def close(self, code: int = NORMAL_CLOSURE):
+        """Stop reading and sending; `serve` closes the socket"""
+        if not self.closed:
+            self.closed = True
+            self.close_code = code
+            self._closing.set()
+            # Wake producers waiting for room; their frames are dropped
+            self._space.set()
+
+    def lock(self, key: str) -> asyncio.Lock:
+        """A lock per key (a session id), so requests on it run in order"""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    async def serve(self, handle: FrameHandler):
+        """Accept the connection and run its requests until it closes
+
+        Args:
+            handle: Runs one request frame; its own task, so requests overlap
+        """
+        global _open_channels
+        await self.websocket.accept()
+        _open_channels += 1
+        set_gauge("ws_connections", _open_channels)
+        increment("ws_connections_opened")
+        writer = asyncio.create_task(self._write())
+        heartbeat = asyncio.create_task(self._heartbeat())
+        closing = asyncio.create_task(self._closing.wait())
+        try:
+            while not self.closed:
+                receive = asyncio.ensure_future(self.websocket.receive_text())
+                done, _ = await asyncio.wait({receive, closing}, timeout=self.idle_timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if receive not in done:
+                    receive.cancel()
+                    if not done:
+                        increment("ws_idle_closed")
+                        self.close(GOING_AWAY)
+                    break
+                try:
+                    text = receive.result()
+                except (WebSocketDisconnect, RuntimeError):
+                    self.close(GOING_AWAY)
+                    break
+                await self._dispatch(text, handle)
+        finally:
+            self.close()
+            heartbeat.cancel()
+            closing.cancel()
+            writer.cancel()
+            try:
+                await self.websocket.close(self.close_code)
+            except Exception:
+                # Already closed by the client
+                pass
+            _open_channels -= 1
+            set_gauge("ws_connections", _open_channels)
+
+    async def _dispatch(self, text: str, handle: FrameHandler):
+        try:
+            frame = json.loads(text)
+        except ValueError:
+            frame = None
+        if not isinstance(frame, dict):
+            await self.send(error_frame(None, 400, "Frames must be JSON objects"))
+            return
+        increment("ws_frames_received")
+        kind = frame.get("type")
+        if kind == "pong":
+            return
+        if kind == "ping":
+            await self.send({"type": "pong"})
+            return
+        # Waiting here stops reading the socket: backpressure on the client
+        await self._in_flight.acquire()
+        task = asyncio.create_task(self._run(frame, handle))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, frame: dict, handle: FrameHandler):
+        start = time.perf_counter()
+        try:
+            await handle(frame)
+        except Exception as e:
+            print(f"WebSocket request {frame.get('type')} failed: {e!r}")
+            await self.send(error_frame(frame.get("id"), 500, "Request failed"))
+        finally:
+            self._in_flight.release()
+            record_latency("ws_request", time.perf_counter() - start)
+
+    async def _write(self):
+        while True:
+            while not self._outbox:
+                self._ready.clear()
+                await self._ready.wait()
+            frame = self._outbox.popleft()
+            # Token frames of one reply that queued up behind a slow client
+            # (or a busy worker) go out as one
+            while frame.get("type") == "token" and self._outbox and _same_reply(frame, self._outbox[0]):
+                frame = {**frame, "text": frame["text"] + self._outbox.popleft()["text"]}
+                increment("ws_tokens_coalesced")
+            self._space.set()
+            try:
+                await self.websocket.send_text(json.dumps(frame))
+            except Exception:
+                # The client went away; the reader sees it too
+                self.close(GOING_AWAY)
+                return
+            increment("ws_frames_sent")
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            await self.send({"type": "ping", "time": time.time()})
+
+
+def _same_reply(frame: dict, other: dict) -> bool:
+    return (
+        other.get("type") == "token"
+        and other.get("id") == frame.get("id")
+        and other.get("session_id") == frame.get("session_id")
+    )
+
+
+def open_channel(websocket: WebSocket) -> SessionChannel:
+    """A channel for a new connection, configured from the environment"""
+    return SessionChannel(
+        websocket,
+        heartbeat=float(os.getenv("WS_HEARTBEAT_SECONDS", "20")),
+        idle_timeout=float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "60")),
+        queue_frames=int(os.getenv("WS_SEND_QUEUE_FRAMES", "256")),
+        send_timeout=float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10")),
+        max_in_flight=int(os.getenv("WS_MAX_IN_FLIGHT", "8"))
+    )
@@ -0,0 +1,293 @@
+"""Write-ahead log that lets the in-memory session store survive restarts.
+
+With SESSION_STORE=memory, every redeploy used to end every live tutoring
+conversation. With SESSION_WAL_DIR set, the store writes each change (a new
+session, appended messages, changed fields) to an append-only log before
+acknowledging it, and rebuilds its sessions from the log on startup:
+
+- group commit: changes that arrive while a write is in progress are
+  written and fsynced together by the next one, so concurrent turns share
+  one fsync instead of paying for one each,
+- snapshots: after SESSION_WAL_SNAPSHOT_BYTES of log, and on shutdown, the
+  store's state is written to a snapshot (as the records that recreate
+  it) and the log segments it covers are deleted, which bounds replay time,
+- replay: the newest complete snapshot, then every log segment written
+  since it began. Records are idempotent (appends carry the position they
+  were made at), so changes the snapshot already holds are skipped, and a
+  line torn by a crash mid-write ends that segment's replay.
+
+Files in the directory: `snapshot-<segment>.jsonl`, holding everything
+logged before segment `<segment>`, and `wal-<segment>.jsonl`; both have one
+record per line.
+
+Only one process may use a directory: the log locks it (see
+directory_lock) from recovery until it closes, so a second worker, or a
+maintenance script run against the memory store while the app is up,
+fails with DirectoryLockedError instead of interleaving its records. The
+directory must be on storage that outlives the process's container (on
+Railway, a mounted volume) for sessions to survive a redeploy; see
+`on_ephemeral_filesystem`.
+"""
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from .directory_lock import lock_directory, unlock_directory
+from .metrics_service import increment, record_latency
+
+# Returns the records that recreate the store's current state
+SnapshotSource = Callable[[], List[dict]]
+
+
+class SessionLog:
+    def __init__(self, directory: Path, fsync: bool = True, snapshot_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            directory: Where the log segments and snapshots are kept
+            fsync: Wait for each commit to reach the disk; without it a
+                commit survives a process crash but not a machine crash
+            snapshot_bytes: Log written before a new snapshot is taken
+        """
+        self.directory = Path(directory)
+        self.fsync = fsync
+        self.snapshot_bytes = snapshot_bytes
+        self.segment = 1
+        self.bytes_since_snapshot = 0
+
+        # (segment, encoded record) waiting for the next commit, and the
+        # futures of the writers waiting on it
+        self._pending: List[Tuple[int, bytes]] = []
+        self._waiters: List[asyncio.Future] = []
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._writer: Optional[asyncio.Task] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._snapshot_source: Optional[SnapshotSource] = None
+        self._file = None
+        self._file_segment = 0
+
+    def recover(self) -> Iterator[dict]:
+        """Read what the log holds; called once before `open`
+
+        Returns:
+            The records of the newest snapshot, then those logged since, to
+            apply in order
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock_directory(self.directory, self, "Session log")
+        for path in self.directory.glob("*.tmp"):
+            path.unlink(missing_ok=True)
+
+        base = 0
+        paths = []
+        snapshots = _numbered(self.directory, "snapshot")
+        if snapshots:
+            base, path = snapshots[-1]
+            paths.append(path)
+        segments = [(number, path) for number, path in _numbered(self.directory, "wal") if number >= base]
+        paths.extend(path for _, path in segments)
+        self.segment = max([base] + [number for number, _ in segments]) + 1
+        return self._read(paths)
+
+    @staticmethod
+    def _read(paths: List[Path]) -> Iterator[dict]:
+        for path in paths:
+            with path.open("rb") as records:
+                for line in records:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # The tail of a write cut short by a crash
+                        increment("session_wal_torn_records")
+                        break
+
+    def open(self, snapshot_source: SnapshotSource):
+        """Start accepting records
+
+        Args:
+            snapshot_source: Called synchronously for each snapshot, so
+                its records reflect every record written before the call
+                and none after
+        """
+        self._snapshot_source = snapshot_source
+        self._writer = asyncio.create_task(self._run())
+
+    def write(self, record: dict) -> asyncio.Future:
+        """Queue a record for the next commit
+
+        The record is encoded right away, so later changes to the objects in
+        it are not logged. Records are committed in the order written.
+
+        Returns:
+            A future that completes once the record is durable
+
+        Raises:
+            RuntimeError: If the log is closing
+        """
+        if self._closing:
+            raise RuntimeError("Session log is closed")
+        future = asyncio.get_running_loop().create_future()
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        self._pending.append((self.segment, line))
+        self._waiters.append(future)
+        self._wakeup.set()
+        return future
+
+    async def snapshot(self):
+        """Snapshot the store's state and delete the log segments it covers"""
+        records = self._snapshot_source()
+        # Records written from here on go to a new segment, kept by this snapshot
+        self.segment += 1
+        self.bytes_since_snapshot = 0
+        start = time.perf_counter()
+        await asyncio.to_thread(self._write_snapshot, self.segment, records)
+        record_latency("session_wal_snapshot", time.perf_counter() - start)
+        increment("session_wal_snapshots")
+
+    async def close(self):
+        """Commit what is pending, take a final snapshot and stop"""
+        if self._writer is None:
+            unlock_directory(self.directory, self)
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._writer
+        self._writer = None
+        if self._snapshot_task is not None:
+            await self._snapshot_task
+        await self.snapshot()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        unlock_directory(self.directory, self)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                if self._closing:
+                    return
+                continue
+            batch, waiters = self._pending, self._waiters
+            self._pending, self._waiters = [], []
+            start = time.perf_counter()
+            try:
+                written = await asyncio.to_thread(self._write_batch, batch)
+            except OSError as e:
+                print(f"Session log write failed: {e}")
+                increment("session_wal_errors")
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            else:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+                record_latency("session_wal_commit", time.perf_counter() - start)
+                increment("session_wal_commits")
+                increment("session_wal_records", len(batch))
+
+                self.bytes_since_snapshot += written
+                if self.bytes_since_snapshot >= self.snapshot_bytes and (
+                    self._snapshot_task is None or self._snapshot_task.done()
+                ):
+                    self._snapshot_task = asyncio.create_task(self.snapshot())
+            # Records queued meanwhile, or a close, are handled next round
+            if self._pending or self._closing:
+                self._wakeup.set()
+
+    def _write_batch(self, batch: List[Tuple[int, bytes]]) -> int:
+        """Append records to their segment files and sync them (runs in a thread)"""
+        written = 0
+        for segment, line in batch:
+            if segment != self._file_segment:
+                self._switch_segment(segment)
+            self._file.write(line)
+            written += len(line)
+        self._sync_file()
+        return written
+
+    def _switch_segment(self, segment: int):
+        if self._file is not None:
+            self._sync_file()
+            self._file.close()
+        self._file = open(self.directory / f"wal-{segment:08d}.jsonl", "ab")
+        self._file_segment = segment
+        if self.fsync:
+            _sync_directory(self.directory)
+
+    def _sync_file(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _write_snapshot(self, segment: int, records: List[dict]):
+        """Write a snapshot atomically, then drop older files (runs in a thread)"""
+        path = self.directory / f"snapshot-{segment:08d}.jsonl"
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("wb") as snapshot:
+            for record in records:
+                snapshot.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            snapshot.flush()
+            if self.fsync:
+                os.fsync(snapshot.fileno())
+        os.replace(tmp_path, path)
+        if self.fsync:
+            _sync_directory(self.directory)
+        for prefix in ("snapshot", "wal"):
+            for number, old_path in _numbered(self.directory, prefix):
+                if number < segment:
+                    old_path.unlink(missing_ok=True)
+
+
+def on_ephemeral_filesystem(directory: Path) -> bool:
+    """Whether files in `directory` are lost when the container is replaced
+
+    On Railway that is anything outside the service's volume
+    (RAILWAY_VOLUME_MOUNT_PATH); elsewhere, anything on the container's
+    overlay root filesystem.
+    """
+    path = Path(directory).resolve()
+    volume = os.getenv("RAILWAY_VOLUME_MOUNT_PATH")
+    if volume:
+        return not path.is_relative_to(Path(volume).resolve())
+    if os.getenv("RAILWAY_ENVIRONMENT"):
+        return True
+    mount = path
+    while not os.path.ismount(mount):
+        mount = mount.parent
+    filesystem = None
+    try:
+        with open("/proc/mounts") as mounts:
+            for line in mounts:
+                fields = line.split()
+                # The last mount on a path is the one in use
+                if len(fields) > 2 and fields[1] == str(mount):
+                    filesystem = fields[2]
+    except OSError:
+        pass
+    return filesystem == "overlay"
+
+
+def _numbered(directory: Path, prefix: str) -> List[Tuple[int, Path]]:
+    """`<prefix>-<number>.jsonl` files in number order"""
+    files = []
+    for path in directory.glob(f"{prefix}-*.jsonl"):
+        try:
+            files.append((int(path.stem.split("-", 1)[1]), path))
+        except ValueError:
+            continue
+    return sorted(files)
+
+
+def _sync_directory(directory: Path):
+    """Make created, renamed and deleted files in `directory` durable"""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,1067 @@
+"""Session storage behind a common interface.
+
+Sessions used to live in a dict in main.py, which lost them on restart and
+tied each session to one uvicorn worker. They now go through a SessionStore
+(SESSION_STORE):
+
+- memory: a bounded process-local cache, spilling evicted sessions to disk
+  and, with SESSION_WAL_DIR, logging every change so sessions survive a
+  restart (see session_log.py)
+- postgres: sessions and messages in PostgreSQL (schema.sql), through a
+  shared asyncpg pool
+
+A session is a dict of the session fields plus "messages", the list of
+{"content", "sender", "timestamp"} dicts in order. Messages are only ever
+appended; the fields in SESSION_FIELDS change through `update`. Ended
+sessions can also be read in bulk and given new scores (`iter_ended`,
+`save_scores`), for offline re-scoring.
+
+Stores also keep each tutor's progress document (see progress_service.py)
+and the cohort score rollups (see analytics_service.py).
+"""
+import heapq
+import json
+import os
+import re
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from .analytics_service import (
+    RollupKey,
+    add_rollup,
+    aggregate_cohorts,
+    filter_rollups,
+    merge_rollups,
+    query_grain,
+    rollup_grain,
+    rollup_key
+)
+from .metrics_service import increment, set_gauge
+from .progress_service import average_scores
+from .session_log import SessionLog, on_ephemeral_filesystem
+
+SCHEMA_PATH = Path(__file__).parent.parent / "schema.sql"
+
+DEFAULT_SPILL_DIR = Path(__file__).parent.parent / "data" / "sessions"
+DEFAULT_WAL_DIR = Path(__file__).parent.parent / "data" / "wal"
+
+# Spilled sessions not resumed within this long are deleted on startup
+SPILL_RETENTION = timedelta(days=1)
+
+# Subdirectory of the spill directory for ended sessions, kept for bulk reads
+ENDED_SPILL_DIR = "ended"
+
+# Fields that can change after a session is created
+SESSION_FIELDS = ("is_active", "ended_at", "scoring_job_id", "rolling_evaluation", "context_memo")
+
+# Fields kept together in the sessions.state JSONB column
+STATE_FIELDS = ("rolling_evaluation", "context_memo")
+
+# Position in the (created_at, id) order of sessions, as ISO timestamp and id
+SessionCursor = Tuple[str, str]
+
+# Takes a tutor's progress document (None if there is none yet), returns the new one
+ProgressUpdate = Callable[[Optional[dict]], dict]
+
+
+class SessionStore(ABC):
+    async def start(self):
+        """Open connections; called once from the app lifespan"""
+
+    async def close(self):
+        """Release connections"""
+
+    @abstractmethod
+    async def create(self, session: dict):
+        """Store a new session together with its first messages"""
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[dict]:
+        """Return the session with its messages, or None if it does not exist"""
+
+    @abstractmethod
+    async def append_messages(self, session_id: str, messages: List[dict]):
+        """Append messages to the end of a session's history"""
+
+    @abstractmethod
+    async def update(self, session_id: str, fields: dict):
+        """Change session fields (see SESSION_FIELDS)
+
+        Raises:
+            ValueError: If a field cannot be updated
+        """
+
+    @abstractmethod
+    def iter_ended(self, after: Optional[SessionCursor] = None, page_size: int = 100) -> AsyncIterator[dict]:
+        """Yield ended sessions with their messages, ordered by (created_at, id)
+
+        Args:
+            after: Only sessions after this position
+            page_size: Sessions read per query
+        """
+
+    @abstractmethod
+    def iter_export(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        persona_type: Optional[str] = None,
+        tutor_name: Optional[str] = None,
+        batch_size: int = 500
+    ) -> AsyncIterator[dict]:
+        """Yield the ended sessions to export, with their messages, ordered
+        by (created_at, id); only one session is held at a time
+
+        Args:
+            start: Only sessions created from this ISO timestamp on
+            end: Only sessions created before this ISO timestamp
+            persona_type: Only sessions with this persona
+            tutor_name: Only this tutor's sessions
+            batch_size: Rows fetched from the database at a time
+        """
+
+    @abstractmethod
+    async def save_scores(self, scores: Dict[str, dict]):
+        """Store the scores of several sessions at once (session id -> scores)"""
+
+    @abstractmethod
+    async def get_tutor_progress(self, tutor_name: str) -> Optional[dict]:
+        """Return a tutor's progress document, or None if nothing was scored"""
+
+    @abstractmethod
+    async def update_tutor_progress(self, tutor_name: str, update: ProgressUpdate):
+        """Replace a tutor's progress document with `update(current)`
+
+        Concurrent updates of one tutor are applied one after the other.
+        """
+
+    @abstractmethod
+    async def update_rollups(self, deltas: List[dict], replace: bool = False):
+        """Add deltas to the cohort rollup rows (see analytics_service.py)
+
+        Args:
+            deltas: Rollup rows to add, creating rows that do not exist yet
+            replace: Delete every existing row first (for a rebuild)
+        """
+
+    @abstractmethod
+    async def get_cohorts(
+        self,
+        by: str,
+        categories: List[str],
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        persona_type: Optional[str] = None,
+        problem: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = 50
+    ) -> List[dict]:
+        """Sum rollup rows into cohorts (see analytics_service.aggregate_cohorts)
+
+        Args:
+            by: A COHORT_DIMENSIONS key to group by
+            categories: Only rows of these categories
+            start: Only weeks from this ISO date on
+            end: Only weeks before this ISO date
+            persona_type: Only rows of this persona
+            problem: Only rows of this problem
+            after: Only cohorts after this one
+            limit: Cohorts returned
+        """
+
+    @staticmethod
+    def _check_fields(fields: dict):
+        unknown = set(fields) - set(SESSION_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot update session fields: {', '.join(sorted(unknown))}")
+
+
+class InMemorySessionStore(SessionStore):
+    """Sessions in a bounded, process-local LRU cache
+
+    `get` returns the stored dict itself, so changes made to it outside
+    `update` are visible to later requests as well.
+
+    Sessions are evicted least recently used first once there are more
+    than `max_sessions` of them or their estimated size passes `max_bytes`,
+    and whenever they have been idle for `idle_ttl` seconds. Evicted
+    sessions are spilled to `spill_dir` (if set) as JSON and rehydrated on
+    their next access. Ended sessions go to its "ended" subdirectory, named
+    by (created_at, id) and not deleted on startup, so `iter_ended` and
+    `iter_export` still read them; without a spill directory they are
+    dropped, and left out of both (counted in `dropped_ended`).
+
+    With a `log`, every change is committed to it before the call returns,
+    and `start` rebuilds the sessions from it. Changes made to a returned
+    session outside the store's methods are not logged.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        max_bytes: int = 256 * 1024 * 1024,
+        idle_ttl: float = 3600,
+        spill_dir: Optional[Path] = None,
+        log: Optional[SessionLog] = None
+    ):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.log = log
+
+        # session id -> session, least recently used first
+        self.sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self.progress: Dict[str, dict] = {}
+        # (category, grain) -> week -> rollup key -> row
+        self.rollups: Dict[Tuple[str, int], Dict[str, Dict[RollupKey, dict]]] = {}
+        self._sizes: Dict[str, int] = {}
+        self._last_access: Dict[str, float] = {}
+        self.resident_bytes = 0
+        # id of an ended session spilled to disk -> its (created_at, id)
+        self._ended_spills: Dict[str, SessionCursor] = {}
+        self.dropped_ended = 0
+
+    async def start(self):
+        """Prepare the spill directory and replay the log, if any"""
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            cutoff = time.time() - SPILL_RETENTION.total_seconds()
+            for path in self.spill_dir.glob("*.json"):
+                if path.stat().st_mtime < cutoff:
+                    path.unlink(missing_ok=True)
+            ended_dir = self.spill_dir / ENDED_SPILL_DIR
+            ended_dir.mkdir(exist_ok=True)
+            for path in ended_dir.glob("*.json"):
+                created_at, _, session_id = path.stem.rpartition("_")
+                self._ended_spills[session_id] = (created_at, session_id)
+        if self.log is not None:
+            self._recover()
+            self.log.open(self._snapshot_records)
+
+    async def close(self):
+        """Commit pending changes and snapshot the sessions"""
+        if self.log is not None:
+            await self.log.close()
+
+    async def create(self, session: dict):
+        session = {**session, "messages": list(session.get("messages", []))}
+        self._insert(session)
+        await self._commit({"op": "create", "session": session})
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        return self._load(session_id)
+
+    async def append_messages(self, session_id: str, messages: List[dict]):
+        session = self._load(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        at = len(session["messages"])
+        self._append(session, messages)
+        await self._commit({"op": "append", "id": session_id, "at": at, "messages": messages})
+
+    async def update(self, session_id: str, fields: dict):
+        self._check_fields(fields)
+        session = self._load(session_id)
+        if session is not None:
+            self._update(session, fields)
+            await self._commit({"op": "update", "id": session_id, "fields": fields})
+
+    async def iter_ended(self, after: Optional[SessionCursor] = None, page_size: int = 100) -> AsyncIterator[dict]:
+        if self.dropped_ended:
+            print(f"{self.dropped_ended} ended session(s) were evicted with no spill directory and are left out")
+        resident = sorted(
+            ((session_cursor(session), session)
+             for session in self.sessions.values() if not session.get("is_active", True)),
+            key=_position
+        )
+        # Spilled ones are read back one at a time, without being cached again
+        spilled = sorted(
+            (cursor, None) for session_id, cursor in self._ended_spills.items() if session_id not in self.sessions
+        )
+        for cursor, session in heapq.merge(resident, spilled, key=_position):
+            if after is not None and cursor <= tuple(after):
+                continue
+            if session is None:
+                session = self._read_ended_spill(cursor)
+            if session is not None:
+                yield session
+
+    async def iter_export(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        persona_type: Optional[str] = None,
+        tutor_name: Optional[str] = None,
+        batch_size: int = 500
+    ) -> AsyncIterator[dict]:
+        # Timestamps are compared as ISO strings, so in the stored form
+        start = datetime.fromisoformat(start).isoformat() if start else None
+        end = datetime.fromisoformat(end).isoformat() if end else None
+        async for session in self.iter_ended():
+            if start is not None and session["created_at"] < start or end is not None and session["created_at"] >= end:
+                continue
+            if persona_type is not None and session["persona_type"] != persona_type:
+                continue
+            if tutor_name is None or session["tutor_name"] == tutor_name:
+                yield session
+
+    async def save_scores(self, scores: Dict[str, dict]):
+        self._save_scores(scores)
+        await self._commit({"op": "scores", "scores": scores})
+
+    async def get_tutor_progress(self, tutor_name: str) -> Optional[dict]:
+        return self.progress.get(tutor_name)
+
+    async def update_tutor_progress(self, tutor_name: str, update: ProgressUpdate):
+        # Synchronous, so no other update can interleave
+        progress = update(self.progress.get(tutor_name))
+        self.progress[tutor_name] = progress
+        await self._commit({"op": "progress", "tutor": tutor_name, "progress": progress})
+
+    async def update_rollups(self, deltas: List[dict], replace: bool = False):
+        self._update_rollups(deltas, replace)
+        await self._commit({"op": "rollups", "rows": deltas, "replace": replace})
+
+    async def get_cohorts(
+        self,
+        by: str,
+        categories: List[str],
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        persona_type: Optional[str] = None,
+        problem: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = 50
+    ) -> List[dict]:
+        grain = query_grain(by, persona_type, problem)
+        rows = (
+            row
+            for category in categories
+            for week, week_rows in self.rollups.get((category, grain), {}).items()
+            if (start is None or week >= start) and (end is None or week < end)
+            for row in week_rows.values()
+        )
+        return aggregate_cohorts(filter_rollups(rows, persona_type=persona_type, problem=problem), by, after, limit)
+
+    def _append(self, session: dict, messages: List[dict]):
+        session["messages"].extend(messages)
+        self._resize(session["id"], sum(_message_size(message) for message in messages))
+
+    def _update(self, session: dict, fields: dict):
+        before = _fields_size(session)
+        session.update(fields)
+        self._resize(session["id"], _fields_size(session) - before)
+
+    def _update_rollups(self, deltas: List[dict], replace: bool):
+        if replace:
+            self.rollups = {}
+        for delta in deltas:
+            weeks = self.rollups.setdefault((delta["category"], rollup_grain(delta)), {})
+            rows = weeks.setdefault(delta["week"], {})
+            key = rollup_key(delta)
+            if key in rows:
+                add_rollup(rows[key], delta)
+            else:
+                rows[key] = {**delta, "histogram": list(delta["histogram"])}
+
+    def _save_scores(self, scores: Dict[str, dict]):
+        for session_id, session_scores in scores.items():
+            # Rehydrates a spilled session, so re-scoring it is not lost
+            session = self._load(session_id)
+            if session is not None:
+                before = len(json.dumps(session["scores"])) if session.get("scores") else 0
+                session["scores"] = session_scores
+                self._resize(session_id, len(json.dumps(session_scores)) - before)
+
+    async def _commit(self, record: dict):
+        if self.log is not None:
+            await self.log.write(record)
+
+    def _recover(self):
+        """Rebuild the sessions from the log's snapshot and records"""
+        start = time.perf_counter()
+        replayed = 0
+        for record in self.log.recover():
+            self._replay(record)
+            replayed += 1
+        if replayed:
+            print(f"Restored {len(self.sessions)} session(s) from {replayed} logged record(s) "
+                  f"in {time.perf_counter() - start:.2f}s")
+
+    def _replay(self, record: dict):
+        """Apply a logged change, skipping it if the session already has it"""
+        op = record["op"]
+        if op == "create":
+            if self._load(record["session"]["id"]) is None:
+                self._insert(record["session"])
+        elif op == "put":
+            # A snapshot's copy, newer than any spill file of the session
+            session = record["session"]
+            if session["id"] in self.sessions:
+                del self.sessions[session["id"]]
+                self.resident_bytes -= self._sizes.pop(session["id"])
+            self._insert(session)
+        elif op == "append":
+            session = self._load(record["id"])
+            if session is not None and len(session["messages"]) == record["at"]:
+                self._append(session, record["messages"])
+        elif op == "update":
+            session = self._load(record["id"])
+            if session is not None:
+                self._update(session, record["fields"])
+        elif op == "scores":
+            self._save_scores(record["scores"])
+        elif op == "progress":
+            self.progress[record["tutor"]] = record["progress"]
+        elif op == "rollups":
+            self._update_rollups(record["rows"], record["replace"])
+
+    def _snapshot_records(self) -> List[dict]:
+        # Messages are never changed once appended, so copying the lists is
+        # enough; progress documents are replaced, never changed in place,
+        # and rollup rows are copied by merge_rollups.
+        # "put" rather than "create": the copy wins over a stale spill file
+        rollups = [row for weeks in self.rollups.values() for rows in weeks.values() for row in rows.values()]
+        return [
+            {"op": "put", "session": {**session, "messages": list(session["messages"])}}
+            for session in self.sessions.values()
+        ] + [
+            {"op": "progress", "tutor": tutor_name, "progress": progress}
+            for tutor_name, progress in self.progress.items()
+        ] + [
+            {"op": "rollups", "rows": list(merge_rollups(rollups).values()), "replace": True}
+        ]
+
+    def _insert(self, session: dict):
+        session_id = session["id"]
+        self.sessions[session_id] = session
+        self._sizes[session_id] = _session_size(session)
+        self.resident_bytes += self._sizes[session_id]
+        self._last_access[session_id] = time.monotonic()
+        self._evict()
+
+    def _load(self, session_id: str) -> Optional[dict]:
+        self._evict_idle()
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+            self._last_access[session_id] = time.monotonic()
+            return session
+        return self._rehydrate(session_id)
+
+    def _resize(self, session_id: str, delta: int):
+        self._sizes[session_id] += delta
+        self.resident_bytes += delta
+        self._evict()
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        while self.sessions:
+            session_id = next(iter(self.sessions))
+            if self._last_access[session_id] > cutoff:
+                break
+            self._evict_one(session_id, "idle")
+
+    def _evict(self):
+        self._evict_idle()
+        # Never evict the session that was just touched
+        while len(self.sessions) > 1 and (
+            len(self.sessions) > self.max_sessions or self.resident_bytes > self.max_bytes
+        ):
+            self._evict_one(next(iter(self.sessions)), "lru")
+        set_gauge("session_cache_resident_bytes", self.resident_bytes)
+        set_gauge("session_cache_sessions", len(self.sessions))
+
+    def _evict_one(self, session_id: str, reason: str):
+        session = self.sessions.pop(session_id)
+        self.resident_bytes -= self._sizes.pop(session_id)
+        del self._last_access[session_id]
+        increment(f"session_evictions_{reason}")
+        if self.spill_dir is None:
+            if not session.get("is_active", True):
+                self.dropped_ended += 1
+                increment("session_ended_dropped")
+            return
+        path = self._spill_path(session_id)
+        if session.get("is_active", True):
+            _write_atomic(path, session)
+            increment("session_spills")
+        else:
+            # An older spill of this session must not bring it back as active
+            path.unlink(missing_ok=True)
+            cursor = session_cursor(session)
+            _write_atomic(self._ended_spill_path(cursor), session)
+            self._ended_spills[session_id] = cursor
+            increment("session_ended_spills")
+
+    def _rehydrate(self, session_id: str) -> Optional[dict]:
+        if self.spill_dir is None:
+            return None
+        try:
+            ended = self._ended_spills.get(session_id)
+            path = self._ended_spill_path(ended) if ended else self._spill_path(session_id)
+            session = json.loads(path.read_text())
+        except (ValueError, OSError):
+            return None
+        if self.log is None:
+            path.unlink(missing_ok=True)
+            self._ended_spills.pop(session_id, None)
+        # With a log, the file stays: a snapshot taken while the session was
+        # spilled does not hold it, and replay after a crash reads it from here
+        self._insert(session)
+        increment("session_rehydrations")
+        return session
+
+    def _spill_path(self, session_id: str) -> Path:
+        # Validates the id, which comes from the URL, before using it as a file name
+        return self.spill_dir / f"{uuid.UUID(session_id)}.json"
+
+    def _ended_spill_path(self, cursor: SessionCursor) -> Path:
+        created_at, session_id = cursor
+        # Named by position, so listing the directory gives the order
+        datetime.fromisoformat(created_at)
+        return self.spill_dir / ENDED_SPILL_DIR / f"{created_at}_{uuid.UUID(session_id)}.json"
+
+    def _read_ended_spill(self, cursor: SessionCursor) -> Optional[dict]:
+        try:
+            return json.loads(self._ended_spill_path(cursor).read_text())
+        except (ValueError, OSError):
+            # Rehydrated (and its file removed) since the listing
+            return self.sessions.get(cursor[1])
+
+
+def _position(item: Tuple[SessionCursor, Optional[dict]]) -> SessionCursor:
+    return item[0]
+
+
+def _write_atomic(path: Path, session: dict):
+    """Write a spill file so a crash never leaves a partial one"""
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(session))
+    os.replace(tmp_path, path)
+
+
+# Rough per-object overheads, so byte estimates track what the dicts really cost
+_MESSAGE_OVERHEAD = 400
+_SESSION_OVERHEAD = 1200
+
+
+def _message_size(message: dict) -> int:
+    return _MESSAGE_OVERHEAD + len(message["content"]) + len(message.get("timestamp", ""))
+
+
+def _fields_size(session: dict) -> int:
+    return sum(len(json.dumps(session[key])) for key in STATE_FIELDS + ("scores",) if session.get(key))
+
+
+def _session_size(session: dict) -> int:
+    return (
+        _SESSION_OVERHEAD
+        + len(session.get("problem", ""))
+        + _fields_size(session)
+        + sum(_message_size(message) for message in session["messages"])
+    )
+
+
+# Sums the rollup rows of one grain and week range into one page of
+# cohorts; the histograms are summed only for the cohorts on the page
+_SELECT_COHORTS = """
+    WITH matching AS (
+        SELECT {column} AS cohort, sessions, score_sum, score_sumsq, histogram
+        FROM score_rollups
+        WHERE category = ANY($1::text[]) AND grain = $2 AND week >= $3 AND week < $4
+          AND ($5::text IS NULL OR persona_type = $5)
+          AND ($6::text IS NULL OR problem = $6)
+          AND {column} > $7
+    ),
+    page AS (
+        SELECT cohort, sum(sessions)::int AS sessions, sum(score_sum) AS score_sum,
+               sum(score_sumsq) AS score_sumsq
+        FROM matching GROUP BY cohort HAVING sum(sessions) > 0
+        ORDER BY cohort LIMIT $8
+    )
+    SELECT page.*, ARRAY(
+        SELECT sum(h.count)::int
+        FROM matching, unnest(matching.histogram) WITH ORDINALITY AS h(count, bucket)
+        WHERE matching.cohort = page.cohort
+        GROUP BY h.bucket ORDER BY h.bucket
+    ) AS histogram
+    FROM page ORDER BY cohort
+"""
+
+_COHORT_COLUMNS = {"week": "week::text", "persona": "persona_type", "problem": "problem", "category": "category"}
+
+
+class PostgresSessionStore(SessionStore):
+    """Sessions in PostgreSQL
+
+    Each turn inserts its new rows into `messages` in a single statement
+    instead of rewriting the session's whole history. Queries are constant
+    strings, so asyncpg prepares each one once per pooled connection and
+    reuses it from its statement cache afterwards.
+    """
+
+    INSERT_SESSION = """
+        INSERT INTO sessions (id, tutor_name, persona_type, math_problem, created_at, is_active)
+        VALUES ($1, $2, $3, $4, $5, $6)
+    """
+
+    # Reserves sequence numbers and inserts the rows in one round trip; the
+    # row lock from the UPDATE keeps concurrent appends to a session ordered
+    APPEND_MESSAGES = """
+        WITH reserved AS (
+            UPDATE sessions SET message_count = message_count + cardinality($2::text[])
+            WHERE id = $1
+            RETURNING message_count - cardinality($2::text[]) AS base
+        )
+        INSERT INTO messages (session_id, seq, sender, content, created_at)
+        SELECT $1, reserved.base + m.ord - 1, m.sender, m.content, m.created_at
+        FROM reserved,
+             unnest($2::text[], $3::text[], $4::timestamptz[]) WITH ORDINALITY
+                 AS m(sender, content, created_at, ord)
+    """
+
+    SELECT_SESSION = """
+        SELECT id, tutor_name, persona_type, math_problem, created_at, ended_at,
+               is_active, scoring_job_id, state, scores
+        FROM sessions WHERE id = $1
+    """
+
+    # Keyset pagination over idx_sessions_ended_created
+    SELECT_ENDED_PAGE = """
+        SELECT id, tutor_name, persona_type, math_problem, created_at, ended_at,
+               is_active, scoring_job_id, state, scores
+        FROM sessions
+        WHERE ended_at IS NOT NULL AND (created_at, id) > ($1, $2)
+        ORDER BY created_at, id
+        LIMIT $3
+    """
+
+    SELECT_MESSAGES_FOR_SESSIONS = """
+        SELECT session_id, content, sender, created_at FROM messages
+        WHERE session_id = ANY($1::uuid[]) ORDER BY session_id, seq
+    """
+
+    # Ended sessions joined with their messages in export order; the
+    # (created_at, id) and (session_id, seq) indexes let the rows come out
+    # in order without sorting the whole export
+    EXPORT_ROWS = """
+        SELECT s.id, s.tutor_name, s.persona_type, s.math_problem, s.created_at, s.ended_at, s.scores,
+               m.sender, m.content, m.created_at AS message_at
+        FROM sessions s
+        LEFT JOIN messages m ON m.session_id = s.id
+        WHERE s.ended_at IS NOT NULL AND s.created_at >= $1 AND s.created_at < $2
+          AND ($3::text IS NULL OR s.persona_type = $3)
+          AND ($4::text IS NULL OR s.tutor_name = $4)
+        ORDER BY s.created_at, s.id, m.seq
+    """
+
+    SAVE_SCORES = """
+        UPDATE sessions AS s SET scores = u.scores::jsonb
+        FROM unnest($1::uuid[], $2::text[]) AS u(id, scores)
+        WHERE s.id = u.id
+    """
+
+    SELECT_PROGRESS = "SELECT progress FROM tutor_profiles WHERE name = $1"
+
+    INSERT_PROFILE = "INSERT INTO tutor_profiles (name) VALUES ($1) ON CONFLICT (name) DO NOTHING"
+
+    # The row lock orders concurrent updates of one tutor
+    LOCK_PROGRESS = "SELECT progress FROM tutor_profiles WHERE name = $1 FOR UPDATE"
+
+    # The summary columns are kept in step for existing readers of the table
+    UPDATE_PROGRESS = """
+        UPDATE tutor_profiles SET
+            progress = $2,
+            total_sessions = $3,
+            average_scores = $4,
+            last_session_at = $5
+        WHERE name = $1
+    """
+
+    # Rows are sorted by key (merge_rollups), so concurrent upserts lock
+    # them in the same order
+    UPSERT_ROLLUPS = """
+        INSERT INTO score_rollups AS r
+            (category, grain, week, persona_type, problem, sessions, score_sum, score_sumsq, histogram)
+        SELECT d.category, (d.persona_type <> '*')::int + 2 * (d.problem <> '*')::int, d.week,
+               d.persona_type, d.problem, d.sessions, d.score_sum, d.score_sumsq, d.histogram::int[]
+        FROM unnest($1::text[], $2::date[], $3::text[], $4::text[], $5::int[], $6::float8[],
+                    $7::float8[], $8::text[])
+            AS d(category, week, persona_type, problem, sessions, score_sum, score_sumsq, histogram)
+        ON CONFLICT (category, grain, week, persona_type, problem) DO UPDATE SET
+            sessions = r.sessions + EXCLUDED.sessions,
+            score_sum = r.score_sum + EXCLUDED.score_sum,
+            score_sumsq = r.score_sumsq + EXCLUDED.score_sumsq,
+            histogram = ARRAY(
+                SELECT a + b FROM unnest(r.histogram, EXCLUDED.histogram) WITH ORDINALITY AS h(a, b, i)
+                ORDER BY i
+            )
+    """
+
+    DELETE_ROLLUPS = "DELETE FROM score_rollups"
+
+    SELECT_COHORTS = {by: _SELECT_COHORTS.format(column=column) for by, column in _COHORT_COLUMNS.items()}
+
+    # Ad hoc queries on one category's scores; one index per configured
+    # category, created at startup
+    CATEGORY_SCORE_INDEX = """
+        CREATE INDEX IF NOT EXISTS idx_sessions_score_{key}
+        ON sessions (((scores->'categories'->'{key}'->>'score')::numeric), persona_type)
+        WHERE scores IS NOT NULL
+    """
+
+    SELECT_MESSAGES = """
+        SELECT content, sender, created_at FROM messages
+        WHERE session_id = $1 ORDER BY seq
+    """
+
+    UPDATE_SESSION = """
+        UPDATE sessions SET
+            is_active = COALESCE($2, is_active),
+            ended_at = COALESCE($3, ended_at),
+            scoring_job_id = COALESCE($4, scoring_job_id),
+            state = state || $5::jsonb
+        WHERE id = $1
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = 2,
+        max_size: int = 10,
+        apply_schema: bool = True
+    ):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.apply_schema = apply_schema
+        self.pool = None
+
+    async def start(self):
+        import asyncpg
+
+        self.pool = await asyncpg.create_pool(
+            self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            init=self._init_connection
+        )
+        if self.apply_schema:
+            from .scoring_service import get_category_keys
+
+            async with self.pool.acquire() as conn:
+                await conn.execute(SCHEMA_PATH.read_text())
+                for key in get_category_keys():
+                    # Keys go into the statement, so only plain identifiers
+                    if re.fullmatch(r"[a-z0-9_]+", key):
+                        await conn.execute(self.CATEGORY_SCORE_INDEX.format(key=key))
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    @staticmethod
+    async def _init_connection(conn):
+        await conn.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+    async def create(self, session: dict):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    self.INSERT_SESSION,
+                    session["id"],
+                    session["tutor_name"],
+                    session["persona_type"],
+                    session["problem"],
+                    _timestamptz(session["created_at"]),
+                    session.get("is_active", True)
+                )
+                if session.get("messages"):
+                    await self._append(conn, session["id"], session["messages"])
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        try:
+            uuid.UUID(session_id)
+        except ValueError:
+            return None
+
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(self.SELECT_SESSION, session_id)
+            if row is None:
+                return None
+            message_rows = await conn.fetch(self.SELECT_MESSAGES, session_id)
+        return self._session_from_row(row, message_rows)
+
+    async def iter_ended(self, after: Optional[SessionCursor] = None, page_size: int = 100) -> AsyncIterator[dict]:
+        if after is None:
+            created_at, session_id = datetime.min.replace(tzinfo=timezone.utc), uuid.UUID(int=0)
+        else:
+            created_at, session_id = _timestamptz(after[0]), uuid.UUID(after[1])
+        while True:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(self.SELECT_ENDED_PAGE, created_at, session_id, page_size)
+                if not rows:
+                    return
+                message_rows = await conn.fetch(
+                    self.SELECT_MESSAGES_FOR_SESSIONS, [row["id"] for row in rows]
+                )
+            messages_by_session: Dict[uuid.UUID, list] = {}
+            for message in message_rows:
+                messages_by_session.setdefault(message["session_id"], []).append(message)
+            for row in rows:
+                yield self._session_from_row(row, messages_by_session.get(row["id"], []))
+            created_at, session_id = rows[-1]["created_at"], rows[-1]["id"]
+
+    async def iter_export(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        persona_type: Optional[str] = None,
+        tutor_name: Optional[str] = None,
+        batch_size: int = 500
+    ) -> AsyncIterator[dict]:
+        async with self.pool.acquire() as conn:
+            # A server-side cursor, which needs a transaction; the read-only
+            # snapshot keeps a long export consistent
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                session = None
+                rows = conn.cursor(
+                    self.EXPORT_ROWS,
+                    _timestamptz(start) if start else datetime.min.replace(tzinfo=timezone.utc),
+                    _timestamptz(end) if end else datetime.max.replace(tzinfo=timezone.utc),
+                    persona_type,
+                    tutor_name,
+                    prefetch=batch_size
+                )
+                async for row in rows:
+                    if session is None or session["id"] != str(row["id"]):
+                        if session is not None:
+                            yield session
+                        session = {
+                            "id": str(row["id"]),
+                            "tutor_name": row["tutor_name"],
+                            "problem": row["math_problem"],
+                            "persona_type": row["persona_type"],
+                            "messages": [],
+                            "created_at": row["created_at"].isoformat(),
+                            "ended_at": row["ended_at"].isoformat(),
+                            "is_active": False
+                        }
+                        if row["scores"] is not None:
+                            session["scores"] = row["scores"]
+                    if row["sender"] is not None:
+                        session["messages"].append({
+                            "content": row["content"],
+                            "sender": row["sender"],
+                            "timestamp": row["message_at"].isoformat()
+                        })
+                if session is not None:
+                    yield session
+
+    async def save_scores(self, scores: Dict[str, dict]):
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                self.SAVE_SCORES,
+                list(scores),
+                [json.dumps(session_scores) for session_scores in scores.values()]
+            )
+
+    async def get_tutor_progress(self, tutor_name: str) -> Optional[dict]:
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(self.SELECT_PROGRESS, tutor_name)
+
+    async def update_tutor_progress(self, tutor_name: str, update: ProgressUpdate):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(self.INSERT_PROFILE, tutor_name)
+                progress = update(await conn.fetchval(self.LOCK_PROGRESS, tutor_name))
+                last_session_at = progress.get("last_session_at")
+                await conn.execute(
+                    self.UPDATE_PROGRESS,
+                    tutor_name,
+                    progress,
+                    progress["sessions"],
+                    average_scores(progress),
+                    _timestamptz(last_session_at) if last_session_at else None
+                )
+
+    async def update_rollups(self, deltas: List[dict], replace: bool = False):
+        rows = list(merge_rollups(deltas).values())
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if replace:
+                    await conn.execute(self.DELETE_ROLLUPS)
+                await conn.execute(
+                    self.UPSERT_ROLLUPS,
+                    [row["category"] for row in rows],
+                    [date.fromisoformat(row["week"]) for row in rows],
+                    [row["persona_type"] for row in rows],
+                    [row["problem"] for row in rows],
+                    [row["sessions"] for row in rows],
+                    [row["score_sum"] for row in rows],
+                    [row["score_sumsq"] for row in rows],
+                    ["{" + ",".join(map(str, row["histogram"])) + "}" for row in rows]
+                )
+
+    async def get_cohorts(
+        self,
+        by: str,
+        categories: List[str],
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        persona_type: Optional[str] = None,
+        problem: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: int = 50
+    ) -> List[dict]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                self.SELECT_COHORTS[by],
+                categories,
+                query_grain(by, persona_type, problem),
+                date.fromisoformat(start) if start else date.min,
+                date.fromisoformat(end) if end else date.max,
+                persona_type,
+                problem,
+                after or "",
+                limit
+            )
+        return [
+            {
+                "cohort": row["cohort"],
+                "sessions": row["sessions"],
+                "score_sum": row["score_sum"],
+                "score_sumsq": row["score_sumsq"],
+                "histogram": list(row["histogram"])
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    def _session_from_row(row, message_rows) -> dict:
+        session = {
+            "id": str(row["id"]),
+            "tutor_name": row["tutor_name"],
+            "problem": row["math_problem"],
+            "persona_type": row["persona_type"],
+            "messages": [
+                {
+                    "content": message["content"],
+                    "sender": message["sender"],
+                    "timestamp": message["created_at"].isoformat()
+                }
+                for message in message_rows
+            ],
+            "created_at": row["created_at"].isoformat(),
+            "is_active": row["is_active"]
+        }
+        if row["ended_at"] is not None:
+            session["ended_at"] = row["ended_at"].isoformat()
+        if row["scoring_job_id"] is not None:
+            session["scoring_job_id"] = row["scoring_job_id"]
+        if row["scores"] is not None:
+            session["scores"] = row["scores"]
+        session.update(row["state"])
+        return session
+
+    async def append_messages(self, session_id: str, messages: List[dict]):
+        async with self.pool.acquire() as conn:
+            await self._append(conn, session_id, messages)
+
+    async def _append(self, conn, session_id: str, messages: List[dict]):
+        await conn.execute(
+            self.APPEND_MESSAGES,
+            session_id,
+            [message["sender"] for message in messages],
+            [message["content"] for message in messages],
+            [_timestamptz(message["timestamp"]) for message in messages]
+        )
+
+    async def update(self, session_id: str, fields: dict):
+        self._check_fields(fields)
+        ended_at = fields.get("ended_at")
+        async with self.pool.acquire() as conn:
+            await conn.execute(
+                self.UPDATE_SESSION,
+                session_id,
+                fields.get("is_active"),
+                _timestamptz(ended_at) if ended_at else None,
+                fields.get("scoring_job_id"),
+                {key: fields[key] for key in STATE_FIELDS if key in fields}
+            )
+
+
+def _timestamptz(value: str) -> datetime:
+    """An ISO timestamp for a timestamptz column; one without an offset is UTC
+
+    Taken as UTC rather than left to the server's timezone, so sessions
+    written before timestamps carried an offset keep their time.
+    """
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
+def session_cursor(session: dict) -> SessionCursor:
+    """A session's position in the (created_at, id) order"""
+    return (session["created_at"], session["id"])
+
+
+_session_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    if _session_store is None:
+        raise RuntimeError("Session store has not been started")
+    return _session_store
+
+
+async def start_session_store() -> SessionStore:
+    """Create and start the process-wide store using environment settings"""
+    global _session_store
+    backend = os.getenv("SESSION_STORE", "memory")
+    if backend == "memory":
+        spill_dir = os.getenv("SESSION_SPILL_DIR", str(DEFAULT_SPILL_DIR))
+        wal_dir = os.getenv("SESSION_WAL_DIR", str(DEFAULT_WAL_DIR))
+        if wal_dir and on_ephemeral_filesystem(Path(wal_dir)):
+            print(f"WARNING: SESSION_WAL_DIR {wal_dir} is on the container's own filesystem; "
+                  "sessions survive a restart but not a redeploy. Point it at a mounted volume.")
+        store = InMemorySessionStore(
+            max_sessions=int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "10000")),
+            max_bytes=int(os.getenv("SESSION_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            idle_ttl=float(os.getenv("SESSION_IDLE_TTL_SECONDS", "3600")),
+            spill_dir=Path(spill_dir) if spill_dir else None,
+            log=SessionLog(
+                Path(wal_dir),
+                fsync=os.getenv("SESSION_WAL_FSYNC", "true").lower() == "true",
+                snapshot_bytes=int(os.getenv("SESSION_WAL_SNAPSHOT_BYTES", str(64 * 1024 * 1024)))
+            ) if wal_dir else None
+        )
+    elif backend == "postgres":
+        dsn = os.getenv("DATABASE_URL")
+        if not dsn:
+            raise RuntimeError("SESSION_STORE=postgres requires DATABASE_URL")
+        store = PostgresSessionStore(
+            dsn,
+            min_size=int(os.getenv("SESSION_STORE_POOL_MIN", "2")),
+            max_size=int(os.getenv("SESSION_STORE_POOL_MAX", "10"))
+        )
+    else:
+        raise ValueError(f"Unknown session store: {backend}")
+    await store.start()
+    _session_store = store
+    return store
+
+
+async def stop_session_store():
+    global _session_store
+    if _session_store is not None:
+        await _session_store.close()
+        _session_store = None
@@ -0,0 +1,318 @@
+"""Client-side traffic control for Anthropic API requests.
+
+Under class-wide load the provider answers some requests with 429 (rate
+limited) or 529 (overloaded), and a slow tail of persona replies holds up
+tutors. Every request ClaudeService sends goes through a TrafficController:
+
+- a token bucket per model (Haiku for persona turns, Sonnet for scoring)
+  spaces out request starts; a 429 halves that model's rate, which then
+  creeps back up as requests succeed, and a retry-after pauses the bucket
+  so waiting requests do not all retry at once,
+- retryable errors (429, 408, 409, 5xx including overloaded, connection
+  errors and timeouts) are retried with full-jitter exponential backoff,
+  never sooner than the provider's retry-after; when retries run out,
+  ProviderBusyError is raised from the last error,
+- hedged calls (persona turns, with CLAUDE_HEDGE_PERSONA) send a second
+  request when the first has not answered within the recent p95 latency,
+  and use whichever finishes first; a loser that still succeeds is handed
+  to `discard` so what it holds (an open stream) is released.
+
+Metrics: `claude_queue_depth_<bucket>` and `claude_rate_per_minute_<bucket>`
+gauges, and the `claude_retries`, `claude_retries_<status>`,
+`claude_hedges` and `claude_hedges_won` counters.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import anthropic
+
+from .admission_service import ServiceUnavailableError
+from .metrics_service import increment, set_gauge
+
+T = TypeVar("T")
+
+# Successful hedged-call latencies kept per model, and how many are needed
+# before hedging starts
+HEDGE_LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+
+class ProviderBusyError(ServiceUnavailableError):
+    """Raised when a request still fails with a retryable error after every retry"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed request may succeed if sent again"""
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """The delay the provider asked for in retry-after(-ms) headers, if any"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _error_label(error: BaseException) -> str:
+    if isinstance(error, anthropic.APIStatusError):
+        return str(error.status_code)
+    if isinstance(error, anthropic.APITimeoutError):
+        return "timeout"
+    return "connection"
+
+
+class TokenBucket:
+    """Limit request starts to a rate, adapting it when the provider pushes back"""
+
+    def __init__(self, name: str, per_minute: float, burst: Optional[float] = None, min_fraction: float = 0.05):
+        """
+        Args:
+            name: Used in metric names
+            per_minute: Highest request rate; 0 for no limit (retry-after
+                pauses still apply)
+            burst: Requests that may start back to back; defaults to ten
+                seconds' worth
+            min_fraction: Lowest share of `per_minute` that 429s can push
+                the rate down to
+        """
+        self.name = name
+        self.max_rate = per_minute / 60.0
+        self.min_rate = self.max_rate * min_fraction
+        self.rate = self.max_rate
+        self.capacity = burst or max(1.0, per_minute / 6)
+        self.waiting = 0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait for a turn to start a request; waiters are served in order"""
+        if not self.max_rate and self._paused_until <= time.monotonic():
+            return
+        self.waiting += 1
+        set_gauge(f"claude_queue_depth_{self.name}", self.waiting)
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    wait = self._paused_until - now
+                    if wait <= 0:
+                        if not self.max_rate:
+                            return
+                        self._refill(now)
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            return
+                        wait = (1 - self._tokens) / self.rate
+                    await asyncio.sleep(wait)
+        finally:
+            self.waiting -= 1
+            set_gauge(f"claude_queue_depth_{self.name}", self.waiting)
+
+    def throttle(self, retry_after: Optional[float] = None):
+        """Halve the rate after a 429 and pause for the provider's retry-after"""
+        if self.max_rate:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            set_gauge(f"claude_rate_per_minute_{self.name}", round(self.rate * 60, 1))
+        self.pause(retry_after)
+
+    def pause(self, seconds: Optional[float]):
+        """Start no requests for the next `seconds`"""
+        if seconds:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def on_success(self):
+        """Recover the rate a little after each successful request"""
+        if self.rate < self.max_rate:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+            set_gauge(f"claude_rate_per_minute_{self.name}", round(self.rate * 60, 1))
+
+    @property
+    def throttled(self) -> bool:
+        return self.rate < self.max_rate or self._paused_until > time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class RetryPolicy:
+    def __init__(self, max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before retry number `attempt` (from 0)
+
+        Full jitter spreads retries from many clients apart; a retry-after
+        from the provider is a lower bound.
+        """
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            return max(retry_after, backoff)
+        return backoff
+
+
+def _discard(task: asyncio.Task, discard: Callable[[T], Awaitable[None]]):
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(discard(task.result()))
+
+
+class _LatencyWindow:
+    """Recent latencies with a p95 recomputed every few samples"""
+
+    def __init__(self):
+        self.samples: Deque[float] = deque(maxlen=HEDGE_LATENCY_WINDOW)
+        self.p95: Optional[float] = None
+        self._since_update = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self._since_update += 1
+        if len(self.samples) >= HEDGE_MIN_SAMPLES and (self.p95 is None or self._since_update >= 10):
+            ordered = sorted(self.samples)
+            self.p95 = ordered[int(0.95 * (len(ordered) - 1))]
+            self._since_update = 0
+
+
+class TrafficController:
+    def __init__(
+        self,
+        buckets: Dict[str, TokenBucket],
+        retry_policy: Optional[RetryPolicy] = None,
+        hedge_min_delay: float = 1.0
+    ):
+        """
+        Args:
+            buckets: Token bucket per model name; models without one are
+                not rate limited
+            hedge_min_delay: Never hedge sooner than this, however fast
+                recent requests were
+        """
+        self.buckets = buckets
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.hedge_min_delay = hedge_min_delay
+        self._latencies: Dict[str, _LatencyWindow] = {}
+        self._unlimited = TokenBucket("unlimited", 0)
+
+    async def call(
+        self,
+        model: str,
+        send: Callable[[], Awaitable[T]],
+        hedge: bool = False,
+        latency_key: Optional[str] = None,
+        discard: Optional[Callable[[T], Awaitable[None]]] = None
+    ) -> T:
+        """Send a request through the model's rate limit, retrying failures
+
+        Args:
+            send: Makes the request; called again for every attempt
+            hedge: Send a second copy if this one is slower than the recent
+                p95 for the model, and return whichever succeeds first
+            latency_key: Latency window the hedge delay comes from, for
+                calls timed differently from the model's other calls
+                (defaults to the model)
+            discard: Releases the result of a hedged copy that succeeded
+                but was not used
+
+        Raises:
+            ProviderBusyError: If retries are used up (from the last error)
+            Any non-retryable error from `send`
+        """
+        if not hedge:
+            return await self._with_retries(model, send)
+
+        window = self._latencies.setdefault(latency_key or model, _LatencyWindow())
+
+        async def timed() -> T:
+            start = time.perf_counter()
+            result = await self._with_retries(model, send)
+            window.record(time.perf_counter() - start)
+            return result
+
+        primary = asyncio.ensure_future(timed())
+        tasks = [primary]
+        winner = None
+        try:
+            delay = self._hedge_delay(model, window)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and not self._bucket(model).throttled:
+                    # Hedging a queue that is already backed up only adds load
+                    increment("claude_hedges")
+                    tasks.append(asyncio.ensure_future(timed()))
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            increment("claude_hedges_won")
+                        winner = task
+                        return task.result()
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+                if discard is not None and task is not winner:
+                    task.add_done_callback(lambda loser: _discard(loser, discard))
+
+    def _hedge_delay(self, model: str, window: _LatencyWindow) -> Optional[float]:
+        if window.p95 is None:
+            return None
+        return max(self.hedge_min_delay, window.p95)
+
+    def _bucket(self, model: str) -> TokenBucket:
+        return self.buckets.get(model, self._unlimited)
+
+    async def _with_retries(self, model: str, send: Callable[[], Awaitable[T]]) -> T:
+        bucket = self._bucket(model)
+        for attempt in range(self.retry_policy.max_retries + 1):
+            await bucket.acquire()
+            try:
+                result = await send()
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                retry_after = retry_after_seconds(e)
+                if attempt == self.retry_policy.max_retries:
+                    raise ProviderBusyError(
+                        f"Model provider unavailable after {attempt + 1} attempts: {e}",
+                        retry_after=retry_after or 1.0
+                    ) from e
+                if isinstance(e, anthropic.RateLimitError):
+                    bucket.throttle(retry_after)
+                else:
+                    bucket.pause(retry_after)
+                increment("claude_retries")
+                increment(f"claude_retries_{_error_label(e)}")
+                await asyncio.sleep(self.retry_policy.delay(attempt, retry_after))
+                continue
+            bucket.on_success()
+            return result
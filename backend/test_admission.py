@@ -0,0 +1,176 @@
+"""Admission control for model calls.
+
+- queued calls start in priority order (persona turns, openings, scoring)
+  and tutors within a priority take turns,
+- no tutor holds more than its cap of slots, and scoring leaves slots free,
+- a call whose estimated wait exceeds its deadline is rejected at once, and
+  one still queued at its deadline is rejected then,
+- cancelled and rejected calls leave no slots or queue entries behind,
+- an opening that cannot be admitted makes /api/sessions/start answer 503
+  with Retry-After.
+
+Run from the backend directory:
+    python test_admission.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import httpx
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+os.environ["SESSION_STORE"] = "memory"
+os.environ["SESSION_SPILL_DIR"] = ""
+os.environ["SESSION_WAL_DIR"] = ""
+os.environ["OPENER_POOL_SIZE"] = "0"
+os.environ["SCORING_JOB_DIR"] = tempfile.mkdtemp()
+
+import main
+from services.admission_service import (
+    OPENING_TURN,
+    PERSONA_TURN,
+    SCORING,
+    AdmissionController,
+    AdmissionRejectedError
+)
+from services.claude_service import ClaudeService
+
+
+async def hold(admission: AdmissionController, order: list, name: str, priority: int,
+               tutor=None, seconds: float = 0.05, max_wait=None):
+    async with admission.slot(priority, tutor, max_wait):
+        order.append(name)
+        await asyncio.sleep(seconds)
+
+
+async def priorities_and_fairness():
+    admission = AdmissionController(max_concurrency=1, per_tutor_limit=5)
+    order = []
+    blocker = asyncio.create_task(hold(admission, order, "blocker", SCORING, seconds=0.1))
+    await asyncio.sleep(0.01)
+    queued = [
+        hold(admission, order, "scoring", SCORING),
+        hold(admission, order, "opening", OPENING_TURN, tutor="b"),
+        hold(admission, order, "a1", PERSONA_TURN, tutor="a"),
+        hold(admission, order, "a2", PERSONA_TURN, tutor="a"),
+        hold(admission, order, "b1", PERSONA_TURN, tutor="b"),
+    ]
+    tasks = [asyncio.create_task(call) for call in queued]
+    await asyncio.sleep(0.01)
+    assert admission.stats()["queued"] == {"persona": 3, "opening": 1, "scoring": 1}
+    await asyncio.gather(blocker, *tasks)
+    print(f"  start order: {order}")
+    # Tutor b's turn comes before tutor a's second one
+    assert order == ["blocker", "a1", "b1", "a2", "opening", "scoring"]
+    assert admission.active == 0 and sum(admission.stats()["queued"].values()) == 0
+
+
+async def caps():
+    admission = AdmissionController(max_concurrency=8, per_tutor_limit=2, background_share=0.5)
+    peak = {"tutor": 0, "scoring": 0}
+    in_flight = {"tutor": 0, "scoring": 0}
+
+    async def call(kind: str, priority: int, tutor=None):
+        async with admission.slot(priority, tutor):
+            in_flight[kind] += 1
+            peak[kind] = max(peak[kind], in_flight[kind])
+            await asyncio.sleep(0.02)
+            in_flight[kind] -= 1
+
+    await asyncio.gather(
+        *(call("tutor", PERSONA_TURN, "greedy") for _ in range(10)),
+        *(call("scoring", SCORING) for _ in range(20))
+    )
+    print(f"  peak slots: one tutor {peak['tutor']}, scoring {peak['scoring']}")
+    assert peak["tutor"] == 2 and peak["scoring"] == 4
+
+
+async def deadlines():
+    admission = AdmissionController(max_concurrency=2, initial_hold_time=1.0)
+    order = []
+    busy = [asyncio.create_task(hold(admission, order, f"busy-{i}", PERSONA_TURN, seconds=0.3)) for i in range(2)]
+    queued = [asyncio.create_task(hold(admission, order, f"queued-{i}", PERSONA_TURN)) for i in range(4)]
+    await asyncio.sleep(0.01)
+
+    # Five calls ahead over two slots at ~1 s each: rejected without queueing
+    try:
+        await hold(admission, order, "early", PERSONA_TURN, max_wait=0.5)
+        raise AssertionError("Expected an early rejection")
+    except AdmissionRejectedError as e:
+        print(f"  early: {e} (retry after {e.retry_after:.1f}s)")
+        assert "estimated wait" in str(e) and e.retry_after >= 1
+    assert admission.stats()["queued"]["persona"] == 4
+
+    # The estimate allows it, but the slots are held longer than that
+    admission.mean_hold_time = 0.01
+    try:
+        await hold(admission, order, "late", PERSONA_TURN, max_wait=0.1)
+        raise AssertionError("Expected a deadline rejection")
+    except AdmissionRejectedError as e:
+        print(f"  late: {e}")
+        assert "not started within" in str(e)
+
+    # A cancelled waiter leaves the queue
+    cancelled = asyncio.create_task(hold(admission, order, "cancelled", PERSONA_TURN))
+    await asyncio.sleep(0.01)
+    cancelled.cancel()
+    await asyncio.gather(*busy, *queued)
+    assert "early" not in order and "late" not in order and "cancelled" not in order
+    assert admission.stats()["rejected"]["persona"] == 2
+    assert admission.active == 0 and sum(admission.stats()["queued"].values()) == 0
+
+
+async def rejected_start():
+    admission = AdmissionController(max_concurrency=1, initial_hold_time=30)
+    service = ClaudeService(admission=admission)
+    sys.modules["services.claude_service"]._claude_service = service
+    order = []
+    async with main.app.router.lifespan_context(main.app):
+        blocker = asyncio.create_task(hold(admission, order, "blocker", SCORING, seconds=0.2))
+        queued = asyncio.create_task(hold(admission, order, "queued", SCORING))
+        await asyncio.sleep(0.01)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/api/sessions/start", json={
+                "tutor_name": "tutor",
+                "problem": "Solve the quadratic equation x² - 5x + 6 = 0",
+                "persona_type": "anxious_alex"
+            })
+            stats = (await client.get("/api/admission")).json()
+        await asyncio.gather(blocker, queued)
+    print(f"  {response.status_code} with Retry-After: {response.headers.get('retry-after')}")
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 20
+    assert stats["rejected"]["opening"] == 1 and stats["queued"]["scoring"] == 1
+
+
+def test_priorities_and_fairness():
+    asyncio.run(priorities_and_fairness())
+
+
+def test_tutor_and_scoring_caps():
+    asyncio.run(caps())
+
+
+def test_deadlines():
+    asyncio.run(deadlines())
+
+
+def test_rejected_start_returns_503():
+    asyncio.run(rejected_start())
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("ADMISSION CONTROL TEST")
+    print("=" * 80)
+    print("\nPriorities and per-tutor turns")
+    test_priorities_and_fairness()
+    print("\nCaps")
+    test_tutor_and_scoring_caps()
+    print("\nDeadlines")
+    test_deadlines()
+    print("\nRejected session start")
+    test_rejected_start_returns_503()
+    print("\nAll checks passed")
@@ -0,0 +1,244 @@
+"""Cohort analytics served from precomputed rollups.
+
+- cohorts summed from the rollups match statistics computed directly from
+  the scored sessions, by week, persona, problem and category, also after
+  some sessions are re-scored,
+- walking the pages with the cursor returns every cohort exactly once,
+- the memory store's write-ahead log restores the rollups on restart, and
+  the backfill rebuilds them from the stored sessions,
+- the endpoint answers from the rollups as sessions are scored through the
+  app, with an ETag and cache headers.
+
+Run from the backend directory:
+    python test_analytics.py
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+from fake_llm_server import FakeLLMServer
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+os.environ["SESSION_STORE"] = "memory"
+os.environ["SESSION_SPILL_DIR"] = ""
+os.environ["SESSION_WAL_DIR"] = ""
+os.environ["OPENER_POOL_SIZE"] = "0"
+os.environ["ROLLING_SCORING_INTERVAL"] = "0"
+os.environ["SCORING_JOB_DIR"] = tempfile.mkdtemp()
+
+import main
+from backfill_progress import backfill
+from services.analytics_service import cohort_view, rollup_deltas, session_values, week_of
+from services.claude_service import ClaudeService
+from services.session_log import SessionLog
+from services.session_store import InMemorySessionStore
+
+CATEGORIES = ["explanation", "questioning", "patience"]
+PERSONAS = ["anxious_alex", "overconfident_olivia", "distracted_dana"]
+PROBLEMS = [f"Problem {index}" for index in range(12)]
+SESSIONS = 400
+
+
+def result(rng: random.Random) -> dict:
+    return {"categories": {key: {"score": rng.choice([1, 2, 3, 4, 5, 2.5])} for key in CATEGORIES}}
+
+
+def scored_session(index: int, rng: random.Random) -> dict:
+    ended_at = datetime(2025, 1, 1) + timedelta(hours=index * 7)
+    return {
+        "id": str(uuid.UUID(int=index + 1)),
+        "tutor_name": f"tutor-{index % 4}",
+        "problem": rng.choice(PROBLEMS),
+        "persona_type": rng.choice(PERSONAS),
+        "messages": [],
+        "created_at": (ended_at - timedelta(minutes=20)).isoformat(),
+        "ended_at": ended_at.isoformat(),
+        "is_active": False,
+        "scores": result(rng)
+    }
+
+
+async def scored_store(log_directory: Path = None):
+    """A store with scored sessions, a fifth of them re-scored, and the sessions"""
+    rng = random.Random(5)
+    store = InMemorySessionStore(log=SessionLog(log_directory) if log_directory else None)
+    await store.start()
+    sessions = [scored_session(index, rng) for index in range(SESSIONS)]
+    for session in sessions:
+        await store.create(session)
+        await store.update_rollups(rollup_deltas(session, session["scores"]))
+    for session in sessions[::5]:
+        new = result(rng)
+        await store.update_rollups(rollup_deltas(session, new, session["scores"]))
+        session["scores"] = new
+        await store.save_scores({session["id"]: new})
+    return store, sessions
+
+
+def expected_cohorts(sessions: list, by: str, category: str, start: str = None, end: str = None) -> dict:
+    """Cohort -> the session's values, computed from the sessions themselves"""
+    field = {"persona": "persona_type", "problem": "problem"}.get(by)
+    cohorts = defaultdict(list)
+    for session in sessions:
+        week = week_of(session["ended_at"])
+        if start is not None and week < start or end is not None and week >= end:
+            continue
+        values = session_values(session["scores"])
+        if by == "category":
+            for key, value in values.items():
+                cohorts[key].append(value)
+        else:
+            cohorts[week if by == "week" else session[field]].append(values[category])
+    return cohorts
+
+
+def check_cohort(view: dict, values: list):
+    assert view["sessions"] == len(values)
+    assert abs(view["mean"] - statistics.mean(values)) < 1e-3
+    assert abs(view["stddev"] - statistics.pstdev(values)) < 1e-3
+    assert sum(view["histogram"].values()) == len(values)
+    assert view["histogram"]["3"] == sum(1 for value in values if 2.5 <= value < 3.5)
+
+
+async def rollups_match_sessions():
+    store, sessions = await scored_store()
+    checks = [
+        ("week", "overall", None, None),
+        ("persona", "patience", None, None),
+        ("problem", "explanation", "2025-01-13", "2025-02-10"),
+        ("category", None, "2025-01-20", None)
+    ]
+    for by, category, start, end in checks:
+        categories = [*CATEGORIES, "overall"] if by == "category" else [category]
+        cohorts = await store.get_cohorts(by, categories, start=start, end=end, limit=200)
+        expected = expected_cohorts(sessions, by, category, start, end)
+        print(f"  by {by}: {len(cohorts)} cohorts")
+        assert [cohort["cohort"] for cohort in cohorts] == sorted(expected)
+        for cohort in cohorts:
+            check_cohort(cohort_view(cohort), expected[cohort["cohort"]])
+
+
+async def cursor_pages():
+    store, sessions = await scored_store()
+    seen = []
+    cursor = None
+    while True:
+        page = await store.get_cohorts("problem", ["overall"], persona_type="anxious_alex", after=cursor, limit=5)
+        seen.extend(cohort["cohort"] for cohort in page)
+        if len(page) < 5:
+            break
+        cursor = page[-1]["cohort"]
+    expected = {session["problem"] for session in sessions if session["persona_type"] == "anxious_alex"}
+    assert seen == sorted(expected)
+
+
+async def restart_and_backfill():
+    directory = Path(tempfile.mkdtemp())
+    store, _ = await scored_store(directory)
+    expected = await store.get_cohorts("week", ["overall"], limit=200)
+    # No close: restored from the log
+    recovered = InMemorySessionStore(log=SessionLog(directory))
+    await recovered.start()
+    assert await recovered.get_cohorts("week", ["overall"], limit=200) == expected
+
+    # Lose the rollups, then rebuild them from the sessions
+    await recovered.update_rollups([], replace=True)
+    assert await recovered.get_cohorts("week", ["overall"], limit=200) == []
+    report = await backfill(recovered, page_size=50)
+    print(f"  backfill: {report}")
+    rebuilt = await recovered.get_cohorts("week", ["overall"], limit=200)
+    assert [cohort_view(cohort) for cohort in rebuilt] == [cohort_view(cohort) for cohort in expected]
+    await recovered.close()
+
+    # After a clean shutdown: restored from the snapshot
+    again = InMemorySessionStore(log=SessionLog(directory))
+    await again.start()
+    assert await again.get_cohorts("week", ["overall"], limit=200) == rebuilt
+    await again.close()
+
+
+async def app_flow():
+    with FakeLLMServer(latency=0.01) as server:
+        sys.modules["services.claude_service"]._claude_service = ClaudeService(base_url=server.base_url)
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.app.router.lifespan_context(main.app), \
+                httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            for persona in ["anxious_alex", "anxious_alex", "overconfident_olivia"]:
+                started = await client.post("/api/sessions/start", json={
+                    "tutor_name": "analytics-tutor", "problem": f"Factor x² - 5x + 6 ({persona})",
+                    "persona_type": persona
+                })
+                session_id = started.json()["session_id"]
+                await client.post(f"/api/sessions/{session_id}/message", json={"message": "Hi!", "sender": "tutor"})
+                job = (await client.post(f"/api/sessions/{session_id}/end")).json()
+                for _ in range(200):
+                    job = (await client.get(f"/api/scoring-jobs/{job['id']}")).json()
+                    if job["status"] in ("completed", "failed"):
+                        break
+                    await asyncio.sleep(0.05)
+                assert job["status"] == "completed"
+
+            response = await client.get("/api/analytics/cohorts", params={"by": "persona"})
+            body = response.json()
+            print(f"  {[(c['cohort'], c['sessions'], c['mean']) for c in body['cohorts']]}")
+            assert [(c["cohort"], c["sessions"]) for c in body["cohorts"]] == [
+                ("anxious_alex", 2), ("overconfident_olivia", 1)
+            ]
+            assert response.headers["cache-control"].startswith("public, max-age=")
+            revalidated = await client.get(
+                "/api/analytics/cohorts", params={"by": "persona"},
+                headers={"If-None-Match": response.headers["etag"]}
+            )
+            assert revalidated.status_code == 304
+
+            this_week = week_of(datetime.now().isoformat())
+            paged = (await client.get("/api/analytics/cohorts", params={
+                "by": "category", "from": this_week, "limit": 2
+            })).json()
+            assert len(paged["cohorts"]) == 2 and paged["next_cursor"] == paged["cohorts"][1]["cohort"]
+            later = (await client.get("/api/analytics/cohorts", params={
+                "by": "week", "from": (datetime.now() + timedelta(days=8)).date().isoformat()
+            })).json()
+            assert later["cohorts"] == []
+            assert (await client.get("/api/analytics/cohorts", params={"by": "tutor"})).status_code == 422
+            assert (await client.get("/api/analytics/cohorts", params={"from": "last week"})).status_code == 422
+
+
+def test_rollups_match_sessions():
+    asyncio.run(rollups_match_sessions())
+
+
+def test_cursor_pages():
+    asyncio.run(cursor_pages())
+
+
+def test_restart_and_backfill():
+    asyncio.run(restart_and_backfill())
+
+
+def test_cohorts_endpoint():
+    asyncio.run(app_flow())
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("COHORT ANALYTICS TEST")
+    print("=" * 80)
+    print("\nRollups vs statistics of the sessions")
+    test_rollups_match_sessions()
+    print("\nCursor pages")
+    test_cursor_pages()
+    print("\nRestart and backfill")
+    test_restart_and_backfill()
+    print("\nCohorts endpoint")
+    test_cohorts_endpoint()
+    print("\nAll checks passed")
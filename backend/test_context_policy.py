@@ -0,0 +1,59 @@
+"""Context policies for persona turns.
+
+- the token budget policy keeps the most recent messages that fit, moving
+  its cut-off in CONTEXT_TRIM_STEP steps,
+- the summary policy asks for a summary once enough tokens aged out of the
+  recent window, and sends only the turns after the memo,
+- selecting never writes to the messages, which are stored, logged,
+  exported and sent to clients as they are.
+
+Run from the backend directory:
+    python test_context_policy.py
+"""
+import copy
+
+from services.context_service import SummaryPolicy, TokenBudgetPolicy, estimate_message_tokens
+
+
+def transcript(turns: int) -> list:
+    messages = []
+    for turn in range(turns):
+        messages.append({"sender": "tutor", "content": f"Question {turn}: " + "why " * 20})
+        messages.append({"sender": "learner", "content": f"Answer {turn}: " + "because " * 20})
+    return messages
+
+
+def test_token_budget():
+    messages = transcript(20)
+    untouched = copy.deepcopy(messages)
+    policy = TokenBudgetPolicy(max_tokens=400, step=4)
+    selected = policy.select(messages)
+    tokens = sum(estimate_message_tokens(m) for m in selected)
+    print(f"  {len(selected)} of {len(messages)} messages, {tokens} tokens")
+    assert 0 < tokens <= 400 and selected == messages[-len(selected):]
+    assert (len(messages) - len(selected)) % 4 == 0
+    # Everything fits: everything is sent
+    assert TokenBudgetPolicy(max_tokens=100000, step=4).select(messages) == messages
+    assert messages == untouched
+
+
+def test_summary():
+    messages = transcript(20)
+    untouched = copy.deepcopy(messages)
+    policy = SummaryPolicy(max_tokens=100000, step=1, keep_messages=10, chunk_tokens=300)
+    assert policy.needs_summary(messages, None)
+    memo = {"summary": "Understands factoring.", "through": 30}
+    assert policy.select(messages, memo) == messages[30:]
+    assert not policy.needs_summary(messages, memo)
+    assert messages == untouched
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("CONTEXT POLICY TEST")
+    print("=" * 80)
+    print("\nToken budget")
+    test_token_budget()
+    print("\nSummary")
+    test_summary()
+    print("\nAll checks passed")
@@ -0,0 +1,224 @@
+"""Bulk session export.
+
+- an NDJSON export holds exactly the ended sessions matching the date,
+  persona and tutor filters, in (created_at, id) order, with their messages
+  and scores,
+- a Parquet export reads back with the same sessions, a column per category
+  score and the messages, split into row groups (skipped without pyarrow),
+- exports are encoded as sessions are read: the first chunk comes out
+  before most sessions have been read,
+- the endpoint streams the export with its content type and an attachment
+  file name, and rejects unknown formats and bad dates.
+
+Run from the backend directory:
+    python test_export.py
+"""
+import asyncio
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+os.environ["SESSION_STORE"] = "memory"
+os.environ["SESSION_SPILL_DIR"] = ""
+os.environ["SESSION_WAL_DIR"] = ""
+os.environ["OPENER_POOL_SIZE"] = "0"
+os.environ["ROLLING_SCORING_INTERVAL"] = "0"
+os.environ["SCORING_JOB_DIR"] = tempfile.mkdtemp()
+
+import main
+from export_sessions import export
+from services.export_service import export_chunks, parquet_chunks
+from services.session_store import InMemorySessionStore
+
+CATEGORIES = ["explanation", "questioning", "patience"]
+PERSONAS = ["anxious_alex", "overconfident_olivia"]
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+def session(index: int) -> dict:
+    created_at = datetime(2025, 3, 1) + timedelta(hours=index * 5)
+    record = {
+        "id": str(uuid.UUID(int=index + 1)),
+        "tutor_name": f"tutor-{index % 3}",
+        "problem": f"Problem {index % 4} with “quotes” and ünïcode",
+        "persona_type": PERSONAS[index % 2],
+        "messages": [
+            {
+                "content": f"Turn {turn} of session {index}\nsecond line",
+                "sender": "tutor" if turn % 2 == 0 else "student",
+                "timestamp": (created_at + timedelta(minutes=turn)).isoformat()
+            }
+            for turn in range(index % 5)
+        ],
+        "created_at": created_at.isoformat(),
+        "ended_at": (created_at + timedelta(minutes=30)).isoformat(),
+        # Every fourth session is still going and is not exported
+        "is_active": index % 4 == 3
+    }
+    # Some ended sessions were never scored
+    if index % 6 != 0:
+        record["scores"] = {"categories": {key: {"score": (index + i) % 5 + 1} for i, key in enumerate(CATEGORIES)}}
+    return record
+
+
+async def filled_store(count: int = 120) -> tuple:
+    store = InMemorySessionStore()
+    sessions = [session(index) for index in range(count)]
+    # Stored out of order; exported in (created_at, id) order
+    for record in reversed(sessions):
+        await store.create(record)
+    return store, sessions
+
+
+def expected(sessions: list, start=None, end=None, persona=None, tutor=None) -> list:
+    return [
+        record for record in sessions
+        if not record["is_active"]
+        and (start is None or record["created_at"] >= start) and (end is None or record["created_at"] < end)
+        and (persona is None or record["persona_type"] == persona)
+        and (tutor is None or record["tutor_name"] == tutor)
+    ]
+
+
+async def collect(chunks) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+async def ndjson_export():
+    store, sessions = await filled_store()
+    filters = [
+        {},
+        {"start": "2025-03-05", "end": "2025-03-10T12:00:00"},
+        {"persona_type": "anxious_alex", "tutor_name": "tutor-1"},
+        {"start": "2030-01-01"}
+    ]
+    for query in filters:
+        data = await collect(export_chunks(store.iter_export(**query), "ndjson"))
+        lines = [json.loads(line) for line in data.decode("utf-8").splitlines()]
+        wanted = expected(
+            sessions, query.get("start") and datetime.fromisoformat(query["start"]).isoformat(),
+            query.get("end"), query.get("persona_type"), query.get("tutor_name")
+        )
+        print(f"  {query or 'no filters'}: {len(lines)} sessions")
+        assert [line["id"] for line in lines] == [record["id"] for record in wanted]
+        for line, record in zip(lines, wanted):
+            assert line["messages"] == record["messages"]
+            assert line["scores"] == record.get("scores")
+            assert line["problem"] == record["problem"] and line["ended_at"] == record["ended_at"]
+
+
+async def parquet_export():
+    import pyarrow.parquet as pq
+
+    store, sessions = await filled_store()
+    # Small row groups, so there are several
+    data = await collect(parquet_chunks(store.iter_export(), CATEGORIES, row_group_messages=40))
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    rows = parquet.read().to_pylist()
+    wanted = expected(sessions)
+    print(f"  {len(rows)} sessions in {parquet.num_row_groups} row groups, {len(data)} bytes")
+    assert parquet.num_row_groups > 1
+    assert [row["id"] for row in rows] == [record["id"] for record in wanted]
+    for row, record in zip(rows, wanted):
+        assert row["messages"] == record["messages"]
+        assert row["message_count"] == len(record["messages"])
+        if "scores" in record:
+            assert json.loads(row["scores"]) == record["scores"]
+            for key in CATEGORIES:
+                assert row[f"score_{key}"] == record["scores"]["categories"][key]["score"]
+            assert abs(row["score_overall"] - sum(row[f"score_{key}"] for key in CATEGORIES) / 3) < 1e-9
+        else:
+            assert row["scores"] is None and row["score_overall"] is None
+
+    # The CLI writes the same export to a file
+    path = os.path.join(tempfile.mkdtemp(), "sessions.parquet")
+    report = await export(store, path, "parquet", persona_type="overconfident_olivia")
+    assert report["sessions"] == len(expected(sessions, persona="overconfident_olivia"))
+    assert pq.read_table(path).num_rows == report["sessions"]
+
+
+async def streams_while_reading():
+    read = 0
+
+    async def sessions():
+        nonlocal read
+        for index in range(20000):
+            read += 1
+            record = session(index)
+            record["is_active"] = False
+            yield record
+
+    chunks = export_chunks(sessions(), "ndjson")
+    first = await chunks.__anext__()
+    print(f"  first chunk of {len(first)} bytes after reading {read} of 20000 sessions")
+    assert read < 1000
+    rest = await collect(chunks)
+    assert (first + rest).count(b"\n") == 20000
+
+
+async def app_flow():
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+        sessions = [session(index) for index in range(40)]
+        store = main.get_session_store()
+        for record in sessions:
+            await store.create(record)
+
+        response = await client.get("/api/export/sessions", params={"persona": "anxious_alex", "to": "2025-03-05"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert response.headers["content-disposition"].endswith('.ndjson"')
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        wanted = expected(sessions, end="2025-03-05T00:00:00", persona="anxious_alex")
+        print(f"  {len(lines)} sessions streamed")
+        assert [line["id"] for line in lines] == [record["id"] for record in wanted]
+
+        parquet = await client.get("/api/export/sessions", params={"format": "parquet", "tutor": "tutor-2"})
+        if HAS_PYARROW:
+            assert parquet.status_code == 200 and parquet.content[:4] == b"PAR1"
+        else:
+            assert parquet.status_code == 501
+        assert (await client.get("/api/export/sessions", params={"format": "xml"})).status_code == 422
+        assert (await client.get("/api/export/sessions", params={"from": "last week"})).status_code == 422
+
+
+def test_ndjson_export():
+    asyncio.run(ndjson_export())
+
+
+def test_parquet_export():
+    if not HAS_PYARROW:
+        print("  pyarrow is not installed, skipped")
+        return
+    asyncio.run(parquet_export())
+
+
+def test_export_streams_while_reading():
+    asyncio.run(streams_while_reading())
+
+
+def test_export_endpoint():
+    asyncio.run(app_flow())
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("SESSION EXPORT TEST")
+    print("=" * 80)
+    print("\nNDJSON with filters")
+    test_ndjson_export()
+    print("\nParquet")
+    test_parquet_export()
+    print("\nStreaming")
+    test_export_streams_while_reading()
+    print("\nExport endpoint")
+    test_export_endpoint()
+    print("\nAll checks passed")
@@ -0,0 +1,173 @@
+"""Idempotency keys on message posts, against the local fake LLM server.
+
+- the same turn posted 50 times in parallel with one key makes exactly one
+  model call and adds one tutor message and one reply to the session,
+- a repeat after the turn completed replays the stored reply,
+- reusing the key for a different message is rejected with 422,
+- a repeat on the streaming endpoint gets the reply without a model call,
+- an expired key runs the turn again,
+- a turn still running neither holds back the expiry of keys after it nor
+  is evicted to make room, so a retry of it always joins it.
+
+Run from the backend directory:
+    python test_idempotency.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+
+from fake_llm_server import FakeLLMServer
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+os.environ["SESSION_STORE"] = "memory"
+os.environ["SESSION_SPILL_DIR"] = ""
+os.environ["SESSION_WAL_DIR"] = ""
+os.environ["OPENER_POOL_SIZE"] = "0"
+os.environ["ROLLING_SCORING_INTERVAL"] = "0"
+os.environ["SCORING_JOB_DIR"] = tempfile.mkdtemp()
+
+import main
+from services.claude_service import PERSONA_MODEL, ClaudeService
+from services.idempotency_service import IdempotencyCache
+from services.session_store import get_session_store
+
+DUPLICATES = 50
+
+
+def persona_requests(server: FakeLLMServer) -> int:
+    return sum(1 for body in server.requests if body.get("model") == PERSONA_MODEL)
+
+
+async def new_session() -> str:
+    session_id = str(uuid.uuid4())
+    await get_session_store().create({
+        "id": session_id,
+        "tutor_name": "tutor",
+        "problem": "Solve the quadratic equation x² - 5x + 6 = 0",
+        "persona_type": "anxious_alex",
+        "messages": [],
+        "created_at": datetime.now().isoformat(),
+        "is_active": True
+    })
+    return session_id
+
+
+async def with_app(server: FakeLLMServer, check):
+    service = ClaudeService(base_url=server.base_url)
+    sys.modules["services.claude_service"]._claude_service = service
+    sys.modules["services.idempotency_service"]._idempotency_cache = None
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            await check(client)
+
+
+def post_turn(client: httpx.AsyncClient, session_id: str, key: str, text: str = "What is 2 times 3?",
+              stream: bool = False):
+    path = f"/api/sessions/{session_id}/message" + ("/stream" if stream else "")
+    return client.post(path, json={"message": text, "sender": "tutor"}, headers={"Idempotency-Key": key})
+
+
+async def parallel_duplicates(client: httpx.AsyncClient, server: FakeLLMServer):
+    session_id = await new_session()
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(post_turn(client, session_id, "turn-1") for _ in range(DUPLICATES)))
+    print(f"  {DUPLICATES} parallel posts answered in {time.perf_counter() - start:.2f} s")
+
+    assert all(response.status_code == 200 for response in responses), [r.text for r in responses]
+    assert persona_requests(server) == 1, persona_requests(server)
+    assert len({response.json()["response"] for response in responses}) == 1
+    replayed = sum(1 for response in responses if response.headers.get("Idempotent-Replayed") == "true")
+    assert replayed == DUPLICATES - 1, replayed
+    session = await get_session_store().get(session_id)
+    assert [message["sender"] for message in session["messages"]] == ["tutor", "learner"]
+
+    # After completion: replayed without a model call
+    again = await post_turn(client, session_id, "turn-1")
+    assert again.json() == responses[0].json() and again.headers["Idempotent-Replayed"] == "true"
+    streamed = await post_turn(client, session_id, "turn-1", stream=True)
+    assert "event: done" in streamed.text and streamed.headers["Idempotent-Replayed"] == "true"
+    assert persona_requests(server) == 1
+
+    # Same key, different message
+    conflict = await post_turn(client, session_id, "turn-1", text="Something else")
+    assert conflict.status_code == 422
+
+    # A new key is a new turn
+    await post_turn(client, session_id, "turn-2")
+    assert persona_requests(server) == 2
+    session = await get_session_store().get(session_id)
+    assert len(session["messages"]) == 4
+
+
+async def expiry(client: httpx.AsyncClient, server: FakeLLMServer):
+    sys.modules["services.idempotency_service"]._idempotency_cache = IdempotencyCache(ttl=0.05)
+    session_id = await new_session()
+    await post_turn(client, session_id, "turn-1")
+    await asyncio.sleep(0.1)
+    retried = await post_turn(client, session_id, "turn-1")
+    assert "Idempotent-Replayed" not in retried.headers
+    assert persona_requests(server) == 2
+
+
+async def in_flight_keys():
+    cache = IdempotencyCache(ttl=0.05, max_keys=2)
+    slow = asyncio.get_running_loop().create_future()
+
+    async def wait_slow():
+        return await slow
+
+    async def reply():
+        return "done"
+
+    running = asyncio.create_task(cache.run("s", "slow", "a", wait_slow))
+    await asyncio.sleep(0)
+    for key in ("k1", "k2", "k3"):
+        assert await cache.run("s", key, "a", reply) == ("done", False)
+    # Over max_keys: a finished key made room, the running one stayed
+    assert ("s", "slow") in cache._running and ("s", "k1") not in cache._entries
+    _, replayed = await cache.run("s", "k3", "a", reply)
+    assert replayed
+
+    await asyncio.sleep(0.1)
+    cache._expire()
+    print(f"  keys left after the TTL with one turn running: {len(cache)}")
+    assert len(cache) == 1
+    joined = asyncio.create_task(cache.run("s", "slow", "a", wait_slow))
+    await asyncio.sleep(0)
+    slow.set_result("slow reply")
+    assert await running == ("slow reply", False)
+    assert await joined == ("slow reply", True)
+
+
+def test_parallel_duplicates_make_one_model_call():
+    with FakeLLMServer(latency=0.3) as server:
+        asyncio.run(with_app(server, lambda client: parallel_duplicates(client, server)))
+
+
+def test_expired_keys_run_again():
+    with FakeLLMServer(latency=0.01) as server:
+        asyncio.run(with_app(server, lambda client: expiry(client, server)))
+
+
+def test_running_turns_are_kept():
+    asyncio.run(in_flight_keys())
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("IDEMPOTENCY KEY TEST")
+    print("=" * 80)
+    print("\nParallel duplicates")
+    test_parallel_duplicates_make_one_model_call()
+    print("\nExpiry")
+    test_expired_keys_run_again()
+    print("\nTurns still running")
+    test_running_turns_are_kept()
+    print("\nAll checks passed")
@@ -0,0 +1,118 @@
+"""Opener cache misses under concurrency.
+
+- a class starting the same persona and problem on a cold cache makes one
+  inline model call, and every session gets its reply,
+- the shared reply is pooled with the uses it already had, so it is not
+  handed out more than OPENER_MAX_USES times,
+- a caller that gives up does not cancel the call for the others,
+- a failed call fails every caller waiting on it, and the next miss tries
+  again.
+
+Run from the backend directory:
+    python test_opener_cache.py
+"""
+import asyncio
+
+from services.opener_service import OpenerCache
+
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+PERSONA = "anxious_alex"
+CLASS_SIZE = 30
+
+
+class FakeClaudeService:
+    """Counts persona calls; each takes `latency` seconds"""
+
+    def __init__(self, latency: float = 0.05, fail: bool = False):
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+
+    async def get_persona_response(self, messages, persona_type, problem, priority, tutor=None) -> str:
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return f"Um, hi... where do I start? (take {call})"
+
+
+async def cold_class():
+    service = FakeClaudeService()
+    cache = OpenerCache(service, pool_size=0)
+    openers = await asyncio.gather(*(cache.get_opener(PERSONA, PROBLEM, tutor=f"t{i}") for i in range(CLASS_SIZE)))
+    print(f"  {CLASS_SIZE} sessions, {service.calls} model call(s), {len(set(openers))} opener(s)")
+    assert service.calls == 1 and len(set(openers)) == 1
+    # Nothing in flight any more: the next miss calls the model again
+    await cache.get_opener(PERSONA, PROBLEM)
+    assert service.calls == 2
+
+
+async def shared_uses():
+    service = FakeClaudeService()
+    cache = OpenerCache(service, pool_size=4, max_uses=3)
+    first, second = await asyncio.gather(cache.get_opener(PERSONA, PROBLEM), cache.get_opener(PERSONA, PROBLEM))
+    assert first == second
+    entry = next(entry for entry in cache._pools[next(iter(cache._pools))] if entry["text"] == first)
+    assert entry["uses"] == 2
+    await cache.close()
+
+    # Shared by more callers than it may be used by: not pooled at all
+    service = FakeClaudeService()
+    cache = OpenerCache(service, pool_size=4, max_uses=3)
+    openers = await asyncio.gather(*(cache.get_opener(PERSONA, PROBLEM) for _ in range(5)))
+    await cache.warm_up([PROBLEM], [PERSONA], wait=True)
+    assert openers[0] not in [entry["text"] for entry in cache._pools[next(iter(cache._pools))]]
+    await cache.close()
+
+
+async def caller_gives_up():
+    service = FakeClaudeService()
+    cache = OpenerCache(service, pool_size=0)
+    impatient = asyncio.create_task(cache.get_opener(PERSONA, PROBLEM))
+    patient = asyncio.create_task(cache.get_opener(PERSONA, PROBLEM))
+    await asyncio.sleep(0.01)
+    impatient.cancel()
+    assert (await patient).startswith("Um, hi")
+    assert service.calls == 1
+
+
+async def failed_call():
+    service = FakeClaudeService(fail=True)
+    cache = OpenerCache(service, pool_size=0)
+    results = await asyncio.gather(*(cache.get_opener(PERSONA, PROBLEM) for _ in range(5)), return_exceptions=True)
+    assert service.calls == 1 and all(isinstance(result, RuntimeError) for result in results)
+    service.fail = False
+    assert (await cache.get_opener(PERSONA, PROBLEM)).startswith("Um, hi")
+    assert service.calls == 2
+
+
+def test_cold_class_makes_one_call():
+    asyncio.run(cold_class())
+
+
+def test_shared_reply_counts_its_uses():
+    asyncio.run(shared_uses())
+
+
+def test_caller_giving_up():
+    asyncio.run(caller_gives_up())
+
+
+def test_failed_call():
+    asyncio.run(failed_call())
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("OPENER CACHE TEST")
+    print("=" * 80)
+    print("\nCold class")
+    test_cold_class_makes_one_call()
+    print("\nUses of a shared reply")
+    test_shared_reply_counts_its_uses()
+    print("\nA caller giving up")
+    test_caller_giving_up()
+    print("\nFailed call")
+    test_failed_call()
+    print("\nAll checks passed")
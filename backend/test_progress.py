@@ -0,0 +1,251 @@
+"""Running tutor progress aggregates.
+
+- the running mean and variance match those computed from all the values,
+  also after a session's values are replaced by a re-scoring,
+- the recent-window trend follows the direction of the latest scores,
+- rebuilding the aggregates from stored sessions (the backfill) gives the
+  same result as folding the scores in one by one,
+- ending sessions through the app updates the progress endpoints, also when
+  a session's scores come straight from the scoring cache,
+- the memory store's write-ahead log restores the aggregates on restart.
+
+Run from the backend directory:
+    python test_progress.py
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+from fake_llm_server import FakeLLMServer
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+os.environ["SESSION_STORE"] = "memory"
+os.environ["SESSION_SPILL_DIR"] = ""
+os.environ["SESSION_WAL_DIR"] = ""
+os.environ["OPENER_POOL_SIZE"] = "0"
+os.environ["ROLLING_SCORING_INTERVAL"] = "0"
+os.environ["SCORING_JOB_DIR"] = tempfile.mkdtemp()
+
+import main
+from backfill_progress import backfill
+from services.claude_service import ClaudeService
+from services.progress_service import apply_scores, progress_view, rebuild_progress, stats_view
+from services.session_log import SessionLog
+from services.session_store import InMemorySessionStore
+
+CATEGORIES = ["explanation", "questioning", "patience"]
+PERSONAS = ["anxious_alex", "overconfident_olivia"]
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+
+
+def result(rng: random.Random) -> dict:
+    return {"categories": {key: {"score": rng.randint(1, 5)} for key in CATEGORIES}}
+
+
+def scored_session(index: int, rng: random.Random) -> dict:
+    return {
+        "id": str(uuid.UUID(int=index + 1)),
+        "tutor_name": f"tutor-{index % 3}",
+        "problem": PROBLEM,
+        "persona_type": PERSONAS[index % 2],
+        "messages": [],
+        "created_at": (datetime(2025, 1, 1) + timedelta(minutes=index)).isoformat(),
+        "ended_at": (datetime(2025, 1, 1) + timedelta(minutes=index + 10)).isoformat(),
+        "is_active": False,
+        "scores": result(rng)
+    }
+
+
+def check_stats(view: dict, values: list):
+    assert view["count"] == len(values)
+    assert abs(view["mean"] - statistics.mean(values)) < 1e-3
+    assert abs(view["variance"] - statistics.variance(values)) < 1e-3
+
+
+def running_statistics():
+    rng = random.Random(1)
+    sessions = [scored_session(index, rng) for index in range(60)]
+    progress = None
+    for session in sessions:
+        progress = apply_scores(progress, session, session["scores"])
+    # Re-score a third of them: their old values are taken out, not added to
+    for session in sessions[::3]:
+        new = result(rng)
+        progress = apply_scores(progress, session, new, previous=session["scores"])
+        session["scores"] = new
+
+    view = progress_view("tutor", progress)
+    assert view["sessions"] == 60
+    for key in CATEGORIES:
+        check_stats(view["categories"][key], [s["scores"]["categories"][key]["score"] for s in sessions])
+        for persona in PERSONAS:
+            check_stats(
+                view["personas"][persona]["categories"][key],
+                [s["scores"]["categories"][key]["score"] for s in sessions if s["persona_type"] == persona]
+            )
+    overall = [statistics.mean(c["score"] for c in s["scores"]["categories"].values()) for s in sessions]
+    check_stats(view["overall"], overall)
+    print(f"  overall mean {view['overall']['mean']}, variance {view['overall']['variance']} over 60 sessions")
+
+
+def recent_trend():
+    progress = None
+    for index in range(20):
+        # Flat at 2 for ten sessions, then climbing
+        score = 2 if index < 10 else min(5, 2 + (index - 9) * 0.3)
+        session = {"id": str(index), "persona_type": "anxious_alex", "ended_at": None}
+        progress = apply_scores(progress, session, {"categories": {"patience": {"score": score}}})
+    view = stats_view(progress["categories"]["patience"])
+    print(f"  recent mean {view['recent_mean']}, trend {view['trend_per_session']} per session")
+    assert view["trend_per_session"] > 0.2
+    assert view["recent_mean"] > view["mean"]
+
+
+async def rebuild_matches_incremental():
+    rng = random.Random(2)
+    store = InMemorySessionStore()
+    incremental = {}
+    for index in range(90):
+        session = scored_session(index, rng)
+        # Some sessions were never scored
+        if index % 7 == 0:
+            session.pop("scores")
+        await store.create(session)
+        if "scores" in session:
+            tutor = session["tutor_name"]
+            incremental[tutor] = apply_scores(incremental.get(tutor), session, session["scores"])
+
+    rebuilt = await rebuild_progress(store.iter_ended(page_size=10))
+    assert rebuilt == incremental
+
+    report = await backfill(store, page_size=10)
+    print(f"  backfill: {report}")
+    assert report["sessions_read"] == 90 and report["sessions_scored"] == 90 - 13 and report["tutors"] == 3
+    for tutor, progress in incremental.items():
+        assert await store.get_tutor_progress(tutor) == progress
+
+
+async def progress_survives_restart():
+    directory = Path(tempfile.mkdtemp())
+    store = InMemorySessionStore(log=SessionLog(directory))
+    await store.start()
+    session = scored_session(0, random.Random(3))
+    await store.create(session)
+    await store.update_tutor_progress("tutor-0", lambda progress: apply_scores(progress, session, session["scores"]))
+    expected = await store.get_tutor_progress("tutor-0")
+    # No close: restored from the log
+    recovered = InMemorySessionStore(log=SessionLog(directory))
+    await recovered.start()
+    assert await recovered.get_tutor_progress("tutor-0") == expected
+    await recovered.close()
+    # After a clean shutdown: restored from the snapshot
+    again = InMemorySessionStore(log=SessionLog(directory))
+    await again.start()
+    assert await again.get_tutor_progress("tutor-0") == expected
+    await again.close()
+
+
+def scoring_request_count(server: FakeLLMServer) -> int:
+    return sum(1 for body in server.requests if "<categories>" in body.get("system", [{}])[0].get("text", ""))
+
+
+async def wait_for_job(client: httpx.AsyncClient, job: dict) -> dict:
+    for _ in range(200):
+        job = (await client.get(f"/api/scoring-jobs/{job['id']}")).json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        await asyncio.sleep(0.05)
+    raise AssertionError("Scoring job did not finish")
+
+
+async def app_flow():
+    with FakeLLMServer(latency=0.01) as server:
+        sys.modules["services.claude_service"]._claude_service = ClaudeService(base_url=server.base_url)
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.app.router.lifespan_context(main.app), \
+                httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            assert (await client.get("/api/users/progress-tutor/progress")).status_code == 404
+
+            async def session_with_turn() -> str:
+                started = await client.post("/api/sessions/start", json={
+                    "tutor_name": "progress-tutor", "problem": PROBLEM, "persona_type": "anxious_alex"
+                })
+                session_id = started.json()["session_id"]
+                reply = await client.post(
+                    f"/api/sessions/{session_id}/message",
+                    json={"message": "Which two numbers multiply to 6?", "sender": "tutor"}
+                )
+                assert reply.status_code == 200
+                return session_id
+
+            first = await session_with_turn()
+            job = await wait_for_job(client, (await client.post(f"/api/sessions/{first}/end")).json())
+            assert job["status"] == "completed"
+            scoring_requests = scoring_request_count(server)
+
+            # Rebuild the same transcript so its scores come from the cache
+            second_id = await session_with_turn()
+            store = main.get_session_store()
+            store.sessions[second_id]["messages"] = list((await store.get(first))["messages"])
+            job = (await client.post(f"/api/sessions/{second_id}/end")).json()
+            assert job["status"] == "completed"
+            await asyncio.sleep(0.1)
+
+            progress = (await client.get("/api/users/progress-tutor/progress")).json()
+            print(f"  {progress['sessions']} sessions, overall {progress['overall']}")
+            assert progress["sessions"] == 2 and progress["overall"]["count"] == 2
+            assert "anxious_alex" in progress["personas"]
+            assert (await store.get(first))["scores"]["fingerprint"]
+            assert scoring_request_count(server) == scoring_requests
+
+            category = next(iter(progress["categories"]))
+            detail = (await client.get(f"/api/users/progress-tutor/progress/categories/{category}")).json()
+            assert detail["overall"] == progress["categories"][category]
+            assert detail["personas"]["anxious_alex"]["count"] == 2
+            missing = await client.get("/api/users/progress-tutor/progress/categories/not-a-category")
+            assert missing.status_code == 404
+
+
+def test_running_statistics_match_recomputed():
+    running_statistics()
+
+
+def test_recent_trend():
+    recent_trend()
+
+
+def test_rebuild_matches_incremental():
+    asyncio.run(rebuild_matches_incremental())
+
+
+def test_progress_survives_restart():
+    asyncio.run(progress_survives_restart())
+
+
+def test_ending_sessions_updates_progress():
+    asyncio.run(app_flow())
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("TUTOR PROGRESS TEST")
+    print("=" * 80)
+    print("\nRunning statistics, with re-scored sessions")
+    test_running_statistics_match_recomputed()
+    print("\nRecent trend")
+    test_recent_trend()
+    print("\nRebuild and backfill")
+    test_rebuild_matches_incremental()
+    print("\nRestart")
+    test_progress_survives_restart()
+    print("\nEnding sessions through the app")
+    test_ending_sessions_updates_progress()
+    print("\nAll checks passed")
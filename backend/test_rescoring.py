@@ -0,0 +1,181 @@
+"""Batch re-scoring against the local fake LLM server.
+
+Fills an in-memory session store with ended sessions, then re-scores them
+through BatchRescorer:
+
+- a run that crashes part-way (a failing bulk write) and is resumed from its
+  checkpoint must end with every session scored, without re-scoring the
+  sessions that were already written,
+- a session the model never answers properly is retried and then reported
+  as failed without stopping the run,
+- running again with the same configuration does nothing, and a changed
+  scoring configuration re-scores everything.
+
+Run from the backend directory:
+    python test_rescoring.py
+"""
+import asyncio
+import os
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from fake_llm_server import FakeLLMServer, default_responder
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+
+from services.claude_service import ClaudeService
+from services.rescoring_service import BatchRescorer, format_report
+from services.session_store import InMemorySessionStore
+
+SESSIONS = 120
+BROKEN_PROBLEM = "This problem always gets a broken score"
+FLAKY_PROBLEM = "This problem fails to score once"
+
+
+def responder():
+    """Garbage for the broken session, and for each flaky session's first request"""
+    failed_once = set()
+
+    def respond(body: dict) -> str:
+        prompt = body["messages"][0]["content"]
+        if BROKEN_PROBLEM in prompt:
+            return "<category_evaluation>truncated"
+        if FLAKY_PROBLEM in prompt:
+            key = prompt.split("<session_id>")[-1][:36]
+            if key not in failed_once:
+                failed_once.add(key)
+                return "<json>{not json</json>"
+        return default_responder(body)
+
+    return respond
+
+
+class CrashingStore(InMemorySessionStore):
+    """Fails the nth bulk write, like a worker dying mid-run"""
+
+    def __init__(self, crash_on_write: int):
+        super().__init__(max_sessions=SESSIONS * 2)
+        self.crash_on_write = crash_on_write
+        self.writes = 0
+
+    async def save_scores(self, scores):
+        self.writes += 1
+        if self.writes == self.crash_on_write:
+            raise RuntimeError("simulated crash")
+        await super().save_scores(scores)
+
+
+async def fill(store: InMemorySessionStore):
+    start = datetime(2025, 1, 1)
+    for index in range(SESSIONS):
+        session_id = str(uuid.UUID(int=index + 1))
+        if index == 7:
+            problem = BROKEN_PROBLEM
+        elif index % 10 == 3:
+            problem = f"{FLAKY_PROBLEM} <session_id>{session_id}"
+        else:
+            problem = "Solve the quadratic equation x² - 5x + 6 = 0"
+        await store.create({
+            "id": session_id,
+            "tutor_name": f"tutor-{index % 5}",
+            "problem": problem,
+            "persona_type": "anxious_alex",
+            "messages": [
+                {"content": "Which two numbers multiply to 6 and add to -5?", "sender": "tutor",
+                 "timestamp": start.isoformat()},
+                {"content": "Is it -2 and -3? Sorry if that's wrong...", "sender": "learner",
+                 "timestamp": start.isoformat()}
+            ],
+            "created_at": (start + timedelta(minutes=index)).isoformat(),
+            "is_active": False
+        })
+
+
+def scoring_requests(server: FakeLLMServer) -> int:
+    return sum(1 for body in server.requests if "<categories>" in body.get("system", [{}])[0].get("text", ""))
+
+
+async def rescore(server: FakeLLMServer, store, checkpoint: Path, **kwargs) -> dict:
+    service = ClaudeService(base_url=server.base_url)
+    try:
+        rescorer = BatchRescorer(
+            store,
+            service,
+            checkpoint_path=checkpoint,
+            concurrency=8,
+            requests_per_minute=0,
+            page_size=25,
+            write_batch_size=10,
+            **kwargs
+        )
+        return await rescorer.run()
+    finally:
+        await service.aclose()
+
+
+async def crash_and_resume():
+    with FakeLLMServer(latency=0.02, responder=responder()) as server, \
+            tempfile.TemporaryDirectory() as data_dir:
+        checkpoint = Path(data_dir) / "checkpoint.json"
+        store = CrashingStore(crash_on_write=4)
+        await fill(store)
+
+        try:
+            await rescore(server, store, checkpoint)
+            raise AssertionError("The first run should have crashed")
+        except RuntimeError as e:
+            assert str(e) == "simulated crash"
+        scored_before_crash = sum(1 for s in store.sessions.values() if s.get("scores"))
+        requests_before_resume = scoring_requests(server)
+        print(f"  crashed after scoring {scored_before_crash} sessions")
+        assert 0 < scored_before_crash < SESSIONS
+
+        report = await rescore(server, store, checkpoint)
+        print("  " + format_report(report).replace("\n", "\n  "))
+
+        scored = [s for s in store.sessions.values() if (s.get("scores") or {}).get("fingerprint")]
+        assert len(scored) == SESSIONS - 1
+        assert report["failed"] == 1 and report["failures"][0]["session_id"] == str(uuid.UUID(int=8))
+        assert report["retries"] >= SESSIONS // 10
+        assert report["tokens"]["output"] > 0 and report["cost_usd"] > 0
+        # Already-written sessions were skipped, not scored again
+        resumed_requests = scoring_requests(server) - requests_before_resume
+        assert resumed_requests < SESSIONS - scored_before_crash + report["retries"] + 3 * 2 + 8, resumed_requests
+
+        again = await rescore(server, store, checkpoint)
+        assert scoring_requests(server) - requests_before_resume == resumed_requests
+        assert again["scored"] == report["scored"]
+
+
+async def configuration_change():
+    with FakeLLMServer(latency=0.01) as server, tempfile.TemporaryDirectory() as data_dir:
+        checkpoint = Path(data_dir) / "checkpoint.json"
+        store = InMemorySessionStore(max_sessions=SESSIONS * 2)
+        await fill(store)
+        single = await rescore(server, store, checkpoint, limit=30, max_attempts=1)
+        assert single["scored"] + single["failed"] == 30
+        # A different configuration (here the scoring mode) starts a new run
+        parallel = await rescore(server, store, checkpoint, mode="parallel", limit=30, max_attempts=1)
+        assert parallel["fingerprint"] != single["fingerprint"]
+        assert parallel["scored"] + parallel["failed"] == 30 and parallel["skipped"] == 0
+
+
+def test_rescoring_resumes_after_crash():
+    asyncio.run(crash_and_resume())
+
+
+def test_rescoring_restarts_when_configuration_changes():
+    asyncio.run(configuration_change())
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("BATCH RE-SCORING TEST")
+    print("=" * 80)
+    print("\nCrash and resume")
+    test_rescoring_resumes_after_crash()
+    print("\nConfiguration change")
+    test_rescoring_restarts_when_configuration_changes()
+    print("\nAll checks passed")
@@ -0,0 +1,133 @@
+"""Rolling scoring while a session is live.
+
+- with a model slower than the tutor, evaluations are not cancelled by new
+  turns: each one finishes and records its evidence, and the turns that
+  came in meanwhile are evaluated right after it, so evidence keeps up
+  with the session and every model call counts,
+- with a model faster than the tutor, every interval gets its own
+  evaluation,
+- ending the session cancels the in-flight evaluation and its follow-up.
+
+Run from the backend directory:
+    python test_rolling_scoring.py
+"""
+import asyncio
+import os
+
+from services.rolling_scoring_service import (
+    cancel_rolling_evaluation,
+    schedule_rolling_evaluation,
+    wait_for_rolling_evaluation
+)
+
+
+class FakeEvaluator:
+    """Stands in for ClaudeService.evaluate_new_turns, taking `latency` seconds"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.started = 0
+        self.finished = 0
+
+    async def evaluate_new_turns(self, conversation_history, persona_type, problem, rolling_evaluation=None) -> dict:
+        self.started += 1
+        await asyncio.sleep(self.latency)
+        self.finished += 1
+        return {"categories": {"patience": {"score": 4, "new_evidence": [f"through {len(conversation_history)}"]}}}
+
+
+def new_session(session_id: str) -> dict:
+    return {"id": session_id, "persona_type": "anxious_alex", "problem": "x + 1 = 2", "messages": []}
+
+
+async def run_session(session: dict, evaluator: FakeEvaluator, turns: int, turn_gap: float) -> list:
+    """Send turns every `turn_gap` seconds; returns evaluated_through after each"""
+    updates = []
+
+    async def on_update(session_id: str, fields: dict):
+        updates.append(fields["rolling_evaluation"]["evaluated_through"])
+
+    progress = []
+    for _ in range(turns):
+        session["messages"].append({"sender": "tutor", "content": "What comes next?"})
+        session["messages"].append({"sender": "learner", "content": "I'm not sure."})
+        schedule_rolling_evaluation(session, evaluator, on_update=on_update)
+        await asyncio.sleep(turn_gap)
+        progress.append((session.get("rolling_evaluation") or {}).get("evaluated_through", 0))
+    await wait_for_rolling_evaluation(session["id"])
+    assert updates == sorted(updates)
+    return progress
+
+
+async def slow_model():
+    # A turn every 10 ms, an evaluation takes 50 ms
+    evaluator = FakeEvaluator(latency=0.05)
+    session = new_session("slow")
+    progress = await run_session(session, evaluator, turns=30, turn_gap=0.01)
+    print(f"  {evaluator.started} evaluations for 30 turns, evaluated through {progress[9::10]} "
+          f"then {session['rolling_evaluation']['evaluated_through']}")
+    assert evaluator.started == evaluator.finished
+    assert progress[9] > 0 and progress[19] > progress[9] and progress[29] > progress[19]
+    assert session["rolling_evaluation"]["evaluated_through"] == 60
+    # About one evaluation per 50 ms of turns, not one per turn
+    assert evaluator.started < 15
+
+
+async def fast_model():
+    evaluator = FakeEvaluator(latency=0.001)
+    session = new_session("fast")
+    progress = await run_session(session, evaluator, turns=10, turn_gap=0.01)
+    assert evaluator.started == evaluator.finished == 10
+    assert progress == [2 * turn for turn in range(1, 11)]
+
+
+async def cancel_on_end():
+    evaluator = FakeEvaluator(latency=0.05)
+    session = new_session("ended")
+    for _ in range(3):
+        session["messages"].append({"sender": "tutor", "content": "What comes next?"})
+        session["messages"].append({"sender": "learner", "content": "I'm not sure."})
+        schedule_rolling_evaluation(session, evaluator)
+        await asyncio.sleep(0)
+    cancel_rolling_evaluation(session["id"])
+    await asyncio.sleep(0.1)
+    assert evaluator.started == 1 and evaluator.finished == 0
+    assert "rolling_evaluation" not in session
+
+
+def every_turn(check):
+    """Run a check with an evaluation due after every turn"""
+    previous = os.environ.get("ROLLING_SCORING_INTERVAL")
+    os.environ["ROLLING_SCORING_INTERVAL"] = "1"
+    try:
+        asyncio.run(check())
+    finally:
+        if previous is None:
+            del os.environ["ROLLING_SCORING_INTERVAL"]
+        else:
+            os.environ["ROLLING_SCORING_INTERVAL"] = previous
+
+
+def test_slow_model_keeps_up():
+    every_turn(slow_model)
+
+
+def test_fast_model_evaluates_each_interval():
+    every_turn(fast_model)
+
+
+def test_cancel_on_end():
+    every_turn(cancel_on_end)
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("ROLLING SCORING TEST")
+    print("=" * 80)
+    print("\nModel slower than the tutor")
+    test_slow_model_keeps_up()
+    print("\nModel faster than the tutor")
+    test_fast_model_evaluates_each_interval()
+    print("\nEnding the session")
+    test_cancel_on_end()
+    print("\nAll checks passed")
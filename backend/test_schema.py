@@ -0,0 +1,76 @@
+"""Smoke test for schema.sql, which the PostgreSQL store runs on every start.
+
+- every statement is one the schema is made of (CREATE TABLE / INDEX,
+  ALTER TABLE ... ADD COLUMN), is safe to run again (IF NOT EXISTS), and
+  has balanced parentheses; stray text left between statements fails here,
+- with DATABASE_URL set (and asyncpg installed), the file is executed
+  twice in a transaction that is rolled back, as PostgresSessionStore.start
+  runs it.
+
+Run from the backend directory:
+    python test_schema.py
+"""
+import asyncio
+import importlib.util
+import os
+import re
+
+from services.session_store import SCHEMA_PATH
+
+STATEMENT = re.compile(
+    r"^(CREATE TABLE IF NOT EXISTS|CREATE (UNIQUE )?INDEX IF NOT EXISTS|ALTER TABLE \w+ ADD COLUMN IF NOT EXISTS)\s"
+)
+
+
+def schema_statements() -> list:
+    """The statements of schema.sql, comments removed"""
+    text = "\n".join(line.split("--", 1)[0] for line in SCHEMA_PATH.read_text().splitlines())
+    return [" ".join(statement.split()) for statement in text.split(";") if statement.strip()]
+
+
+def check_statements():
+    statements = schema_statements()
+    print(f"  {len(statements)} statements")
+    for statement in statements:
+        assert STATEMENT.match(statement), f"Unexpected statement: {statement[:80]}"
+        assert statement.count("(") == statement.count(")"), f"Unbalanced parentheses: {statement[:80]}"
+
+
+async def execute_schema(database_url: str):
+    import asyncpg
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            # Twice: the store runs it on every start
+            await conn.execute(SCHEMA_PATH.read_text())
+            await conn.execute(SCHEMA_PATH.read_text())
+        finally:
+            await transaction.rollback()
+    finally:
+        await conn.close()
+
+
+def test_schema_statements():
+    check_statements()
+
+
+def test_schema_executes():
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url or importlib.util.find_spec("asyncpg") is None:
+        print("  DATABASE_URL is not set or asyncpg is not installed, skipped")
+        return
+    asyncio.run(execute_schema(database_url))
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("SCHEMA TEST")
+    print("=" * 80)
+    print("\nStatements")
+    test_schema_statements()
+    print("\nExecuted against PostgreSQL")
+    test_schema_executes()
+    print("\nAll checks passed")
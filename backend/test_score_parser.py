@@ -0,0 +1,168 @@
+"""Fuzz tests for the streaming score parser.
+
+Realistic and adversarial scoring responses are fed to ScoreStreamParser
+in random chunk sizes. Well-formed responses must parse to the expected
+result, with every category reported before the JSON block ends. Broken or
+randomly mutated responses must fail with ValueError, never any other
+exception.
+
+Run from the backend directory:
+    python test_score_parser.py
+"""
+import json
+import random
+
+from fake_llm_server import _filler
+from services.score_parser import ScoreStreamParser, extract_json, parse_scoring_response
+from services.scoring_service import get_category_keys
+
+KEYS = get_category_keys()
+FUZZ_CASES = 500
+
+TRICKY_FEEDBACK = [
+    'Asked "why?" {twice} and waited]',
+    "Closed with } and then { again",
+    'Escaped \\"quotes\\" and a trailing backslash \\\\',
+    "Unicode: x² − 5x + 6 = 0 ✓ 👍",
+    "<json>{\"categories\": {}}</json> quoted inside feedback",
+    "Line one\nline two",
+]
+
+
+def make_result(rng: random.Random) -> dict:
+    return {
+        "categories": {
+            key: {"score": rng.randint(1, 5), "feedback": rng.choice(TRICKY_FEEDBACK)}
+            for key in KEYS
+        },
+        "session_summary": rng.choice(TRICKY_FEEDBACK)
+    }
+
+
+def make_response(result: dict, rng: random.Random) -> str:
+    """A scoring response with analysis sections that try to confuse the parser"""
+    analysis = []
+    for key in KEYS:
+        noise = rng.choice([
+            _filler(rng.randint(10, 400)),
+            "The tutor wrote {\"categories\": {\"score\": 5 and never closed it {{{",
+            "Maybe the answer is <json>{\"score\": 1}</json>? No, keep reading.",
+            "Unbalanced ]]]}}} brackets and a lone \" quote",
+        ])
+        analysis.append(f"<category_evaluation>\n{key}: {noise}\n</category_evaluation>")
+    indent = rng.choice([None, 2])
+    return "\n".join(analysis) + f"\n<json>\n{json.dumps(result, indent=indent, ensure_ascii=rng.random() < 0.5)}\n</json>"
+
+
+def chunked(text: str, rng: random.Random):
+    position = 0
+    while position < len(text):
+        size = rng.choice([1, 2, 3, 4, 16, 200])
+        yield text[position:position + size]
+        position += size
+
+
+def stream(text: str, rng: random.Random, keys=KEYS):
+    """Feed text in random chunks; returns (result, reported categories)"""
+    parser = ScoreStreamParser(keys)
+    reported = []
+    for chunk in chunked(text, rng):
+        for key, category in parser.feed(chunk):
+            reported.append((key, category))
+    return parser.finish(), reported
+
+
+def test_realistic_responses_parse():
+    rng = random.Random(1)
+    for _ in range(FUZZ_CASES):
+        expected = make_result(rng)
+        result, reported = stream(make_response(expected, rng), rng)
+        assert result == expected
+        assert dict(reported) == expected["categories"]
+        assert [key for key, _ in reported] == KEYS
+
+
+def test_categories_reported_before_json_ends():
+    rng = random.Random(2)
+    expected = make_result(rng)
+    text = make_response(expected, rng)
+    end_of_first_category = text.index('"feedback"', text.index("<json>")) + 200
+    parser = ScoreStreamParser(KEYS)
+    reported = []
+    for chunk in chunked(text[:end_of_first_category], rng):
+        reported.extend(parser.feed(chunk))
+    assert reported and reported[0][0] == KEYS[0]
+
+
+def test_fallbacks():
+    rng = random.Random(3)
+    expected = make_result(rng)
+    body = json.dumps(expected)
+    # Bare JSON without tags, as the old raw-JSON regex handled
+    assert parse_scoring_response(f"Here are the scores:\n{body}\nThanks!", KEYS) == expected
+    # Analysis section that is never closed
+    assert parse_scoring_response(f"<category_evaluation>oops\n<json>{body}</json>", KEYS) == expected
+    # Old {"scores", "feedback"} format
+    old = {"scores": {key: 3 for key in KEYS}, "feedback": "Good session", "session_summary": "Done"}
+    result = parse_scoring_response(f"<json>{json.dumps(old)}</json>", KEYS)
+    assert result["categories"][KEYS[0]] == {"score": 3, "feedback": "Good session"}
+    # Schema-free extraction used for single-category and summary calls
+    assert extract_json('<category_evaluation>x</category_evaluation><json>{"score": 2}</json>') == {"score": 2}
+
+
+def test_invalid_responses_raise_value_error():
+    rng = random.Random(4)
+    body = json.dumps(make_result(rng))
+    out_of_range = body.replace('"score": ', '"score": 9', 1)
+    string_score = body.replace('"score": ', '"score": "', 1)
+    broken = [
+        "",
+        "No JSON here at all",
+        "<json>",
+        f"<json>{body[:len(body) // 2]}",
+        "<json>{\"categories\": {\"x\": 1,}}</json>",
+        "<json>[1, 2, 3]</json>",
+        f"<json>{out_of_range}</json>",
+        f"<json>{json.dumps({'categories': {KEYS[0]: {'score': 3, 'feedback': 'ok'}}})}</json>",
+        f"<json>{string_score}</json>",
+    ]
+    for text in broken:
+        try:
+            parse_scoring_response(text, KEYS)
+        except ValueError:
+            continue
+        raise AssertionError(f"Expected ValueError for {text[:60]!r}")
+
+
+def test_random_mutations_only_raise_value_error():
+    rng = random.Random(5)
+    outcomes = {"parsed": 0, "rejected": 0}
+    for _ in range(FUZZ_CASES):
+        text = list(make_response(make_result(rng), rng))
+        for _ in range(rng.randint(1, 5)):
+            position = rng.randrange(len(text))
+            operation = rng.random()
+            if operation < 0.4:
+                del text[position]
+            elif operation < 0.8:
+                text.insert(position, rng.choice('{}[]"\\:,<>/'))
+            else:
+                del text[position:]
+        try:
+            stream("".join(text), rng)
+            outcomes["parsed"] += 1
+        except ValueError:
+            outcomes["rejected"] += 1
+    print(f"  {outcomes['parsed']} mutated responses still parsed, {outcomes['rejected']} rejected")
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("SCORE PARSER FUZZ TESTS")
+    print("=" * 80)
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            print(f"\n{name}")
+            test()
+            print("  ok")
+    print("\nAll checks passed")
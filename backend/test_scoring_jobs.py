@@ -0,0 +1,259 @@
+"""Scoring job queue and its event stream.
+
+- the events stream sends every status a client has not seen and always
+  ends with the finished job, also when the job changes (or finishes)
+  while the stream is waiting for the client to take a frame,
+- partial scores added while a job runs each change the streamed status,
+- finished jobs drop their transcript once the result is handed over, in
+  memory and on disk, and are forgotten (file included) after the
+  retention window; a restart drops expired files and old transcripts,
+- jobs that share one scoring computation through the score cache all get
+  its partial scores, also those scored before a job joined, and a
+  session finalized from running evidence never shares a cache key with a
+  full scoring pass of the same transcript,
+- a job directory another process is running jobs from is refused, so a
+  second worker cannot run its jobs again.
+
+Run from the backend directory:
+    python test_scoring_jobs.py
+"""
+import asyncio
+import fcntl
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+os.environ["SESSION_STORE"] = "memory"
+os.environ["SESSION_SPILL_DIR"] = ""
+os.environ["SESSION_WAL_DIR"] = ""
+os.environ["OPENER_POOL_SIZE"] = "0"
+os.environ["ROLLING_SCORING_INTERVAL"] = "0"
+os.environ["SCORING_JOB_DIR"] = tempfile.mkdtemp()
+
+import main
+from services import job_service
+from services.directory_lock import DirectoryLockedError
+from services.job_service import ScoringJobQueue
+from services.score_cache import ScoreCache, scoring_cache_key
+
+
+class ConnectedRequest:
+    """Stands in for the request of a client that stays connected"""
+
+    async def is_disconnected(self) -> bool:
+        return False
+
+
+class SteppedScorer:
+    """Scores one category each time `step` is called, then finishes"""
+
+    def __init__(self, categories: list):
+        self.categories = categories
+        self._steps = asyncio.Queue()
+
+    def step(self):
+        self._steps.put_nowait(None)
+
+    async def __call__(self, payload: dict, on_category) -> dict:
+        scored = {}
+        for key in self.categories:
+            await self._steps.get()
+            scored[key] = {"score": 4}
+            on_category(key, scored[key])
+        await self._steps.get()
+        return {"categories": scored}
+
+
+async def settle():
+    """Let the worker run until it waits for the next step"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def status(frame: str) -> dict:
+    event, data = frame.strip().split("\n")
+    assert event == "event: status", frame
+    return json.loads(data[len("data: "):])
+
+
+async def stream_with_slow_client():
+    scorer = SteppedScorer(["explanation", "questioning"])
+    queue = ScoringJobQueue(scorer, job_dir=tempfile.mkdtemp(), workers=1)
+    await queue.start()
+    job_service._scoring_job_queue = queue
+    try:
+        job = queue.submit("session-1", "tutor", {})
+        await settle()
+        response = await main.stream_scoring_job(job["id"], ConnectedRequest())
+        frames = response.body_iterator
+
+        first = status(await frames.__anext__())
+        assert first["status"] == "running" and first["partial_scores"] == {}
+
+        # One category is scored while the client has not asked for more
+        scorer.step()
+        await settle()
+        second = status(await frames.__anext__())
+        assert list(second["partial_scores"]) == ["explanation"]
+
+        # The job finishes while the stream sits at a yield: no event is
+        # set for it, and the stream must still send the final status
+        scorer.step()
+        scorer.step()
+        await settle()
+        assert queue.get(job["id"])["status"] == "completed"
+        last = status(await asyncio.wait_for(frames.__anext__(), 1))
+        print(f"  statuses: {first['status']} -> {second['status']} -> {last['status']}")
+        assert last["status"] == "completed" and set(last["result"]["categories"]) == set(scorer.categories)
+        try:
+            await frames.__anext__()
+            raise AssertionError("The stream went on after the job finished")
+        except StopAsyncIteration:
+            pass
+    finally:
+        await queue.stop()
+        job_service._scoring_job_queue = None
+
+
+async def instant_scorer(payload: dict, on_category) -> dict:
+    return {"categories": {"patience": {"score": len(payload["conversation_history"])}}}
+
+
+async def retention():
+    job_dir = Path(tempfile.mkdtemp())
+    delivered = []
+
+    async def on_result(job: dict):
+        delivered.append(job["payload"]["persona_type"])
+
+    queue = ScoringJobQueue(instant_scorer, job_dir=job_dir, workers=1, on_result=on_result,
+                            retention=timedelta(seconds=0.2))
+    await queue.start()
+    try:
+        payload = {"conversation_history": ["hi"] * 3, "persona_type": "anxious_alex"}
+        job = queue.submit("session-1", "tutor", payload, dedupe_key="session-1:a")
+        for _ in range(50):
+            if "payload" not in job:
+                break
+            await asyncio.sleep(0.01)
+        assert delivered == ["anxious_alex"], "the result handler must still get the transcript"
+        assert job["status"] == "completed" and job["result"]["categories"]["patience"]["score"] == 3
+        assert "payload" not in job and "payload" not in json.loads((job_dir / f"{job['id']}.json").read_text())
+        assert queue.submit("session-1", "tutor", payload, dedupe_key="session-1:a") is job
+
+        await asyncio.sleep(0.25)
+        other = queue.submit("session-2", "tutor", payload, dedupe_key="session-2:a")
+        print(f"  jobs kept after the retention window: {len(queue.jobs)}")
+        assert queue.get(job["id"]) is None and not (job_dir / f"{job['id']}.json").exists()
+        assert "session-1:a" not in queue._by_dedupe_key
+        assert queue.get(other["id"]) is other
+    finally:
+        await queue.stop()
+
+    # Files left by a worker that stopped: one expired, one with its transcript
+    expired = {"id": "expired", "session_id": "s", "tutor_name": "t", "status": "completed",
+               "created_at": "2025-01-01T00:00:00", "finished_at": "2025-01-01T00:00:01",
+               "payload": payload, "dedupe_key": None}
+    recent = {**expired, "id": "recent", "finished_at": datetime.now().isoformat()}
+    for old in (expired, recent):
+        (job_dir / f"{old['id']}.json").write_text(json.dumps(old))
+    queue = ScoringJobQueue(instant_scorer, job_dir=job_dir, workers=1, retention=timedelta(hours=1))
+    await queue.start()
+    try:
+        assert queue.get("expired") is None and not (job_dir / "expired.json").exists()
+        assert "payload" not in queue.get("recent")
+    finally:
+        await queue.stop()
+
+
+async def shared_computation():
+    scorer = SteppedScorer(["explanation", "questioning"])
+    cache = ScoreCache()
+
+    async def cached_scorer(payload: dict, on_category) -> dict:
+        return await cache.get_or_compute("same transcript", lambda report: scorer(payload, report), on_category)
+
+    queue = ScoringJobQueue(cached_scorer, job_dir=tempfile.mkdtemp(), workers=2)
+    await queue.start()
+    try:
+        first = queue.submit("session-1", "tutor", {})
+        await settle()
+        scorer.step()
+        await settle()
+        # Joins after the first category was scored
+        second = queue.submit("session-2", "tutor", {})
+        await settle()
+        assert list(second["partial_scores"]) == ["explanation"]
+        scorer.step()
+        await settle()
+        print(f"  partial scores: {list(first['partial_scores'])} and {list(second['partial_scores'])}")
+        assert first["partial_scores"] == second["partial_scores"]
+        assert set(second["partial_scores"]) == {"explanation", "questioning"}
+        scorer.step()
+        await settle()
+        assert first["status"] == second["status"] == "completed"
+    finally:
+        await queue.stop()
+
+
+def test_cache_key_covers_rolling_evaluation():
+    messages = [{"sender": "tutor", "content": "Hi"}, {"sender": "learner", "content": "Hello"}]
+    full = scoring_cache_key(messages, "anxious_alex", "x + 1 = 2", "single")
+    assert scoring_cache_key(messages, "anxious_alex", "x + 1 = 2", "single", {}) == full
+    rolling = {"evaluated_through": 2, "categories": {"patience": {"score": 4, "evidence": ["waited"]}}}
+    from_evidence = scoring_cache_key(messages, "anxious_alex", "x + 1 = 2", "single", rolling)
+    assert from_evidence != full
+    other_evidence = {**rolling, "categories": {"patience": {"score": 2, "evidence": ["rushed"]}}}
+    assert scoring_cache_key(messages, "anxious_alex", "x + 1 = 2", "single", other_evidence) != from_evidence
+
+
+async def locked_job_dir():
+    job_dir = Path(tempfile.mkdtemp())
+    # Another worker's lock: a separate open file, as a second process has
+    fd = os.open(job_dir / "lock", os.O_RDWR | os.O_CREAT)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    queue = ScoringJobQueue(instant_scorer, job_dir=job_dir, workers=1)
+    try:
+        await queue.start()
+        raise AssertionError("Started on a job directory another process holds")
+    except DirectoryLockedError as e:
+        print(f"  {e}")
+    finally:
+        os.close(fd)
+    await queue.start()
+    await queue.stop()
+
+
+def test_shared_computation_reports_to_every_job():
+    asyncio.run(shared_computation())
+
+
+def test_locked_job_dir_is_refused():
+    asyncio.run(locked_job_dir())
+
+
+def test_events_stream_ends_with_final_status():
+    asyncio.run(stream_with_slow_client())
+
+
+def test_finished_jobs_are_released():
+    asyncio.run(retention())
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("SCORING JOB QUEUE TEST")
+    print("=" * 80)
+    print("\nEvents stream with a slow client")
+    test_events_stream_ends_with_final_status()
+    print("\nRetention of finished jobs")
+    test_finished_jobs_are_released()
+    print("\nJobs sharing one scoring computation")
+    test_shared_computation_reports_to_every_job()
+    test_cache_key_covers_rolling_evaluation()
+    print("\nJob directory in use by another process")
+    test_locked_job_dir_is_refused()
+    print("\nAll checks passed")
@@ -0,0 +1,262 @@
+"""Crash-safe sessions: the in-memory store's write-ahead log and snapshots.
+
+- sessions changed concurrently are restored exactly after a crash (no
+  close, no final snapshot), from the log alone,
+- with frequent snapshots the log is compacted and replay still restores
+  everything, including a session that was spilled when a snapshot was
+  taken and came back later,
+- a record torn by a crash mid-write is ignored,
+- concurrent turns share fsyncs (group commit),
+- a turn in flight when the app shuts down is drained, logged and present
+  after the app starts again,
+- a log directory another process is writing to is refused, and usable
+  again once that process is gone.
+
+Run from the backend directory:
+    python test_session_recovery.py
+"""
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from fake_llm_server import FakeLLMServer
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+os.environ["SESSION_STORE"] = "memory"
+os.environ["SESSION_SPILL_DIR"] = ""
+os.environ["OPENER_POOL_SIZE"] = "0"
+os.environ["ROLLING_SCORING_INTERVAL"] = "0"
+os.environ["SCORING_JOB_DIR"] = tempfile.mkdtemp()
+
+import main
+from services.claude_service import ClaudeService
+from services.metrics_service import get_metrics_snapshot, reset_metrics
+from services.directory_lock import DirectoryLockedError
+from services.session_log import SessionLog
+from services.session_store import InMemorySessionStore
+
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+
+
+def message(sender: str, content: str) -> dict:
+    return {"content": content, "sender": sender, "timestamp": datetime.now().isoformat()}
+
+
+async def new_session(store: InMemorySessionStore) -> str:
+    session_id = str(uuid.uuid4())
+    await store.create({
+        "id": session_id,
+        "tutor_name": "tutor",
+        "problem": PROBLEM,
+        "persona_type": "anxious_alex",
+        "messages": [message("tutor", "Hi"), message("learner", "Hello")],
+        "created_at": datetime.now().isoformat(),
+        "is_active": True
+    })
+    return session_id
+
+
+async def run_sessions(store: InMemorySessionStore, count: int, seed: int = 0):
+    rng = random.Random(seed)
+
+    async def one():
+        session_id = await new_session(store)
+        for turn in range(rng.randrange(1, 8)):
+            await store.append_messages(session_id, [message("tutor", f"Turn {turn}"), message("learner", "Um...")])
+            await asyncio.sleep(0)
+        if rng.random() < 0.5:
+            await store.update(session_id, {"context_memo": {"summary": "Factoring", "through": 2}})
+        if rng.random() < 0.3:
+            await store.update(session_id, {"is_active": False, "ended_at": datetime.now().isoformat()})
+
+    await asyncio.gather(*(one() for _ in range(count)))
+
+
+async def restarted(directory: Path, **store_options) -> InMemorySessionStore:
+    store = InMemorySessionStore(log=SessionLog(directory), **store_options)
+    await store.start()
+    return store
+
+
+async def crash_recovery():
+    directory = Path(tempfile.mkdtemp())
+    store = InMemorySessionStore(log=SessionLog(directory))
+    await store.start()
+    await run_sessions(store, 200)
+    # No close: the process dies with every acknowledged change in the log only
+    recovered = await restarted(directory)
+    print(f"  {len(recovered.sessions)} sessions restored from {len(list(directory.glob('wal-*')))} log segment(s)")
+    assert recovered.sessions == store.sessions
+    await recovered.close()
+
+
+async def snapshots_and_spills():
+    directory = Path(tempfile.mkdtemp())
+    spill_dir = Path(tempfile.mkdtemp())
+    store = InMemorySessionStore(max_sessions=50, spill_dir=spill_dir, log=SessionLog(directory, snapshot_bytes=20_000))
+    await store.start()
+    spilled = await new_session(store)
+    await run_sessions(store, 300, seed=1)
+    assert spilled not in store.sessions
+    # Comes back from its spill file after snapshots that did not hold it
+    await store.append_messages(spilled, [message("tutor", "Still there?"), message("learner", "Yes!")])
+    expected = {session_id: dict(session) for session_id, session in store.sessions.items()}
+    snapshots = get_metrics_snapshot()["counters"].get("session_wal_snapshots", 0)
+    segments = len(list(directory.glob("wal-*")))
+    print(f"  {snapshots} snapshot(s) taken, {segments} log segment(s) left")
+    assert snapshots > 0 and segments <= 2
+
+    recovered = await restarted(directory, max_sessions=50, spill_dir=spill_dir)
+    for session_id, session in expected.items():
+        assert await recovered.get(session_id) == session
+    assert len((await recovered.get(spilled))["messages"]) == 4
+    await recovered.close()
+
+
+async def torn_record():
+    directory = Path(tempfile.mkdtemp())
+    store = InMemorySessionStore(log=SessionLog(directory))
+    await store.start()
+    session_id = await new_session(store)
+    await store.append_messages(session_id, [message("tutor", "One"), message("learner", "Two")])
+    segment = max(directory.glob("wal-*"))
+    with segment.open("ab") as log:
+        log.write(b'{"op": "append", "id": "' + session_id.encode() + b'", "at": 4, "messa')
+    recovered = await restarted(directory)
+    assert recovered.sessions == store.sessions
+    assert get_metrics_snapshot()["counters"]["session_wal_torn_records"] == 1
+    # Later changes go to a new segment and replay past the torn one
+    await recovered.append_messages(session_id, [message("tutor", "Three"), message("learner", "Four")])
+    again = await restarted(directory)
+    assert len(again.sessions[session_id]["messages"]) == 6
+    await again.close()
+
+
+async def group_commit():
+    store = InMemorySessionStore(log=SessionLog(Path(tempfile.mkdtemp())))
+    await store.start()
+    session_ids = [await new_session(store) for _ in range(100)]
+    reset_metrics()
+    await asyncio.gather(*(
+        store.append_messages(session_id, [message("tutor", "Hi"), message("learner", "Hey")])
+        for session_id in session_ids
+    ))
+    counters = get_metrics_snapshot()["counters"]
+    print(f"  {counters['session_wal_records']} records in {counters['session_wal_commits']} commit(s)")
+    assert counters["session_wal_records"] == 100 and counters["session_wal_commits"] < 10
+    await store.close()
+
+
+async def drained_restart():
+    os.environ["SESSION_WAL_DIR"] = tempfile.mkdtemp()
+    with FakeLLMServer(latency=0.5) as server:
+        async def lifespan():
+            sys.modules["services.claude_service"]._claude_service = ClaudeService(base_url=server.base_url)
+            return main.app.router.lifespan_context(main.app)
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            async with await lifespan():
+                started = await client.post("/api/sessions/start", json={
+                    "tutor_name": "tutor", "problem": PROBLEM, "persona_type": "anxious_alex"
+                })
+                session_id = started.json()["session_id"]
+                turn = asyncio.create_task(client.post(
+                    f"/api/sessions/{session_id}/message", json={"message": "Where do we start?", "sender": "tutor"}
+                ))
+                await asyncio.sleep(0.1)
+            # Shutdown waited for the turn before closing the store
+            assert turn.done() and (await turn).status_code == 200
+
+            async with await lifespan():
+                session = await main.get_session_store().get(session_id)
+    os.environ["SESSION_WAL_DIR"] = ""
+    print(f"  {len(session['messages'])} messages after restart")
+    assert [m["sender"] for m in session["messages"]] == ["tutor", "learner", "tutor", "learner"]
+    assert session["messages"][2]["content"] == "Where do we start?"
+
+
+# Holds the log directory's lock, as another worker would, until stdin closes
+LOCK_HOLDER = """
+import fcntl, os, sys
+fd = os.open(os.path.join(sys.argv[1], "lock"), os.O_RDWR | os.O_CREAT)
+fcntl.flock(fd, fcntl.LOCK_EX)
+os.write(fd, str(os.getpid()).encode())
+print("locked", flush=True)
+sys.stdin.read()
+"""
+
+
+async def locked_directory():
+    directory = Path(tempfile.mkdtemp())
+    holder = subprocess.Popen([sys.executable, "-c", LOCK_HOLDER, str(directory)],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        store = InMemorySessionStore(log=SessionLog(directory))
+        try:
+            await store.start()
+            raise AssertionError("Opened a log another process holds")
+        except DirectoryLockedError as e:
+            print(f"  {e}")
+            assert str(holder.pid) in str(e)
+    finally:
+        holder.stdin.close()
+        holder.wait()
+    # The lock went with the process
+    store = await restarted(directory)
+    await new_session(store)
+    await store.close()
+
+
+def test_crash_recovery():
+    asyncio.run(crash_recovery())
+
+
+def test_snapshots_and_spilled_sessions():
+    reset_metrics()
+    asyncio.run(snapshots_and_spills())
+
+
+def test_torn_record_is_ignored():
+    reset_metrics()
+    asyncio.run(torn_record())
+
+
+def test_group_commit():
+    asyncio.run(group_commit())
+
+
+def test_turn_in_flight_survives_restart():
+    asyncio.run(drained_restart())
+
+
+def test_locked_directory_is_refused():
+    asyncio.run(locked_directory())
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("SESSION RECOVERY TEST")
+    print("=" * 80)
+    print("\nCrash recovery from the log")
+    test_crash_recovery()
+    print("\nSnapshots, compaction and spilled sessions")
+    test_snapshots_and_spilled_sessions()
+    print("\nTorn record")
+    test_torn_record_is_ignored()
+    print("\nGroup commit")
+    test_group_commit()
+    print("\nRestart with a turn in flight")
+    test_turn_in_flight_survives_restart()
+    print("\nLog directory in use by another process")
+    test_locked_directory_is_refused()
+    print("\nAll checks passed")
@@ -0,0 +1,214 @@
+"""Soak test for the in-memory session store: memory must stay flat.
+
+Drives 100k synthetic sessions through the bounded store. Most are
+abandoned mid-session and the rest are ended, the way a busy classroom
+deployment would. After a warm-up phase the process RSS and the store's
+own byte estimate must stop growing. A second check spills sessions to
+disk and resumes them. A third evicts ended sessions and checks that bulk
+reads (iter_ended, iter_export), re-scoring and a restart still see them,
+and that without a spill directory the ones left out are counted.
+
+Run from the backend directory:
+    python test_session_soak.py
+"""
+import asyncio
+import random
+import resource
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from services.metrics_service import get_metrics_snapshot, reset_metrics
+from services.session_store import InMemorySessionStore, session_cursor
+
+SESSIONS = 100_000
+WARM_UP_SESSIONS = 20_000
+MAX_SESSIONS = 2_000
+MAX_BYTES = 8 * 1024 * 1024
+# Allowed RSS growth between the end of warm-up and the end of the run
+RSS_TOLERANCE_BYTES = 16 * 1024 * 1024
+
+TUTOR_LINE = "Can you tell me which two numbers multiply to 6 and add up to -5?"
+LEARNER_LINE = "Um, is it -2 and -3? Sorry if that's wrong, I always mix up the signs..."
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process"""
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return pages * resource.getpagesize()
+
+
+def message(sender: str, content: str) -> dict:
+    return {"content": content, "sender": sender, "timestamp": datetime.now().isoformat()}
+
+
+async def run_session(store: InMemorySessionStore, rng: random.Random):
+    session_id = str(uuid.uuid4())
+    await store.create({
+        "id": session_id,
+        "tutor_name": f"tutor-{rng.randrange(500)}",
+        "problem": "Solve the quadratic equation x² - 5x + 6 = 0",
+        "persona_type": "anxious_alex",
+        "messages": [message("tutor", TUTOR_LINE), message("learner", LEARNER_LINE)],
+        "created_at": datetime.now().isoformat(),
+        "is_active": True
+    })
+    for _ in range(rng.randrange(1, 12)):
+        await store.get(session_id)
+        await store.append_messages(session_id, [message("tutor", TUTOR_LINE), message("learner", LEARNER_LINE)])
+    if rng.random() < 0.3:
+        await store.update(session_id, {"is_active": False, "ended_at": datetime.now().isoformat()})
+
+
+async def soak():
+    reset_metrics()
+    store = InMemorySessionStore(max_sessions=MAX_SESSIONS, max_bytes=MAX_BYTES, idle_ttl=3600)
+    rng = random.Random(42)
+
+    start = time.perf_counter()
+    for _ in range(WARM_UP_SESSIONS):
+        await run_session(store, rng)
+    warm_rss = rss_bytes()
+    warm_bytes = store.resident_bytes
+
+    for index in range(WARM_UP_SESSIONS, SESSIONS):
+        await run_session(store, rng)
+        if (index + 1) % 20_000 == 0:
+            print(f"  {index + 1:>7} sessions: {len(store.sessions):>5} resident, "
+                  f"{store.resident_bytes / 1024 / 1024:>5.1f} MB estimated, "
+                  f"RSS {rss_bytes() / 1024 / 1024:>6.1f} MB")
+    elapsed = time.perf_counter() - start
+
+    counters = get_metrics_snapshot()["counters"]
+    print(f"  {SESSIONS} sessions in {elapsed:.1f} s, "
+          f"{counters.get('session_evictions_lru', 0)} LRU evictions")
+
+    assert len(store.sessions) <= MAX_SESSIONS
+    assert store.resident_bytes <= MAX_BYTES
+    assert store.resident_bytes <= warm_bytes * 1.1
+    assert rss_bytes() - warm_rss <= RSS_TOLERANCE_BYTES, (
+        f"RSS grew by {(rss_bytes() - warm_rss) / 1024 / 1024:.1f} MB after warm-up"
+    )
+
+
+async def spill_and_resume():
+    reset_metrics()
+    with tempfile.TemporaryDirectory() as spill_dir:
+        store = InMemorySessionStore(max_sessions=10, spill_dir=spill_dir)
+        await store.start()
+        rng = random.Random(7)
+        session_ids = []
+        for _ in range(50):
+            session_id = str(uuid.uuid4())
+            session_ids.append(session_id)
+            await store.create({
+                "id": session_id,
+                "tutor_name": "tutor",
+                "problem": "2 + 2",
+                "persona_type": "anxious_alex",
+                "messages": [message("tutor", TUTOR_LINE)],
+                "created_at": datetime.now().isoformat(),
+                "is_active": rng.random() < 0.8
+            })
+
+        resumed = 0
+        for session_id in session_ids:
+            session = await store.get(session_id)
+            if session is not None:
+                assert session["messages"][0]["content"] == TUTOR_LINE
+                resumed += 1
+
+        counters = get_metrics_snapshot()["counters"]
+        print(f"  {resumed}/50 sessions resumed, {counters.get('session_spills', 0)} spills, "
+              f"{counters.get('session_rehydrations', 0)} rehydrations")
+        # Ended sessions are spilled too, so every session comes back
+        assert resumed == 50
+        assert counters.get("session_rehydrations", 0) > 0
+        assert len(store.sessions) <= 10
+
+
+async def ended_session_store(spill_dir, created: list) -> InMemorySessionStore:
+    """A store of 5 resident sessions after 40 ended ones went through it"""
+    store = InMemorySessionStore(max_sessions=5, spill_dir=spill_dir)
+    await store.start()
+    for created_at, session_id in created:
+        await store.create({
+            "id": session_id,
+            "tutor_name": f"tutor-{len(session_id) % 2}",
+            "problem": "2 + 2",
+            "persona_type": "anxious_alex" if int(session_id[-1], 16) % 2 else "overconfident_olivia",
+            "messages": [message("tutor", TUTOR_LINE), message("learner", LEARNER_LINE)],
+            "created_at": created_at,
+            "is_active": False
+        })
+    return store
+
+
+async def ended_sessions_on_disk():
+    reset_metrics()
+    rng = random.Random(11)
+    start = datetime(2025, 3, 1)
+    created = [((start + timedelta(minutes=index)).isoformat(), str(uuid.uuid4())) for index in range(40)]
+    # Ended out of creation order
+    shuffled = created[:]
+    rng.shuffle(shuffled)
+    with tempfile.TemporaryDirectory() as spill_dir:
+        store = await ended_session_store(spill_dir, shuffled)
+        assert len(store.sessions) == 5
+        ended = [session_cursor(session) async for session in store.iter_ended()]
+        print(f"  {len(ended)} ended sessions read, {len(store.sessions)} resident")
+        assert ended == created
+        assert [session_cursor(session) async for session in store.iter_ended(after=created[19])] == created[20:]
+        exported = [session async for session in store.iter_export(start=created[10][0], persona_type="anxious_alex")]
+        assert [session_cursor(session) for session in exported] == [
+            cursor for cursor in created[10:] if int(cursor[1][-1], 16) % 2
+        ]
+        assert all(len(session["messages"]) == 2 for session in exported)
+
+        # Re-scoring a spilled session keeps its scores
+        # Among the first 35, so it is on disk again after the reads below
+        spilled = next(session_id for _, session_id in created[:35] if session_id not in store.sessions)
+        await store.save_scores({spilled: {"overall_score": 4}})
+        assert (await store.get(spilled))["scores"] == {"overall_score": 4}
+
+        # A restart finds the spilled ones on disk (the resident ones need
+        # the write-ahead log)
+        for _, session_id in created:
+            await store.get(session_id)
+        on_disk = [cursor for cursor in created if cursor[1] not in store.sessions]
+        restarted = InMemorySessionStore(max_sessions=5, spill_dir=spill_dir)
+        await restarted.start()
+        assert [session_cursor(session) async for session in restarted.iter_ended()] == on_disk
+        assert (await restarted.get(spilled))["scores"] == {"overall_score": 4}
+
+    # Without a spill directory they are dropped, and counted
+    store = await ended_session_store(None, shuffled)
+    assert len([session async for session in store.iter_ended()]) == 5
+    assert store.dropped_ended == 35
+    assert get_metrics_snapshot()["counters"]["session_ended_dropped"] == 35
+
+
+def test_session_store_memory_stays_flat():
+    asyncio.run(soak())
+
+
+def test_session_store_spills_and_resumes():
+    asyncio.run(spill_and_resume())
+
+
+def test_ended_sessions_spill_for_bulk_reads():
+    asyncio.run(ended_sessions_on_disk())
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("SESSION STORE SOAK TEST")
+    print("=" * 80)
+    test_session_store_memory_stays_flat()
+    print("\nSpill and resume")
+    test_session_store_spills_and_resumes()
+    print("\nEnded sessions on disk")
+    test_ended_sessions_spill_for_bulk_reads()
+    print("\nAll checks passed")
@@ -0,0 +1,318 @@
+"""WebSocket session channel.
+
+Runs the app under uvicorn against the fake LLM server and talks to it with
+the websockets client:
+
+- turns in two sessions stream over one connection at once; each reply's
+  token frames carry its request id and add up to the reply, which is
+  stored,
+- ending a session pushes scoring frames until the job completes,
+- after a connection drops mid-turn, the turn still completes; a new
+  connection resumes from the last message it had and a resent turn with
+  the same idempotency key is replayed without another model call,
+- the server pings, closes a connection that stays silent and keeps one
+  that answers,
+- a client that stops reading makes producers wait, then is disconnected;
+  token frames that queued up behind it are merged,
+- a started session carries its persona's display name from the persona
+  file,
+- bad requests get error frames with the HTTP endpoints' statuses.
+
+Run from the backend directory:
+    python test_session_socket.py
+"""
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+from contextlib import asynccontextmanager
+
+import uvicorn
+import websockets
+
+from fake_llm_server import FakeLLMServer
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+os.environ["SESSION_STORE"] = "memory"
+os.environ["SESSION_SPILL_DIR"] = ""
+os.environ["SESSION_WAL_DIR"] = ""
+os.environ["OPENER_POOL_SIZE"] = "0"
+os.environ["ROLLING_SCORING_INTERVAL"] = "0"
+os.environ["SCORING_JOB_DIR"] = tempfile.mkdtemp()
+
+import main
+from services.claude_service import ClaudeService
+from services.session_channel import TRY_AGAIN_LATER, SessionChannel
+
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+
+
+@asynccontextmanager
+async def running_app(server: FakeLLMServer):
+    """The app served by uvicorn on this event loop; yields its ws:// URL"""
+    sys.modules["services.claude_service"]._claude_service = ClaudeService(base_url=server.base_url)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    app_server = uvicorn.Server(uvicorn.Config(main.app, log_level="warning", ws="websockets"))
+    task = asyncio.create_task(app_server.serve(sockets=[sock]))
+    while not app_server.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield f"ws://127.0.0.1:{sock.getsockname()[1]}/api/sessions/ws"
+    finally:
+        app_server.should_exit = True
+        await task
+
+
+async def receive(connection, request_id=None) -> dict:
+    """The next frame, skipping heartbeats and, if given, other requests' frames"""
+    while True:
+        frame = json.loads(await asyncio.wait_for(connection.recv(), 10))
+        if frame["type"] != "ping" and (request_id is None or frame.get("id") == request_id):
+            return frame
+
+
+async def start(connection, request_id: str, persona: str = "anxious_alex") -> dict:
+    await connection.send(json.dumps({
+        "type": "start", "id": request_id, "tutor_name": "socket-tutor", "problem": PROBLEM, "persona_type": persona
+    }))
+    started = await receive(connection, request_id)
+    assert started["type"] == "started" and started["seq"] == 2
+    return started
+
+
+async def multiplexed_turns():
+    # Tokens trickle in, so the two replies interleave
+    with FakeLLMServer(latency=0.05, per_token_latency=0.01) as server:
+        async with running_app(server) as url, websockets.connect(url) as connection:
+            first = (await start(connection, "s1"))["session_id"]
+            started = await start(connection, "s2", "overconfident_olivia")
+            assert started["persona_info"] == {"name": "Overconfident Olivia", "type": "overconfident_olivia"}
+            second = started["session_id"]
+            for request_id, session_id in (("t1", first), ("t2", second)):
+                await connection.send(json.dumps({
+                    "type": "message", "id": request_id, "session_id": session_id,
+                    "message": "Which two numbers multiply to 6?", "sender": "tutor"
+                }))
+            tokens = {"t1": [], "t2": []}
+            replies = {}
+            order = []
+            while len(replies) < 2:
+                frame = await receive(connection)
+                order.append(frame["id"])
+                if frame["type"] == "token":
+                    tokens[frame["id"]].append(frame["text"])
+                else:
+                    assert frame["type"] == "reply", frame
+                    replies[frame["id"]] = frame
+            switches = sum(1 for a, b in zip(order, order[1:]) if a != b)
+            print(f"  {len(order)} frames, request id switched {switches} times")
+            assert switches > 1
+            store = main.get_session_store()
+            for request_id, session_id in (("t1", first), ("t2", second)):
+                reply = replies[request_id]
+                assert reply["session_id"] == session_id and reply["seq"] == 4 and not reply["replayed"]
+                assert "".join(tokens[request_id]) == reply["response"]
+                assert (await store.get(session_id))["messages"][-1]["content"] == reply["response"]
+
+            # Without streaming: just the reply
+            await connection.send(json.dumps({
+                "type": "message", "id": "t3", "session_id": second, "stream": False,
+                "message": "And what do they add up to?", "sender": "tutor"
+            }))
+            reply = await receive(connection, "t3")
+            assert reply["type"] == "reply" and reply["seq"] == 6
+            assert (await store.get(second))["messages"][-1]["content"] == reply["response"]
+
+            await connection.send(json.dumps({"type": "end", "id": "e1", "session_id": first}))
+            ended = await receive(connection, "e1")
+            assert ended["type"] == "ended"
+            job = ended["job"]
+            statuses = [job["status"]]
+            while job["status"] not in ("completed", "failed"):
+                frame = await receive(connection, "e1")
+                assert frame["type"] == "scoring"
+                job = frame["job"]
+                statuses.append(job["status"])
+            print(f"  scoring: {' -> '.join(statuses)}")
+            assert job["status"] == "completed" and job["result"]["categories"]
+
+
+async def resume_after_drop():
+    # A fresh idempotency cache with the default TTL
+    sys.modules["services.idempotency_service"]._idempotency_cache = None
+    with FakeLLMServer(latency=0.3) as server:
+        async with running_app(server) as url:
+            async with websockets.connect(url) as connection:
+                session_id = (await start(connection, "s"))["session_id"]
+                await connection.send(json.dumps({
+                    "type": "message", "id": "t", "session_id": session_id, "idempotency_key": "turn-1",
+                    "message": "What do you notice about the constant term?", "sender": "tutor"
+                }))
+            # Dropped before the reply; the turn runs on
+            store = main.get_session_store()
+            for _ in range(100):
+                if len((await store.get(session_id))["messages"]) == 4:
+                    break
+                await asyncio.sleep(0.05)
+            model_calls = len(server.requests)
+
+            async with websockets.connect(url) as connection:
+                await connection.send(json.dumps({"type": "resume", "id": "r", "session_id": session_id, "after": 2}))
+                resumed = await receive(connection, "r")
+                assert resumed["type"] == "resumed" and resumed["seq"] == 4 and resumed["session_active"]
+                assert [m["sender"] for m in resumed["messages"]] == ["tutor", "learner"]
+
+                # The client never saw the reply, so it resends the turn
+                await connection.send(json.dumps({
+                    "type": "message", "id": "t", "session_id": session_id, "idempotency_key": "turn-1",
+                    "message": "What do you notice about the constant term?", "sender": "tutor"
+                }))
+                frame = await receive(connection, "t")
+                while frame["type"] == "token":
+                    frame = await receive(connection, "t")
+                print(f"  resumed {len(resumed['messages'])} messages; resent turn replayed={frame['replayed']}")
+                assert frame["type"] == "reply" and frame["replayed"] and frame["seq"] == 4
+                assert frame["response"] == resumed["messages"][1]["content"]
+                assert len(server.requests) == model_calls
+                assert len((await store.get(session_id))["messages"]) == 4
+
+
+async def heartbeats():
+    os.environ["WS_HEARTBEAT_SECONDS"] = "0.1"
+    os.environ["WS_IDLE_TIMEOUT_SECONDS"] = "0.35"
+    try:
+        with FakeLLMServer(latency=0.01) as server:
+            async with running_app(server) as url:
+                # Answers every ping: stays open
+                async with websockets.connect(url) as connection:
+                    pings = 0
+                    while pings < 6:
+                        frame = json.loads(await asyncio.wait_for(connection.recv(), 2))
+                        assert frame["type"] == "ping"
+                        pings += 1
+                        await connection.send(json.dumps({"type": "pong"}))
+                    await connection.send(json.dumps({"type": "ping"}))
+                    assert (await receive(connection))["type"] == "pong"
+
+                # Silent: closed as gone away
+                async with websockets.connect(url) as connection:
+                    try:
+                        while True:
+                            await asyncio.wait_for(connection.recv(), 2)
+                    except websockets.ConnectionClosed as closed:
+                        print(f"  silent client closed with {closed.rcvd.code} after the idle timeout")
+                        assert closed.rcvd.code == 1001
+    finally:
+        del os.environ["WS_HEARTBEAT_SECONDS"]
+        del os.environ["WS_IDLE_TIMEOUT_SECONDS"]
+
+
+class StalledSocket:
+    """A client connection that never reads what it is sent"""
+
+    def __init__(self):
+        self.frames = []
+        self.closed_with = None
+        self._stalled = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def receive_text(self) -> str:
+        await asyncio.Event().wait()
+
+    async def send_text(self, text: str):
+        self.frames.append(json.loads(text))
+        await self._stalled.wait()
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+async def slow_consumer():
+    socket_ = StalledSocket()
+    channel = SessionChannel(socket_, queue_frames=4, send_timeout=0.2)
+    serving = asyncio.create_task(channel.serve(lambda frame: None))
+    await asyncio.sleep(0)
+    sent = 0
+    started = asyncio.get_running_loop().time()
+    # The writer merges the first four frames into one and stalls sending it;
+    # four more fill the queue and the ninth waits for room
+    while not channel.closed:
+        await channel.send({"type": "token", "id": "t", "text": "x" * 100})
+        sent += 1
+    waited = asyncio.get_running_loop().time() - started
+    await asyncio.wait_for(serving, 1)
+    print(f"  {sent} frames accepted, producer held {waited:.2f}s, closed with {socket_.closed_with}")
+    assert sent == 9 and waited >= 0.2
+    assert socket_.closed_with == TRY_AGAIN_LATER
+    assert socket_.frames == [{"type": "token", "id": "t", "text": "x" * 400}]
+    # Further frames are dropped without waiting
+    await asyncio.wait_for(channel.send({"type": "token"}), 0.05)
+
+
+async def error_frames():
+    with FakeLLMServer(latency=0.01) as server:
+        async with running_app(server) as url, websockets.connect(url) as connection:
+            await connection.send("not json")
+            assert (await receive(connection))["status"] == 400
+            await connection.send(json.dumps({"type": "dance", "id": "a"}))
+            assert (await receive(connection, "a"))["status"] == 400
+            await connection.send(json.dumps({
+                "type": "message", "id": "b", "session_id": "missing", "message": "Hi", "sender": "tutor"
+            }))
+            assert (await receive(connection, "b"))["status"] == 404
+            await connection.send(json.dumps({"type": "message", "id": "c", "session_id": "missing"}))
+            invalid = await receive(connection, "c")
+            assert invalid["status"] == 422 and invalid["errors"]
+            # Senders are checked before they reach the messages table
+            await connection.send(json.dumps({
+                "type": "message", "id": "e", "session_id": "missing", "message": "Hi", "sender": "teacher"
+            }))
+            assert (await receive(connection, "e"))["status"] == 422
+            await connection.send(json.dumps({"type": "start", "id": "d", "tutor_name": "x"}))
+            assert (await receive(connection, "d"))["status"] == 422
+            await connection.send(json.dumps({
+                "type": "start", "id": "f", "tutor_name": "x", "problem": PROBLEM, "persona_type": "nobody"
+            }))
+            assert (await receive(connection, "f"))["status"] == 400
+
+
+def test_multiplexed_turns_and_scoring():
+    asyncio.run(multiplexed_turns())
+
+
+def test_resume_after_drop():
+    asyncio.run(resume_after_drop())
+
+
+def test_heartbeats():
+    asyncio.run(heartbeats())
+
+
+def test_slow_consumer_backpressure():
+    asyncio.run(slow_consumer())
+
+
+def test_error_frames():
+    asyncio.run(error_frames())
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("WEBSOCKET SESSION CHANNEL TEST")
+    print("=" * 80)
+    print("\nMultiplexed turns and scoring progress")
+    test_multiplexed_turns_and_scoring()
+    print("\nResume after a dropped connection")
+    test_resume_after_drop()
+    print("\nHeartbeats")
+    test_heartbeats()
+    print("\nSlow consumer")
+    test_slow_consumer_backpressure()
+    print("\nError frames")
+    test_error_frames()
+    print("\nAll checks passed")
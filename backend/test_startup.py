@@ -0,0 +1,86 @@
+"""The app starts and serves without Anthropic credentials.
+
+In a fresh process with no ANTHROPIC_API_KEY:
+
+- importing the app does not import the Anthropic SDK or create a client,
+- startup and shutdown run, /health, /api/personas and
+  /api/scoring-categories answer 200,
+- model-backed routes answer 503 instead of failing at import or with a 500.
+
+Run from the backend directory:
+    python test_startup.py
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+
+
+async def boot_without_credentials() -> dict:
+    """Runs in the child process"""
+    import httpx
+
+    import main
+    results = {"anthropic_after_import": "anthropic" in sys.modules}
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            for path in ["/health", "/api/personas", "/api/scoring-categories"]:
+                results[path] = (await client.get(path)).status_code
+            results["anthropic_after_reads"] = "anthropic" in sys.modules
+            start = await client.post("/api/sessions/start", json={
+                "tutor_name": "tutor", "problem": PROBLEM, "persona_type": "anxious_alex"
+            })
+            results["/api/sessions/start"] = start.status_code
+            results["start_detail"] = start.json()["detail"]
+            message = {"message": "Hi", "sender": "tutor"}
+            results["/api/sessions/missing/message"] = (
+                await client.post("/api/sessions/missing/message", json=message)
+            ).status_code
+    return results
+
+
+def run_child() -> dict:
+    env = dict(
+        os.environ,
+        ANTHROPIC_API_KEY="",
+        SESSION_STORE="memory",
+        SESSION_SPILL_DIR="",
+        SESSION_WAL_DIR="",
+        OPENER_POOL_SIZE="0",
+        SCORING_JOB_DIR=tempfile.mkdtemp()
+    )
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_boots_without_credentials():
+    results = run_child()
+    print(f"  {results}")
+    assert not results["anthropic_after_import"]
+    assert not results["anthropic_after_reads"]
+    assert results["/health"] == 200
+    assert results["/api/personas"] == 200
+    assert results["/api/scoring-categories"] == 200
+    assert results["/api/sessions/start"] == 503
+    assert "ANTHROPIC_API_KEY" in results["start_detail"]
+    assert results["/api/sessions/missing/message"] == 503
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--child"]:
+        print(json.dumps(asyncio.run(boot_without_credentials())))
+    else:
+        print("=" * 80)
+        print("STARTUP WITHOUT CREDENTIALS TEST")
+        print("=" * 80)
+        test_boots_without_credentials()
+        print("\nAll checks passed")
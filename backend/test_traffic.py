@@ -0,0 +1,288 @@
+"""ClaudeService's traffic layer against the fault-injecting fake LLM server.
+
+- persona turns and scoring streams survive a provider that answers 40% of
+  requests with 429 or 529: every fault is retried, none reaches the caller,
+- a retry-after from the provider is waited out and halves the model's rate,
+- the token bucket spaces out request starts and reports its queue depth,
+- hedged persona turns cut off the slow tail, streamed ones included: a
+  stream with no text by the recent p95 is raced by a second, and the one
+  that loses is closed and gives back its admission slot,
+- a scoring stream waiting out a retry does not hold an admission slot
+  meanwhile,
+- a provider that stays overloaded turns into a 503 with Retry-After from
+  the message endpoint, not a 500.
+
+Run from the backend directory:
+    python test_traffic.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+
+from fake_llm_server import FakeLLMServer, FaultInjector
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "fake-key")
+os.environ["SESSION_STORE"] = "memory"
+os.environ["SESSION_SPILL_DIR"] = ""
+os.environ["SESSION_WAL_DIR"] = ""
+os.environ["OPENER_POOL_SIZE"] = "0"
+os.environ["ROLLING_SCORING_INTERVAL"] = "0"
+os.environ["SCORING_JOB_DIR"] = tempfile.mkdtemp()
+
+import main
+from services.admission_service import AdmissionController
+from services.claude_service import PERSONA_MODEL, SCORING_MODEL, ClaudeService
+from services.metrics_service import get_metrics_snapshot, reset_metrics
+from services.session_store import get_session_store
+from services.traffic_service import RetryPolicy, TokenBucket, TrafficController
+
+TURN = [{"content": "Which two numbers multiply to 6 and add to -5?", "sender": "tutor"}]
+PROBLEM = "Solve the quadratic equation x² - 5x + 6 = 0"
+
+
+def make_service(server: FakeLLMServer, max_retries: int = 8, per_minute: float = 0,
+                 hedge_min_delay: float = 1.0, hedge_persona: bool = False,
+                 admission: AdmissionController = None) -> ClaudeService:
+    traffic = TrafficController(
+        buckets={
+            PERSONA_MODEL: TokenBucket("persona", per_minute),
+            SCORING_MODEL: TokenBucket("scoring", per_minute)
+        },
+        retry_policy=RetryPolicy(max_retries=max_retries, base_delay=0.01, max_delay=0.2),
+        hedge_min_delay=hedge_min_delay
+    )
+    return ClaudeService(base_url=server.base_url, traffic=traffic, hedge_persona=hedge_persona, admission=admission)
+
+
+def persona_turn(service: ClaudeService):
+    return service.get_persona_response(messages=TURN, persona_type="anxious_alex", problem=PROBLEM)
+
+
+async def faulty_provider():
+    faults = FaultInjector(rate_limited=0.2, overloaded=0.2, retry_after=0.02, seed=7)
+    with FakeLLMServer(latency=0.02, faults=faults) as server:
+        service = make_service(server)
+        try:
+            replies = await asyncio.gather(*(persona_turn(service) for _ in range(60)))
+            streamed = [text async for text in service.stream_persona_response(
+                messages=TURN, persona_type="anxious_alex", problem=PROBLEM
+            )]
+            scores = await service.get_session_scores(TURN, "anxious_alex", PROBLEM, mode="single")
+        finally:
+            await service.aclose()
+
+    counters = get_metrics_snapshot()["counters"]
+    failed = faults.injected["rate_limited"] + faults.injected["overloaded"]
+    print(f"  {dict(faults.injected)} injected, {counters['claude_retries']} retries")
+    assert all(replies) and "".join(streamed) and scores["categories"]
+    assert failed >= 20
+    assert counters["claude_retries"] == failed
+    assert counters.get("claude_retries_429", 0) == faults.injected["rate_limited"]
+    assert counters.get("claude_retries_529", 0) == faults.injected["overloaded"]
+    assert len(server.requests) == 62 + failed
+
+
+async def retry_after():
+    faults = FaultInjector(script=["rate_limited"], retry_after=0.5)
+    with FakeLLMServer(latency=0.01, faults=faults) as server:
+        service = make_service(server, per_minute=600)
+        try:
+            start = time.perf_counter()
+            await persona_turn(service)
+            elapsed = time.perf_counter() - start
+        finally:
+            await service.aclose()
+    gauges = get_metrics_snapshot()["gauges"]
+    print(f"  retried after {elapsed:.2f} s, persona rate now {gauges['claude_rate_per_minute_persona']}/min")
+    assert elapsed >= 0.5
+    assert gauges["claude_rate_per_minute_persona"] < 600
+
+
+async def token_bucket():
+    bucket = TokenBucket("test", per_minute=1200, burst=5)
+    depths = []
+
+    async def watch():
+        while True:
+            depths.append(get_metrics_snapshot()["gauges"].get("claude_queue_depth_test", 0))
+            await asyncio.sleep(0.05)
+
+    watcher = asyncio.create_task(watch())
+    start = time.perf_counter()
+    await asyncio.gather(*(bucket.acquire() for _ in range(25)))
+    elapsed = time.perf_counter() - start
+    watcher.cancel()
+    print(f"  25 starts at 20/s with a burst of 5 took {elapsed:.2f} s, max queue depth {max(depths)}")
+    # 5 start at once, the other 20 one every 50 ms
+    assert 0.9 <= elapsed < 1.5
+    assert max(depths) >= 10
+    assert get_metrics_snapshot()["gauges"]["claude_queue_depth_test"] == 0
+
+
+async def hedging():
+    faults = FaultInjector(slow_latency=1.5)
+    with FakeLLMServer(latency=0.05, faults=faults) as server:
+        service = make_service(server, hedge_min_delay=0.3, hedge_persona=True)
+        try:
+            for _ in range(30):
+                await persona_turn(service)
+            # Every other turn's first request stalls; its hedge does not
+            faults.script = ["slow", None, None] * 5
+            latencies = []
+            for _ in range(10):
+                start = time.perf_counter()
+                await persona_turn(service)
+                latencies.append(time.perf_counter() - start)
+        finally:
+            await service.aclose()
+    counters = get_metrics_snapshot()["counters"]
+    print(f"  {faults.injected['slow']} slow replies, {counters.get('claude_hedges', 0)} hedges, "
+          f"{counters.get('claude_hedges_won', 0)} won, slowest turn {max(latencies):.2f} s")
+    assert faults.injected["slow"] == 5
+    assert counters["claude_hedges"] == counters["claude_hedges_won"] == 5
+    assert max(latencies) < 1.0
+
+
+async def stream_turn(service: ClaudeService) -> str:
+    chunks = []
+    async for text in service.stream_persona_response(messages=TURN, persona_type="anxious_alex", problem=PROBLEM):
+        chunks.append(text)
+    return "".join(chunks)
+
+
+async def stream_hedging():
+    faults = FaultInjector(slow_latency=1.5)
+    with FakeLLMServer(latency=0.05, per_token_latency=0.001, faults=faults) as server:
+        admission = AdmissionController(max_concurrency=4)
+        service = make_service(server, hedge_min_delay=0.3, hedge_persona=True, admission=admission)
+        try:
+            expected = await stream_turn(service)
+            for _ in range(29):
+                assert await stream_turn(service) == expected
+            faults.script = ["slow", None, None] * 5
+            latencies = []
+            for _ in range(10):
+                start = time.perf_counter()
+                assert await stream_turn(service) == expected
+                latencies.append(time.perf_counter() - start)
+            # The losing streams are closed in the background
+            await asyncio.sleep(0.1)
+            assert admission.active == 0
+        finally:
+            await service.aclose()
+    counters = get_metrics_snapshot()["counters"]
+    print(f"  {faults.injected['slow']} slow streams, {counters.get('claude_hedges', 0)} hedges, "
+          f"slowest turn {max(latencies):.2f} s")
+    assert faults.injected["slow"] == 5
+    assert counters["claude_hedges"] == counters["claude_hedges_won"] == 5
+    assert max(latencies) < 1.0
+
+
+async def stream_backoff():
+    # One slot: a scoring stream that kept it through its retry would block
+    # the persona turn (on another model, so the paused scoring bucket does not)
+    faults = FaultInjector(script=["overloaded"], retry_after=0.5)
+    with FakeLLMServer(latency=0.01, faults=faults) as server:
+        admission = AdmissionController(max_concurrency=1, background_share=1.0)
+        service = make_service(server, admission=admission)
+        try:
+            scoring = asyncio.create_task(service.get_session_scores(TURN, "anxious_alex", PROBLEM, mode="single"))
+            await asyncio.sleep(0.1)
+            start = time.perf_counter()
+            await persona_turn(service)
+            elapsed = time.perf_counter() - start
+            assert not scoring.done()
+            assert (await scoring)["categories"]
+        finally:
+            await service.aclose()
+    print(f"  persona turn during the scoring stream's retry backoff took {elapsed:.2f} s")
+    assert faults.injected["overloaded"] == 1
+    assert elapsed < 0.3
+    assert admission.active == 0
+
+
+async def overloaded_endpoint():
+    faults = FaultInjector(overloaded=1.0, retry_after=2)
+    with FakeLLMServer(latency=0.01, faults=faults) as server:
+        sys.modules["services.claude_service"]._claude_service = make_service(server, max_retries=1)
+        async with main.app.router.lifespan_context(main.app):
+            session_id = str(uuid.uuid4())
+            await get_session_store().create({
+                "id": session_id,
+                "tutor_name": "tutor",
+                "problem": PROBLEM,
+                "persona_type": "anxious_alex",
+                "messages": [],
+                "created_at": datetime.now().isoformat(),
+                "is_active": True
+            })
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+                response = await client.post(
+                    f"/api/sessions/{session_id}/message",
+                    json={"message": "What is 2 times 3?", "sender": "tutor"}
+                )
+    print(f"  {response.status_code} with Retry-After: {response.headers.get('retry-after')}")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "2"
+    assert faults.injected["overloaded"] == 2
+
+
+def run(check):
+    reset_metrics()
+    asyncio.run(check())
+
+
+def test_faults_are_retried():
+    run(faulty_provider)
+
+
+def test_retry_after_is_honored():
+    run(retry_after)
+
+
+def test_token_bucket_spaces_out_requests():
+    run(token_bucket)
+
+
+def test_hedging_cuts_slow_tail():
+    run(hedging)
+
+
+def test_hedging_streamed_turns():
+    run(stream_hedging)
+
+
+def test_stream_retry_releases_admission_slot():
+    run(stream_backoff)
+
+
+def test_overloaded_provider_returns_503():
+    run(overloaded_endpoint)
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("CLAUDE TRAFFIC LAYER TEST")
+    print("=" * 80)
+    print("\nInjected 429s and 529s")
+    test_faults_are_retried()
+    print("\nRetry-after")
+    test_retry_after_is_honored()
+    print("\nToken bucket")
+    test_token_bucket_spaces_out_requests()
+    print("\nHedged persona turns")
+    test_hedging_cuts_slow_tail()
+    print("\nHedged streamed turns")
+    test_hedging_streamed_turns()
+    print("\nStream retry backoff")
+    test_stream_retry_releases_admission_slot()
+    print("\nProvider stays overloaded")
+    test_overloaded_provider_returns_503()
+    print("\nAll checks passed")
@@ -53,31 +53,47 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({
     setMessages(prev => [...prev, tutorMessage]);
 
     setIsLoading(true);
+    const aiMessageId = `${messages.length + 2}`;
+    let streamed = '';
     try {
-      const response = await sessionApi.sendMessage(sessionId, {
-        message: content,
-        sender: 'tutor'
-      });
+      const response = await sessionApi.streamMessage(
+        sessionId,
+        { message: content, sender: 'tutor' },
+        (text) => {
+          // Show the reply as it is generated
+          streamed += text;
+          const partial = streamed;
+          setMessages(prev => {
+            const others = prev.filter(m => m.id !== aiMessageId);
+            return [...others, {
+              id: aiMessageId,
+              content: partial,
+              sender: 'learner',
+              timestamp: new Date().toISOString()
+            }];
+          });
+        }
+      );
 
-      // Add AI response
+      // Replace the streamed text with the final response
       const aiMessage: Message = {
-        id: `${messages.length + 2}`,
+        id: aiMessageId,
         content: response.response,
         sender: 'learner',
         timestamp: new Date().toISOString()
       };
-      setMessages(prev => [...prev, aiMessage]);
+      setMessages(prev => [...prev.filter(m => m.id !== aiMessageId), aiMessage]);
       setSessionActive(response.session_active);
     } catch (error) {
       console.error('Error sending message:', error);
       // Add error message
       const errorMessage: Message = {
-        id: `${messages.length + 2}`,
+        id: aiMessageId,
         content: 'Sorry, I had trouble understanding that. Can you try again?',
         sender: 'learner',
         timestamp: new Date().toISOString()
       };
-      setMessages(prev => [...prev, errorMessage]);
+      setMessages(prev => [...prev.filter(m => m.id !== aiMessageId), errorMessage]);
     } finally {
       setIsLoading(false);
     }
@@ -123,7 +139,7 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({
           {messages.map((message) => (
             <MessageBubble key={message.id} message={message} />
           ))}
-          {isLoading && (
+          {isLoading && messages[messages.length - 1]?.sender !== 'learner' && (
             <div className="flex justify-start mb-4">
               <div className="bg-gray-200 rounded-lg px-4 py-2">
                 <div className="flex space-x-2">
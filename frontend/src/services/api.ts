@@ -5,9 +5,12 @@ import type {
   MessageRequest,
   MessageResponse,
   SessionEndResponse,
+  ScoringJob,
   Persona,
 } from "../types";
 
+const SCORING_POLL_INTERVAL_MS = 1500;
+
 const api = axios.create({
   baseURL: "/api",
   headers: {
@@ -41,11 +44,62 @@ export const sessionApi = {
     return response.data;
   },
 
+  async streamMessage(
+    sessionId: string,
+    message: MessageRequest,
+    onToken: (text: string) => void
+  ): Promise<MessageResponse> {
+    const response = await fetch(`/api/sessions/${sessionId}/message/stream`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(message),
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Streaming request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Server-Sent Events frames are separated by a blank line
+      let boundary = buffer.indexOf("\n\n");
+      while (boundary !== -1) {
+        const frame = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf("\n\n");
+
+        const event = frame.match(/^event: (.*)$/m)?.[1];
+        const data = frame.match(/^data: (.*)$/m)?.[1];
+        if (!event || !data) continue;
+        const payload = JSON.parse(data);
+        if (event === "token") {
+          onToken(payload.text);
+        } else if (event === "done") {
+          return payload as MessageResponse;
+        } else if (event === "error") {
+          throw new Error(payload.detail);
+        }
+      }
+    }
+    throw new Error("Stream ended before the response completed");
+  },
+
   async endSession(sessionId: string): Promise<SessionEndResponse> {
-    const response = await api.post<SessionEndResponse>(
-      `/sessions/${sessionId}/end`
-    );
-    return response.data;
+    // Ending a session queues a scoring job; poll it until it finishes
+    let job = (await api.post<ScoringJob>(`/sessions/${sessionId}/end`)).data;
+    while (job.status === "queued" || job.status === "running") {
+      await new Promise((resolve) => setTimeout(resolve, SCORING_POLL_INTERVAL_MS));
+      job = (await api.get<ScoringJob>(`/scoring-jobs/${job.id}`)).data;
+    }
+    if (job.status === "failed" || !job.result) {
+      throw new Error(job.error ?? "Scoring failed");
+    }
+    return job.result;
   },
 
   async getPersonas(): Promise<Persona[]> {
@@ -64,3 +64,11 @@ export interface SessionEndResponse {
   session_summary: string;
 }
 
+export interface ScoringJob {
+  id: string;
+  session_id: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
+  queue_position?: number;
+  result: SessionEndResponse | null;
+  error: string | null;
+}